@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CTR列式存储模块
+CTR样本以 Parquet 分块存储：每次落盘只把新增或被更新的行写成一个新分块
+（带 _row 行号列，后写的分块覆盖先写的同号行），分块过多时合并为一个。
+分块列表记录在 manifest.json 中，原子替换，读取时只读清单里的分块。
+启动时用 LazyRecords 按列加载，行字典在首次访问时才构建。
+"""
+
+import json
+import os
+import threading
+from collections.abc import Sequence as SequenceABC
+from typing import Any, Dict, List, Optional, Sequence
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+ROW_COLUMN = "_row"
+
+
+class LazyRecords(SequenceABC):
+    """
+    按需构建行字典的样本列表
+    已落盘的行按列保存，首次访问时才转换成字典（缺失字段不输出）并缓存，之后可原地修改；
+    新样本用 append 直接追加字典。
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self._columns = {name: frame[name].tolist() for name in frame.columns}
+        self._rows: List[Optional[Dict[str, Any]]] = [None] * len(frame)
+
+    def column(self, name: str) -> List[Any]:
+        """已落盘行的某一列（缺失值为None），只在行字典被修改前使用"""
+        values = self._columns.get(name)
+        if values is None:
+            return [None] * len(self._rows)
+        return [None if _is_missing(value) else value for value in values]
+
+    def _row(self, pos: int) -> Dict[str, Any]:
+        row = self._rows[pos]
+        if row is None:
+            row = self._rows[pos] = {name: values[pos] for name, values in self._columns.items()
+                                     if not _is_missing(values[pos])}
+        return row
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(pos) for pos in range(*index.indices(len(self._rows)))]
+        if index < 0:
+            index += len(self._rows)
+        if not 0 <= index < len(self._rows):
+            raise IndexError(index)
+        return self._row(index)
+
+    def append(self, row: Dict[str, Any]):
+        self._rows.append(row)
+
+    def copy(self) -> List[Dict[str, Any]]:
+        """全部行字典（浅拷贝列表，与 list.copy 一致）"""
+        return self[:]
+
+
+class CTRColumnarStore:
+    """Parquet分块存储（追加写 + 定期合并）"""
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, base_dir: str = "models/ctr_store", max_chunks: int = 16):
+        """
+        Args:
+            base_dir: 存储目录
+            max_chunks: 分块数超过该值时合并
+        """
+        self.base_dir = base_dir
+        self.max_chunks = max_chunks
+        self.manifest_path = os.path.join(base_dir, self.MANIFEST)
+        self._lock = threading.Lock()
+        # 已读取的DataFrame，按清单版本缓存
+        self._frame: Optional[pd.DataFrame] = None
+        self._frame_generation = -1
+
+    def exists(self) -> bool:
+        """是否已有列式数据"""
+        return os.path.exists(self.manifest_path)
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if not os.path.exists(self.manifest_path):
+            return {'generation': 0, 'next_chunk': 0, 'chunks': [], 'rows': 0}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        os.makedirs(self.base_dir, exist_ok=True)
+        temp_file = self.manifest_path + ".tmp"
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.manifest_path)
+
+    def _write_chunk(self, manifest: Dict[str, Any], frame: pd.DataFrame) -> str:
+        name = f"chunk_{manifest['next_chunk']:06d}.parquet"
+        manifest['next_chunk'] += 1
+        os.makedirs(self.base_dir, exist_ok=True)
+        pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), os.path.join(self.base_dir, name))
+        return name
+
+    def _remove_chunks(self, names: Sequence[str]):
+        for name in names:
+            path = os.path.join(self.base_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def append_rows(self, row_ids: Sequence[int], rows: List[Dict[str, Any]], total_rows: int,
+                    log_seq: Optional[int] = None) -> int:
+        """
+        把新增/更新的行写成一个新分块
+
+        Args:
+            row_ids: 行号（样本在全部数据中的位置）
+            rows: 行数据
+            total_rows: 写入后的总行数
+            log_seq: 本次写入已包含的事件日志序号（CTREventStore.log_seq），与清单一起原子提交
+
+        Returns:
+            int: 写入的行数
+        """
+        with self._lock:
+            manifest = self._read_manifest()
+            if rows:
+                frame = pd.DataFrame(rows)
+                frame.insert(0, ROW_COLUMN, pd.array(row_ids, dtype='int64'))
+                manifest['chunks'].append(self._write_chunk(manifest, frame))
+            manifest['rows'] = total_rows
+            if log_seq is not None:
+                manifest['log_seq'] = log_seq
+            manifest['generation'] += 1
+            self._write_manifest(manifest)
+
+            if len(manifest['chunks']) > self.max_chunks:
+                self._compact(manifest)
+            return len(rows)
+
+    def compact(self):
+        """合并所有分块为一个"""
+        with self._lock:
+            self._compact(self._read_manifest())
+
+    def _compact(self, manifest: Dict[str, Any]):
+        old_chunks = list(manifest['chunks'])
+        frame = self._load_frame(manifest)
+        manifest['chunks'] = [self._write_chunk(manifest, frame.reset_index())] if len(frame) else []
+        manifest['generation'] += 1
+        self._write_manifest(manifest)
+        self._remove_chunks(old_chunks)
+        print(f"🗜️ CTR列式存储合并完成: {len(old_chunks)}个分块 -> {len(manifest['chunks'])}个, {len(frame)}行")
+
+    def reset(self):
+        """清空所有分块"""
+        with self._lock:
+            manifest = self._read_manifest()
+            old_chunks = list(manifest['chunks'])
+            manifest.update(chunks=[], rows=0, generation=manifest['generation'] + 1)
+            self._write_manifest(manifest)
+            self._remove_chunks(old_chunks)
+
+    def _load_frame(self, manifest: Dict[str, Any]) -> pd.DataFrame:
+        """读取清单中的所有分块，按行号去重（保留最后写入的版本），以行号为索引"""
+        if self._frame is not None and self._frame_generation == manifest['generation']:
+            return self._frame
+        frames = [pq.read_table(os.path.join(self.base_dir, name)).to_pandas() for name in manifest['chunks']]
+        if frames:
+            frame = pd.concat(frames, ignore_index=True)
+            frame = frame.drop_duplicates(subset=ROW_COLUMN, keep='last').set_index(ROW_COLUMN).sort_index()
+            frame = frame[frame.index < manifest['rows']]
+        else:
+            frame = pd.DataFrame(index=pd.Index([], name=ROW_COLUMN, dtype='int64'))
+        self._frame, self._frame_generation = frame, manifest['generation']
+        return frame
+
+    def load_frame(self) -> pd.DataFrame:
+        """
+        读取已落盘的全部样本（按清单版本缓存，调用方不要修改返回值）
+
+        Returns:
+            pd.DataFrame: 以行号为索引的样本
+        """
+        with self._lock:
+            return self._load_frame(self._read_manifest())
+
+    def load_records(self) -> LazyRecords:
+        """读取全部样本（行字典在访问时才构建，缺失字段不输出）"""
+        return LazyRecords(self.load_frame())
+
+    def log_seq(self) -> int:
+        """已提交的分块包含的事件日志序号（-1 表示未记录）"""
+        with self._lock:
+            return self._read_manifest().get('log_seq', -1)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """存储统计"""
+        with self._lock:
+            manifest = self._read_manifest()
+        size = sum(os.path.getsize(os.path.join(self.base_dir, name)) for name in manifest['chunks']
+                   if os.path.exists(os.path.join(self.base_dir, name)))
+        return {'chunks': len(manifest['chunks']), 'rows': manifest['rows'], 'bytes': size}
+
+
+def _is_missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and value != value)
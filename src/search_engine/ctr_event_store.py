@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CTR事件存储模块
+按写入顺序保存CTR样本，并维护：
+- 哈希索引：(request_id, doc_id)、request_id、query、doc_id -> 样本位置
+- 计数器：每个查询/文档的展示数和点击数，以及全局点击统计
+- 追加写日志：每个展示/点击事件写一行JSON，快照落盘后轮转，启动时重放（跳过快照中记录的已包含序号）
+- 脏行集合：上次落盘后新增或被点击更新的样本位置，供增量落盘
+- 在线特征：可选地把展示/首次点击同步给 OnlineFeatureStore（加载、重放时同样重建）
+- 事件监听：可选地把写入日志的新事件同时交给监听函数（如后台训练进程的队列），重放时不通知
+
+所有方法都不加锁，由调用方（DataService）持锁调用。
+"""
+
+import glob
+import json
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class CTREventStore:
+    """带索引的CTR事件存储"""
+
+    def __init__(self, log_file: Optional[str] = None, feature_store=None,
+                 event_listener: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        """
+        Args:
+            log_file: 追加写日志路径，为None时不写日志
+            feature_store: 在线特征存储（OnlineFeatureStore），为None时不同步
+            event_listener: 新事件（与日志行同格式）的监听函数，为None时不通知
+        """
+        self.log_file = log_file
+        self.feature_store = feature_store
+        self.event_listener = event_listener
+        self._log_handle = None
+        # 下一个轮转日志的序号，单调递增（快照记录已包含的最大序号）
+        self._next_seq = 0
+        self._reset()
+
+    def _reset(self):
+        self.samples: List[Dict[str, Any]] = []
+        self._by_key: Dict[Tuple[str, str], List[int]] = defaultdict(list)
+        self._by_request: Dict[str, List[int]] = defaultdict(list)
+        self._by_query: Dict[str, List[int]] = defaultdict(list)
+        self._by_doc: Dict[str, List[int]] = defaultdict(list)
+        self._position_keys: Dict[Tuple[str, str, Any], int] = defaultdict(int)
+        # [展示数, 点击样本数]
+        self._query_counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self._doc_counts: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+        self.total_clicked = 0
+        self.total_click_events = 0
+        self.max_click_count = 0
+        self.duplicate_count = 0
+        # 增量落盘状态
+        self._dirty: Set[int] = set()
+        self.cleared = False
+        if self.feature_store is not None:
+            self.feature_store.clear()
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    # ---------------- 索引维护 ----------------
+
+    def _index_sample(self, sample: Dict[str, Any]):
+        pos = len(self.samples)
+        self.samples.append(sample)
+        self._dirty.add(pos)
+        self._index_fields(pos, sample.get('request_id'), sample.get('doc_id'), sample.get('query'),
+                           sample.get('position'), sample.get('clicked', 0), sample.get('click_count', 1),
+                           sample.get('timestamp'))
+
+    def _index_fields(self, pos: int, request_id: str, doc_id: str, query: str, position: Any,
+                      clicked: Any, click_count: Any, timestamp: Optional[str]):
+        self._by_key[(request_id, doc_id)].append(pos)
+        self._by_request[request_id].append(pos)
+        self._by_query[query].append(pos)
+        self._by_doc[doc_id].append(pos)
+
+        position_key = (request_id, doc_id, position)
+        if self._position_keys[position_key]:
+            self.duplicate_count += 1
+        self._position_keys[position_key] += 1
+
+        clicked = 1 if clicked else 0
+        query_counts = self._query_counts[query]
+        query_counts[0] += 1
+        query_counts[1] += clicked
+        doc_counts = self._doc_counts[doc_id]
+        doc_counts[0] += 1
+        doc_counts[1] += clicked
+        if clicked:
+            click_count = click_count or 1
+            self.total_clicked += 1
+            self.total_click_events += click_count
+            self.max_click_count = max(self.max_click_count, click_count)
+        if self.feature_store is not None:
+            self.feature_store.record_impression(query, doc_id, timestamp, clicked=bool(clicked))
+
+    def load(self, samples: Iterable[Dict[str, Any]], dirty: bool = False):
+        """
+        用已有样本重建索引（启动时一次性 O(N)）
+
+        Args:
+            samples: 样本列表
+            dirty: 是否标记为待落盘（从旧格式迁移时为True）
+        """
+        self._reset()
+        for sample in samples:
+            self._index_sample(sample)
+        if not dirty:
+            self._dirty.clear()
+
+    def load_records(self, records):
+        """
+        用列式加载的样本（LazyRecords）重建索引，只读取索引需要的列，不构建行字典
+
+        Args:
+            records: LazyRecords，之后作为样本列表继续追加
+        """
+        self._reset()
+        self.samples = records
+        columns = [records.column(name) for name in
+                   ('request_id', 'doc_id', 'query', 'position', 'clicked', 'click_count', 'timestamp')]
+        for pos, fields in enumerate(zip(*columns)):
+            self._index_fields(pos, *fields)
+
+    def take_dirty(self) -> Tuple[bool, List[int]]:
+        """
+        取出并清空待落盘状态
+
+        Returns:
+            Tuple[bool, List[int]]: (上次落盘后是否清空过, 升序的脏行位置)
+        """
+        cleared, dirty = self.cleared, sorted(self._dirty)
+        self.cleared = False
+        self._dirty = set()
+        return cleared, dirty
+
+    def restore_dirty(self, cleared: bool, positions: Iterable[int]):
+        """落盘失败时放回待落盘状态"""
+        self.cleared = self.cleared or cleared
+        self._dirty.update(pos for pos in positions if pos < len(self.samples))
+
+    def dirty_positions(self) -> List[int]:
+        """尚未落盘的样本位置（不清空）"""
+        return sorted(self._dirty)
+
+    # ---------------- 写入 ----------------
+
+    def append(self, sample: Dict[str, Any], log: bool = True) -> int:
+        """
+        追加展示样本
+
+        Returns:
+            int: 追加前相同 (request_id, doc_id, position) 的样本数
+        """
+        existing = self.count_duplicates(sample.get('request_id'), sample.get('doc_id'), sample.get('position'))
+        self._index_sample(sample)
+        if log:
+            self._emit({'op': 'impression', 'sample': sample})
+        return existing
+
+    def extend(self, samples: Iterable[Dict[str, Any]], log: bool = True) -> int:
+        """批量追加展示样本，返回追加数量"""
+        count = 0
+        for sample in samples:
+            self.append(sample, log=log)
+            count += 1
+        return count
+
+    def apply_click(self, request_id: str, doc_id: str, all_matches: bool = True,
+                    click_time: Optional[str] = None, log: bool = True) -> List[Dict[str, Any]]:
+        """
+        记录点击：首次点击置 clicked=1，重复点击递增 click_count
+
+        Args:
+            request_id: 请求ID
+            doc_id: 文档ID
+            all_matches: True 时更新所有匹配的展示（单条点击），False 时只更新第一条（批量点击）
+            click_time: 点击时间，默认当前时间（重放日志时传入原时间）
+            log: 是否写入日志
+
+        Returns:
+            List[Dict]: 被更新的样本
+        """
+        positions = self._by_key.get((request_id, doc_id))
+        if not positions:
+            return []
+        if not all_matches:
+            positions = positions[:1]
+        click_time = click_time or datetime.now().isoformat()
+
+        updated = []
+        for pos in positions:
+            sample = self.samples[pos]
+            if sample.get('clicked', 0) == 0:
+                sample['clicked'] = 1
+                sample['click_time'] = click_time
+                sample['click_count'] = 1
+                self._query_counts[sample.get('query')][1] += 1
+                self._doc_counts[sample.get('doc_id')][1] += 1
+                self.total_clicked += 1
+                self.total_click_events += 1
+                self.max_click_count = max(self.max_click_count, 1)
+                if self.feature_store is not None:
+                    self.feature_store.record_click(sample.get('query'), sample.get('doc_id'), click_time)
+            else:
+                sample['click_count'] = sample.get('click_count', 1) + 1
+                sample['last_click_time'] = click_time
+                self.total_click_events += 1
+                self.max_click_count = max(self.max_click_count, sample['click_count'])
+            self._dirty.add(pos)
+            updated.append(sample)
+
+        if log:
+            self._emit({'op': 'click', 'request_id': request_id, 'doc_id': doc_id,
+                             'all': all_matches, 'time': click_time})
+        return updated
+
+    def clear(self, log: bool = True):
+        """清空所有样本"""
+        self._reset()
+        self.cleared = True
+        if log:
+            self._emit({'op': 'clear'})
+
+    # ---------------- 查询 ----------------
+
+    def count_duplicates(self, request_id: str, doc_id: str, position: Any) -> int:
+        """相同 (request_id, doc_id, position) 的已有样本数"""
+        return self._position_keys.get((request_id, doc_id, position), 0)
+
+    def by_request(self, request_id: str) -> List[Dict[str, Any]]:
+        return [self.samples[pos] for pos in self._by_request.get(request_id, ())]
+
+    def by_query(self, query: str) -> List[Dict[str, Any]]:
+        return [self.samples[pos] for pos in self._by_query.get(query, ())]
+
+    def by_doc(self, doc_id: str) -> List[Dict[str, Any]]:
+        return [self.samples[pos] for pos in self._by_doc.get(doc_id, ())]
+
+    def query_ctr(self, query: str, default: float = 0.1) -> float:
+        """查询的历史点击率（没有历史时返回默认值）"""
+        counts = self._query_counts.get(query)
+        return counts[1] / counts[0] if counts and counts[0] else default
+
+    def doc_ctr(self, doc_id: str, default: float = 0.1) -> float:
+        """文档的历史点击率（没有历史时返回默认值）"""
+        counts = self._doc_counts.get(doc_id)
+        return counts[1] / counts[0] if counts and counts[0] else default
+
+    @property
+    def unique_queries(self) -> int:
+        return len(self._by_query)
+
+    @property
+    def unique_docs(self) -> int:
+        return len(self._by_doc)
+
+    # ---------------- 追加写日志 ----------------
+
+    def _emit(self, event: Dict[str, Any]):
+        """新事件：写日志并通知监听函数"""
+        self._write_log(event)
+        if self.event_listener is not None:
+            try:
+                self.event_listener(event)
+            except Exception as e:
+                print(f"⚠️ CTR事件监听失败: {e}")
+
+    def _write_log(self, event: Dict[str, Any]):
+        if not self.log_file:
+            return
+        if self._log_handle is None:
+            directory = os.path.dirname(self.log_file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._log_handle = open(self.log_file, 'a', encoding='utf-8')
+        self._log_handle.write(json.dumps(event, ensure_ascii=False) + "\n")
+        self._log_handle.flush()
+
+    @staticmethod
+    def _log_seq(path: str) -> int:
+        return int(path.rsplit('.', 2)[-2])
+
+    def _pending_logs(self) -> List[str]:
+        """已轮转但快照尚未确认落盘的日志（按轮转顺序）"""
+        return sorted(glob.glob(self.log_file + ".*.pending"), key=self._log_seq)
+
+    @property
+    def log_seq(self) -> int:
+        """已轮转日志的最大序号（-1 表示尚未轮转）；轮转后取的快照包含序号不超过它的全部日志"""
+        return self._next_seq - 1
+
+    def rotate_log(self) -> Optional[str]:
+        """
+        轮转日志（在取快照的同一把锁内调用），之后的事件写入新日志
+
+        Returns:
+            Optional[str]: 轮转后的日志路径，快照落盘后应调用 discard_log 删除
+        """
+        if not self.log_file:
+            return None
+        if self._log_handle is not None:
+            self._log_handle.close()
+            self._log_handle = None
+        if not os.path.exists(self.log_file):
+            return None
+        pending = self._pending_logs()
+        seq = max(self._log_seq(pending[-1]) + 1 if pending else 0, self._next_seq)
+        self._next_seq = seq + 1
+        rotated = f"{self.log_file}.{seq}.pending"
+        os.replace(self.log_file, rotated)
+        return rotated
+
+    def discard_log(self, rotated: Optional[str]):
+        """快照落盘后删除已轮转的日志（以及更早的未确认日志）"""
+        if not rotated:
+            return
+        for path in self._pending_logs():
+            os.remove(path)
+            if path == rotated:
+                break
+
+    def replay_log(self, covered_seq: int = -1) -> int:
+        """
+        在快照之上重放未确认的日志
+
+        Args:
+            covered_seq: 快照中记录的 log_seq；序号不超过它的轮转日志已包含在快照中
+                （快照落盘后、删除日志前中断留下的），直接删除不再重放
+
+        Returns:
+            int: 重放的事件数
+        """
+        if not self.log_file:
+            return 0
+        self._next_seq = max(self._next_seq, covered_seq + 1)
+        replayed = 0
+        for path in self._pending_logs() + [self.log_file]:
+            if not os.path.exists(path):
+                continue
+            if path != self.log_file and self._log_seq(path) <= covered_seq:
+                os.remove(path)
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写到一半的最后一行
+                        continue
+                    op = event.get('op')
+                    if op == 'impression':
+                        self.append(event['sample'], log=False)
+                    elif op == 'click':
+                        self.apply_click(event['request_id'], event['doc_id'], event.get('all', True),
+                                         event.get('time'), log=False)
+                    elif op == 'clear':
+                        self.clear(log=False)
+                    replayed += 1
+        return replayed
+
+    def close(self):
+        if self._log_handle is not None:
+            self._log_handle.close()
+            self._log_handle = None
@@ -3,8 +3,11 @@ import uuid
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import pandas as pd
-import jieba
 from .training_tab.ctr_config import CTRSampleConfig
+from .tokenization_service import get_tokenization_service
+from .ctr_event_store import CTREventStore
+from .ctr_columnar_store import CTRColumnarStore, PARQUET_AVAILABLE
+from .online_feature_store import get_online_feature_store
 from abc import ABC, abstractmethod
 import time
 import asyncio
@@ -49,12 +52,38 @@ class DataService(DataServiceInterface):
     - 批量保存：减少频繁的文件IO操作
     - 延迟保存：异步保存数据，不阻塞主线程
     - 数据缓存：内存缓存提高访问速度
+    - 事件索引：按 (request_id, doc_id)、query、doc_id 建哈希索引，点击和历史CTR均为O(1)
+    - 追加写日志：快照之间的事件写入 models/ctr_events.jsonl，启动时重放
+    - 列式增量落盘：只把新增/更新的行写成 Parquet 分块（models/ctr_store），
+      DataFrame 直接从列式数据读取；未安装 pyarrow 时回退到 JSON 快照
+    - 在线特征：事件实时更新查询/文档的展示/点击计数（OnlineFeatureStore），随落盘定期快照
     """
     
-    def __init__(self, auto_save_interval: int = 30, batch_size: int = 100, model_service=None):
-        self.ctr_data: List[Dict[str, Any]] = []
+    def __init__(self, auto_save_interval: int = 30, batch_size: int = 100, model_service=None,
+                 in_process_online_training: bool = False):
+        """
+        Args:
+            auto_save_interval: 自动保存间隔（秒）
+            batch_size: 累计多少条变更后立即保存
+            model_service: 模型服务引用（在线学习）
+            in_process_online_training: 后台训练进程未运行时，是否在服务进程内的线程中做在线训练
+                （默认关闭，训练只在后台进程中进行，不占用服务进程）
+        """
         self.lock = threading.Lock()
         self.data_file = "models/ctr_data.json"
+        self.event_log_file = "models/ctr_events.jsonl"
+        # 展示/点击事件同时更新在线特征计数，供预测时查询历史CTR
+        self.feature_store = get_online_feature_store()
+        # 新事件同时转发给后台训练进程（若已启动）
+        self.event_store = CTREventStore(self.event_log_file, feature_store=self.feature_store,
+                                         event_listener=self._on_ctr_event)
+        self.store_dir = "models/ctr_store"
+        self.columnar_store = CTRColumnarStore(self.store_dir) if PARQUET_AVAILABLE else None
+        # 正在落盘的行（位置集合、是否包含清空），落盘完成前读取DataFrame时用内存数据覆盖
+        self._inflight_positions: List[int] = []
+        self._inflight_cleared = False
+        # 串行化落盘，保证分块按取数顺序写入（后写的分块覆盖先写的）
+        self._save_lock = threading.Lock()
         
         # 优化参数
         self.auto_save_interval = auto_save_interval  # 自动保存间隔（秒）
@@ -70,16 +99,23 @@ class DataService(DataServiceInterface):
         self._stats_cache = None
         self._stats_cache_time = 0
         self._cache_ttl = 10  # 缓存TTL（秒）
+        self._samples_frame: Optional[pd.DataFrame] = None
         
         # 在线学习相关
         self.model_service = model_service  # 模型服务引用
         self.last_training_data_count = 0  # 上次训练时的数据量
         self.online_training_trigger_threshold = 10  # 每新增N条数据触发一次在线训练
+        self.in_process_online_training = in_process_online_training
         
         self._load_existing_data()
         self.last_training_data_count = len(self.ctr_data)  # 初始化训练数据计数
         self._start_auto_save_timer()
     
+    @property
+    def ctr_data(self) -> List[Dict[str, Any]]:
+        """全部CTR样本（按写入顺序，只读访问；从列式数据加载的行在首次访问时才构建字典）"""
+        return self.event_store.samples
+    
     def _start_auto_save_timer(self):
         """启动自动保存定时器"""
         def auto_save():
@@ -108,14 +144,22 @@ class DataService(DataServiceInterface):
     
     def _save_data_sync(self):
         """同步保存数据到文件"""
+        self.feature_store.maybe_snapshot()
+        if self.columnar_store is not None:
+            self._save_columnar_sync()
+            return
         try:
             import json
             import os
             
             with self.lock:
-                data_to_save = self.ctr_data.copy()
+                # 复制样本字典，避免落盘期间的点击同时进入快照和新日志
+                data_to_save = [dict(sample) for sample in self.ctr_data]
                 self.pending_changes = 0
                 self.last_save_time = time.time()
+                # 快照之后的事件写入新日志；快照记录已包含的日志序号，删除轮转日志前中断时重放会跳过它
+                rotated_log = self.event_store.rotate_log()
+                log_seq = self.event_store.log_seq
             
             # 确保目录存在
             os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
@@ -123,10 +167,12 @@ class DataService(DataServiceInterface):
             # 写入临时文件，然后原子性替换
             temp_file = self.data_file + ".tmp"
             with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data_to_save, f, ensure_ascii=False, indent=2)
+                json.dump({'log_seq': log_seq, 'samples': data_to_save}, f, ensure_ascii=False, indent=2)
             
             # 原子性替换
             os.replace(temp_file, self.data_file)
+            # 快照已包含轮转日志中的事件
+            self.event_store.discard_log(rotated_log)
             
             print(f"✅ 数据保存成功: {len(data_to_save)}条记录")
             
@@ -135,23 +181,76 @@ class DataService(DataServiceInterface):
         finally:
             self.is_saving = False
     
+    def _save_columnar_sync(self):
+        """增量保存：只把上次落盘后新增/更新的行写成一个Parquet分块"""
+        with self._save_lock:
+            self._write_dirty_chunk()
+    
+    def _write_dirty_chunk(self):
+        cleared, dirty = False, []
+        try:
+            with self.lock:
+                cleared, dirty = self.event_store.take_dirty()
+                rows = [dict(self.ctr_data[pos]) for pos in dirty]
+                total_rows = len(self.ctr_data)
+                self._inflight_positions, self._inflight_cleared = dirty, cleared
+                self.pending_changes = 0
+                self.last_save_time = time.time()
+                # 分块之后的事件写入新日志
+                rotated_log = self.event_store.rotate_log()
+                log_seq = self.event_store.log_seq
+            
+            if cleared:
+                self.columnar_store.reset()
+            written = self.columnar_store.append_rows(dirty, rows, total_rows, log_seq=log_seq)
+            # 分块已包含轮转日志中的事件
+            self.event_store.discard_log(rotated_log)
+            
+            print(f"✅ 数据增量保存成功: 写入{written}条记录, 共{total_rows}条")
+            
+        except Exception as e:
+            print(f"⚠️ 保存CTR数据失败: {e}")
+            with self.lock:
+                self.event_store.restore_dirty(cleared, dirty)
+        finally:
+            with self.lock:
+                self._inflight_positions, self._inflight_cleared = [], False
+            self.is_saving = False
+    
     def _invalidate_cache(self):
         """清除缓存"""
         self._stats_cache = None
         self._stats_cache_time = 0
+        self._samples_frame = None
     
     def _load_existing_data(self):
         """加载已存在的CTR数据"""
         try:
             import json
             import os
-            if os.path.exists(self.data_file):
+            covered_seq = -1
+            if self.columnar_store is not None and self.columnar_store.exists():
+                self.event_store.load_records(self.columnar_store.load_records())
+                covered_seq = self.columnar_store.log_seq()
+                print(f"✅ 加载CTR列式数据成功，共{len(self.ctr_data)}条记录")
+            elif os.path.exists(self.data_file):
+                # JSON快照：启用列式存储时全部标记为待落盘，首次保存即完成迁移
                 with open(self.data_file, 'r', encoding='utf-8') as f:
-                    self.ctr_data = json.load(f)
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    covered_seq = data.get('log_seq', -1)
+                    data = data.get('samples', [])
+                self.event_store.load(data, dirty=self.columnar_store is not None)
+                if self.columnar_store is not None:
+                    self.pending_changes += len(self.ctr_data)
                 print(f"✅ 加载CTR数据成功，共{len(self.ctr_data)}条记录")
+            replayed = self.event_store.replay_log(covered_seq)
+            if replayed:
+                self.pending_changes += replayed
+                print(f"✅ 重放CTR事件日志: {replayed}条事件")
         except Exception as e:
             print(f"⚠️ 加载CTR数据失败: {e}")
-            self.ctr_data = []
+            self.event_store.load([])
     
     def record_impression(self, query: str, doc_id: str, position: int, 
                          score: float, summary: str, request_id: str) -> Dict[str, Any]:
@@ -161,16 +260,12 @@ class DataService(DataServiceInterface):
                 # 使用内部方法创建样本
                 sample = self._create_sample(query, doc_id, position, score, summary, request_id)
                 
-                # 检查重复记录
-                duplicate_count = sum(1 for d in self.ctr_data 
-                                    if d.get('request_id') == request_id.strip() and 
-                                       d.get('doc_id') == doc_id.strip() and 
-                                       d.get('position') == position)
+                # 追加样本（返回此前相同请求/文档/位置的记录数，用于检查重复）
+                duplicate_count = self.event_store.append(sample)
                 
                 if duplicate_count > 0:
                     print(f"⚠️ 发现重复记录: request_id={request_id}, doc_id={doc_id}, position={position}")
                 
-                self.ctr_data.append(sample)
                 self.pending_changes += 1
                 self._invalidate_cache()  # 新增数据时清除缓存
                 
@@ -194,27 +289,17 @@ class DataService(DataServiceInterface):
         
         with self.lock:
             try:
-                updated_count = 0
                 doc_id_clean = doc_id.strip()
                 request_id_clean = request_id.strip()
                 
-                for sample in self.ctr_data:
-                    if (sample.get('request_id') == request_id_clean and 
-                        sample.get('doc_id') == doc_id_clean):
-                        # 记录点击事件 - 不同次点击作为独立事件
-                        if sample.get('clicked', 0) == 0:
-                            # 首次点击
-                            sample['clicked'] = 1
-                            sample['click_time'] = datetime.now().isoformat()
-                            sample['click_count'] = 1
-                            updated_count += 1
-                            print(f"✅ 首次点击: doc_id={doc_id_clean}, request_id={request_id_clean}")
-                        else:
-                            # 多次点击，递增点击计数
-                            sample['click_count'] = sample.get('click_count', 1) + 1
-                            sample['last_click_time'] = datetime.now().isoformat()
-                            updated_count += 1
-                            print(f"✅ 多次点击: doc_id={doc_id_clean}, request_id={request_id_clean}, 总计点击{sample['click_count']}次")
+                # 记录点击事件 - 不同次点击作为独立事件
+                updated_samples = self.event_store.apply_click(request_id_clean, doc_id_clean)
+                for sample in updated_samples:
+                    if sample['click_count'] == 1:
+                        print(f"✅ 首次点击: doc_id={doc_id_clean}, request_id={request_id_clean}")
+                    else:
+                        print(f"✅ 多次点击: doc_id={doc_id_clean}, request_id={request_id_clean}, 总计点击{sample['click_count']}次")
+                updated_count = len(updated_samples)
                 
                 if updated_count > 0:
                     self.pending_changes += updated_count
@@ -223,15 +308,10 @@ class DataService(DataServiceInterface):
                         self._save_data_async()
                     print(f"✅ 记录点击事件成功: doc_id={doc_id_clean}, request_id={request_id_clean}, 更新{updated_count}条记录")
                     
-                    # 临时禁用在线训练触发，排查 segmentation fault
-                    # TODO: 重新启用后需要调试 threading + scikit-learn 的兼容性
-                    # 检查是否需要触发在线训练（释放锁后执行）
-                    # should_trigger = self._should_trigger_online_training()
-                    # 
-                    # # 释放锁
-                    # if should_trigger:
-                    #     # 在锁外执行训练，避免死锁
-                    #     threading.Thread(target=self._trigger_online_training_async, daemon=True).start()
+                    # 检查是否需要触发在线训练（增量更新只用新样本，不再调用 liblinear 全量重训）
+                    if self._should_trigger_online_training():
+                        # 后台线程在本方法释放锁后才能取到数据，避免死锁
+                        threading.Thread(target=self._trigger_online_training_async, daemon=True).start()
                     
                     return True
                 else:
@@ -245,26 +325,39 @@ class DataService(DataServiceInterface):
     def get_samples_by_request(self, request_id: str) -> List[Dict[str, Any]]:
         """获取指定请求的CTR样本"""
         with self.lock:
-            return [sample for sample in self.ctr_data if sample.get('request_id') == request_id]
+            return self.event_store.by_request(request_id)
     
     def get_all_samples(self) -> List[Dict[str, Any]]:
         """获取所有CTR样本"""
         with self.lock:
             return self.ctr_data.copy()
     
+    def get_sample_count(self) -> int:
+        """获取CTR样本总数"""
+        with self.lock:
+            return len(self.ctr_data)
+    
+    def get_samples_range(self, start: int, end: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按写入顺序获取 [start, end) 区间的样本（增量学习只读取新样本）"""
+        with self.lock:
+            return [dict(sample) for sample in self.ctr_data[start:end]]
+    
     def get_samples_dataframe(self, request_id: Optional[str] = None) -> pd.DataFrame:
-        """获取CTR样本DataFrame"""
+        """获取CTR样本DataFrame（全量时直接读取列式数据，只用内存数据覆盖未落盘的行）"""
         with self.lock:
             if request_id:
-                samples = [sample for sample in self.ctr_data if sample.get('request_id') == request_id]
+                samples = self.event_store.by_request(request_id)
+                df = pd.DataFrame(samples) if samples else pd.DataFrame()
+            elif not self.ctr_data:
+                df = pd.DataFrame()
             else:
-                samples = self.ctr_data
+                if self._samples_frame is None:
+                    self._samples_frame = self._build_samples_frame()
+                df = self._samples_frame.copy()
             
-            if not samples:
+            if df.empty:
                 return pd.DataFrame()
             
-            df = pd.DataFrame(samples)
-            
             # 确保DataFrame包含所有配置的列
             expected_columns = CTRSampleConfig.get_field_names()
             missing_columns = [col for col in expected_columns if col not in df.columns]
@@ -278,6 +371,29 @@ class DataService(DataServiceInterface):
             
             return df
     
+    def _build_samples_frame(self) -> pd.DataFrame:
+        """已落盘的列式数据 + 未落盘行的内存版本（需要在锁内调用）"""
+        total_rows = len(self.ctr_data)
+        if self.columnar_store is None:
+            return pd.DataFrame(self.ctr_data)
+        
+        overlay = sorted(set(self._inflight_positions).union(self.event_store.dirty_positions()))
+        if self.event_store.cleared or self._inflight_cleared:
+            base = pd.DataFrame()
+        else:
+            base = self.columnar_store.load_frame()
+            base = base.drop(index=[pos for pos in overlay if pos in base.index])
+        if overlay:
+            pending = pd.DataFrame([self.ctr_data[pos] for pos in overlay], index=overlay)
+            frame = pd.concat([base, pending]).sort_index() if len(base) else pending
+        else:
+            frame = base
+        if len(frame) != total_rows or (total_rows and frame.index[-1] != total_rows - 1):
+            # 列式数据与内存不一致（如外部修改了存储目录），以内存为准
+            print("⚠️ CTR列式数据与内存不一致，使用内存数据")
+            return pd.DataFrame(self.ctr_data)
+        return frame.reset_index(drop=True)
+    
     def get_stats(self) -> Dict[str, Any]:
         """获取数据统计信息（带缓存）"""
         current_time = time.time()
@@ -300,28 +416,15 @@ class DataService(DataServiceInterface):
                     'cache_time': current_time
                 }
             else:
-                df = pd.DataFrame(self.ctr_data)
-                total_samples = len(df)
-                total_clicks = df['clicked'].sum() if 'clicked' in df.columns else 0
+                store = self.event_store
+                total_samples = len(store)
+                total_clicks = store.total_clicked
                 click_rate = total_clicks / total_samples if total_samples > 0 else 0.0
-                unique_queries = df['query'].nunique() if 'query' in df.columns else 0
-                unique_docs = df['doc_id'].nunique() if 'doc_id' in df.columns else 0
-                
-                # 新增点击计数统计
-                total_click_events = 0
-                avg_clicks_per_clicked_item = 0.0
-                max_clicks_per_item = 0
-                if 'click_count' in df.columns:
-                    click_counts = df[df['clicked'] == 1]['click_count']
-                    if len(click_counts) > 0:
-                        total_click_events = click_counts.sum()
-                        avg_clicks_per_clicked_item = click_counts.mean()
-                        max_clicks_per_item = click_counts.max()
-                else:
-                    # 兼容旧数据
-                    total_click_events = total_clicks
-                    avg_clicks_per_clicked_item = 1.0 if total_clicks > 0 else 0.0
-                    max_clicks_per_item = 1 if total_clicks > 0 else 0
+                
+                # 点击计数统计（由事件存储的计数器维护）
+                total_click_events = store.total_click_events
+                avg_clicks_per_clicked_item = total_click_events / total_clicks if total_clicks > 0 else 0.0
+                max_clicks_per_item = store.max_click_count
                 
                 stats = {
                     'total_samples': total_samples,
@@ -330,8 +433,8 @@ class DataService(DataServiceInterface):
                     'click_rate': click_rate,
                     'avg_clicks_per_clicked_item': round(avg_clicks_per_clicked_item, 2),
                     'max_clicks_per_item': max_clicks_per_item,
-                    'unique_queries': unique_queries,
-                    'unique_docs': unique_docs,
+                    'unique_queries': store.unique_queries,
+                    'unique_docs': store.unique_docs,
                     'cache_hit': False,
                     'cache_time': current_time
                 }
@@ -345,8 +448,9 @@ class DataService(DataServiceInterface):
     def clear_data(self):
         """清空所有CTR数据"""
         with self.lock:
-            self.ctr_data = []
+            self.event_store.clear()
             self.pending_changes = 0
+            self._invalidate_cache()
             self._save_data_async() # 清空后也保存一次
             print("✅ CTR数据已清空")
     
@@ -356,7 +460,7 @@ class DataService(DataServiceInterface):
             with self.lock:
                 import json
                 with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(self.ctr_data, f, ensure_ascii=False, indent=2)
+                    json.dump(list(self.ctr_data), f, ensure_ascii=False, indent=2)
                 print(f"✅ CTR数据导出成功: {filepath}")
                 return True
         except Exception as e:
@@ -371,8 +475,9 @@ class DataService(DataServiceInterface):
                 imported_data = json.load(f)
             
             with self.lock:
-                self.ctr_data.extend(imported_data)
+                self.event_store.extend(imported_data)
                 self.pending_changes += len(imported_data)
+                self._invalidate_cache()
                 if self._should_save_now():
                     self._save_data_async()
                 print(f"✅ CTR数据导入成功: {len(imported_data)}条记录")
@@ -425,7 +530,7 @@ class DataService(DataServiceInterface):
                 
                 # 批量添加到数据中
                 if batch_samples:
-                    self.ctr_data.extend(batch_samples)
+                    self.event_store.extend(batch_samples)
                     self.pending_changes += len(batch_samples)
                     self._invalidate_cache()
                     
@@ -464,17 +569,16 @@ class DataService(DataServiceInterface):
         ts = datetime.now().isoformat()
         
         # 计算查询匹配度
-        query_words = set(jieba.lcut(query.strip()))
-        summary_words = set(jieba.lcut(summary or ""))
+        tokenizer = get_tokenization_service()
+        query_words = set(tokenizer.lcut(query.strip()))
+        summary_words = set(tokenizer.lcut(summary or ""))
         match_ratio = 0.0
         if len(query_words) > 0:
             match_ratio = len(query_words.intersection(summary_words)) / len(query_words)
         
-        # 计算历史CTR
-        query_history = [d for d in self.ctr_data if d.get('query') == query.strip()]
-        doc_history = [d for d in self.ctr_data if d.get('doc_id') == doc_id.strip()]
-        query_ctr = sum(d.get('clicked', 0) for d in query_history) / len(query_history) if query_history else 0.1
-        doc_ctr = sum(d.get('clicked', 0) for d in doc_history) / len(doc_history) if doc_history else 0.1
+        # 计算历史CTR（事件存储维护的计数器）
+        query_ctr = self.event_store.query_ctr(query.strip())
+        doc_ctr = self.event_store.doc_ctr(doc_id.strip())
         
         # 创建样本
         sample = {
@@ -530,24 +634,8 @@ class DataService(DataServiceInterface):
                         doc_id_clean = click['doc_id'].strip()
                         request_id_clean = click['request_id'].strip()
                         
-                        # 查找并更新匹配的样本
-                        updated = False
-                        for sample in self.ctr_data:
-                            if (sample.get('request_id') == request_id_clean and 
-                                sample.get('doc_id') == doc_id_clean):
-                                if sample.get('clicked', 0) == 0:
-                                    # 首次点击
-                                    sample['clicked'] = 1
-                                    sample['click_time'] = datetime.now().isoformat()
-                                    sample['click_count'] = 1
-                                    updated = True
-                                    break
-                                else:
-                                    # 多次点击，递增点击计数
-                                    sample['click_count'] = sample.get('click_count', 1) + 1
-                                    sample['last_click_time'] = datetime.now().isoformat()
-                                    updated = True
-                                    break
+                        # 查找并更新第一条匹配的样本
+                        updated = self.event_store.apply_click(request_id_clean, doc_id_clean, all_matches=False)
                         
                         if updated:
                             results['success_count'] += 1
@@ -617,6 +705,7 @@ class DataService(DataServiceInterface):
     def force_save(self):
         """强制保存数据"""
         self._save_data_sync()
+        self.feature_store.save_snapshot()
     
     def get_data_health_check(self) -> Dict[str, Any]:
         """数据健康检查"""
@@ -636,14 +725,7 @@ class DataService(DataServiceInterface):
                     return health_report
                 
                 # 检查重复记录
-                seen_keys = set()
-                duplicates = 0
-                for sample in self.ctr_data:
-                    key = (sample.get('request_id'), sample.get('doc_id'), sample.get('position'))
-                    if key in seen_keys:
-                        duplicates += 1
-                    else:
-                        seen_keys.add(key)
+                duplicates = self.event_store.duplicate_count
                 
                 if duplicates > 0:
                     health_report['data_issues'].append(f'发现{duplicates}条重复记录')
@@ -661,7 +743,7 @@ class DataService(DataServiceInterface):
                     health_report['recommendations'].append('检查数据收集逻辑')
                 
                 # 检查点击率
-                total_clicks = sum(sample.get('clicked', 0) for sample in self.ctr_data)
+                total_clicks = self.event_store.total_clicked
                 click_rate = total_clicks / len(self.ctr_data) if self.ctr_data else 0
                 
                 if click_rate < 0.01:
@@ -682,9 +764,16 @@ class DataService(DataServiceInterface):
         self.model_service = model_service
         print("✅ 模型服务已关联到数据服务")
     
+    def _on_ctr_event(self, event: Dict[str, Any]):
+        """新CTR事件转发给后台训练进程（在锁内调用，只做非阻塞投递）"""
+        if self.model_service is not None:
+            self.model_service.submit_training_event(event)
+    
     def set_online_training_threshold(self, threshold: int):
         """设置在线训练触发阈值"""
         self.online_training_trigger_threshold = max(1, threshold)
+        if self.model_service is not None:
+            self.model_service.set_online_batch_size(self.online_training_trigger_threshold)
         print(f"🔄 在线训练触发阈值已设置为: {threshold}条新数据")
     
     def _should_trigger_online_training(self) -> bool:
@@ -697,6 +786,10 @@ class DataService(DataServiceInterface):
         if not self.model_service.is_online_learning_enabled():
             return False
         
+        # 训练默认只在后台进程中进行；进程内训练需显式开启，且后台进程已在消费事件时不做
+        if not self.in_process_online_training or self.model_service.is_training_worker_running():
+            return False
+        
         # 计算新增的数据量
         current_data_count = len(self.ctr_data)
         new_data_count = current_data_count - self.last_training_data_count
@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入存储模块 - 分段、内存映射、可量化、按槽位寻址的向量存储
+- 槽位（slot）：每个向量追加时分配一个递增的槽位号，之后不再改变（图片元数据中的 embedding_index 即槽位）
+- 追加写：每次追加写一个新段文件，已有段不重写；小段按二进制计数规则合并（段数 O(log N)），
+  超过 MAX_MERGE_ROWS 的段不再参与合并
+- 删除：只在有效位图中标记墓碑并追加写入删除日志（O(1)），检索时跳过；
+  墓碑比例超过阈值时由后台线程压实（重写含墓碑的段），槽位不变，因此元数据和向量索引都不需要改写
+- 所有段用 np.load(mmap_mode='r') 打开，多个进程共享同一份页缓存，不在各自进程里复制整份嵌入
+- 扫描格式（dtype）：float32 / float16 / int8（按行对称标量量化，每行一个缩放系数）；
+  量化格式另存一份 float32 原始向量，检索先用量化向量取候选，再对候选用原始向量精确重排。
+  量化格式节省的是内存而不是计算：NumPy 没有 float16 / int8 的 BLAS，每次查询扫描时都要把分块转成 float32，
+  全量扫描的 QPS 低于 float32（float16 约为 float32 的 1/10～1/6，int8 约 1/2～3/4，见 tools/embedding_store_benchmark.py）
+
+崩溃一致性：段文件写完后才通过原子替换 manifest.json 生效，压实中途退出时旧清单和旧段仍完整；
+清单未引用的段文件在下一次提交时删除。删除日志中指向已被压实掉的槽位的记录会被忽略。
+
+目录结构:
+    manifest.json                 {"format_version", "dtype", "dim", "next_slot", "next_segment", "segments": [{"name", "rows"}]}
+    deleted.log                   删除的槽位号（int64 小端，追加写）
+    seg_000001.f32.npy            原始向量（float32）
+    seg_000001.slots.npy          每行的槽位号（int64，升序）
+    seg_000001.f16.npy / .i8.npy  扫描用的量化向量（float32 格式时不存在）
+    seg_000001.scale.npy          int8 每行缩放系数
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .vector_index import top_k_indices
+
+STORE_FORMAT_VERSION = 2
+MANIFEST_FILE = 'manifest.json'
+DELETE_LOG_FILE = 'deleted.log'
+EMBEDDING_DTYPES = ('float32', 'float16', 'int8')
+
+# 达到这个行数的段不再参与合并
+MAX_MERGE_ROWS = 262144
+# 分块计算内积：量化向量每次查询按块转 float32（扫描的主要开销），临时矩阵（1024 x 512 x 4B = 2MB）留在 CPU 缓存内
+SCORE_CHUNK_ROWS = 1024
+# 量化格式下先取 top_k * DEFAULT_RESCORE_FACTOR 个候选再精确重排
+DEFAULT_RESCORE_FACTOR = 4
+# 墓碑占已存储行数的比例达到该值时触发压实
+DEFAULT_COMPACTION_THRESHOLD = 0.2
+
+_CODE_SUFFIX = {'float16': '.f16.npy', 'int8': '.i8.npy'}
+
+
+def quantize(vectors: np.ndarray, dtype: str) -> Dict[str, np.ndarray]:
+    """把 float32 向量转成扫描格式，返回 {'codes', 'scales'(仅 int8)}"""
+    if dtype == 'float16':
+        return {'codes': vectors.astype(np.float16)}
+    if dtype == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales > 0, scales, 1.0).astype(np.float32)
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return {'codes': codes, 'scales': scales}
+    return {'codes': vectors}
+
+
+class EmbeddingSegment:
+    """一个只读的段（内存映射）"""
+
+    def __init__(self, directory: str, name: str, dtype: str, first_slot: int = 0):
+        """
+        Args:
+            directory: 存储目录
+            name: 段名
+            dtype: 扫描格式
+            first_slot: 没有槽位文件的旧版（v1）段的首个槽位号，槽位连续
+        """
+        self.name = name
+        self.dtype = dtype
+        self.full = np.load(os.path.join(directory, f"{name}.f32.npy"), mmap_mode='r')
+        slots_path = os.path.join(directory, f"{name}.slots.npy")
+        if os.path.exists(slots_path):
+            self.slots = np.load(slots_path, mmap_mode='r')
+        else:
+            self.slots = np.arange(first_slot, first_slot + len(self.full), dtype=np.int64)
+        self.codes = self.full
+        self.scales: Optional[np.ndarray] = None
+        if dtype in _CODE_SUFFIX:
+            self.codes = np.load(os.path.join(directory, name + _CODE_SUFFIX[dtype]), mmap_mode='r')
+        if dtype == 'int8':
+            self.scales = np.load(os.path.join(directory, f"{name}.scale.npy"))
+        # 段内墓碑数，发布段时统计，之后随删除递增
+        self.tombstones: Optional[int] = None
+
+    @property
+    def rows(self) -> int:
+        return len(self.full)
+
+    @staticmethod
+    def files(name: str, dtype: str) -> List[str]:
+        """段包含的文件名"""
+        files = [f"{name}.f32.npy", f"{name}.slots.npy"]
+        if dtype in _CODE_SUFFIX:
+            files.append(name + _CODE_SUFFIX[dtype])
+        if dtype == 'int8':
+            files.append(f"{name}.scale.npy")
+        return files
+
+    @staticmethod
+    def write(directory: str, name: str, vectors: np.ndarray, slots: np.ndarray, dtype: str):
+        """写入段文件（先写临时文件再替换）"""
+        arrays = {f"{name}.f32.npy": vectors, f"{name}.slots.npy": np.asarray(slots, dtype=np.int64)}
+        quantized = quantize(vectors, dtype)
+        if dtype in _CODE_SUFFIX:
+            arrays[name + _CODE_SUFFIX[dtype]] = quantized['codes']
+        if dtype == 'int8':
+            arrays[f"{name}.scale.npy"] = quantized['scales']
+        for filename, array in arrays.items():
+            path = os.path.join(directory, filename)
+            with open(f"{path}.tmp", 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(f"{path}.tmp", path)
+
+    def positions(self, slots: np.ndarray) -> np.ndarray:
+        """槽位在段内的行号（槽位必须在段中）"""
+        return np.searchsorted(self.slots, slots)
+
+    def inner_products(self, query: np.ndarray, positions: Optional[np.ndarray] = None) -> np.ndarray:
+        """扫描格式下的内积（int8 为近似值）"""
+        codes = self.codes if positions is None else self.codes[positions]
+        scales = self.scales if positions is None or self.scales is None else self.scales[positions]
+        if codes.dtype == np.float32:
+            return codes @ query
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_ROWS):
+            chunk = np.asarray(codes[start:start + SCORE_CHUNK_ROWS], dtype=np.float32)
+            scores[start:start + len(chunk)] = chunk @ query
+        if scales is not None:
+            scores *= scales
+        return scores
+
+
+class EmbeddingStore:
+    """
+    分段嵌入存储，按槽位读取原始向量、计算内积，删除为 O(1) 墓碑
+
+    线程安全：追加、压实互斥；删除只持有删除日志锁；检索不加锁，段列表由写入方整体替换
+    """
+
+    def __init__(self, directory: str, dtype: str = 'float32'):
+        """
+        Args:
+            directory: 存储目录
+            dtype: 扫描格式（float32 / float16 / int8）；与已有存储不同时重新量化
+        """
+        if dtype not in EMBEDDING_DTYPES:
+            raise ValueError(f"不支持的嵌入格式: {dtype}，可选 {EMBEDDING_DTYPES}")
+        self.directory = directory
+        self.dtype = dtype
+        self.dim = 0
+        self.next_slot = 0
+        self.next_segment = 1
+        # (段列表, 每段最后一个槽位)，写入方整体替换
+        self._layout: Tuple[List[EmbeddingSegment], np.ndarray] = ([], np.empty(0, dtype=np.int64))
+        # 有效位图：按槽位记录是否已删除（容量按 2 倍扩展）
+        self._deleted = np.zeros(0, dtype=bool)
+        self._stored_rows = 0
+        self._tombstones = 0
+        self._write_lock = threading.RLock()
+        self._log_lock = threading.Lock()
+        self._log_handle = None
+        self._compaction_thread: Optional[threading.Thread] = None
+        self.last_compaction: Dict[str, Any] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    # ---------------- 清单与日志 ----------------
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    @property
+    def delete_log_path(self) -> str:
+        return os.path.join(self.directory, DELETE_LOG_FILE)
+
+    @property
+    def segments(self) -> List[EmbeddingSegment]:
+        return self._layout[0]
+
+    def _load(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        version = manifest.get('format_version')
+        if version not in (1, STORE_FORMAT_VERSION):
+            raise ValueError(f"不支持的嵌入存储版本: {version}")
+        stored_dtype = manifest['dtype']
+        self.dim = manifest['dim']
+        self.next_segment = manifest['next_segment']
+        segments = []
+        first_slot = 0
+        for info in manifest['segments']:
+            segments.append(EmbeddingSegment(self.directory, info['name'], stored_dtype, first_slot))
+            first_slot += info['rows']
+        # v1 没有槽位，行号即槽位
+        self.next_slot = manifest.get('next_slot', first_slot)
+        self._grow_deleted(self.next_slot)
+        if os.path.exists(self.delete_log_path):
+            with open(self.delete_log_path, 'rb') as f:
+                data = f.read()
+            # 忽略写了一半的末尾记录和越界的槽位
+            deleted = np.frombuffer(data[:len(data) // 8 * 8], dtype='<i8')
+            self._deleted[deleted[(deleted >= 0) & (deleted < self.next_slot)]] = True
+        self._set_segments(segments)
+        if stored_dtype != self.dtype and segments:
+            print(f"🔁 嵌入存储格式 {stored_dtype} -> {self.dtype}，重新量化 {len(self)} 个向量")
+            with self._write_lock:
+                slots = self.live_slots()
+                self._commit([self._new_segment(self.get(slots), slots)] if len(slots) else [])
+                self._rewrite_delete_log()
+
+    def _write_manifest(self):
+        manifest = {
+            'format_version': STORE_FORMAT_VERSION,
+            'dtype': self.dtype,
+            'dim': self.dim,
+            'next_slot': self.next_slot,
+            'next_segment': self.next_segment,
+            'segments': [{'name': segment.name, 'rows': segment.rows} for segment in self.segments],
+        }
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _remove_orphans(self):
+        """
+        删除清单中没有引用的段文件（被合并或压实的旧段、上次写入中途退出留下的文件）
+        只在写入方提交时调用：加载时清理可能删掉其他进程已写出、尚未写入清单的新段
+        """
+        referenced = {filename for segment in self.segments
+                      for filename in EmbeddingSegment.files(segment.name, self.dtype)}
+        for filename in os.listdir(self.directory):
+            if filename.startswith('seg_') and filename not in referenced:
+                os.remove(os.path.join(self.directory, filename))
+
+    def _grow_deleted(self, size: int):
+        """扩展有效位图到至少 size 个槽位（在发布含新槽位的段之前调用）"""
+        with self._log_lock:
+            if size > len(self._deleted):
+                grown = np.zeros(max(size, 2 * len(self._deleted), 1024), dtype=bool)
+                grown[:len(self._deleted)] = self._deleted
+                self._deleted = grown
+
+    def _set_segments(self, segments: List[EmbeddingSegment]):
+        """整体替换段列表，统计新段的墓碑数并更新已存储行数和墓碑总数（与段数成正比，与行数无关）"""
+        last_slots = np.array([int(segment.slots[-1]) for segment in segments], dtype=np.int64)
+        with self._log_lock:
+            for segment in segments:
+                if segment.tombstones is None:
+                    segment.tombstones = int(self._deleted[segment.slots].sum())
+            self._layout = (segments, last_slots)
+            self._stored_rows = sum(segment.rows for segment in segments)
+            self._tombstones = sum(segment.tombstones for segment in segments)
+
+    def _new_segment(self, vectors: np.ndarray, slots: np.ndarray) -> EmbeddingSegment:
+        name = f"seg_{self.next_segment:06d}"
+        self.next_segment += 1
+        EmbeddingSegment.write(self.directory, name, vectors, slots, self.dtype)
+        return EmbeddingSegment(self.directory, name, self.dtype)
+
+    def _commit(self, segments: List[EmbeddingSegment]):
+        """切换到新的段列表：先写清单，再删除不再引用的段文件"""
+        self._set_segments(segments)
+        self._write_manifest()
+        self._remove_orphans()
+
+    def _live_rows(self, segment: EmbeddingSegment) -> Tuple[np.ndarray, np.ndarray]:
+        """段中未删除的 (向量, 槽位)"""
+        live = ~self._deleted[segment.slots]
+        return np.asarray(segment.full[live]), np.asarray(segment.slots[live])
+
+    def _rewrite_delete_log(self):
+        """删除日志只保留仍然存储在段中的墓碑槽位"""
+        with self._log_lock:
+            if self._log_handle is not None:
+                self._log_handle.close()
+                self._log_handle = None
+            tombstones = [np.asarray(segment.slots[self._deleted[segment.slots]]) for segment in self.segments]
+            data = np.concatenate(tombstones).astype('<i8') if tombstones else np.empty(0, dtype='<i8')
+            tmp_path = f"{self.delete_log_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data.tobytes())
+            os.replace(tmp_path, self.delete_log_path)
+
+    # ---------------- 读写 ----------------
+
+    def __len__(self) -> int:
+        """未删除的向量数"""
+        return self._stored_rows - self._tombstones
+
+    @property
+    def shape(self):
+        return (len(self), self.dim)
+
+    @property
+    def quantized(self) -> bool:
+        return self.dtype != 'float32'
+
+    def fragmentation(self) -> float:
+        """墓碑占已存储行数的比例"""
+        return self._tombstones / self._stored_rows if self._stored_rows else 0.0
+
+    def append(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        追加向量：写一个新段，然后按需合并末尾的小段（合并时丢弃墓碑）
+
+        Returns:
+            np.ndarray: 分配的槽位号
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return np.empty(0, dtype=np.int64)
+        if self.dim and vectors.shape[1] != self.dim:
+            raise ValueError(f"嵌入维度不一致: {vectors.shape[1]} != {self.dim}")
+        with self._write_lock:
+            self.dim = vectors.shape[1]
+            slots = np.arange(self.next_slot, self.next_slot + len(vectors), dtype=np.int64)
+            self.next_slot += len(vectors)
+            self._grow_deleted(self.next_slot)
+            segments = self.segments + [self._new_segment(vectors, slots)]
+            # 二进制计数式合并：末段不小于前一段时合并（大段不参与），每行被重写 O(log N) 次
+            while (len(segments) > 1 and segments[-1].rows >= segments[-2].rows
+                   and segments[-2].rows < MAX_MERGE_ROWS):
+                parts = [self._live_rows(segments[-2]), self._live_rows(segments[-1])]
+                merged_slots = np.concatenate([part[1] for part in parts])
+                merged = []
+                if len(merged_slots):
+                    merged = [self._new_segment(np.concatenate([part[0] for part in parts]), merged_slots)]
+                segments = segments[:-2] + merged
+            self._commit(segments)
+        return slots
+
+    def delete(self, slot: int) -> bool:
+        """删除一个槽位：标记墓碑并追加写入删除日志，O(1)"""
+        with self._log_lock:
+            if slot < 0 or slot >= self.next_slot or self._deleted[slot]:
+                return False
+            if self._log_handle is None:
+                self._log_handle = open(self.delete_log_path, 'ab')
+            self._log_handle.write(np.array([slot], dtype='<i8').tobytes())
+            self._log_handle.flush()
+            self._deleted[slot] = True
+            segments, last_slots = self._layout
+            owner = int(np.searchsorted(last_slots, slot))
+            if owner < len(segments):
+                segments[owner].tombstones += 1
+                self._tombstones += 1
+        return True
+
+    def is_live(self, slot: int) -> bool:
+        """槽位是否存在且未删除"""
+        segments, last_slots = self._layout
+        owner = int(np.searchsorted(last_slots, slot))
+        if slot < 0 or owner >= len(segments) or self._deleted[slot]:
+            return False
+        segment = segments[owner]
+        position = int(segment.positions(slot))
+        return position < segment.rows and int(segment.slots[position]) == slot
+
+    def live_slots(self) -> np.ndarray:
+        """全部未删除的槽位（升序）"""
+        segments, _ = self._layout
+        deleted = self._deleted
+        parts = [np.asarray(segment.slots[~deleted[segment.slots]]) for segment in segments]
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def _locate(self, slots: np.ndarray):
+        """按所在段分组：yield (段, 在 slots 中的位置掩码, 段内行号)"""
+        segments, last_slots = self._layout
+        owners = np.searchsorted(last_slots, slots)
+        for owner in np.unique(owners):
+            mask = owners == owner
+            segment = segments[owner]
+            yield segment, mask, segment.positions(slots[mask])
+
+    def get(self, slots) -> np.ndarray:
+        """按槽位（整数或数组）读取原始 float32 向量"""
+        slots = np.asarray(slots, dtype=np.int64)
+        if slots.ndim == 0:
+            return self.get(slots.reshape(1))[0]
+        result = np.empty((len(slots), self.dim), dtype=np.float32)
+        for segment, mask, positions in self._locate(slots):
+            result[mask] = segment.full[positions]
+        return result
+
+    __getitem__ = get
+
+    def inner_products(self, query: np.ndarray, slots: np.ndarray) -> np.ndarray:
+        """扫描格式下 query 与指定槽位向量的内积"""
+        query = np.asarray(query, dtype=np.float32)
+        slots = np.asarray(slots, dtype=np.int64)
+        scores = np.empty(len(slots), dtype=np.float32)
+        for segment, mask, positions in self._locate(slots):
+            scores[mask] = segment.inner_products(query, positions)
+        return scores
+
+    def scan(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        扫描全部未删除的向量
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (槽位, 扫描格式下的内积)
+        """
+        query = np.asarray(query, dtype=np.float32)
+        segments, _ = self._layout
+        deleted = self._deleted
+        all_slots, all_scores = [], []
+        for segment in segments:
+            scores = segment.inner_products(query)
+            live = ~deleted[segment.slots]
+            if live.all():
+                all_slots.append(np.asarray(segment.slots))
+                all_scores.append(scores)
+            else:
+                all_slots.append(np.asarray(segment.slots[live]))
+                all_scores.append(scores[live])
+        if not all_slots:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(all_slots), np.concatenate(all_scores)
+
+    # ---------------- 压实 ----------------
+
+    def compact(self, threshold: float = 0.0) -> Dict[str, Any]:
+        """
+        压实：重写墓碑比例不低于 threshold 的段（只保留未删除的行，槽位不变），然后精简删除日志
+
+        Args:
+            threshold: 段内墓碑比例阈值（0 表示重写所有含墓碑的段）
+
+        Returns:
+            Dict: rewritten_segments、removed_rows、seconds
+        """
+        start = time.time()
+        with self._write_lock:
+            segments = []
+            rewritten, removed = 0, 0
+            for segment in self.segments:
+                if segment.tombstones == 0 or segment.tombstones / segment.rows < threshold:
+                    segments.append(segment)
+                    continue
+                vectors, slots = self._live_rows(segment)
+                if len(slots):
+                    segments.append(self._new_segment(vectors, slots))
+                rewritten += 1
+                removed += segment.rows - len(slots)
+            if rewritten:
+                self._commit(segments)
+                self._rewrite_delete_log()
+        self.last_compaction = {'rewritten_segments': rewritten, 'removed_rows': removed,
+                                'seconds': round(time.time() - start, 3)}
+        return self.last_compaction
+
+    def start_background_compaction(self, threshold: float = 0.0) -> bool:
+        """在后台线程中压实（已有压实在运行时不重复启动）"""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return False
+
+        def run():
+            try:
+                result = self.compact(threshold)
+                print(f"🧹 嵌入存储压实完成: {result}")
+            except Exception as e:
+                print(f"❌ 嵌入存储压实失败: {e}")
+
+        self._compaction_thread = threading.Thread(target=run, name='embedding-compaction', daemon=True)
+        self._compaction_thread.start()
+        return True
+
+    def wait_for_compaction(self, timeout: Optional[float] = None):
+        """等待后台压实结束"""
+        if self._compaction_thread is not None:
+            self._compaction_thread.join(timeout)
+
+    def clear(self):
+        """删除全部向量"""
+        with self._write_lock:
+            self.next_slot = 0
+            self.dim = 0
+            with self._log_lock:
+                self._deleted = np.zeros(0, dtype=bool)
+            self._commit([])
+            self._rewrite_delete_log()
+
+    def get_stats(self) -> Dict[str, Any]:
+        segments = self.segments
+        scan_bytes = sum(segment.codes.nbytes + (segment.scales.nbytes if segment.scales is not None else 0)
+                         for segment in segments)
+        disk_bytes = scan_bytes + sum(segment.slots.nbytes for segment in segments)
+        if self.quantized:
+            disk_bytes += sum(segment.full.nbytes for segment in segments)
+        return {
+            'dtype': self.dtype,
+            'rows': len(self),
+            'dim': self.dim,
+            'segments': len(segments),
+            'tombstones': self._tombstones,
+            'fragmentation': round(self.fragmentation(), 4),
+            'scan_mb': round(scan_bytes / (1024 * 1024), 2),
+            'disk_mb': round(disk_bytes / (1024 * 1024), 2),
+        }
+
+
+def search_with_rescore(index, vectors, query: np.ndarray, top_k: int = 10,
+                        rescore_factor: int = DEFAULT_RESCORE_FACTOR):
+    """
+    用向量索引检索；量化存储时先取 top_k * rescore_factor 个候选，再用原始 float32 向量精确重排
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (槽位, 内积得分)，按得分降序
+    """
+    if not isinstance(vectors, EmbeddingStore) or not vectors.quantized or rescore_factor <= 1:
+        return index.search(vectors, query, top_k)
+    candidates, _ = index.search(vectors, query, top_k * rescore_factor)
+    scores = vectors.get(candidates) @ query
+    best = top_k_indices(scores, top_k)
+    return candidates[best], scores[best]
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片元数据日志模块
+图片元数据（ImageService.image_index）以「检查点 + 追加写日志」保存，新增/删除一张图片不再重写全部元数据：
+- 检查点：image_index.json，全量元数据，先写临时文件再原子替换
+- 日志：image_index.journal，每次新增/删除图片追加一行JSON（O(1)），启动时在检查点之上重放
+- 日志条数达到 max(JOURNAL_CHECKPOINT_MIN_OPS, 图片数 * JOURNAL_CHECKPOINT_RATIO) 时由调用方写检查点并清空日志，
+  每次操作均摊 O(1)
+
+崩溃一致性：检查点原子替换后才删除日志；两步之间中断时重放的日志操作已包含在检查点中，
+新增（按图片ID覆盖）和删除（不存在时忽略）都是幂等的，重放结果不变。写到一半的最后一行被忽略。
+
+另提供 reconcile_slots：按嵌入存储的有效槽位对齐元数据（元数据与嵌入分别写入，中途退出时两者可能不一致）。
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+JOURNAL_CHECKPOINT_MIN_OPS = 1000
+JOURNAL_CHECKPOINT_RATIO = 0.1
+
+
+class ImageIndexJournal:
+    """图片元数据的检查点 + 追加写日志"""
+
+    def __init__(self, index_file: str, journal_file: str):
+        """
+        Args:
+            index_file: 检查点文件（image_index.json）
+            journal_file: 追加写日志文件
+        """
+        self.index_file = index_file
+        self.journal_file = journal_file
+        # 上次检查点之后的日志条数
+        self.pending_ops = 0
+        self._handle = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        读取检查点并重放日志
+
+        Returns:
+            Dict: 图片ID -> 元数据
+        """
+        images: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                images = json.load(f).get('images', {})
+        self.pending_ops = 0
+        if os.path.exists(self.journal_file):
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 写到一半的末尾行
+                        break
+                    if entry.get('op') == 'add':
+                        images[entry['image']['id']] = entry['image']
+                    elif entry.get('op') == 'delete':
+                        images.pop(entry['id'], None)
+                    self.pending_ops += 1
+        return images
+
+    def _append(self, entries: List[Dict[str, Any]]):
+        with self._lock:
+            if self._handle is None:
+                self._handle = open(self.journal_file, 'a', encoding='utf-8')
+            self._handle.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+            self._handle.flush()
+            self.pending_ops += len(entries)
+
+    def record_add(self, images: List[Dict[str, Any]]):
+        """记录新增的图片（调用方先更新内存中的元数据再记录）"""
+        if images:
+            self._append([{'op': 'add', 'image': image} for image in images])
+
+    def record_delete(self, image_id: str):
+        """记录删除的图片（调用方先更新内存中的元数据再记录）"""
+        self._append([{'op': 'delete', 'id': image_id}])
+
+    def needs_checkpoint(self, total_images: int) -> bool:
+        """日志是否已足够长，应写检查点"""
+        return self.pending_ops >= max(JOURNAL_CHECKPOINT_MIN_OPS, total_images * JOURNAL_CHECKPOINT_RATIO)
+
+    def checkpoint(self, images: Dict[str, Dict[str, Any]]):
+        """
+        写全量检查点并清空日志
+        持有日志锁：期间其他线程的记录等到日志清空后再写入，不会丢失
+        """
+        with self._lock:
+            images = dict(images)
+            index_data = {
+                'images': images,
+                'last_updated': datetime.now().isoformat(),
+                'total_images': len(images)
+            }
+            tmp_path = f"{self.index_file}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(index_data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.index_file)
+            self._close()
+            if os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+            self.pending_ops = 0
+
+    def clear(self):
+        """删除检查点和日志"""
+        with self._lock:
+            self._close()
+            for path in (self.index_file, self.journal_file):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.pending_ops = 0
+
+    def _close(self):
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def close(self):
+        """关闭日志文件"""
+        with self._lock:
+            self._close()
+
+
+def reconcile_slots(image_index: Dict[str, Dict[str, Any]], store) -> Tuple[Dict[int, str], bool]:
+    """
+    按元数据和嵌入存储的有效槽位对齐（写入或删除中途退出时两者可能不一致）：
+    - 嵌入已追加但元数据未记录：删除没有图片的槽位
+    - 元数据已记录但嵌入不存在（或已删除）：丢弃该图片
+
+    Args:
+        image_index: 图片ID -> 元数据（原地修改）
+        store: EmbeddingStore
+
+    Returns:
+        Tuple[Dict[int, str], bool]: (槽位 -> 图片ID, 是否有改动)
+    """
+    missing = [image_id for image_id, info in image_index.items()
+               if not store.is_live(info.get('embedding_index', -1))]
+    for image_id in missing:
+        del image_index[image_id]
+    slot_ids = {info['embedding_index']: image_id for image_id, info in image_index.items()}
+    orphans = [int(slot) for slot in store.live_slots() if int(slot) not in slot_ids]
+    for slot in orphans:
+        store.delete(slot)
+    if missing or orphans:
+        print(f"⚠️ 元数据与嵌入不一致: 丢弃 {len(missing)} 张无嵌入的图片, 删除 {len(orphans)} 个无图片的槽位")
+    return slot_ids, bool(missing or orphans)
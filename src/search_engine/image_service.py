@@ -2,14 +2,16 @@
 # -*- coding: utf-8 -*-
 """
 图片索引服务 - 基于CLIP的图片检索系统
-支持图片存储、图搜图、文搜图功能
+支持图片存储、图搜图、文搜图功能，以及批量导入（add_images_bulk）
+元数据以检查点 + 追加写日志保存（ImageIndexJournal），向量索引只在写检查点时保存
 """
 
 import os
-import json
+import io
 import hashlib
 import time
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional, Any
 import numpy as np
@@ -19,22 +21,47 @@ from transformers import CLIPProcessor, CLIPModel
 import cv2
 from pathlib import Path
 
+from .embedding_store import (DEFAULT_COMPACTION_THRESHOLD, DEFAULT_RESCORE_FACTOR, EmbeddingStore,
+                              search_with_rescore)
+from .image_index_journal import ImageIndexJournal, reconcile_slots
+from .query_cache import normalize_query
+from .text_embedding_cache import TextEmbeddingCache, TextQueryBatcher
+from .vector_index import VectorIndex, create_vector_index, load_vector_index
+
+
 class ImageService:
     """图片索引服务 - 基于CLIP的图片检索"""
     
-    def __init__(self, storage_dir: str = "models/images"):
+    def __init__(self, storage_dir: str = "models/images", index_type: str = "flat",
+                 index_params: Optional[Dict[str, Any]] = None, embedding_dtype: str = "float32",
+                 rescore_factor: int = DEFAULT_RESCORE_FACTOR,
+                 compaction_threshold: float = DEFAULT_COMPACTION_THRESHOLD,
+                 text_cache_size: int = 1024, text_batch_size: int = 32, text_batch_wait_ms: float = 2.0):
         """
         初始化图片服务
         
         Args:
             storage_dir: 图片存储目录
+            index_type: 向量索引类型（'flat' 精确检索，'ivf' 近似检索）
+            index_params: 向量索引参数（如 IVF 的 nlist、nprobe）
+            embedding_dtype: 嵌入扫描格式（'float32'、'float16'、'int8'）
+            rescore_factor: 量化格式下取 top_k * rescore_factor 个候选用原始向量精确重排
+            compaction_threshold: 删除后墓碑比例达到该值时在后台压实嵌入存储
+            text_cache_size: 文本嵌入 LRU 缓存条目数（0 表示不缓存）
+            text_batch_size: 并发文本查询合并编码的最大批大小
+            text_batch_wait_ms: 合并并发文本查询时的最长等待时间（毫秒）
         """
         self.storage_dir = Path(storage_dir)
         self.storage_dir.mkdir(parents=True, exist_ok=True)
         
-        # 索引文件路径
+        # 索引文件路径（元数据检查点及其追加写日志）
         self.index_file = self.storage_dir / "image_index.json"
+        self.journal_file = self.storage_dir / "image_index.journal"
+        self.metadata_journal = ImageIndexJournal(str(self.index_file), str(self.journal_file))
+        # 旧版单文件嵌入，加载时迁移到分段存储
         self.embeddings_file = self.storage_dir / "image_embeddings.npy"
+        self.embeddings_dir = self.storage_dir / "embeddings"
+        self.vector_index_file = self.storage_dir / "image_vector_index.npz"
         
         # 初始化CLIP模型
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -44,12 +71,27 @@ class ImageService:
         
         # 图片索引和嵌入
         self.image_index: Dict[str, Dict] = {}
-        self.image_embeddings: Optional[np.ndarray] = None
-        self.image_ids: List[str] = []
+        # 嵌入槽位 -> 图片ID（槽位即元数据中的 embedding_index，删除后不重新编号）
+        self.slot_ids: Dict[int, str] = {}
+        self.embedding_dtype = embedding_dtype
+        self.rescore_factor = rescore_factor
+        self.compaction_threshold = compaction_threshold
+        # 文本查询嵌入：规范化查询 -> 嵌入的 LRU 缓存，未命中的并发查询合并成一批编码
+        self.text_cache = TextEmbeddingCache(text_cache_size)
+        self.text_batcher = TextQueryBatcher(self._encode_texts, text_batch_size, text_batch_wait_ms)
+        self.embedding_store = EmbeddingStore(str(self.embeddings_dir), embedding_dtype)
+        self.index_type = index_type
+        self.index_params = index_params or {}
+        self.vector_index: VectorIndex = create_vector_index(index_type, **self.index_params)
         
         # 加载现有索引
         self._load_index()
     
+    @property
+    def image_ids(self) -> List[str]:
+        """全部图片ID"""
+        return list(self.image_index)
+    
     def _init_clip_model(self):
         """初始化CLIP模型"""
         try:
@@ -65,45 +107,102 @@ class ImageService:
     def _load_index(self):
         """加载图片索引"""
         try:
-            if self.index_file.exists():
-                with open(self.index_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.image_index = data.get('images', {})
-                    self.image_ids = list(self.image_index.keys())
-                    print(f"📸 加载图片索引: {len(self.image_index)} 张图片")
-            
-            if self.embeddings_file.exists() and len(self.image_ids) > 0:
-                self.image_embeddings = np.load(self.embeddings_file)
-                print(f"🔢 加载图片嵌入: {self.image_embeddings.shape}")
+            self.image_index = self.metadata_journal.load()
+            replayed = self.metadata_journal.pending_ops
+            if self.image_index or replayed:
+                print(f"📸 加载图片索引: {len(self.image_index)} 张图片 (重放日志 {replayed} 条)")
+            
+            if len(self.embedding_store) == 0 and self.embeddings_file.exists() and len(self.image_index) > 0:
+                self._migrate_legacy_embeddings()
+            reconciled = self._reconcile_slots()
+            print(f"🔢 加载图片嵌入: {self.embedding_store.get_stats()}")
+            
+            # 向量索引只在检查点时保存：检查点之后有日志或对齐改动时索引文件已过期
+            stale = bool(replayed or reconciled)
+            self._load_vector_index(stale)
+            if stale:
+                self._save_index()
             
         except Exception as e:
             print(f"⚠️ 加载索引失败: {e}")
             self.image_index = {}
-            self.image_embeddings = None
-            self.image_ids = []
+            self.slot_ids = {}
+            self.vector_index = create_vector_index(self.index_type, **self.index_params)
+    
+    def _migrate_legacy_embeddings(self):
+        """把旧版 image_embeddings.npy 写入分段存储，旧文件改名为 .bak"""
+        embeddings = np.load(self.embeddings_file)
+        self.embedding_store.append(embeddings)
+        self.embeddings_file.rename(self.embeddings_file.with_suffix('.npy.bak'))
+        print(f"🔁 旧版嵌入已迁移到分段存储: {embeddings.shape}")
+    
+    def _reconcile_slots(self) -> bool:
+        """
+        按元数据和嵌入存储的有效槽位对齐（见 reconcile_slots）
+
+        Returns:
+            bool: 是否有改动（需要重新保存元数据）
+        """
+        self.slot_ids, changed = reconcile_slots(self.image_index, self.embedding_store)
+        return changed
+    
+    def _load_vector_index(self, stale: bool = False):
+        """加载向量索引；文件已过期、不存在、类型不同或与嵌入行数不一致时重建"""
+        count = len(self.embedding_store)
+        if not stale and self.vector_index_file.exists():
+            try:
+                index = load_vector_index(str(self.vector_index_file))
+                if index.index_type == self.index_type and index.size == count:
+                    self.vector_index = index
+                    print(f"🧭 加载向量索引: {index.get_stats()}")
+                    return
+            except Exception as e:
+                print(f"⚠️ 加载向量索引失败，重新构建: {e}")
+        self._rebuild_vector_index()
+    
+    def _rebuild_vector_index(self):
+        """用全部嵌入重建向量索引"""
+        self.vector_index = create_vector_index(self.index_type, **self.index_params)
+        if len(self.embedding_store) > 0:
+            start = time.time()
+            self.vector_index.build(self.embedding_store)
+            print(f"🧭 向量索引已构建 ({time.time() - start:.2f}s): {self.vector_index.get_stats()}")
+    
+    def set_vector_index(self, index_type: str, **index_params) -> Dict[str, Any]:
+        """
+        切换向量索引类型或参数并重建、保存
+        
+        Args:
+            index_type: 'flat' 或 'ivf'
+            **index_params: 索引参数
+            
+        Returns:
+            Dict: 索引统计
+        """
+        self.index_type = index_type
+        self.index_params = index_params
+        self._rebuild_vector_index()
+        self.vector_index.save(str(self.vector_index_file))
+        return self.vector_index.get_stats()
     
     def _save_index(self):
-        """保存图片索引"""
+        """写检查点：保存向量索引和全量元数据，清空元数据日志"""
         try:
-            # 保存图片元数据
-            index_data = {
-                'images': self.image_index,
-                'last_updated': datetime.now().isoformat(),
-                'total_images': len(self.image_index)
-            }
-            
-            with open(self.index_file, 'w', encoding='utf-8') as f:
-                json.dump(index_data, f, ensure_ascii=False, indent=2)
-            
-            # 保存嵌入向量
-            if self.image_embeddings is not None:
-                np.save(self.embeddings_file, self.image_embeddings)
+            # 嵌入在追加时已写入分段存储；向量索引先于元数据保存，
+            # 两者之间中断时日志仍在，下次加载会判定索引文件过期并重建
+            self.vector_index.save(str(self.vector_index_file))
+            self.metadata_journal.checkpoint(self.image_index)
             
             print(f"💾 图片索引已保存: {len(self.image_index)} 张图片")
             
         except Exception as e:
             print(f"❌ 保存索引失败: {e}")
     
+    def _maybe_checkpoint(self):
+        """元数据日志足够长时写检查点（均摊 O(1)）"""
+        if self.metadata_journal.needs_checkpoint(len(self.image_index)):
+            self._save_index()
+    
     def _generate_image_id(self, image_path: str) -> str:
         """生成图片ID"""
         # 使用文件内容的哈希值作为ID
@@ -131,21 +230,41 @@ class ImageService:
     
     def _encode_text(self, text: str) -> np.ndarray:
         """对文本进行CLIP编码"""
+        return self._encode_texts([text])[0]
+    
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """对一批文本进行CLIP编码（一次 get_text_features 调用），返回 (n, dim)"""
         try:
-            # 预处理文本
-            inputs = self.processor(text=text, return_tensors="pt").to(self.device)
+            # 预处理文本（按批内最长文本补齐）
+            inputs = self.processor(text=texts, return_tensors="pt", padding=True).to(self.device)
             
             # 获取文本嵌入
             with torch.no_grad():
                 text_features = self.model.get_text_features(**inputs)
                 text_features = text_features / text_features.norm(dim=-1, keepdim=True)
             
-            return text_features.cpu().numpy().flatten()
+            return text_features.cpu().numpy()
             
         except Exception as e:
-            print(f"❌ 文本编码失败 '{text}': {e}")
+            print(f"❌ 文本编码失败 {texts}: {e}")
             raise e
     
+    def get_text_embedding(self, query_text: str) -> np.ndarray:
+        """
+        查询文本的嵌入：先查 LRU 缓存，未命中时交给微批编码（与其他线程的并发查询合并）
+        
+        Args:
+            query_text: 查询文本（规范化后作为缓存键，大小写和多余空白不影响结果）
+            
+        Returns:
+            np.ndarray: 已归一化的嵌入（只读）
+        """
+        key = normalize_query(query_text)
+        embedding = self.text_cache.get(key)
+        if embedding is None:
+            embedding = self.text_cache.put(key, self.text_batcher.encode(key))
+        return embedding
+    
     def add_image(self, image_path: str, description: str = "", tags: List[str] = None) -> str:
         """
         添加图片到索引
@@ -183,6 +302,9 @@ class ImageService:
             width, height = image.size
             file_size = os.path.getsize(image_path)
             
+            # 追加嵌入，分配槽位
+            slot = int(self._append_embeddings(embedding.reshape(1, -1))[0])
+            
             # 添加到索引
             self.image_index[image_id] = {
                 'id': image_id,
@@ -195,19 +317,13 @@ class ImageService:
                 'file_size': file_size,
                 'format': image.format,
                 'created_at': datetime.now().isoformat(),
-                'embedding_index': len(self.image_ids)
+                'embedding_index': slot
             }
+            self.slot_ids[slot] = image_id
             
-            # 更新嵌入矩阵
-            if self.image_embeddings is None:
-                self.image_embeddings = embedding.reshape(1, -1)
-            else:
-                self.image_embeddings = np.vstack([self.image_embeddings, embedding])
-            
-            self.image_ids.append(image_id)
-            
-            # 保存索引
-            self._save_index()
+            # 追加写元数据日志
+            self.metadata_journal.record_add([self.image_index[image_id]])
+            self._maybe_checkpoint()
             
             print(f"✅ 图片添加成功: {image_id}")
             return image_id
@@ -216,6 +332,188 @@ class ImageService:
             print(f"❌ 添加图片失败: {e}")
             raise e
     
+    def _append_embeddings(self, embeddings: np.ndarray) -> np.ndarray:
+        """
+        追加嵌入向量：写入分段存储的新段（不重写已有向量），并加入向量索引
+
+        Args:
+            embeddings: (n, dim) 已归一化的嵌入
+
+        Returns:
+            np.ndarray: 分配的槽位
+        """
+        slots = self.embedding_store.append(embeddings)
+        self.vector_index.add(embeddings, slots)
+        if self.vector_index.needs_build():
+            self._rebuild_vector_index()
+        return slots
+
+    def _read_image_file(self, image_path: str) -> Dict[str, Any]:
+        """
+        读取一张图片（线程池中执行）：只读一次文件，同时计算 MD5、解码、取尺寸并做 CLIP 预处理
+
+        Returns:
+            Dict: path、id、data、size、width、height、format、pixel_values；失败时包含 error
+        """
+        try:
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            image = Image.open(io.BytesIO(data))
+            width, height = image.size
+            image_format = image.format
+            pixel_values = self.processor(images=image.convert('RGB'), return_tensors="np")['pixel_values'][0]
+            return {
+                'path': image_path,
+                'id': hashlib.md5(data).hexdigest(),
+                'data': data,
+                'size': len(data),
+                'width': width,
+                'height': height,
+                'format': image_format,
+                'pixel_values': pixel_values,
+            }
+        except Exception as e:
+            return {'path': image_path, 'error': str(e)}
+
+    def _encode_pixel_batch(self, pixel_values: List[np.ndarray]) -> np.ndarray:
+        """对一批已预处理的图片做CLIP编码，返回 (n, dim) 归一化嵌入"""
+        inputs = torch.from_numpy(np.stack(pixel_values)).to(self.device)
+        with torch.no_grad():
+            image_features = self.model.get_image_features(pixel_values=inputs)
+            image_features = image_features / image_features.norm(dim=-1, keepdim=True)
+        return image_features.cpu().numpy().astype(np.float32)
+
+    def add_images_bulk(self, image_paths: List[str], descriptions: Optional[List[str]] = None,
+                        tags: Optional[List[List[str]]] = None, batch_size: int = 32,
+                        num_workers: Optional[int] = None, save_every: int = 0) -> Dict[str, Any]:
+        """
+        批量添加图片
+
+        读取、MD5、解码和预处理在线程池中并行执行，并与上一批的CLIP编码重叠；
+        每批图片一次送入 get_image_features，嵌入追加写入分段存储，元数据每批追加写入日志；
+        检查点（全量元数据和向量索引）默认只在结束时写一次。
+
+        Args:
+            image_paths: 图片文件路径列表
+            descriptions: 与 image_paths 对应的描述（可选）
+            tags: 与 image_paths 对应的标签列表（可选）
+            batch_size: 每批编码的图片数
+            num_workers: 读取/预处理线程数（默认 min(8, CPU 数)）
+            save_every: 每多少批写一次检查点，0 表示只在结束时写
+
+        Returns:
+            Dict: added、skipped、failed、image_ids、seconds、images_per_sec（按新增张数计）、timings
+        """
+        descriptions = descriptions or [""] * len(image_paths)
+        tags = tags or [[] for _ in image_paths]
+        num_workers = num_workers or min(8, os.cpu_count() or 1)
+        batch_size = max(1, batch_size)
+        batches = [list(range(start, min(start + batch_size, len(image_paths))))
+                   for start in range(0, len(image_paths), batch_size)]
+
+        result: Dict[str, Any] = {'added': 0, 'skipped': 0, 'failed': [], 'image_ids': []}
+        timings = {'read_wait': 0.0, 'encode': 0.0, 'store': 0.0, 'save': 0.0}
+        unsaved_batches = 0
+        start_time = time.time()
+        print(f"📥 批量导入 {len(image_paths)} 张图片 (批大小 {batch_size}, 线程 {num_workers})")
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            def submit(batch):
+                return [executor.submit(self._read_image_file, image_paths[i]) for i in batch]
+
+            pending = submit(batches[0]) if batches else []
+            for batch_num, batch in enumerate(batches, 1):
+                stage = time.time()
+                items = [future.result() for future in pending]
+                timings['read_wait'] += time.time() - stage
+                # 预取下一批，与本批编码重叠
+                pending = submit(batches[batch_num]) if batch_num < len(batches) else []
+
+                new_items = []
+                seen = set()
+                for position, item in zip(batch, items):
+                    if 'error' in item:
+                        result['failed'].append({'path': item['path'], 'error': item['error']})
+                        continue
+                    result['image_ids'].append(item['id'])
+                    if item['id'] in self.image_index or item['id'] in seen:
+                        result['skipped'] += 1
+                        continue
+                    seen.add(item['id'])
+                    item['position'] = position
+                    new_items.append(item)
+                if not new_items:
+                    continue
+
+                stage = time.time()
+                try:
+                    embeddings = self._encode_pixel_batch([item['pixel_values'] for item in new_items])
+                except Exception as e:
+                    print(f"❌ 批次 {batch_num} 编码失败: {e}")
+                    result['failed'].extend({'path': item['path'], 'error': str(e)} for item in new_items)
+                    continue
+                timings['encode'] += time.time() - stage
+
+                stage = time.time()
+                created_at = datetime.now().isoformat()
+                slots = self._append_embeddings(embeddings)
+                for item, slot in zip(new_items, slots.tolist()):
+                    stored_path = self.storage_dir / f"{item['id']}{Path(item['path']).suffix}"
+                    with open(stored_path, 'wb') as f:
+                        f.write(item['data'])
+                    self.image_index[item['id']] = {
+                        'id': item['id'],
+                        'original_name': Path(item['path']).name,
+                        'stored_path': str(stored_path),
+                        'description': descriptions[item['position']],
+                        'tags': tags[item['position']] or [],
+                        'width': item['width'],
+                        'height': item['height'],
+                        'file_size': item['size'],
+                        'format': item['format'],
+                        'created_at': created_at,
+                        'embedding_index': slot
+                    }
+                    self.slot_ids[slot] = item['id']
+                self.metadata_journal.record_add([self.image_index[item['id']] for item in new_items])
+                result['added'] += len(new_items)
+                timings['store'] += time.time() - stage
+
+                unsaved_batches += 1
+                if save_every and unsaved_batches >= save_every:
+                    stage = time.time()
+                    self._save_index()
+                    timings['save'] += time.time() - stage
+                    unsaved_batches = 0
+
+                elapsed = time.time() - start_time
+                print(f"🔄 批次 {batch_num}/{len(batches)}: 已添加 {result['added']} 张, "
+                      f"{result['added'] / max(elapsed, 1e-9):.1f} 张/秒")
+
+        if unsaved_batches:
+            stage = time.time()
+            self._save_index()
+            timings['save'] += time.time() - stage
+
+        seconds = time.time() - start_time
+        result['seconds'] = round(seconds, 3)
+        result['images_per_sec'] = round(result['added'] / seconds, 2) if seconds > 0 else 0.0
+        result['timings'] = {key: round(value, 3) for key, value in timings.items()}
+        print(f"✅ 批量导入完成: 新增 {result['added']}, 重复 {result['skipped']}, 失败 {len(result['failed'])}, "
+              f"用时 {seconds:.2f}s, {result['images_per_sec']} 张/秒")
+        return result
+
+    def _search_embeddings(self, query_embedding: np.ndarray, top_k: int) -> List[Dict]:
+        """用向量索引检索最相似的图片"""
+        slots, scores = search_with_rescore(self.vector_index, self.embedding_store,
+                                            query_embedding.astype(np.float32), top_k, self.rescore_factor)
+        results = []
+        for slot, score in zip(slots.tolist(), scores):
+            image_info = self.image_index[self.slot_ids[slot]].copy()
+            image_info['similarity'] = float(score)
+            results.append(image_info)
+        return results
+    
     def search_by_image(self, query_image_path: str, top_k: int = 10) -> List[Dict]:
         """
         图搜图
@@ -228,26 +526,13 @@ class ImageService:
             相似图片列表
         """
         try:
-            if len(self.image_ids) == 0:
+            if len(self.image_index) == 0:
                 return []
             
             # 编码查询图片
             query_embedding = self._encode_image(query_image_path)
             
-            # 计算相似度
-            similarities = np.dot(self.image_embeddings, query_embedding)
-            
-            # 获取最相似的图片
-            top_indices = np.argsort(similarities)[::-1][:top_k]
-            
-            results = []
-            for idx in top_indices:
-                image_id = self.image_ids[idx]
-                image_info = self.image_index[image_id].copy()
-                image_info['similarity'] = float(similarities[idx])
-                results.append(image_info)
-            
-            return results
+            return self._search_embeddings(query_embedding, top_k)
             
         except Exception as e:
             print(f"❌ 图搜图失败: {e}")
@@ -265,30 +550,45 @@ class ImageService:
             相似图片列表
         """
         try:
-            if len(self.image_ids) == 0:
+            if len(self.image_index) == 0:
                 return []
             
-            # 编码查询文本
-            query_embedding = self._encode_text(query_text)
+            # 编码查询文本（命中缓存时不运行文本模型）
+            query_embedding = self.get_text_embedding(query_text)
             
-            # 计算相似度
-            similarities = np.dot(self.image_embeddings, query_embedding)
+            return self._search_embeddings(query_embedding, top_k)
             
-            # 获取最相似的图片
-            top_indices = np.argsort(similarities)[::-1][:top_k]
+        except Exception as e:
+            print(f"❌ 文搜图失败: {e}")
+            return []
+    
+    def search_by_texts(self, query_texts: List[str], top_k: int = 10) -> List[List[Dict]]:
+        """
+        批量文搜图：未命中缓存的查询一次编码
+        
+        Args:
+            query_texts: 查询文本列表
+            top_k: 每个查询返回最相似的K张图片
+            
+        Returns:
+            与 query_texts 一一对应的相似图片列表
+        """
+        try:
+            if len(self.image_index) == 0:
+                return [[] for _ in query_texts]
             
-            results = []
-            for idx in top_indices:
-                image_id = self.image_ids[idx]
-                image_info = self.image_index[image_id].copy()
-                image_info['similarity'] = float(similarities[idx])
-                results.append(image_info)
+            keys = [normalize_query(text) for text in query_texts]
+            embeddings = {key: self.text_cache.get(key) for key in dict.fromkeys(keys)}
+            missing = [key for key, embedding in embeddings.items() if embedding is None]
+            if missing:
+                for key, embedding in zip(missing, self._encode_texts(missing)):
+                    embeddings[key] = self.text_cache.put(key, embedding)
             
-            return results
+            return [self._search_embeddings(embeddings[key], top_k) for key in keys]
             
         except Exception as e:
-            print(f"❌ 文搜图失败: {e}")
-            return []
+            print(f"❌ 批量文搜图失败: {e}")
+            return [[] for _ in query_texts]
     
     def get_image_info(self, image_id: str) -> Optional[Dict]:
         """获取图片信息"""
@@ -313,23 +613,21 @@ class ImageService:
             if stored_path.exists():
                 stored_path.unlink()
             
+            # 嵌入槽位标记删除（O(1)，其他图片的槽位不变）
+            self.embedding_store.delete(embedding_index)
+            self.vector_index.remove(embedding_index)
+            
             # 从索引中删除
             del self.image_index[image_id]
+            self.slot_ids.pop(embedding_index, None)
             
-            # 从嵌入矩阵中删除
-            if self.image_embeddings is not None:
-                self.image_embeddings = np.delete(self.image_embeddings, embedding_index, axis=0)
-            
-            # 从ID列表中删除
-            self.image_ids.remove(image_id)
+            # 追加写元数据日志
+            self.metadata_journal.record_delete(image_id)
+            self._maybe_checkpoint()
             
-            # 更新其他图片的embedding_index
-            for img_id, img_info in self.image_index.items():
-                if img_info['embedding_index'] > embedding_index:
-                    img_info['embedding_index'] -= 1
-            
-            # 保存索引
-            self._save_index()
+            # 墓碑过多时在后台压实嵌入存储
+            if self.embedding_store.fragmentation() >= self.compaction_threshold:
+                self.embedding_store.start_background_compaction(self.compaction_threshold)
             
             print(f"✅ 图片删除成功: {image_id}")
             return True
@@ -354,7 +652,11 @@ class ImageService:
             'formats': formats,
             'storage_dir': str(self.storage_dir),
             'model_device': self.device,
-            'embedding_dimension': self.image_embeddings.shape[1] if self.image_embeddings is not None else 0
+            'embedding_dimension': self.embedding_store.dim,
+            'embedding_store': self.embedding_store.get_stats(),
+            'vector_index': self.vector_index.get_stats(),
+            'text_cache': self.text_cache.get_stats(),
+            'text_batcher': self.text_batcher.get_stats()
         }
     
     def clear_index(self):
@@ -368,14 +670,16 @@ class ImageService:
             
             # 清空索引
             self.image_index = {}
-            self.image_embeddings = None
-            self.image_ids = []
+            self.slot_ids = {}
+            self.embedding_store.clear()
+            self.vector_index = create_vector_index(self.index_type, **self.index_params)
             
             # 删除索引文件
-            if self.index_file.exists():
-                self.index_file.unlink()
+            self.metadata_journal.clear()
             if self.embeddings_file.exists():
                 self.embeddings_file.unlink()
+            if self.vector_index_file.exists():
+                self.vector_index_file.unlink()
             
             print("✅ 图片索引已清空")
             
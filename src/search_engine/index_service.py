@@ -1,19 +1,23 @@
 import os
 import json
-import subprocess
-import sys
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
-from .index_tab.index_service import InvertedIndexService
+from .index_tab.index_service import InvertedIndexService, INDEX_BACKENDS
+from .index_tab.offline_index import load_build_documents
+from .index_tab.parallel_build import parallel_build_index
 from .index_tab.kg_retrieval_service import KGRetrievalService
+from .query_cache import get_query_cache, normalize_query
 
 
 class IndexService:
     """索引服务：负责索引构建、文档管理、检索功能"""
     
-    def __init__(self, index_file: str = "models/index_data.json"):
+    def __init__(self, index_file: str = "models/index_data.json", index_backend: str = "segmented"):
         self.index_file = index_file
-        self.index_service = InvertedIndexService(index_file)
+        self.index_service = InvertedIndexService(index_file, backend=index_backend)
+        self.last_build_stats: Optional[Dict[str, Any]] = None
+        # 查询结果缓存（模型服务变更时同样递增其版本号）
+        self.query_cache = get_query_cache()
         # 确保KGRetrievalService使用Ollama作为默认API配置
         self.kg_retrieval_service = KGRetrievalService(
             api_type="ollama",
@@ -50,49 +54,33 @@ class IndexService:
     
     def _ensure_index_exists(self):
         """确保索引存在，如果不存在则构建"""
-        if not os.path.exists(self.index_file):
+        if os.path.exists(self.index_service.segment_file):
+            print(f"✅ 索引段文件已存在: {self.index_service.segment_file}")
+        elif not os.path.exists(self.index_file):
             print("📦 索引文件不存在，开始构建...")
             self.build_index()
         else:
             print(f"✅ 索引文件已存在: {self.index_file}")
     
-    def build_index(self) -> bool:
-        """构建离线索引"""
+    def build_index(self, workers: Optional[int] = None) -> bool:
+        """构建离线索引（多进程分片分词 + k路归并）"""
         try:
             print("🔨 开始构建离线索引...")
             
-            # 获取当前脚本所在目录
-            current_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            documents = load_build_documents()
+            index, stats = parallel_build_index(documents, index=INDEX_BACKENDS[self.index_service.backend](),
+                                                workers=workers)
             
-            # 添加src目录到Python路径
-            src_path = os.path.join(current_dir, 'src')
-            if src_path not in sys.path:
-                sys.path.insert(0, src_path)
-            
-            # 设置环境变量
-            env = os.environ.copy()
-            if 'PYTHONPATH' in env:
-                env['PYTHONPATH'] = src_path + os.pathsep + env['PYTHONPATH']
-            else:
-                env['PYTHONPATH'] = src_path
-            
-            # 运行离线索引构建
-            result = subprocess.run(
-                [sys.executable, "-m", "search_engine.index_tab.offline_index"],
-                check=True,
-                cwd=current_dir,
-                env=env,
-                capture_output=True,
-                text=True
-            )
+            os.makedirs(os.path.dirname(self.index_file) or '.', exist_ok=True)
+            index.save_to_file(self.index_file)
+            # 构建在当前进程完成，直接替换在线索引（旧索引随后关闭，释放mmap和合并线程）
+            self.index_service.replace_index(index)
+            self.last_build_stats = stats
+            self.query_cache.bump_index_version()
             
             print("✅ 离线索引构建完成")
             return True
             
-        except subprocess.CalledProcessError as e:
-            print(f"❌ 离线索引构建失败: {e}")
-            print(f"错误输出: {e.stderr}")
-            return False
         except Exception as e:
             print(f"❌ 构建索引时发生错误: {e}")
             return False
@@ -108,37 +96,67 @@ class IndexService:
         Args:
             query: 查询字符串
             top_k: 返回结果数量
-            retrieval_mode: 检索模式，目前只支持 'tfidf'
+            retrieval_mode: 检索模式，'tfidf' 或 'bm25'
             
         Returns:
             List[Tuple[str, float, str]]: (doc_id, score, reason)
         """
-        # 目前只支持TF-IDF检索
-        return self.index_service.search(query, top_k)
+        return self.index_service.search(query, top_k, retrieval_mode=retrieval_mode)
+    
+    def retrieve(self, query: str, top_k: int = 20, retrieval_mode: str = "tfidf") -> List[str]:
+        """检索文档ID列表（召回结果带分数缓存下来，rank 直接复用；不生成摘要）"""
+        normalized = normalize_query(query)
+        key = ('retrieve', normalized, top_k, retrieval_mode)
+        # 先读版本再计算，计算期间索引变更时结果不会以新版本写入缓存
+        version = self.query_cache.version()
+        candidates = self.query_cache.get(key)
+        if candidates is None:
+            candidates = self.index_service.search_scored(normalized, top_k, retrieval_mode=retrieval_mode)
+            self.query_cache.put(key, candidates, version)
+        # 记录该查询在该检索模式下最近一次召回的候选
+        self.query_cache.put(('candidates', normalized, retrieval_mode), candidates, version)
+        return [doc_id for doc_id, _ in candidates]
     
-    def retrieve(self, query: str, top_k: int = 20) -> List[str]:
-        """检索文档ID列表"""
-        return self.index_service.search_doc_ids(query, top_k)
+    def _get_candidates(self, normalized: str, doc_ids: List[str], retrieval_mode: str) -> List[Tuple[str, float]]:
+        """获取指定文档的 (doc_id, score)，优先复用同一检索模式下 retrieve 的召回结果"""
+        wanted = set(doc_ids)
+        candidates = self.query_cache.get(('candidates', normalized, retrieval_mode))
+        if candidates is None or not wanted.issubset(doc_id for doc_id, _ in candidates):
+            # 未经 retrieve 召回（或缓存已失效）时才重新搜索
+            candidates = self.index_service.search_scored(normalized, top_k=max(len(doc_ids), 50),
+                                                          retrieval_mode=retrieval_mode)
+        return [result for result in candidates if result[0] in wanted]
     
-    def rank(self, query: str, doc_ids: List[str], top_k: int = 10, sort_mode: str = "tfidf", model_type: Optional[str] = None) -> List[Tuple[str, float, str]]:
-        """对文档进行排序，支持TF-IDF和CTR排序模式"""
+    def _with_summaries(self, normalized: str, results: List[Tuple[str, float]]) -> List[Tuple[str, float, str]]:
+        """只为最终需要展示（或作为CTR特征）的结果生成摘要"""
+        return [(doc_id, score, self.index_service.get_summary(doc_id, normalized)) for doc_id, score in results]
+    
+    def rank(self, query: str, doc_ids: List[str], top_k: int = 10, sort_mode: str = "tfidf", model_type: Optional[str] = None,
+             retrieval_mode: str = "tfidf") -> List[Tuple[str, float, str]]:
+        """对文档进行排序，支持TF-IDF和CTR排序模式（retrieval_mode 与召回时一致，决定相关性分数）"""
         if not doc_ids:
             return []
         
-        # 直接使用底层索引服务搜索，避免重复调用
-        all_results = self.index_service.search(query, top_k=max(len(doc_ids), 50))
+        normalized = normalize_query(query)
+        # CTR排序依赖随每次点击变化的在线特征，不缓存
+        cache_key = None
+        if sort_mode != "ctr":
+            cache_key = ('rank', normalized, top_k, sort_mode, retrieval_mode, tuple(doc_ids))
+            cached = self.query_cache.get(cache_key)
+            if cached is not None:
+                return list(cached)
+        version = self.query_cache.version()
         
         # 过滤出指定doc_ids的结果
-        filtered_results = []
-        for result in all_results:
-            if result[0] in doc_ids:
-                filtered_results.append(result)
+        scored_results = self._get_candidates(normalized, doc_ids, retrieval_mode)
         
-        if not filtered_results:
+        if not scored_results:
             return []
         
         # 如果是CTR排序模式，调用模型服务进行CTR预测
         if sort_mode == "ctr":
+            # 摘要是CTR特征之一，所有候选都需要
+            filtered_results = self._with_summaries(normalized, scored_results)
             try:
                 # 导入模型服务
                 from .service_manager import service_manager
@@ -149,9 +167,9 @@ class IndexService:
                 from datetime import datetime
                 current_timestamp = datetime.now().isoformat()
                 
-                for position, (doc_id, tfidf_score, summary) in enumerate(filtered_results, 1):
-                    # 准备特征
-                    features = {
+                # 准备整批特征，一次调用模型服务完成预测
+                features_list = [
+                    {
                         'query': query,
                         'doc_id': doc_id,
                         'position': position,
@@ -159,11 +177,14 @@ class IndexService:
                         'summary': summary,
                         'timestamp': current_timestamp  # 添加当前时间戳
                     }
-                    
-                    # 预测CTR，使用指定的模型类型
-                    ctr_score = model_service.predict_ctr(features, model_type)
-                    
-                    # 返回4元组: (doc_id, tfidf_score, ctr_score, summary)
+                    for position, (doc_id, tfidf_score, summary) in enumerate(filtered_results, 1)
+                ]
+                
+                # 预测CTR，使用指定的模型类型
+                ctr_scores = model_service.predict_ctr_batch(features_list, model_type)
+                
+                # 返回4元组: (doc_id, tfidf_score, ctr_score, summary)
+                for (doc_id, tfidf_score, summary), ctr_score in zip(filtered_results, ctr_scores):
                     ctr_results.append((doc_id, tfidf_score, ctr_score, summary))
                 
                 # 按CTR分数排序
@@ -176,9 +197,12 @@ class IndexService:
                 sorted_results = sorted(filtered_results, key=lambda x: x[1], reverse=True)
                 return sorted_results[:top_k]
         
-        # 默认TF-IDF排序
-        sorted_results = sorted(filtered_results, key=lambda x: x[1], reverse=True)
-        return sorted_results[:top_k]
+        # 默认TF-IDF排序，只为前top_k生成摘要
+        sorted_results = sorted(scored_results, key=lambda x: x[1], reverse=True)
+        ranked = self._with_summaries(normalized, sorted_results[:top_k])
+        if cache_key is not None:
+            self.query_cache.put(cache_key, ranked, version)
+        return ranked
     
     def get_document_page(self, doc_id: str, request_id: str, data_service=None) -> Dict[str, Any]:
         """获取文档页面（可选记录点击事件）"""
@@ -284,15 +308,24 @@ class IndexService:
     
     def add_document(self, doc_id: str, content: str) -> bool:
         """添加文档到索引"""
-        return self.index_service.add_document(doc_id, content)
+        success = self.index_service.add_document(doc_id, content)
+        if success:
+            self.query_cache.bump_index_version()
+        return success
     
     def delete_document(self, doc_id: str) -> bool:
         """从索引中删除文档"""
-        return self.index_service.delete_document(doc_id)
+        success = self.index_service.delete_document(doc_id)
+        if success:
+            self.query_cache.bump_index_version()
+        return success
     
     def batch_add_documents(self, documents: Dict[str, str]) -> int:
         """批量添加文档"""
-        return self.index_service.batch_add_documents(documents)
+        added = self.index_service.batch_add_documents(documents)
+        if added:
+            self.query_cache.bump_index_version()
+        return added
     
     def get_all_documents(self) -> Dict[str, str]:
         """获取所有文档"""
@@ -300,7 +333,9 @@ class IndexService:
     
     def clear_index(self) -> bool:
         """清空索引"""
-        return self.index_service.clear_index()
+        success = self.index_service.clear_index()
+        self.query_cache.bump_index_version()
+        return success
     
     def save_index(self, filepath: Optional[str] = None) -> bool:
         """保存索引"""
@@ -308,7 +343,13 @@ class IndexService:
     
     def load_index(self, filepath: str) -> bool:
         """加载索引"""
-        return self.index_service.load_index(filepath)
+        success = self.index_service.load_index(filepath)
+        self.query_cache.bump_index_version()
+        return success
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """获取查询结果缓存统计"""
+        return self.query_cache.get_stats()
     
     def export_documents(self) -> Tuple[Optional[str], str]:
         """导出所有文档"""
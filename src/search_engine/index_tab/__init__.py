@@ -1,9 +1,16 @@
 from .index_tab import build_index_tab, show_index_stats, check_index_quality, view_inverted_index
-from .offline_index import InvertedIndex, create_sample_documents, build_index_from_documents
+from .offline_index import InvertedIndex, create_sample_documents, build_index_from_documents, load_build_documents
+from .parallel_build import parallel_build_index
+from .compact_index import CompactInvertedIndex
+from .scoring import ScoringEngine, RETRIEVAL_MODES
+from .segment_store import ReadOnlyIndexError, SegmentIndex, convert_json_to_segment, write_index_segment
+from .segmented_index import SegmentedIndex
 from .index_service import IndexServiceInterface, InvertedIndexService, get_index_service, reset_index_service
 
 __all__ = [
     'build_index_tab', 'show_index_stats', 'check_index_quality', 'view_inverted_index',
-    'InvertedIndex', 'create_sample_documents', 'build_index_from_documents',
+    'InvertedIndex', 'CompactInvertedIndex', 'create_sample_documents', 'build_index_from_documents',
+    'load_build_documents', 'parallel_build_index',
+    'ScoringEngine', 'RETRIEVAL_MODES', 'ReadOnlyIndexError', 'SegmentIndex', 'convert_json_to_segment', 'write_index_segment', 'SegmentedIndex',
     'IndexServiceInterface', 'InvertedIndexService', 'get_index_service', 'reset_index_service'
 ] 
\ No newline at end of file
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+紧凑倒排索引模块
+文档ID整数化 + 数组化倒排表 + 冷词项差值/变长编码压缩，
+对外保持与 InvertedIndex 相同的 search()/get_document() 接口
+"""
+
+import json
+from array import array
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .offline_index import InvertedIndex, STOP_WORDS
+from .scoring import ScoringEngine
+
+
+def encode_varint_postings(doc_ords: array, tfs: array) -> bytes:
+    """把有序倒排表编码为 [数量][文档间隔][词频]... 的变长整数字节串"""
+    out = bytearray()
+
+    def put(value: int):
+        while value >= 0x80:
+            out.append((value & 0x7F) | 0x80)
+            value >>= 7
+        out.append(value)
+
+    put(len(doc_ords))
+    prev = 0
+    for doc_ord, tf in zip(doc_ords, tfs):
+        put(doc_ord - prev)
+        put(tf)
+        prev = doc_ord
+    return bytes(out)
+
+
+def decode_varint_postings(blob: bytes) -> Tuple[array, array]:
+    """解码 encode_varint_postings 的结果，返回 (文档序号数组, 词频数组)"""
+    values = []
+    value = 0
+    shift = 0
+    for byte in blob:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = 0
+            shift = 0
+
+    count = values[0]
+    doc_ords = array('I')
+    tfs = array('I', values[2:2 + 2 * count:2])
+    prev = 0
+    for delta in values[1:1 + 2 * count:2]:
+        prev += delta
+        doc_ords.append(prev)
+    return doc_ords, tfs
+
+
+class _PostingsView(Mapping):
+    """词项 -> 文档ID列表 的只读视图（兼容 InvertedIndex.index 的遍历方式）"""
+
+    def __init__(self, owner: 'CompactInvertedIndex'):
+        self._owner = owner
+
+    def __getitem__(self, term: str) -> List[str]:
+        doc_ords, _ = self._owner._get_postings(term)
+        if doc_ords is None:
+            raise KeyError(term)
+        keys = self._owner._doc_keys
+        return [keys[doc_ord] for doc_ord in doc_ords]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._owner._hot
+        yield from self._owner._cold
+
+    def __len__(self) -> int:
+        return len(self._owner._hot) + len(self._owner._cold)
+
+    def __contains__(self, term) -> bool:
+        return term in self._owner._hot or term in self._owner._cold
+
+
+class CompactInvertedIndex(InvertedIndex):
+    """紧凑倒排索引
+
+    - 文档ID映射为稠密整数序号，倒排表只存整数
+    - 热词项：有序 array('I') 文档序号 + array('I') 词频
+    - 冷词项（文档频率不超过阈值）：差值 + 变长整数编码的 bytes
+    """
+
+    def __init__(self, cold_df_threshold: int = 16):
+        """
+        Args:
+            cold_df_threshold: 文档频率不超过该值的词项在 optimize() 时压缩存储
+        """
+        self.stop_words = set(STOP_WORDS)
+        self.cold_df_threshold = cold_df_threshold
+        self._reset()
+
+    def _reset(self):
+        """清空索引数据"""
+        self._scoring_engine = None
+        self.documents: Dict[str, str] = {}           # 文档ID -> 文档内容
+        self._doc_keys: List[Optional[str]] = []      # 文档序号 -> 文档ID（已删除为None）
+        self._doc_ordinals: Dict[str, int] = {}       # 文档ID -> 文档序号
+        self._doc_lens = array('I')                   # 文档序号 -> 文档长度
+        self._hot: Dict[str, Tuple[array, array]] = {}  # 词项 -> (文档序号数组, 词频数组)
+        self._cold: Dict[str, bytes] = {}             # 词项 -> 压缩倒排表
+
+    @property
+    def index(self) -> Mapping:
+        """词项 -> 文档ID列表 视图"""
+        return _PostingsView(self)
+
+    @property
+    def doc_lengths(self) -> Dict[str, int]:
+        """文档ID -> 文档长度"""
+        return {doc_id: self._doc_lens[doc_ord] for doc_id, doc_ord in self._doc_ordinals.items()}
+
+    def _get_postings(self, term: str) -> Tuple[Optional[array], Optional[array]]:
+        """获取词项倒排表，冷词项即时解码"""
+        postings = self._hot.get(term)
+        if postings is not None:
+            return postings
+        blob = self._cold.get(term)
+        if blob is not None:
+            return decode_varint_postings(blob)
+        return None, None
+
+    def _thaw(self, term: str) -> Tuple[array, array]:
+        """取出可追加的热倒排表（冷词项解压后转为热词项）"""
+        postings = self._hot.get(term)
+        if postings is None:
+            blob = self._cold.pop(term, None)
+            postings = decode_varint_postings(blob) if blob is not None else (array('I'), array('I'))
+            self._hot[term] = postings
+        return postings
+
+    def optimize(self):
+        """把文档频率不超过阈值的词项压缩为变长编码"""
+        for term in list(self._hot):
+            doc_ords, tfs = self._hot[term]
+            if len(doc_ords) <= self.cold_df_threshold:
+                self._cold[term] = encode_varint_postings(doc_ords, tfs)
+                del self._hot[term]
+
+    def add_document(self, doc_id: str, content: str):
+        """添加文档到索引（同ID文档先删除再添加）"""
+        if doc_id in self.documents:
+            self.delete_document(doc_id)
+
+        self._scoring_engine = None
+        self.documents[doc_id] = content
+        words = self.preprocess_text(content, persist=True)
+
+        doc_ord = len(self._doc_keys)
+        self._doc_keys.append(doc_id)
+        self._doc_ordinals[doc_id] = doc_ord
+        self._doc_lens.append(len(words))
+
+        # 新文档序号最大，追加后倒排表仍然有序
+        for word, freq in Counter(words).items():
+            doc_ords, tfs = self._thaw(word)
+            doc_ords.append(doc_ord)
+            tfs.append(freq)
+
+    def delete_document(self, doc_id: str) -> bool:
+        """删除文档从索引"""
+        if doc_id not in self.documents:
+            return False
+
+        self._scoring_engine = None
+        doc_ord = self._doc_ordinals.pop(doc_id)
+        words = set(self.preprocess_text(self.documents.pop(doc_id), persist=True))
+
+        for word in words:
+            doc_ords, tfs = self._get_postings(word)
+            if doc_ords is None:
+                continue
+            keep = [i for i, d in enumerate(doc_ords) if d != doc_ord]
+            if not keep:
+                self._hot.pop(word, None)
+                self._cold.pop(word, None)
+                continue
+            new_ords = array('I', (doc_ords[i] for i in keep))
+            new_tfs = array('I', (tfs[i] for i in keep))
+            if word in self._cold:
+                self._cold[word] = encode_varint_postings(new_ords, new_tfs)
+            else:
+                self._hot[word] = (new_ords, new_tfs)
+
+        self._doc_keys[doc_ord] = None
+        self._doc_lens[doc_ord] = 0
+        return True
+
+    def _build_scoring_engine(self) -> ScoringEngine:
+        """打分引擎直接读取数组化倒排表（复制一份，避免锁住仍需追加的 array）"""
+        def postings(term: str):
+            doc_ords, tfs = self._get_postings(term)
+            if doc_ords is None:
+                return None, None
+            return np.array(doc_ords, dtype=np.uint32), np.array(tfs, dtype=np.uint32)
+
+        return ScoringEngine(np.array(self._doc_lens, dtype=np.float64), len(self.documents),
+                             postings, self._doc_keys.__getitem__)
+
+    def get_index_stats(self) -> Dict:
+        """获取索引统计信息"""
+        total_documents = len(self.documents)
+        if total_documents > 0:
+            average_doc_length = sum(self._doc_lens) / total_documents
+        else:
+            average_doc_length = 0
+
+        return {
+            'total_documents': total_documents,
+            'total_terms': len(self._hot) + len(self._cold),
+            'average_doc_length': average_doc_length,
+            'backend': 'compact',
+            'hot_terms': len(self._hot),
+            'cold_terms': len(self._cold)
+        }
+
+    def save_to_file(self, filename: str):
+        """保存索引到文件（与字典实现相同的JSON格式）"""
+        index_data = {}
+        term_freq = {}
+        doc_freq = {}
+        for term, doc_ids, tfs in self.iter_postings():
+            index_data[term] = doc_ids
+            term_freq[term] = dict(zip(doc_ids, tfs))
+            doc_freq[term] = len(doc_ids)
+
+        data = {
+            'index': index_data,
+            'doc_lengths': self.doc_lengths,
+            'documents': self.documents,
+            'term_freq': term_freq,
+            'doc_freq': doc_freq
+        }
+
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+
+        print(f"✅ 索引已保存到: {filename}")
+
+    def iter_postings(self):
+        """遍历倒排表，产出 (词项, 文档ID列表, 词频列表)"""
+        for term in self.index:
+            doc_ords, tfs = self._get_postings(term)
+            yield term, [self._doc_keys[d] for d in doc_ords], list(tfs)
+
+    def load_postings(self, documents: Dict[str, str], doc_lengths: Dict[str, int], postings):
+        """直接加载已分词的倒排数据（不重新分词）
+
+        Args:
+            documents: 文档ID -> 文档内容
+            doc_lengths: 文档ID -> 文档长度
+            postings: (词项, 文档ID列表, 词频列表) 序列
+        """
+        self._reset()
+        self.documents = dict(documents)
+        for doc_id in self.documents:
+            self._doc_ordinals[doc_id] = len(self._doc_keys)
+            self._doc_keys.append(doc_id)
+            self._doc_lens.append(int(doc_lengths.get(doc_id, 0)))
+
+        ordinals = self._doc_ordinals
+        for term, doc_ids, tfs in postings:
+            pairs = sorted((ordinals[d], int(tf)) for d, tf in zip(doc_ids, tfs) if d in ordinals)
+            if pairs:
+                self._hot[term] = (array('I', (p[0] for p in pairs)), array('I', (p[1] for p in pairs)))
+
+        self.optimize()
+
+    def load_from_file(self, filename: str):
+        """从文件加载索引（读取字典实现的JSON格式，无需重新分词）"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+
+        postings = ((term, list(tf_map.keys()), list(tf_map.values()))
+                    for term, tf_map in data['term_freq'].items())
+        self.load_postings(data['documents'], data['doc_lengths'], postings)
+        print(f"✅ 索引已从文件加载: {filename}")
@@ -7,9 +7,20 @@
 
 import json
 import os
-from typing import List, Dict, Tuple, Optional, Any
+from typing import List, Dict, Tuple, Optional, Any, Set
 from abc import ABC, abstractmethod
 from .offline_index import InvertedIndex
+from .compact_index import CompactInvertedIndex
+from .parallel_build import parallel_build_index
+from .segment_store import SegmentIndex, SEGMENT_SUFFIX, is_segment_file, write_index_segment
+from .segmented_index import SegmentedIndex
+
+# 可选的倒排表实现
+INDEX_BACKENDS = {
+    'dict': InvertedIndex,        # 字典+集合实现
+    'compact': CompactInvertedIndex,  # 整数化+数组化+冷词项压缩实现
+    'segmented': SegmentedIndex,  # LSM分段实现，支持在线写入且查询不阻塞（默认）
+}
 
 class IndexServiceInterface(ABC):
     """倒排索引服务接口"""
@@ -57,16 +68,23 @@ class IndexServiceInterface(ABC):
 class InvertedIndexService(IndexServiceInterface):
     """倒排索引服务实现"""
     
-    def __init__(self, index_file: str = "models/index_data.json"):
+    def __init__(self, index_file: str = "models/index_data.json", backend: str = "segmented"):
         """
         初始化倒排索引服务
         
         Args:
             index_file: 索引文件路径
+            backend: 倒排表实现，'segmented'、'dict' 或 'compact'
         """
-        self.index = InvertedIndex()
+        if backend not in INDEX_BACKENDS:
+            raise ValueError(f"不支持的索引实现: {backend}，可选: {list(INDEX_BACKENDS)}")
+        self.backend = backend
+        self.index = INDEX_BACKENDS[backend]()
         self.index_file = index_file
+        # 二进制段文件，存在时启动直接mmap打开
+        self.segment_file = os.path.splitext(index_file)[0] + SEGMENT_SUFFIX
         # 预置文档ID集合（只读）
+        self.core_doc_ids: Set[str] = set()
 
         self._load_or_create_index()
     
@@ -92,11 +110,37 @@ class InvertedIndexService(IndexServiceInterface):
             print(f"加载预置文档失败: {e}")
         return {}
 
+    def _segment_is_fresh(self) -> bool:
+        """段文件存在且不早于JSON索引文件"""
+        if not os.path.exists(self.segment_file):
+            return False
+        if not os.path.exists(self.index_file):
+            return True
+        return os.path.getmtime(self.segment_file) >= os.path.getmtime(self.index_file)
+
     def _load_or_create_index(self):
         """加载或创建索引"""
         try:
             # 优先加载预置文档
             preloaded_docs = self._load_preloaded_documents()
+            self.core_doc_ids = set(preloaded_docs)
+
+            # 段文件最新时直接mmap打开，无需反序列化JSON
+            if self._segment_is_fresh() and self.load_index(self.segment_file):
+                missing_core_docs = [doc_id for doc_id in preloaded_docs if not self.index.get_document(doc_id)]
+                if not missing_core_docs:
+                    print(f"从段文件加载索引成功: {self.segment_file}")
+                    return
+                if not getattr(self.index, 'read_only', False):
+                    # 分段索引直接把缺失的预置文档写入内存表
+                    for doc_id in missing_core_docs:
+                        self.index.add_document(doc_id, preloaded_docs[doc_id])
+                    print(f"从段文件加载索引成功: {self.segment_file}，补充{len(missing_core_docs)}个预置文档")
+                    return
+                # 只读段文件缺少预置文档时回退到可写索引重新构建
+                print(f"段文件缺少{len(missing_core_docs)}个预置文档，重新构建索引")
+                self.replace_index(INDEX_BACKENDS[self.backend]())
+
             if preloaded_docs:
                 print(f"文档加载成功，共{len(preloaded_docs)}个文档")
                 
@@ -116,11 +160,12 @@ class InvertedIndexService(IndexServiceInterface):
                         if doc_id in preloaded_docs:
                             self.index.add_document(doc_id, preloaded_docs[doc_id])
                             print(f"添加缺失的预置文档: {doc_id}")
+                    if missing_core_docs:
+                        self.index.optimize()
                 else:
                     print(f"索引文件不存在，将创建新索引: {self.index_file}")
-                    # 创建新索引，只包含预置文档
-                    for doc_id, content in preloaded_docs.items():
-                        self.index.add_document(doc_id, content)
+                    # 创建新索引，只包含预置文档（多进程分片分词）
+                    parallel_build_index(preloaded_docs, index=self.index)
                     print(f"创建文档索引成功，共{len(preloaded_docs)}个文档")
             else:
                 # 没有预置文档，使用现有索引或创建示例索引
@@ -131,12 +176,35 @@ class InvertedIndexService(IndexServiceInterface):
                 else:
                     print(f"索引文件不存在，将创建新索引: {self.index_file}")
                     print("未找到预置文档，索引将为空")
+
+            # 写出段文件，下次启动直接mmap打开
+            if self.index.get_index_stats().get('total_documents', 0) > 0:
+                self.save_index(self.segment_file)
         except Exception as e:
             print(f"加载索引失败: {e}")
+
+    def _close_index(self, index=None):
+        """释放段文件索引的mmap映射，停止分段索引的后台合并线程（默认为当前索引）"""
+        index = self.index if index is None else index
+        if isinstance(index, (SegmentIndex, SegmentedIndex)):
+            index.close()
+
+    def replace_index(self, index):
+        """替换在线索引：先切换引用，再关闭旧索引"""
+        previous, self.index = self.index, index
+        if previous is not index:
+            self._close_index(previous)
+
+    def _is_writable(self) -> bool:
+        """当前索引是否支持写入"""
+        if getattr(self.index, 'read_only', False):
+            print("⚠️ 当前索引为只读段文件，请使用 'segmented' 实现以支持在线写入")
+            return False
+        return True
     
     def add_document(self, doc_id: str, content: str) -> bool:
         """
-        添加文档到索引
+        添加文档到索引（同ID文档会被替换）
         
         Args:
             doc_id: 文档ID
@@ -145,8 +213,20 @@ class InvertedIndexService(IndexServiceInterface):
         Returns:
             bool: 是否添加成功
         """
-        print("⚠️ 文档添加功能已禁用")
-        return False
+        try:
+            if not doc_id or not content or not content.strip():
+                print("⚠️ 文档ID和内容不能为空")
+                return False
+            if doc_id in self.core_doc_ids:
+                print(f"⚠️ 预置文档为只读，不能覆盖: {doc_id}")
+                return False
+            if not self._is_writable():
+                return False
+            self.index.add_document(doc_id, content)
+            return True
+        except Exception as e:
+            print(f"添加文档失败: {e}")
+            return False
     
     def delete_document(self, doc_id: str) -> bool:
         """
@@ -158,16 +238,25 @@ class InvertedIndexService(IndexServiceInterface):
         Returns:
             bool: 是否删除成功
         """
-        print("⚠️ 文档删除功能已禁用")
-        return False
+        try:
+            if doc_id in self.core_doc_ids:
+                print(f"⚠️ 预置文档为只读，不能删除: {doc_id}")
+                return False
+            if not self._is_writable():
+                return False
+            return self.index.delete_document(doc_id)
+        except Exception as e:
+            print(f"删除文档失败: {e}")
+            return False
     
-    def search(self, query: str, top_k: int = 20) -> List[Tuple[str, float, str]]:
+    def search(self, query: str, top_k: int = 20, retrieval_mode: str = "tfidf") -> List[Tuple[str, float, str]]:
         """
         搜索文档
         
         Args:
             query: 查询字符串
             top_k: 返回结果数量
+            retrieval_mode: 打分模式，'tfidf' 或 'bm25'
             
         Returns:
             List[Tuple[str, float, str]]: 搜索结果列表 (doc_id, score, summary)
@@ -175,7 +264,7 @@ class InvertedIndexService(IndexServiceInterface):
         try:
             if not query.strip():
                 return []
-            return self.index.search(query.strip(), top_k=top_k)
+            return self.index.search(query.strip(), top_k=top_k, retrieval_mode=retrieval_mode)
         except Exception as e:
             print(f"搜索失败: {e}")
             return []
@@ -227,7 +316,11 @@ class InvertedIndexService(IndexServiceInterface):
             save_path = filepath or self.index_file
             # 确保目录存在
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            self.index.save_to_file(save_path)
+            if save_path.endswith(SEGMENT_SUFFIX):
+                write_index_segment(self.index, save_path)
+                print(f"✅ 段文件已保存到: {save_path}")
+            else:
+                self.index.save_to_file(save_path)
             return True
         except Exception as e:
             print(f"保存索引失败: {e}")
@@ -244,6 +337,16 @@ class InvertedIndexService(IndexServiceInterface):
             bool: 是否加载成功
         """
         try:
+            if is_segment_file(filepath):
+                if self.backend == 'segmented':
+                    # 段文件作为基础段，新写入进入内存表
+                    segment_index = SegmentedIndex.from_segment_file(filepath)
+                else:
+                    segment_index = SegmentIndex(filepath)
+                self.replace_index(segment_index)
+                return True
+            if getattr(self.index, 'read_only', False):
+                self.replace_index(INDEX_BACKENDS[self.backend]())
             self.index.load_from_file(filepath)
             return True
         except Exception as e:
@@ -252,13 +355,24 @@ class InvertedIndexService(IndexServiceInterface):
     
     def clear_index(self) -> bool:
         """
-        清空索引
+        清空索引（保留预置文档）
         
         Returns:
             bool: 是否清空成功
         """
-        print("⚠️ 索引清空功能已禁用")
-        return False
+        try:
+            if not self._is_writable():
+                return False
+            doc_ids = [doc_id for doc_id in self.index.documents if doc_id not in self.core_doc_ids]
+            if isinstance(self.index, SegmentedIndex):
+                removed = self.index.delete_documents(doc_ids)
+            else:
+                removed = sum(1 for doc_id in doc_ids if self.index.delete_document(doc_id))
+            print(f"✅ 索引已清空，删除{removed}个文档，保留{len(self.core_doc_ids)}个预置文档")
+            return True
+        except Exception as e:
+            print(f"清空索引失败: {e}")
+            return False
     
     def batch_add_documents(self, documents: Dict[str, str]) -> int:
         """
@@ -270,22 +384,59 @@ class InvertedIndexService(IndexServiceInterface):
         Returns:
             int: 成功添加的文档数量
         """
-        print("⚠️ 批量添加文档功能已禁用")
-        return 0
+        return sum(1 for doc_id, content in documents.items() if self.add_document(doc_id, content))
     
-    def search_doc_ids(self, query: str, top_k: int = 20) -> List[str]:
+    def search_doc_ids(self, query: str, top_k: int = 20, retrieval_mode: str = "tfidf") -> List[str]:
         """
         搜索并只返回文档ID列表
         
         Args:
             query: 查询字符串
             top_k: 返回结果数量
+            retrieval_mode: 打分模式，'tfidf' 或 'bm25'
             
         Returns:
             List[str]: 文档ID列表
         """
-        results = self.search(query, top_k)
-        return [doc_id for doc_id, score, summary in results]
+        return [doc_id for doc_id, _ in self.search_scored(query, top_k, retrieval_mode)]
+    
+    def search_scored(self, query: str, top_k: int = 20, retrieval_mode: str = "tfidf") -> List[Tuple[str, float]]:
+        """
+        搜索并返回 (doc_id, score)，不生成摘要
+        
+        Args:
+            query: 查询字符串
+            top_k: 返回结果数量
+            retrieval_mode: 打分模式，'tfidf' 或 'bm25'
+            
+        Returns:
+            List[Tuple[str, float]]: 按分数降序的 (doc_id, score)
+        """
+        try:
+            if not query.strip():
+                return []
+            return self.index.search_ids(query.strip(), top_k=top_k, retrieval_mode=retrieval_mode)
+        except Exception as e:
+            print(f"搜索失败: {e}")
+            return []
+    
+    def get_summary(self, doc_id: str, query: str, max_length: int = 200) -> str:
+        """
+        按需生成单个结果的高亮摘要
+        
+        Args:
+            doc_id: 文档ID
+            query: 查询字符串
+            max_length: 摘要长度
+            
+        Returns:
+            str: 摘要，失败时返回空字符串
+        """
+        try:
+            return self.index.summarize(doc_id, query.strip(), max_length)
+        except Exception as e:
+            print(f"生成摘要失败: {e}")
+            return ""
     
     def get_document_count(self) -> int:
         """
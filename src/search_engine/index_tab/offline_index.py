@@ -5,19 +5,30 @@
 负责倒排索引构建、文档管理、样本收集等离线任务
 """
 
-import jieba
 import re
 import json
-import math
 from typing import List, Dict, Tuple, Set
 from collections import defaultdict, Counter
+import numpy as np
 import pandas as pd
 from datetime import datetime
 import os
 
+from .scoring import ScoringEngine
+from .snippets import build_snippet, highlight_keywords
+from ..tokenization_service import get_tokenization_service
+
+# 停用词
+STOP_WORDS = frozenset({
+    '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'
+})
+
 class InvertedIndex:
     """倒排索引类"""
     
+    # 打分引擎（按需构建，索引变更后失效）
+    _scoring_engine = None
+    
     def __init__(self):
         self.index = defaultdict(set)  # 词项 -> 文档ID集合
         self.doc_lengths = {}          # 文档ID -> 文档长度
@@ -26,27 +37,36 @@ class InvertedIndex:
         self.doc_freq = defaultdict(int)    # 词项 -> 文档频率
         
         # 停用词
-        self.stop_words = {
-            '的', '了', '在', '是', '我', '有', '和', '就', '不', '人', '都', '一', '一个', '上', '也', '很', '到', '说', '要', '去', '你', '会', '着', '没有', '看', '好', '自己', '这'
-        }
+        self.stop_words = set(STOP_WORDS)
     
-    def preprocess_text(self, text: str) -> List[str]:
-        """文本预处理"""
-        # 分词
-        words = jieba.lcut(text.lower())
+    def preprocess_text(self, text: str, persist: bool = False) -> List[str]:
+        """文本预处理
         
-        # 过滤停用词和短词
-        words = [word for word in words if len(word) > 1 and word not in self.stop_words]
+        Args:
+            text: 待处理文本
+            persist: 文档内容传True，分词结果写入持久化词ID库；查询走LRU缓存
+        """
+        # 分词
+        words = get_tokenization_service().lcut(text.lower(), persist=persist)
         
-        return words
+        return self.filter_words(words)
+    
+    def filter_words(self, words: List[str]) -> List[str]:
+        """过滤停用词和短词"""
+        return [word for word in words if len(word) > 1 and word not in self.stop_words]
+    
+    def optimize(self):
+        """整理索引内部结构（字典实现无需整理，供紧凑实现覆盖）"""
+        pass
     
     def add_document(self, doc_id: str, content: str):
         """添加文档到索引"""
+        self._scoring_engine = None
         # 保存原始文档
         self.documents[doc_id] = content
         
         # 预处理文本
-        words = self.preprocess_text(content)
+        words = self.preprocess_text(content, persist=True)
         
         # 计算文档长度
         self.doc_lengths[doc_id] = len(words)
@@ -67,10 +87,11 @@ class InvertedIndex:
         """删除文档从索引"""
         if doc_id not in self.documents:
             return False
+        self._scoring_engine = None
         
         # 获取文档的词频信息
         content = self.documents[doc_id]
-        words = self.preprocess_text(content)
+        words = self.preprocess_text(content, persist=True)
         word_freq = Counter(words)
         
         # 从倒排索引中移除文档
@@ -99,90 +120,100 @@ class InvertedIndex:
         
         return True
     
-    def search(self, query: str, top_k: int = 5) -> List[Tuple[str, float, str]]:
-        """搜索文档 - 优化版本使用真正的倒排索引"""
+    def search(self, query: str, top_k: int = 5, retrieval_mode: str = 'tfidf') -> List[Tuple[str, float, str]]:
+        """搜索文档 - 向量化打分 + MaxScore 裁剪
+        
+        Args:
+            query: 查询字符串
+            top_k: 返回结果数量
+            retrieval_mode: 打分模式，'tfidf' 或 'bm25'
+        """
         # 预处理查询
         query_words = self.preprocess_text(query)
         
         if not query_words:
             return []
         
-        # 使用倒排索引快速找到候选文档
-        candidate_docs = set()
-        for word in query_words:
-            if word in self.index:
-                candidate_docs.update(self.index[word])
-        
-        if not candidate_docs:
-            return []
-        
-        # 只对候选文档计算TF-IDF分数
-        scores = {}
-        total_docs = len(self.documents)
-        
-        for doc_id in candidate_docs:
-            score = 0
-            for word in query_words:
-                if word in self.index and doc_id in self.index[word]:
-                    # TF
-                    tf = self.term_freq[word][doc_id] / self.doc_lengths[doc_id]
-                    # IDF
-                    idf = math.log(total_docs / self.doc_freq[word])
-                    # TF-IDF
-                    score += tf * idf
-            
-            if score > 0:
-                scores[doc_id] = score
-        
-        # 排序并返回结果
-        sorted_results = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+        ranked = self.scoring_engine().top_k(query_words, top_k, retrieval_mode)
         
         # 生成摘要
-        results = []
-        for doc_id, score in sorted_results[:top_k]:
-            summary = self.generate_summary(doc_id, query_words)
-            results.append((doc_id, score, summary))
-        
-        return results
+        return [(doc_id, score, self.generate_summary(doc_id, query_words)) for doc_id, score in ranked]
+    
+    def search_ids(self, query: str, top_k: int = 5, retrieval_mode: str = 'tfidf') -> List[Tuple[str, float]]:
+        """只打分不生成摘要，返回 (doc_id, score)，摘要由调用方按需通过 summarize 生成"""
+        query_words = self.preprocess_text(query)
+        if not query_words:
+            return []
+        return self.scoring_engine().top_k(query_words, top_k, retrieval_mode)
+    
+    def summarize(self, doc_id: str, query: str, max_length: int = 200) -> str:
+        """为单个结果按需生成摘要（查询分词命中LRU缓存）"""
+        return self.generate_summary(doc_id, self.preprocess_text(query), max_length)
+    
+    def scoring_engine(self) -> ScoringEngine:
+        """获取打分引擎（索引变更后重建）"""
+        engine = self._scoring_engine
+        if engine is None:
+            engine = self._scoring_engine = self._build_scoring_engine()
+        return engine
+    
+    def _build_scoring_engine(self) -> ScoringEngine:
+        """把字典倒排表按需转换为有序数组供打分引擎使用"""
+        doc_ids = list(self.documents)
+        ordinals = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        doc_lens = np.array([self.doc_lengths.get(doc_id, 0) for doc_id in doc_ids], dtype=np.float64)
+        cache = {}
+        
+        def postings(term: str):
+            arrays = cache.get(term)
+            if arrays is None:
+                tf_map = self.term_freq.get(term)
+                if not tf_map:
+                    return None, None
+                pairs = sorted((ordinals[doc_id], tf) for doc_id, tf in tf_map.items() if doc_id in ordinals)
+                arrays = cache[term] = (np.array([p[0] for p in pairs], dtype=np.uint32),
+                                        np.array([p[1] for p in pairs], dtype=np.uint32))
+            return arrays
+        
+        return ScoringEngine(doc_lens, len(doc_ids), postings, doc_ids.__getitem__)
     
     def generate_summary(self, doc_id: str, query_words: List[str], max_length: int = 200) -> str:
         """生成文档摘要 - 优化版本"""
-        content = self.documents[doc_id]
-        
-        # 快速生成摘要：找到第一个查询词的位置，然后截取周围文本
-        if not query_words:
-            return content[:max_length] + "..." if len(content) > max_length else content
-        
-        # 在原文中找到第一个查询词的位置
-        best_pos = 0
-        for word in query_words:
-            pos = content.lower().find(word.lower())
-            if pos != -1:
-                best_pos = max(0, pos - max_length // 3)  # 从查询词前1/3位置开始
-                break
-        
-        # 截取摘要
-        summary = content[best_pos:best_pos + max_length]
-        if best_pos > 0:
-            summary = "..." + summary
-        if len(content) > best_pos + max_length:
-            summary = summary + "..."
-        
-        # 高亮查询词
-        highlighted_summary = self.highlight_keywords(summary, query_words)
-        
-        return highlighted_summary
+        return self.summarize_content(self.get_document(doc_id), query_words, max_length)
+    
+    def summarize_content(self, content: str, query_words: List[str], max_length: int = 200) -> str:
+        """截取查询词最密集的窗口并高亮（单遍多关键词匹配）"""
+        return build_snippet(content, query_words, max_length)
     
     def highlight_keywords(self, text: str, keywords: List[str]) -> str:
         """高亮关键词"""
-        highlighted_text = text
-        for keyword in keywords:
-            if keyword in highlighted_text:
-                highlighted_text = highlighted_text.replace(
-                    keyword, 
-                    f'<span style="background-color: yellow; font-weight: bold;">{keyword}</span>'
-                )
-        return highlighted_text
+        return highlight_keywords(text, keywords)
+    
+    def iter_postings(self):
+        """遍历倒排表，产出 (词项, 文档ID列表, 词频列表)"""
+        for term, tf_map in self.term_freq.items():
+            yield term, list(tf_map.keys()), list(tf_map.values())
+    
+    def load_postings(self, documents: Dict[str, str], doc_lengths: Dict[str, int], postings):
+        """直接加载已分词的倒排数据（不重新分词）
+        
+        Args:
+            documents: 文档ID -> 文档内容
+            doc_lengths: 文档ID -> 文档长度
+            postings: (词项, 文档ID列表, 词频列表) 序列
+        """
+        self._scoring_engine = None
+        self.index = defaultdict(set)
+        self.term_freq = defaultdict(dict)
+        self.doc_freq = defaultdict(int)
+        self.documents = dict(documents)
+        self.doc_lengths = {doc_id: int(doc_lengths.get(doc_id, 0)) for doc_id in self.documents}
+        
+        for term, doc_ids, tfs in postings:
+            for doc_id, tf in zip(doc_ids, tfs):
+                self.index[term].add(doc_id)
+                self.term_freq[term][doc_id] = int(tf)
+            self.doc_freq[term] = len(self.index[term])
     
     def get_document(self, doc_id: str) -> str:
         """获取文档内容"""
@@ -228,6 +259,7 @@ class InvertedIndex:
         with open(filename, 'r', encoding='utf-8') as f:
             data = json.load(f)
         
+        self._scoring_engine = None
         self.index = defaultdict(set)
         for k, v in data['index'].items():
             self.index[k] = set(v)
@@ -330,15 +362,33 @@ def create_sample_documents():
     }
     return documents
 
-def build_index_from_documents(documents: Dict[str, str], save_path: str = ""):
-    """从文档构建索引"""
-    print("🔨 构建倒排索引...")
+def load_build_documents() -> Dict[str, str]:
+    """加载用于构建索引的文档：优先预置文档，没有时使用示例文档"""
+    preloaded_path = os.path.join("data", "preloaded_documents.json")
+    if os.path.exists(preloaded_path):
+        print("📄 使用预置文档构建索引")
+        with open(preloaded_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # 支持两种格式
+        if isinstance(data, dict) and 'documents' in data:
+            documents = data['documents']
+        else:
+            documents = data
+        print(f"✅ 加载预置文档成功，共{len(documents)}个文档")
+    else:
+        print("⚠️ 未找到预置文档，使用示例文档")
+        # 回退到示例文档
+        documents = create_sample_documents()
+        print(f"✅ 创建示例文档成功，共{len(documents)}个文档")
+    return documents
+
+def build_index_from_documents(documents: Dict[str, str], save_path: str = "", workers: int = None):
+    """从文档构建索引（多进程分片分词 + k路归并）"""
+    from .parallel_build import parallel_build_index
     
-    index = InvertedIndex()
+    print("🔨 构建倒排索引...")
     
-    for doc_id, content in documents.items():
-        index.add_document(doc_id, content)
-        print(f"   添加文档: {doc_id}")
+    index, _ = parallel_build_index(documents, workers=workers)
     
     stats = index.get_index_stats()
     print(f"✅ 索引构建完成:")
@@ -357,25 +407,7 @@ def main():
     print("=" * 50)
     
     # 优先使用预置文档
-    import os
-    import json
-    
-    preloaded_path = os.path.join("data", "preloaded_documents.json")
-    if os.path.exists(preloaded_path):
-        print("📄 使用预置文档构建索引")
-        with open(preloaded_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        # 支持两种格式
-        if isinstance(data, dict) and 'documents' in data:
-            documents = data['documents']
-        else:
-            documents = data
-        print(f"✅ 加载预置文档成功，共{len(documents)}个文档")
-    else:
-        print("⚠️ 未找到预置文档，使用示例文档")
-        # 回退到示例文档
-        documents = create_sample_documents()
-        print(f"✅ 创建示例文档成功，共{len(documents)}个文档")
+    documents = load_build_documents()
     
     # 构建索引
     index = build_index_from_documents(documents, 'models/index_data.json')
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并行索引构建模块
+把文档分片交给多进程分词并构建局部倒排表，再按词项做k路归并，
+一次性装载到内存索引中（不再逐文档调用 add_document）。
+分词结果同时写入共享分词服务的词ID库，后续删除文档等操作无需重新分词。
+"""
+
+import heapq
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .offline_index import InvertedIndex
+from ..tokenization_service import TokenizationService, get_tokenization_service
+
+try:
+    import resource
+    RESOURCE_AVAILABLE = True
+except ImportError:
+    RESOURCE_AVAILABLE = False
+
+# 文档数少于该值时在当前进程内构建，避免进程启动开销
+MIN_PARALLEL_DOCS = 200
+# 每个进程分到的分片数，分片越多负载越均衡
+SHARDS_PER_WORKER = 4
+
+# 局部倒排表：[(词项, 文档ID列表, 词频列表)]，按词项排序
+PartialPostings = List[Tuple[str, List[str], List[int]]]
+
+
+def _build_shard(shard: List[Tuple[str, str]],
+                 persist: bool = True) -> Tuple[Dict[str, int], PartialPostings, List[List[str]]]:
+    """子进程：对一个分片分词并构建局部倒排表
+
+    Args:
+        shard: 分片文档
+        persist: 是否读写本进程的词ID库；子进程传False，只分词不加载/写入词ID库，结果由主进程统一写入
+
+    Returns:
+        (文档ID -> 文档长度, 按词项排序的局部倒排表, 各文档的原始分词结果)
+    """
+    tokenizer = InvertedIndex()
+    service = get_tokenization_service() if persist else TokenizationService(cache_size=0, store_path=None)
+    doc_lengths: Dict[str, int] = {}
+    postings: Dict[str, Tuple[List[str], List[int]]] = {}
+    raw_tokens: List[List[str]] = []
+    for doc_id, content in shard:
+        raw = service.lcut(content.lower(), persist=persist)
+        raw_tokens.append(raw)
+        words = tokenizer.filter_words(raw)
+        doc_lengths[doc_id] = len(words)
+        for word, freq in Counter(words).items():
+            entry = postings.get(word)
+            if entry is None:
+                entry = postings[word] = ([], [])
+            entry[0].append(doc_id)
+            entry[1].append(freq)
+    return doc_lengths, [(term, doc_ids, tfs) for term, (doc_ids, tfs) in sorted(postings.items())], raw_tokens
+
+
+def merge_partial_postings(partials: List[PartialPostings]) -> Iterator[Tuple[str, List[str], List[int]]]:
+    """k路归并各分片的局部倒排表
+
+    heapq.merge 对相同词项按分片顺序输出，合并后文档顺序与原始文档顺序一致。
+    """
+    current_term = None
+    doc_ids: List[str] = []
+    tfs: List[int] = []
+    for term, shard_doc_ids, shard_tfs in heapq.merge(*partials, key=lambda entry: entry[0]):
+        if term != current_term:
+            if current_term is not None:
+                yield current_term, doc_ids, tfs
+            current_term, doc_ids, tfs = term, [], []
+        doc_ids.extend(shard_doc_ids)
+        tfs.extend(shard_tfs)
+    if current_term is not None:
+        yield current_term, doc_ids, tfs
+
+
+def _split_shards(documents: Dict[str, str], num_shards: int) -> List[List[Tuple[str, str]]]:
+    """按原始顺序把文档切成连续分片"""
+    items = list(documents.items())
+    shard_size = max(1, -(-len(items) // num_shards))
+    return [items[i:i + shard_size] for i in range(0, len(items), shard_size)]
+
+
+def _peak_rss_mb(children: bool = False) -> Optional[float]:
+    """峰值常驻内存（MB），children=True 时统计已结束的子进程，不支持的平台返回None"""
+    if not RESOURCE_AVAILABLE:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为KB，macOS 为字节
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def parallel_build_index(documents: Dict[str, str], index: Optional[InvertedIndex] = None,
+                         workers: Optional[int] = None) -> Tuple[InvertedIndex, Dict]:
+    """
+    多进程并行构建倒排索引
+
+    Args:
+        documents: 文档字典 {doc_id: content}
+        index: 装载结果的空索引（字典实现或紧凑实现），默认新建 InvertedIndex
+        workers: 进程数，默认CPU核数
+
+    Returns:
+        Tuple[InvertedIndex, Dict]: (索引, 构建统计)
+    """
+    index = index if index is not None else InvertedIndex()
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+
+    if workers <= 1 or len(documents) < MIN_PARALLEL_DOCS:
+        workers = 1
+        partials = [_build_shard(list(documents.items()))]
+    else:
+        shards = _split_shards(documents, workers * SHARDS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            partials = list(executor.map(partial(_build_shard, persist=False), shards))
+        # 子进程的分词结果写回本进程的词ID库
+        service = get_tokenization_service()
+        for shard, (_, _, raw_tokens) in zip(shards, partials):
+            for (_, content), raw in zip(shard, raw_tokens):
+                service.store(content.lower(), raw)
+    tokenize_seconds = time.perf_counter() - start
+
+    doc_lengths: Dict[str, int] = {}
+    for shard_doc_lengths, _, _ in partials:
+        doc_lengths.update(shard_doc_lengths)
+    index.load_postings(documents, doc_lengths, merge_partial_postings([p for _, p, _ in partials]))
+    index.optimize()
+    get_tokenization_service().save_store()
+    elapsed = time.perf_counter() - start
+
+    stats = {
+        'documents': len(documents),
+        'workers': workers,
+        'tokenize_seconds': tokenize_seconds,
+        'merge_seconds': elapsed - tokenize_seconds,
+        'total_seconds': elapsed,
+        'docs_per_sec': len(documents) / elapsed if elapsed > 0 else 0.0,
+        'peak_rss_mb': _peak_rss_mb(),
+        'worker_peak_rss_mb': _peak_rss_mb(children=True) if workers > 1 else None,
+    }
+    print_build_stats(stats)
+    return index, stats
+
+
+def print_build_stats(stats: Dict):
+    """打印构建统计"""
+    print(f"⚡ 并行构建完成: {stats['documents']}个文档, {stats['workers']}个进程, "
+          f"耗时{stats['total_seconds']:.2f}s (分词{stats['tokenize_seconds']:.2f}s, 归并{stats['merge_seconds']:.2f}s)")
+    print(f"   吞吐: {stats['docs_per_sec']:.1f} docs/sec")
+    if stats['peak_rss_mb'] is not None:
+        worker_rss = stats.get('worker_peak_rss_mb')
+        worker_info = f", 子进程峰值 {worker_rss:.1f}MB" if worker_rss is not None else ""
+        print(f"   峰值内存: 主进程 {stats['peak_rss_mb']:.1f}MB{worker_info}")
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检索打分模块 - 向量化 TF-IDF / BM25 打分
+按词项逐个 (term-at-a-time) 用 NumPy 累加器打分，预计算每个词项的 IDF 和
+最大贡献上界，用 MaxScore 提前裁剪不可能进入前k的文档，前k结果用 argpartition 选出。
+"""
+
+import math
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+RETRIEVAL_MODES = ('tfidf', 'bm25')
+
+# 词项倒排表获取函数：词项 -> (升序文档序号数组, 词频数组)，不存在返回 (None, None)
+PostingsFn = Callable[[str], Tuple[Optional[np.ndarray], Optional[np.ndarray]]]
+
+
+class ScoringEngine:
+    """倒排索引打分引擎
+
+    与具体倒排表实现解耦，只依赖:
+    - doc_lens: 文档序号 -> 文档长度（已删除文档长度为0）
+    - total_docs: 有效文档数（用于计算IDF）
+    - postings: 词项倒排表获取函数，文档序号必须升序
+    - doc_key: 文档序号 -> 文档ID
+    """
+
+    def __init__(self, doc_lens: np.ndarray, total_docs: int, postings: PostingsFn,
+                 doc_key: Callable[[int], str], k1: float = 1.2, b: float = 0.75):
+        self.doc_lens = np.asarray(doc_lens, dtype=np.float64)
+        self.total_docs = total_docs
+        self.avg_doc_len = float(self.doc_lens.sum()) / total_docs if total_docs > 0 else 0.0
+        self.k1 = k1
+        self.b = b
+        self._postings = postings
+        self._doc_key = doc_key
+        # (词项, 模式) -> (IDF, 最大贡献上界)
+        self._term_stats: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def idf(self, df: int, mode: str) -> float:
+        """计算IDF（TF-IDF与原实现一致：log(N/df)）"""
+        if mode == 'bm25':
+            return math.log(1 + (self.total_docs - df + 0.5) / (df + 0.5))
+        return math.log(self.total_docs / df)
+
+    def impacts(self, doc_ords: np.ndarray, tfs: np.ndarray, mode: str) -> np.ndarray:
+        """计算词项在各文档上的词频部分得分（不含IDF）"""
+        doc_lens = self.doc_lens[doc_ords]
+        tfs = tfs.astype(np.float64)
+        if mode == 'bm25':
+            norm = self.k1 * (1 - self.b + self.b * doc_lens / self.avg_doc_len)
+            return tfs * (self.k1 + 1) / (tfs + norm)
+        return tfs / doc_lens
+
+    def term_stats(self, term: str, mode: str, doc_ords: np.ndarray, tfs: np.ndarray) -> Tuple[float, float]:
+        """获取词项的 (IDF, 最大贡献上界)，首次访问时计算并缓存"""
+        key = (term, mode)
+        stats = self._term_stats.get(key)
+        if stats is None:
+            idf = self.idf(len(doc_ords), mode)
+            stats = (idf, float(self.impacts(doc_ords, tfs, mode).max()) * idf)
+            self._term_stats[key] = stats
+        return stats
+
+    def top_k(self, query_words: List[str], top_k: int, mode: str = 'tfidf',
+              prune: bool = True) -> List[Tuple[str, float]]:
+        """计算查询的前k个文档，返回 (文档ID, 分数)，参数同 top_k_ordinals"""
+        return [(self._doc_key(doc_ord), score)
+                for doc_ord, score in self.top_k_ordinals(query_words, top_k, mode, prune)]
+
+    def top_k_ordinals(self, query_words: List[str], top_k: int, mode: str = 'tfidf',
+                       prune: bool = True) -> List[Tuple[int, float]]:
+        """
+        计算查询的前k个文档序号
+
+        Args:
+            query_words: 预处理后的查询词（重复的词重复计分，与原实现一致）
+            top_k: 返回结果数量
+            mode: 'tfidf' 或 'bm25'
+            prune: 是否启用 MaxScore 裁剪（关闭时为穷举打分，用于对比）
+
+        Returns:
+            List[Tuple[int, float]]: (文档序号, 分数)，按分数降序
+        """
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"不支持的检索模式: {mode}，可选: {list(RETRIEVAL_MODES)}")
+        if top_k <= 0 or self.total_docs == 0:
+            return []
+
+        terms = []
+        for word, count in Counter(query_words).items():
+            doc_ords, tfs = self._postings(word)
+            if doc_ords is None or len(doc_ords) == 0:
+                continue
+            idf, upper_bound = self.term_stats(word, mode, doc_ords, tfs)
+            terms.append((count * upper_bound, count * idf, doc_ords, tfs))
+        if not terms:
+            return []
+
+        # 上界高（通常是稀有词）的词项先处理，尽早抬高第k名门槛
+        terms.sort(key=lambda t: t[0], reverse=True)
+        scores = np.zeros(len(self.doc_lens))
+        seen: Optional[np.ndarray] = None       # 已累加过分数的文档
+        candidates: Optional[np.ndarray] = None  # 进入裁剪阶段后仍可能进前k的文档
+
+        for i, (_, weight, doc_ords, tfs) in enumerate(terms):
+            # 剩余词项的上界之和（直接求和，避免逐项相减的浮点误差把自身裁掉）
+            remaining = sum(t[0] for t in terms[i + 1:])
+            if candidates is None:
+                scores[doc_ords] += weight * self.impacts(doc_ords, tfs, mode)
+                seen = doc_ords if seen is None else np.union1d(seen, doc_ords)
+                if prune and len(seen) >= top_k:
+                    threshold = self._kth_score(scores[seen], top_k)
+                    # 未出现过的文档最多再得 remaining 分，低于门槛时只需继续给已有文档打分
+                    if remaining < threshold:
+                        candidates = seen[scores[seen] + remaining >= threshold]
+            else:
+                self._score_candidates(scores, candidates, doc_ords, tfs, weight, mode)
+                threshold = self._kth_score(scores[candidates], top_k)
+                candidates = candidates[scores[candidates] + remaining >= threshold]
+
+        pool = seen if candidates is None else candidates
+        pool = pool[scores[pool] > 0]
+        if len(pool) > top_k:
+            # 与第k名同分的文档按文档序号取前几个（pool 升序），裁剪与穷举选出相同的前k个
+            kth = self._kth_score(scores[pool], top_k)
+            above = pool[scores[pool] > kth]
+            tied = pool[scores[pool] == kth]
+            pool = np.concatenate([above, tied[:top_k - len(above)]])
+        # 分数相同时按文档序号排序，保证结果稳定
+        ranked = pool[np.lexsort((pool, -scores[pool]))]
+        return [(int(doc_ord), float(scores[doc_ord])) for doc_ord in ranked]
+
+    def _score_candidates(self, scores: np.ndarray, candidates: np.ndarray, doc_ords: np.ndarray,
+                          tfs: np.ndarray, weight: float, mode: str):
+        """只给候选文档累加该词项的分数"""
+        if len(candidates) * math.log2(len(doc_ords) + 1) < len(doc_ords):
+            # 候选很少时在有序倒排表上二分跳读，不扫描整个倒排表
+            positions = np.searchsorted(doc_ords, candidates)
+            positions[positions == len(doc_ords)] = 0
+            hit = doc_ords[positions] == candidates
+            positions = positions[hit]
+        else:
+            positions = np.flatnonzero(np.isin(doc_ords, candidates, assume_unique=True))
+        if len(positions):
+            matched = doc_ords[positions]
+            scores[matched] += weight * self.impacts(matched, tfs[positions], mode)
+
+    @staticmethod
+    def _kth_score(values: np.ndarray, k: int) -> float:
+        """第k高的分数（不足k个时门槛为0）"""
+        if len(values) < k:
+            return 0.0
+        return float(np.partition(values, len(values) - k)[len(values) - k])
@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+索引段文件模块 - 带版本号的二进制索引格式
+段文件 (.seg) 包含词项字典、倒排块、文档长度数组和文档ID表，
+文档原文单独存放在文档库文件 (.seg.docs) 中。
+读取时通过 mmap 直接访问，不需要把索引反序列化为Python字典。
+
+用法:
+    python -m search_engine.index_tab.segment_store convert models/index_data.json models/index_data.seg
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .offline_index import InvertedIndex, STOP_WORDS
+from .compact_index import encode_varint_postings, decode_varint_postings
+from .scoring import ScoringEngine
+
+SEGMENT_MAGIC = b'TBIDXSEG'
+DOCSTORE_MAGIC = b'TBIDXDOC'
+SEGMENT_VERSION = 1
+SEGMENT_SUFFIX = '.seg'
+DOCSTORE_SUFFIX = '.docs'
+
+# 段文件中各区块的顺序
+_SECTIONS = ('term_offsets', 'term_blob', 'postings_offsets', 'postings_blob',
+             'doc_lens', 'key_offsets', 'key_blob', 'key_order')
+# magic, 版本, 文档数, 词项数, 各区块 (偏移, 长度)
+_HEADER = struct.Struct('<8sIII4x' + 'QQ' * len(_SECTIONS))
+# magic, 版本, 文档数
+_DOC_HEADER = struct.Struct('<8sII')
+
+# 倒排块编码：文档频率高的词项存原始uint32数组（可零拷贝读取），其余存变长编码
+POSTINGS_RAW = 0
+POSTINGS_VARINT = 1
+RAW_POSTINGS_MIN_DF = 16
+
+
+def _pad(buf: bytearray, alignment: int):
+    buf.extend(b'\0' * (-len(buf) % alignment))
+
+
+def _string_table(values: List[bytes]) -> Tuple[bytes, bytes]:
+    """把字符串列表编码为 (uint64偏移数组, 拼接后的字节串)"""
+    offsets = np.zeros(len(values) + 1, dtype='<u8')
+    np.cumsum([len(v) for v in values], out=offsets[1:])
+    return offsets.tobytes(), b''.join(values)
+
+
+def docstore_path(segment_path: str) -> str:
+    """段文件对应的文档库路径"""
+    return segment_path + DOCSTORE_SUFFIX
+
+
+def is_segment_file(filepath: str) -> bool:
+    """根据文件头判断是否为段文件"""
+    try:
+        with open(filepath, 'rb') as f:
+            return f.read(len(SEGMENT_MAGIC)) == SEGMENT_MAGIC
+    except OSError:
+        return False
+
+
+def write_segment(filepath: str, documents: Dict[str, str], doc_lengths: Dict[str, int],
+                  postings: Iterable[Tuple[str, List[str], List[int]]]):
+    """
+    写入段文件和文档库（先写临时文件再原子替换）
+
+    Args:
+        filepath: 段文件路径
+        documents: 文档ID -> 文档内容，字典顺序即文档序号
+        doc_lengths: 文档ID -> 文档长度（分词后词数）
+        postings: (词项, 文档ID列表, 词频列表) 序列
+    """
+    doc_ids = list(documents.keys())
+    ordinals = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+
+    # 词项按UTF-8字节序排序，读取时二分查找
+    term_postings = []
+    for term, term_doc_ids, tfs in postings:
+        pairs = sorted((ordinals[d], int(tf)) for d, tf in zip(term_doc_ids, tfs) if d in ordinals)
+        if pairs:
+            term_postings.append((term.encode('utf-8'), pairs))
+    term_postings.sort(key=lambda x: x[0])
+
+    postings_blob = bytearray()
+    postings_offsets = np.zeros(len(term_postings) + 1, dtype='<u8')
+    for i, (_, pairs) in enumerate(term_postings):
+        doc_ords = np.array([p[0] for p in pairs], dtype='<u4')
+        tfs = np.array([p[1] for p in pairs], dtype='<u4')
+        if len(pairs) >= RAW_POSTINGS_MIN_DF:
+            postings_blob.extend(struct.pack('<B3xI', POSTINGS_RAW, len(pairs)))
+            postings_blob.extend(doc_ords.tobytes())
+            postings_blob.extend(tfs.tobytes())
+        else:
+            postings_blob.append(POSTINGS_VARINT)
+            postings_blob.extend(encode_varint_postings(doc_ords.tolist(), tfs.tolist()))
+            _pad(postings_blob, 4)
+        postings_offsets[i + 1] = len(postings_blob)
+
+    term_offsets, term_blob = _string_table([t for t, _ in term_postings])
+    encoded_keys = [d.encode('utf-8') for d in doc_ids]
+    key_offsets, key_blob = _string_table(encoded_keys)
+    key_order = np.array(sorted(range(len(doc_ids)), key=lambda i: encoded_keys[i]), dtype='<u4')
+    doc_lens = np.array([int(doc_lengths.get(d, 0)) for d in doc_ids], dtype='<u4')
+
+    sections = {
+        'term_offsets': term_offsets,
+        'term_blob': term_blob,
+        'postings_offsets': postings_offsets.tobytes(),
+        'postings_blob': bytes(postings_blob),
+        'doc_lens': doc_lens.tobytes(),
+        'key_offsets': key_offsets,
+        'key_blob': key_blob,
+        'key_order': key_order.tobytes(),
+    }
+
+    body = bytearray()
+    layout = []
+    for name in _SECTIONS:
+        _pad(body, 8)
+        layout.extend([_HEADER.size + len(body), len(sections[name])])
+        body.extend(sections[name])
+
+    header = _HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, len(doc_ids), len(term_postings), *layout)
+    _atomic_write(filepath, header + bytes(body))
+
+    # 文档库：uint64偏移数组 + UTF-8原文
+    doc_offsets, doc_blob = _string_table([documents[d].encode('utf-8') for d in doc_ids])
+    _atomic_write(docstore_path(filepath),
+                  _DOC_HEADER.pack(DOCSTORE_MAGIC, SEGMENT_VERSION, len(doc_ids)) + doc_offsets + doc_blob)
+
+
+def _atomic_write(filepath: str, data: bytes):
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_file = filepath + ".tmp"
+    with open(temp_file, 'wb') as f:
+        f.write(data)
+    os.replace(temp_file, filepath)
+
+
+def write_index_segment(index: InvertedIndex, filepath: str):
+    """把内存索引（字典实现或紧凑实现）写为段文件"""
+    write_segment(filepath, index.documents, index.doc_lengths, index.iter_postings())
+
+
+def convert_json_to_segment(json_path: str, segment_path: str) -> Dict[str, int]:
+    """
+    把 InvertedIndex.save_to_file 生成的JSON索引转换为段文件（不重新分词）
+
+    Returns:
+        Dict[str, int]: 文档数和词项数
+    """
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    postings = ((term, list(tf_map.keys()), list(tf_map.values()))
+                for term, tf_map in data['term_freq'].items())
+    write_segment(segment_path, data['documents'], data['doc_lengths'], postings)
+    return {'total_documents': len(data['documents']), 'total_terms': len(data['term_freq'])}
+
+
+class ReadOnlyIndexError(RuntimeError):
+    """对只读的段文件索引执行写操作"""
+
+
+class _MappedFile:
+    """只读mmap文件"""
+
+    def __init__(self, filepath: str):
+        self._file = open(filepath, 'rb')
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def array(self, dtype: str, offset: int, nbytes: int) -> np.ndarray:
+        """零拷贝获取mmap上的数组视图"""
+        itemsize = np.dtype(dtype).itemsize
+        return np.frombuffer(self.mm, dtype=dtype, count=nbytes // itemsize, offset=offset)
+
+    def close(self):
+        try:
+            self.mm.close()
+        except BufferError:
+            # 仍有数组视图引用mmap，交由垃圾回收释放映射
+            pass
+        self._file.close()
+
+
+class SegmentReader:
+    """段文件读取器 - 所有数据都直接从mmap读取"""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._file = _MappedFile(filepath)
+        mm = self._file.mm
+
+        fields = _HEADER.unpack_from(mm, 0)
+        magic, self.version, self.num_docs, self.num_terms = fields[:4]
+        if magic != SEGMENT_MAGIC:
+            raise ValueError(f"不是有效的段文件: {filepath}")
+        if self.version > SEGMENT_VERSION:
+            raise ValueError(f"段文件版本 {self.version} 高于当前支持的版本 {SEGMENT_VERSION}")
+        self._sections = {name: (fields[4 + 2 * i], fields[5 + 2 * i]) for i, name in enumerate(_SECTIONS)}
+
+        self._term_offsets = self._array('term_offsets', '<u8')
+        self._postings_offsets = self._array('postings_offsets', '<u8')
+        self.doc_lens = self._array('doc_lens', '<u4')
+        self._key_offsets = self._array('key_offsets', '<u8')
+        self._key_order = self._array('key_order', '<u4')
+
+    def _array(self, section: str, dtype: str) -> np.ndarray:
+        offset, length = self._sections[section]
+        return self._file.array(dtype, offset, length)
+
+    def _string(self, section: str, offsets: np.ndarray, i: int) -> bytes:
+        base = self._sections[section][0]
+        return self._file.mm[base + int(offsets[i]):base + int(offsets[i + 1])]
+
+    def term(self, i: int) -> str:
+        return self._string('term_blob', self._term_offsets, i).decode('utf-8')
+
+    def terms(self) -> Iterator[str]:
+        for i in range(self.num_terms):
+            yield self.term(i)
+
+    def _find_term(self, term: str) -> int:
+        key = term.encode('utf-8')
+        lo, hi = 0, self.num_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string('term_blob', self._term_offsets, mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_terms and self._string('term_blob', self._term_offsets, lo) == key:
+            return lo
+        return -1
+
+    def _postings_at(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        base = self._sections['postings_blob'][0]
+        start = base + int(self._postings_offsets[i])
+        end = base + int(self._postings_offsets[i + 1])
+        mm = self._file.mm
+        if mm[start] == POSTINGS_RAW:
+            df = struct.unpack_from('<I', mm, start + 4)[0]
+            doc_ords = self._file.array('<u4', start + 8, 4 * df)
+            tfs = self._file.array('<u4', start + 8 + 4 * df, 4 * df)
+            return doc_ords, tfs
+        doc_ords, tfs = decode_varint_postings(mm[start + 1:end])
+        return np.frombuffer(doc_ords, dtype=np.uint32), np.frombuffer(tfs, dtype=np.uint32)
+
+    def postings(self, term: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """获取词项倒排表 (文档序号数组, 词频数组)，词项不存在返回 (None, None)"""
+        i = self._find_term(term)
+        if i < 0:
+            return None, None
+        return self._postings_at(i)
+
+    def doc_key(self, doc_ord: int) -> str:
+        return self._string('key_blob', self._key_offsets, doc_ord).decode('utf-8')
+
+    def ordinal(self, doc_id: str) -> Optional[int]:
+        """文档ID -> 文档序号（在排序后的ID表上二分查找）"""
+        key = doc_id.encode('utf-8')
+        lo, hi = 0, self.num_docs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string('key_blob', self._key_offsets, int(self._key_order[mid])) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.num_docs:
+            doc_ord = int(self._key_order[lo])
+            if self._string('key_blob', self._key_offsets, doc_ord) == key:
+                return doc_ord
+        return None
+
+    def close(self):
+        self._term_offsets = self._postings_offsets = self.doc_lens = None
+        self._key_offsets = self._key_order = None
+        self._file.close()
+
+
+class DocumentStore:
+    """文档库读取器"""
+
+    def __init__(self, filepath: str):
+        self._file = _MappedFile(filepath)
+        magic, self.version, self.num_docs = _DOC_HEADER.unpack_from(self._file.mm, 0)
+        if magic != DOCSTORE_MAGIC:
+            raise ValueError(f"不是有效的文档库文件: {filepath}")
+        self._offsets = self._file.array('<u8', _DOC_HEADER.size, 8 * (self.num_docs + 1))
+        self._base = _DOC_HEADER.size + 8 * (self.num_docs + 1)
+
+    def get(self, doc_ord: int) -> str:
+        start = self._base + int(self._offsets[doc_ord])
+        end = self._base + int(self._offsets[doc_ord + 1])
+        return self._file.mm[start:end].decode('utf-8')
+
+    def close(self):
+        self._offsets = None
+        self._file.close()
+
+
+class _DocumentsView(Mapping):
+    """文档ID -> 文档内容 的只读视图"""
+
+    def __init__(self, owner: 'SegmentIndex'):
+        self._owner = owner
+
+    def __getitem__(self, doc_id: str) -> str:
+        doc_ord = self._owner.reader.ordinal(doc_id)
+        if doc_ord is None:
+            raise KeyError(doc_id)
+        return self._owner.doc_store.get(doc_ord)
+
+    def __iter__(self) -> Iterator[str]:
+        for doc_ord in range(self._owner.reader.num_docs):
+            yield self._owner.reader.doc_key(doc_ord)
+
+    def __len__(self) -> int:
+        return self._owner.reader.num_docs
+
+
+class _TermsView(Mapping):
+    """词项 -> 文档ID列表 的只读视图"""
+
+    def __init__(self, owner: 'SegmentIndex'):
+        self._owner = owner
+
+    def __getitem__(self, term: str) -> List[str]:
+        doc_ords, _ = self._owner.reader.postings(term)
+        if doc_ords is None:
+            raise KeyError(term)
+        return [self._owner.reader.doc_key(int(d)) for d in doc_ords]
+
+    def __iter__(self) -> Iterator[str]:
+        return self._owner.reader.terms()
+
+    def __len__(self) -> int:
+        return self._owner.reader.num_terms
+
+
+class SegmentIndex(InvertedIndex):
+    """基于mmap段文件的只读倒排索引，接口与 InvertedIndex 一致"""
+
+    read_only = True
+
+    def __init__(self, filepath: str):
+        self.stop_words = set(STOP_WORDS)
+        self.filepath = filepath
+        self.reader = SegmentReader(filepath)
+        self.doc_store = DocumentStore(docstore_path(filepath))
+
+    @property
+    def documents(self) -> Mapping:
+        return _DocumentsView(self)
+
+    @property
+    def index(self) -> Mapping:
+        return _TermsView(self)
+
+    @property
+    def doc_lengths(self) -> Dict[str, int]:
+        return {self.reader.doc_key(i): int(n) for i, n in enumerate(self.reader.doc_lens)}
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[str], List[int]]]:
+        for i in range(self.reader.num_terms):
+            doc_ords, tfs = self.reader._postings_at(i)
+            yield self.reader.term(i), [self.reader.doc_key(int(d)) for d in doc_ords], tfs.tolist()
+
+    def add_document(self, doc_id: str, content: str):
+        raise ReadOnlyIndexError("段文件索引为只读，不支持添加文档")
+
+    def delete_document(self, doc_id: str) -> bool:
+        raise ReadOnlyIndexError("段文件索引为只读，不支持删除文档")
+
+    def _build_scoring_engine(self) -> ScoringEngine:
+        """打分引擎直接读取mmap上的倒排数组"""
+        return ScoringEngine(self.reader.doc_lens, self.reader.num_docs, self.reader.postings, self.reader.doc_key)
+
+    def get_document(self, doc_id: str) -> str:
+        doc_ord = self.reader.ordinal(doc_id)
+        return self.doc_store.get(doc_ord) if doc_ord is not None else ""
+
+    def get_all_documents(self) -> Dict[str, str]:
+        return dict(self.documents)
+
+    def get_index_stats(self) -> Dict:
+        total_documents = self.reader.num_docs
+        return {
+            'total_documents': total_documents,
+            'total_terms': self.reader.num_terms,
+            'average_doc_length': float(self.reader.doc_lens.mean()) if total_documents > 0 else 0,
+            'backend': 'segment',
+            'segment_version': self.reader.version
+        }
+
+    def save_to_file(self, filename: str):
+        """导出为JSON格式（与字典实现兼容）"""
+        index = InvertedIndex()
+        index.load_postings(self.get_all_documents(), self.doc_lengths, self.iter_postings())
+        index.save_to_file(filename)
+
+    def load_from_file(self, filename: str):
+        raise ReadOnlyIndexError("段文件索引请使用 SegmentIndex(filepath) 打开")
+
+    def close(self):
+        self._scoring_engine = None
+        self.reader.close()
+        self.doc_store.close()
+
+
+def main():
+    """命令行入口：JSON索引 -> 段文件"""
+    if len(sys.argv) != 4 or sys.argv[1] != 'convert':
+        print("用法: python -m search_engine.index_tab.segment_store convert <index_data.json> <index_data.seg>")
+        sys.exit(1)
+
+    json_path, segment_path = sys.argv[2], sys.argv[3]
+    print(f"🔄 转换索引: {json_path} -> {segment_path}")
+    stats = convert_json_to_segment(json_path, segment_path)
+    print(f"✅ 转换完成: {stats['total_documents']}个文档, {stats['total_terms']}个词项")
+
+
+if __name__ == "__main__":
+    main()
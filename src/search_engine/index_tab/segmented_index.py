@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分段倒排索引模块 - LSM 风格的增量更新
+新文档先写入只追加的内存表 (memtable)，写满后冻结为不可变段；
+删除只在墓碑位图上置位，不需要重新分词；后台合并线程把小段合并并清理已删除文档。
+每次写入都发布一个新的只读快照，查询始终读取某个一致的快照，不会被写入阻塞。
+"""
+
+import threading
+from collections import Counter
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .offline_index import InvertedIndex, STOP_WORDS
+from .scoring import ScoringEngine
+from .segment_store import SegmentIndex
+
+
+class MemorySegment:
+    """不可变内存段：文档序号从0开始，倒排表为升序数组"""
+
+    def __init__(self, doc_ids: List[str], contents: List[str], doc_lens: np.ndarray,
+                 postings: Dict[str, Tuple[np.ndarray, np.ndarray]]):
+        self.doc_ids = doc_ids
+        self.contents = contents
+        self.doc_lens = doc_lens
+        self._postings = postings
+
+    @classmethod
+    def from_postings(cls, documents: Dict[str, str], doc_lengths: Dict[str, int],
+                      postings: Iterable[Tuple[str, List[str], List[int]]]) -> 'MemorySegment':
+        """由 (词项, 文档ID列表, 词频列表) 构建段，文档顺序即 documents 的顺序"""
+        doc_ids = list(documents)
+        ordinals = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+        arrays = {}
+        for term, term_doc_ids, tfs in postings:
+            pairs = sorted((ordinals[d], int(tf)) for d, tf in zip(term_doc_ids, tfs) if d in ordinals)
+            if pairs:
+                arrays[term] = (np.array([p[0] for p in pairs], dtype=np.uint32),
+                                np.array([p[1] for p in pairs], dtype=np.uint32))
+        doc_lens = np.array([int(doc_lengths.get(d, 0)) for d in doc_ids], dtype=np.uint32)
+        return cls(doc_ids, [documents[d] for d in doc_ids], doc_lens, arrays)
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def postings(self, term: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        return self._postings.get(term, (None, None))
+
+    def terms(self) -> Iterator[str]:
+        return iter(self._postings)
+
+    def doc_key(self, doc_ord: int) -> str:
+        return self.doc_ids[doc_ord]
+
+    def document(self, doc_ord: int) -> str:
+        return self.contents[doc_ord]
+
+
+class DiskSegment:
+    """mmap段文件 (SegmentIndex) 作为不可变段"""
+
+    def __init__(self, segment_index: SegmentIndex):
+        self.segment_index = segment_index
+        self.doc_lens = segment_index.reader.doc_lens
+
+    @property
+    def num_docs(self) -> int:
+        return self.segment_index.reader.num_docs
+
+    def postings(self, term: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        return self.segment_index.reader.postings(term)
+
+    def terms(self) -> Iterator[str]:
+        return self.segment_index.reader.terms()
+
+    def doc_key(self, doc_ord: int) -> str:
+        return self.segment_index.reader.doc_key(doc_ord)
+
+    def document(self, doc_ord: int) -> str:
+        return self.segment_index.doc_store.get(doc_ord)
+
+    def close(self):
+        self.segment_index.close()
+
+
+class MemTable:
+    """只追加的内存表
+
+    只有持有写锁的写入方会追加；读取方按快照记录的文档数水位线截断，
+    因此无需加锁也能读到一致的数据。
+    """
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.contents: List[str] = []
+        self.doc_lens: List[int] = []
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_ids)
+
+    def append(self, doc_id: str, content: str, words: List[str]) -> int:
+        """追加文档，返回文档序号"""
+        doc_ord = len(self.doc_ids)
+        for word, freq in Counter(words).items():
+            entry = self._postings.get(word)
+            if entry is None:
+                entry = self._postings[word] = ([], [])
+            entry[1].append(freq)
+            entry[0].append(doc_ord)
+        self.doc_lens.append(len(words))
+        self.contents.append(content)
+        # 文档ID最后追加：num_docs 增长时该文档的其余数据都已就绪
+        self.doc_ids.append(doc_id)
+        return doc_ord
+
+    def postings(self, term: str, watermark: int) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """获取水位线以内的倒排表"""
+        entry = self._postings.get(term)
+        if entry is None:
+            return None, None
+        doc_ords, tfs = entry
+        # 先取文档序号：并发追加时词频可能先于文档序号写入，按较短者截断
+        count = len(doc_ords)
+        doc_ords = np.array(doc_ords[:count], dtype=np.uint32)
+        tfs = np.array(tfs[:count], dtype=np.uint32)
+        end = int(np.searchsorted(doc_ords, watermark))
+        if end == 0:
+            return None, None
+        return doc_ords[:end], tfs[:end]
+
+    def terms(self) -> Iterator[str]:
+        return iter(list(self._postings))
+
+    def doc_key(self, doc_ord: int) -> str:
+        return self.doc_ids[doc_ord]
+
+    def document(self, doc_ord: int) -> str:
+        return self.contents[doc_ord]
+
+    def freeze(self) -> MemorySegment:
+        """冻结为不可变段（文档序号保持不变）"""
+        postings = {term: (np.array(doc_ords, dtype=np.uint32), np.array(tfs, dtype=np.uint32))
+                    for term, (doc_ords, tfs) in self._postings.items()}
+        return MemorySegment(list(self.doc_ids), list(self.contents),
+                             np.array(self.doc_lens, dtype=np.uint32), postings)
+
+
+class IndexSnapshot:
+    """某一时刻的只读索引视图：不可变段 + 墓碑位图 + 内存表水位线"""
+
+    def __init__(self, segments: Tuple = (), tombstones: Tuple[np.ndarray, ...] = (),
+                 memtable: Optional[MemTable] = None, mem_docs: int = 0,
+                 mem_tombstones: frozenset = frozenset(), segment_deleted: Optional[int] = None):
+        self.segments = segments
+        self.tombstones = tombstones
+        self.memtable = memtable if memtable is not None else MemTable()
+        self.mem_docs = mem_docs
+        self.mem_tombstones = mem_tombstones
+        # 全局文档序号 = 所在段的起始序号 + 段内序号，内存表排在最后
+        sizes = [segment.num_docs for segment in segments]
+        self.bases = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64))).astype(np.int64)
+        if segment_deleted is None:
+            segment_deleted = sum(int(t.sum()) for t in tombstones)
+        self.segment_deleted = segment_deleted
+        self.deleted_docs = segment_deleted + len(mem_tombstones)
+        self.live_docs = int(self.bases[-1]) + mem_docs - self.deleted_docs
+        self._engine: Optional[ScoringEngine] = None
+
+    def replace(self, **changes) -> 'IndexSnapshot':
+        """基于当前快照生成新快照"""
+        fields = {
+            'segments': self.segments,
+            'tombstones': self.tombstones,
+            'memtable': self.memtable,
+            'mem_docs': self.mem_docs,
+            'mem_tombstones': self.mem_tombstones,
+        }
+        # 段和位图不变时沿用已删除计数，避免每次写入都扫描位图
+        if 'segments' not in changes and 'tombstones' not in changes:
+            fields['segment_deleted'] = self.segment_deleted
+        fields.update(changes)
+        return IndexSnapshot(**fields)
+
+    def _locate(self, global_ord: int) -> Tuple[object, int]:
+        """全局文档序号 -> (段或内存表, 段内序号)"""
+        position = int(np.searchsorted(self.bases, global_ord, side='right')) - 1
+        if position < len(self.segments):
+            return self.segments[position], global_ord - int(self.bases[position])
+        return self.memtable, global_ord - int(self.bases[-1])
+
+    def doc_key(self, global_ord: int) -> str:
+        container, doc_ord = self._locate(global_ord)
+        return container.doc_key(doc_ord)
+
+    def document(self, global_ord: int) -> str:
+        container, doc_ord = self._locate(global_ord)
+        return container.document(doc_ord)
+
+    def _mem_live_mask(self) -> np.ndarray:
+        mask = np.ones(self.mem_docs, dtype=bool)
+        if self.mem_tombstones:
+            mask[list(self.mem_tombstones)] = False
+        return mask
+
+    def postings(self, term: str) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """词项在快照中有效文档上的倒排表（全局文档序号，升序）"""
+        parts_ords, parts_tfs = [], []
+        for base, segment, tombstone in zip(self.bases, self.segments, self.tombstones):
+            doc_ords, tfs = segment.postings(term)
+            if doc_ords is None:
+                continue
+            live = ~tombstone[doc_ords]
+            parts_ords.append(doc_ords[live].astype(np.int64) + base)
+            parts_tfs.append(tfs[live])
+        if self.mem_docs:
+            doc_ords, tfs = self.memtable.postings(term, self.mem_docs)
+            if doc_ords is not None:
+                live = self._mem_live_mask()[doc_ords]
+                parts_ords.append(doc_ords[live].astype(np.int64) + self.bases[-1])
+                parts_tfs.append(tfs[live])
+        if not parts_ords:
+            return None, None
+        doc_ords = np.concatenate(parts_ords)
+        if len(doc_ords) == 0:
+            return None, None
+        return doc_ords, np.concatenate(parts_tfs)
+
+    def doc_lens(self) -> np.ndarray:
+        """全局文档长度数组（已删除文档为0）"""
+        parts = [np.where(tombstone, 0, segment.doc_lens).astype(np.float64)
+                 for segment, tombstone in zip(self.segments, self.tombstones)]
+        mem_lens = np.array(self.memtable.doc_lens[:self.mem_docs], dtype=np.float64)
+        mem_lens[~self._mem_live_mask()] = 0
+        parts.append(mem_lens)
+        return np.concatenate(parts)
+
+    def engine(self) -> ScoringEngine:
+        """快照的打分引擎（首次查询时构建）"""
+        engine = self._engine
+        if engine is None:
+            engine = self._engine = ScoringEngine(self.doc_lens(), self.live_docs, self.postings, self.doc_key)
+        return engine
+
+    def live_ordinals(self) -> Iterator[int]:
+        """按全局序号遍历有效文档"""
+        for base, tombstone in zip(self.bases, self.tombstones):
+            for doc_ord in np.flatnonzero(~tombstone):
+                yield int(base) + int(doc_ord)
+        base = int(self.bases[-1])
+        for doc_ord in range(self.mem_docs):
+            if doc_ord not in self.mem_tombstones:
+                yield base + doc_ord
+
+    def terms(self) -> List[str]:
+        """快照中出现过的全部词项（含只出现在已删除文档中的词项）"""
+        terms = {}
+        for segment in self.segments:
+            terms.update(dict.fromkeys(segment.terms()))
+        if self.mem_docs:
+            terms.update(dict.fromkeys(self.memtable.terms()))
+        return list(terms)
+
+
+def merge_segments(segments: Sequence, tombstones: Sequence[np.ndarray]) -> Tuple[MemorySegment, List[np.ndarray]]:
+    """
+    合并相邻的若干段，丢弃已删除文档
+
+    Returns:
+        (合并后的段, 各源段的 旧序号->新序号 映射，已删除为-1)
+    """
+    doc_ids, contents, doc_lens, mappings = [], [], [], []
+    for segment, tombstone in zip(segments, tombstones):
+        live = np.flatnonzero(~tombstone)
+        mapping = np.full(segment.num_docs, -1, dtype=np.int64)
+        mapping[live] = np.arange(len(doc_ids), len(doc_ids) + len(live))
+        mappings.append(mapping)
+        for doc_ord in live:
+            doc_ids.append(segment.doc_key(int(doc_ord)))
+            contents.append(segment.document(int(doc_ord)))
+        doc_lens.append(np.asarray(segment.doc_lens)[live])
+
+    terms = {}
+    for segment in segments:
+        terms.update(dict.fromkeys(segment.terms()))
+
+    postings = {}
+    for term in terms:
+        parts_ords, parts_tfs = [], []
+        for segment, mapping in zip(segments, mappings):
+            doc_ords, tfs = segment.postings(term)
+            if doc_ords is None:
+                continue
+            new_ords = mapping[doc_ords]
+            live = new_ords >= 0
+            parts_ords.append(new_ords[live])
+            parts_tfs.append(tfs[live])
+        if parts_ords:
+            doc_ords = np.concatenate(parts_ords)
+            if len(doc_ords):
+                postings[term] = (doc_ords.astype(np.uint32), np.concatenate(parts_tfs).astype(np.uint32))
+
+    merged_lens = np.concatenate(doc_lens).astype(np.uint32) if doc_lens else np.zeros(0, dtype=np.uint32)
+    return MemorySegment(doc_ids, contents, merged_lens, postings), mappings
+
+
+class _DocumentsView(Mapping):
+    """文档ID -> 文档内容 的只读视图（有效文档）"""
+
+    def __init__(self, owner: 'SegmentedIndex'):
+        self._owner = owner
+
+    def __getitem__(self, doc_id: str) -> str:
+        location = self._owner._locations.get(doc_id)
+        if location is None:
+            raise KeyError(doc_id)
+        container, doc_ord = location
+        return container.document(doc_ord)
+
+    def __iter__(self) -> Iterator[str]:
+        snapshot = self._owner.snapshot()
+        for global_ord in snapshot.live_ordinals():
+            yield snapshot.doc_key(global_ord)
+
+    def __len__(self) -> int:
+        return self._owner.snapshot().live_docs
+
+    def __contains__(self, doc_id) -> bool:
+        return doc_id in self._owner._locations
+
+
+class _TermsView(Mapping):
+    """词项 -> 文档ID列表 的只读视图"""
+
+    def __init__(self, owner: 'SegmentedIndex'):
+        self._snapshot = owner.snapshot()
+
+    def __getitem__(self, term: str) -> List[str]:
+        doc_ords, _ = self._snapshot.postings(term)
+        if doc_ords is None:
+            raise KeyError(term)
+        return [self._snapshot.doc_key(int(d)) for d in doc_ords]
+
+    def __iter__(self) -> Iterator[str]:
+        for term in self._snapshot.terms():
+            if self._snapshot.postings(term)[0] is not None:
+                yield term
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class SegmentedIndex(InvertedIndex):
+    """LSM 风格的可写倒排索引，接口与 InvertedIndex 一致
+
+    - 写入：追加到内存表，达到 memtable_limit 后冻结为不可变段
+    - 删除：在墓碑位图上置位（写时复制），不重新分词
+    - 合并：段数超过 max_segments 时，后台线程合并最新的 merge_factor 个段
+    - 查询：读取当前快照，不加锁
+    """
+
+    def __init__(self, memtable_limit: int = 1000, max_segments: int = 8, merge_factor: int = 4,
+                 background_merge: bool = True):
+        """
+        Args:
+            memtable_limit: 内存表文档数上限
+            max_segments: 触发合并的段数
+            merge_factor: 每次合并的段数
+            background_merge: 是否在后台线程合并（False 时在写入线程内同步合并）
+        """
+        self.stop_words = set(STOP_WORDS)
+        self.memtable_limit = memtable_limit
+        self.max_segments = max_segments
+        self.merge_factor = max(2, merge_factor)
+        self.background_merge = background_merge
+
+        self._write_lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._merge_event = threading.Event()
+        self._merger: Optional[threading.Thread] = None
+        self._closed = False
+        self._reset()
+
+    @classmethod
+    def from_segment_file(cls, filepath: str, **kwargs) -> 'SegmentedIndex':
+        """以mmap段文件作为基础段打开（启动时无需反序列化）"""
+        index = cls(**kwargs)
+        index._load_segment(DiskSegment(SegmentIndex(filepath)))
+        return index
+
+    def _reset(self):
+        """清空索引数据"""
+        # 文档ID -> (所在段或内存表, 段内序号)，只在写锁内修改
+        self._locations: Dict[str, Tuple[object, int]] = {}
+        self._snapshot = IndexSnapshot()
+
+    def _load_segment(self, segment):
+        """以单个段替换全部数据"""
+        with self._write_lock:
+            self._reset()
+            self._locations = {segment.doc_key(i): (segment, i) for i in range(segment.num_docs)}
+            self._snapshot = IndexSnapshot((segment,), (np.zeros(segment.num_docs, dtype=bool),))
+
+    def snapshot(self) -> IndexSnapshot:
+        """获取当前快照"""
+        return self._snapshot
+
+    @property
+    def documents(self) -> Mapping:
+        return _DocumentsView(self)
+
+    @property
+    def index(self) -> Mapping:
+        return _TermsView(self)
+
+    @property
+    def doc_lengths(self) -> Dict[str, int]:
+        snapshot = self._snapshot
+        doc_lens = snapshot.doc_lens()
+        return {snapshot.doc_key(g): int(doc_lens[g]) for g in snapshot.live_ordinals()}
+
+    # ---------- 写入 ----------
+
+    def add_document(self, doc_id: str, content: str):
+        """添加文档到索引（同ID文档先删除再添加）"""
+        words = self.preprocess_text(content, persist=True)
+        with self._write_lock:
+            if doc_id in self._locations:
+                self._delete_locked([doc_id])
+            snapshot = self._snapshot
+            doc_ord = snapshot.memtable.append(doc_id, content, words)
+            self._locations[doc_id] = (snapshot.memtable, doc_ord)
+            self._snapshot = snapshot.replace(mem_docs=doc_ord + 1)
+            if snapshot.memtable.num_docs >= self.memtable_limit:
+                self._flush_locked()
+
+    def delete_document(self, doc_id: str) -> bool:
+        """删除文档从索引（只置墓碑位）"""
+        return self.delete_documents([doc_id]) > 0
+
+    def delete_documents(self, doc_ids: Iterable[str]) -> int:
+        """批量删除文档，只发布一次快照，返回删除数量"""
+        with self._write_lock:
+            return self._delete_locked(doc_ids)
+
+    def _delete_locked(self, doc_ids: Iterable[str]) -> int:
+        snapshot = self._snapshot
+        positions = {id(segment): i for i, segment in enumerate(snapshot.segments)}
+        tombstones = list(snapshot.tombstones)
+        copied = set()
+        mem_deleted = set()
+        deleted = 0
+        for doc_id in doc_ids:
+            location = self._locations.pop(doc_id, None)
+            if location is None:
+                continue
+            container, doc_ord = location
+            if container is snapshot.memtable:
+                mem_deleted.add(doc_ord)
+            else:
+                i = positions[id(container)]
+                # 写时复制：旧快照的位图保持不变
+                if i not in copied:
+                    tombstones[i] = tombstones[i].copy()
+                    copied.add(i)
+                tombstones[i][doc_ord] = True
+            deleted += 1
+        if deleted:
+            self._snapshot = snapshot.replace(tombstones=tuple(tombstones),
+                                              mem_tombstones=snapshot.mem_tombstones | mem_deleted)
+        return deleted
+
+    def clear(self):
+        """清空索引"""
+        with self._write_lock:
+            self._reset()
+
+    def optimize(self):
+        """把内存表冻结为段"""
+        with self._write_lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        snapshot = self._snapshot
+        memtable = snapshot.memtable
+        if snapshot.mem_docs == 0:
+            return
+        segment = memtable.freeze()
+        tombstone = np.zeros(segment.num_docs, dtype=bool)
+        if snapshot.mem_tombstones:
+            tombstone[list(snapshot.mem_tombstones)] = True
+        for doc_ord, doc_id in enumerate(memtable.doc_ids):
+            location = self._locations.get(doc_id)
+            if location is not None and location[0] is memtable and location[1] == doc_ord:
+                self._locations[doc_id] = (segment, doc_ord)
+        self._snapshot = IndexSnapshot(snapshot.segments + (segment,), snapshot.tombstones + (tombstone,))
+        if len(self._snapshot.segments) > self.max_segments:
+            self._request_merge()
+
+    # ---------- 合并 ----------
+
+    def _request_merge(self):
+        if not self.background_merge:
+            self.merge()
+            return
+        if self._merger is None:
+            self._merger = threading.Thread(target=self._merge_loop, name="segment-merger", daemon=True)
+            self._merger.start()
+        self._merge_event.set()
+
+    def _merge_loop(self):
+        while not self._closed:
+            self._merge_event.wait()
+            self._merge_event.clear()
+            if self._closed:
+                break
+            try:
+                while self.merge():
+                    pass
+            except Exception as e:
+                print(f"❌ 段合并失败: {e}")
+
+    def merge(self) -> bool:
+        """合并最新的 merge_factor 个段，返回是否发生了合并"""
+        with self._merge_lock:
+            snapshot = self._snapshot
+            if len(snapshot.segments) <= self.max_segments:
+                return False
+            start = len(snapshot.segments) - self.merge_factor
+            victims = snapshot.segments[start:]
+            victim_tombstones = snapshot.tombstones[start:]
+
+            # 合并在写锁外进行，期间查询和写入照常
+            merged, mappings = merge_segments(victims, victim_tombstones)
+
+            with self._write_lock:
+                current = self._snapshot
+                if current.segments[start:start + len(victims)] != victims:
+                    # 合并期间索引被清空或重新加载，放弃本次结果
+                    return False
+                tombstone = np.zeros(merged.num_docs, dtype=bool)
+                for old, new, mapping in zip(victim_tombstones, current.tombstones[start:], mappings):
+                    # 合并期间新增的删除要转移到新段
+                    tombstone[mapping[np.flatnonzero(new & ~old)]] = True
+                for new_ord, doc_id in enumerate(merged.doc_ids):
+                    location = self._locations.get(doc_id)
+                    if location is None:
+                        continue
+                    for victim, mapping in zip(victims, mappings):
+                        if location[0] is victim and mapping[location[1]] == new_ord:
+                            self._locations[doc_id] = (merged, new_ord)
+                            break
+                end = start + len(victims)
+                self._snapshot = current.replace(
+                    segments=current.segments[:start] + (merged,) + current.segments[end:],
+                    tombstones=current.tombstones[:start] + (tombstone,) + current.tombstones[end:])
+            return True
+
+    def close(self):
+        """停止后台合并线程（等待进行中的合并结束），释放段文件的mmap映射"""
+        self._closed = True
+        self._merge_event.set()
+        if self._merger is not None and self._merger is not threading.current_thread():
+            self._merger.join()
+        for segment in self._snapshot.segments:
+            if isinstance(segment, DiskSegment):
+                segment.close()
+
+    # ---------- 查询 ----------
+
+    def scoring_engine(self) -> ScoringEngine:
+        return self._snapshot.engine()
+
+    def search(self, query: str, top_k: int = 5, retrieval_mode: str = 'tfidf') -> List[Tuple[str, float, str]]:
+        """搜索文档 - 在当前快照上打分，摘要也从同一快照读取"""
+        query_words = self.preprocess_text(query)
+        if not query_words:
+            return []
+        snapshot = self._snapshot
+        ranked = snapshot.engine().top_k_ordinals(query_words, top_k, retrieval_mode)
+        return [(snapshot.doc_key(doc_ord), score,
+                 self.summarize_content(snapshot.document(doc_ord), query_words))
+                for doc_ord, score in ranked]
+
+    def search_ids(self, query: str, top_k: int = 5, retrieval_mode: str = 'tfidf') -> List[Tuple[str, float]]:
+        """只打分不生成摘要，返回 (doc_id, score)"""
+        query_words = self.preprocess_text(query)
+        if not query_words:
+            return []
+        snapshot = self._snapshot
+        return [(snapshot.doc_key(doc_ord), score)
+                for doc_ord, score in snapshot.engine().top_k_ordinals(query_words, top_k, retrieval_mode)]
+
+    def get_document(self, doc_id: str) -> str:
+        location = self._locations.get(doc_id)
+        if location is None:
+            return ""
+        container, doc_ord = location
+        return container.document(doc_ord)
+
+    def get_all_documents(self) -> Dict[str, str]:
+        snapshot = self._snapshot
+        return {snapshot.doc_key(g): snapshot.document(g) for g in snapshot.live_ordinals()}
+
+    def get_index_stats(self) -> Dict:
+        snapshot = self._snapshot
+        total_documents = snapshot.live_docs
+        return {
+            'total_documents': total_documents,
+            'total_terms': len(snapshot.terms()),
+            'average_doc_length': float(snapshot.doc_lens().sum()) / total_documents if total_documents else 0,
+            'backend': 'segmented',
+            'segments': len(snapshot.segments),
+            'memtable_docs': snapshot.mem_docs,
+            'deleted_docs': snapshot.deleted_docs
+        }
+
+    # ---------- 导入导出 ----------
+
+    def iter_postings(self) -> Iterator[Tuple[str, List[str], List[int]]]:
+        snapshot = self._snapshot
+        for term in snapshot.terms():
+            doc_ords, tfs = snapshot.postings(term)
+            if doc_ords is not None:
+                yield term, [snapshot.doc_key(int(d)) for d in doc_ords], tfs.tolist()
+
+    def load_postings(self, documents: Dict[str, str], doc_lengths: Dict[str, int], postings):
+        """直接加载已分词的倒排数据，作为单个基础段"""
+        self._load_segment(MemorySegment.from_postings(documents, doc_lengths, postings))
+
+    def save_to_file(self, filename: str):
+        """保存为JSON格式（与字典实现兼容）"""
+        index = InvertedIndex()
+        index.load_postings(self.get_all_documents(), self.doc_lengths, self.iter_postings())
+        index.save_to_file(filename)
+
+    def load_from_file(self, filename: str):
+        """从JSON索引加载（无需重新分词）"""
+        index = InvertedIndex()
+        index.load_from_file(filename)
+        self.load_postings(index.documents, index.doc_lengths, index.iter_postings())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+摘要生成模块 - 单遍多关键词匹配与高亮
+用 Aho-Corasick 自动机一遍扫描找出所有查询词的出现位置（忽略大小写），
+选出命中最密集的窗口作为摘要，并在同一遍拼接中插入高亮标签，
+不会像逐词 str.replace 那样改写已插入的标签。
+"""
+
+from bisect import bisect_left, bisect_right
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+HIGHLIGHT_OPEN = '<span style="background-color: yellow; font-weight: bold;">'
+HIGHLIGHT_CLOSE = '</span>'
+
+# 命中位置：(起始, 结束, 关键词序号)
+Match = Tuple[int, int, int]
+
+
+class KeywordMatcher:
+    """多关键词 Aho-Corasick 匹配器（关键词统一转小写）"""
+
+    def __init__(self, keywords: Sequence[str]):
+        self.keywords: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # 状态 -> 以该状态结尾的最长关键词 (长度, 序号)，没有时长度为0
+        self._output: List[Tuple[int, int]] = [(0, -1)]
+        # 状态 -> 沿失败链能到达的所有输出状态中的关键词
+        self._all_outputs: List[List[Tuple[int, int]]] = [[]]
+
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if not keyword or keyword in self.keywords:
+                continue
+            self._add(keyword, len(self.keywords))
+            self.keywords.append(keyword)
+        self._build_fail_links()
+
+    def _add(self, keyword: str, index: int):
+        state = 0
+        for char in keyword:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append((0, -1))
+                self._all_outputs.append([])
+            state = next_state
+        self._output[state] = (len(keyword), index)
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        for state in queue:
+            self._all_outputs[state] = [self._output[state]] if self._output[state][0] else []
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                own = [self._output[next_state]] if self._output[next_state][0] else []
+                self._all_outputs[next_state] = own + self._all_outputs[self._fail[next_state]]
+                queue.append(next_state)
+
+    def find_all(self, text: str) -> List[Match]:
+        """
+        扫描文本，返回不重叠的命中位置（从左到右，同一位置取最长关键词）
+
+        Args:
+            text: 原文（内部按小写匹配，长度变化时按原文匹配）
+
+        Returns:
+            List[Match]: 按起始位置升序的 (起始, 结束, 关键词序号)
+        """
+        if not self.keywords:
+            return []
+        lowered = text.lower()
+        if len(lowered) != len(text):
+            lowered = text
+
+        goto, fail, all_outputs = self._goto, self._fail, self._all_outputs
+        # 起始位置 -> 该位置开始的最长命中
+        longest: Dict[int, Tuple[int, int]] = {}
+        state = 0
+        for pos, char in enumerate(lowered):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length, index in all_outputs[state]:
+                start = pos + 1 - length
+                if length > longest.get(start, (0, -1))[0]:
+                    longest[start] = (length, index)
+
+        matches: List[Match] = []
+        last_end = 0
+        for start in sorted(longest):
+            if start < last_end:
+                continue
+            length, index = longest[start]
+            matches.append((start, start + length, index))
+            last_end = start + length
+        return matches
+
+
+@lru_cache(maxsize=256)
+def get_matcher(keywords: Tuple[str, ...]) -> KeywordMatcher:
+    """按查询词缓存匹配器，同一查询的多个结果共用一个自动机"""
+    return KeywordMatcher(keywords)
+
+
+def _densest_window(matches: List[Match], starts: List[int], max_length: int) -> int:
+    """选出包含命中最多（先比不同关键词数，再比命中次数）的窗口起点"""
+    ends = [m[1] for m in matches]
+    best_begin, best_score = 0, (-1, -1)
+    for start, _, _ in matches:
+        # 与原实现一致：窗口从命中位置前 1/3 处开始
+        begin = max(0, start - max_length // 3)
+        first = bisect_left(starts, begin)
+        last = bisect_right(ends, begin + max_length)
+        window = matches[first:last]
+        score = (len({m[2] for m in window}), len(window))
+        if score > best_score:
+            best_begin, best_score = begin, score
+    return best_begin
+
+
+def highlight_matches(text: str, matches: List[Match], offset: int = 0) -> str:
+    """按命中位置一次拼接出高亮文本（只处理完整落在 text 内的命中）"""
+    parts = []
+    cursor = 0
+    end_limit = len(text)
+    for start, end, _ in matches:
+        start -= offset
+        end -= offset
+        if start >= end_limit:
+            break
+        if start < cursor or end > end_limit:
+            continue
+        parts.append(text[cursor:start])
+        parts.append(HIGHLIGHT_OPEN)
+        parts.append(text[start:end])
+        parts.append(HIGHLIGHT_CLOSE)
+        cursor = end
+    parts.append(text[cursor:])
+    return "".join(parts)
+
+
+def build_snippet(content: str, query_words: Sequence[str], max_length: int = 200) -> str:
+    """
+    生成高亮摘要
+
+    Args:
+        content: 文档原文
+        query_words: 预处理后的查询词
+        max_length: 摘要窗口长度
+
+    Returns:
+        str: 摘要（窗口外有内容时带省略号）
+    """
+    if not query_words:
+        return content[:max_length] + "..." if len(content) > max_length else content
+
+    matches = get_matcher(tuple(query_words)).find_all(content)
+    starts = [m[0] for m in matches]
+    begin = _densest_window(matches, starts, max_length) if matches else 0
+    window = content[begin:begin + max_length]
+    summary = highlight_matches(window, matches[bisect_left(starts, begin):], offset=begin)
+    if begin > 0:
+        summary = "..." + summary
+    if len(content) > begin + max_length:
+        summary = summary + "..."
+    return summary
+
+
+def highlight_keywords(text: str, keywords: Sequence[str]) -> str:
+    """单遍高亮文本中的所有关键词"""
+    return highlight_matches(text, get_matcher(tuple(keywords)).find_all(text))
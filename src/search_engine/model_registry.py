@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型注册表模块
+- ModelRegistry：模型版本清单（models/model_registry.json），每个版本记录
+  模型类型、来源（online/offline）、checkpoint编号、指标、特征流水线指纹和文件 sha256；
+  清单先写临时文件再原子替换，并用文件锁串行化多进程（服务进程、训练进程）的写入
+- ModelHandle / ModelSlot：带引用计数的模型句柄，替换模型只交换槽位中的引用，
+  正在进行的请求持有旧句柄直到结束，读取方从不等待模型加载
+- ShadowScorer：影子模式，用候选模型在后台线程中异步重算线上流量的分数，记录与线上分数的差异
+"""
+
+import glob
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from .training_tab.model_artifact import file_sha256, metadata_path
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为进程内锁
+    fcntl = None
+
+
+def model_files(model_path: str) -> List[str]:
+    """模型路径（或路径前缀）对应的全部模型文件（含 .json 元数据），不含信息文件和临时文件"""
+    candidates = [model_path, metadata_path(model_path)] + sorted(glob.glob(glob.escape(model_path) + '*'))
+    files = []
+    for path in candidates:
+        if (os.path.isfile(path) and path not in files
+                and not path.endswith(('.tmp', '_info.json'))):
+            files.append(path)
+    return files
+
+
+class ModelRegistry:
+    """带清单的模型版本注册表"""
+
+    MANIFEST_VERSION = 1
+
+    def __init__(self, manifest_path: str = "models/model_registry.json", max_versions: int = 50):
+        """
+        Args:
+            manifest_path: 清单文件路径
+            max_versions: 每种模型类型最多保留的版本记录数
+        """
+        self.manifest_path = manifest_path
+        self.max_versions = max_versions
+        self._lock = threading.Lock()
+        self._manifest: Dict[str, Any] = self._empty_manifest()
+        self._mtime = None
+
+    @staticmethod
+    def _empty_manifest() -> Dict[str, Any]:
+        return {'manifest_version': ModelRegistry.MANIFEST_VERSION, 'next_version': 1, 'versions': [], 'active': {}}
+
+    # ---------------- 清单读写 ----------------
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """进程内锁 + 跨进程文件锁"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            directory = os.path.dirname(self.manifest_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.manifest_path + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self) -> Dict[str, Any]:
+        """清单文件有变化时重新读取（需要在锁内调用）"""
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return self._manifest
+        if mtime != self._mtime:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+                if manifest.get('manifest_version') == self.MANIFEST_VERSION:
+                    self._manifest = manifest
+                else:
+                    print(f"⚠️ 模型注册表版本不匹配，忽略: {self.manifest_path}")
+                self._mtime = mtime
+            except (OSError, ValueError) as e:
+                print(f"❌ 读取模型注册表失败: {e}")
+        return self._manifest
+
+    def _write(self, manifest: Dict[str, Any]):
+        directory = os.path.dirname(self.manifest_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.manifest_path)
+        self._manifest = manifest
+        self._mtime = os.path.getmtime(self.manifest_path)
+
+    # ---------------- 注册与查询 ----------------
+
+    def register(self, model_type: str, model_path: str, source: str = 'offline',
+                 checkpoint: Optional[int] = None, metrics: Optional[Dict[str, Any]] = None,
+                 pipeline_hash: Optional[str] = None, extra: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        注册一个模型版本（计算文件校验和）
+
+        Args:
+            model_type: 模型类型（logistic_regression / wide_and_deep）
+            model_path: 模型文件路径（或路径前缀）
+            source: online（增量checkpoint）或 offline（全量训练）
+            checkpoint: 在线checkpoint编号
+            metrics: 训练指标
+            pipeline_hash: 特征流水线指纹
+            extra: 其他信息
+
+        Returns:
+            Optional[Dict]: 版本记录（文件未变化时为已有记录），失败时为None
+        """
+        try:
+            files = {path: file_sha256(path) for path in model_files(model_path)}
+            if not files:
+                print(f"⚠️ 注册模型失败，文件不存在: {model_path}")
+                return None
+            with self._locked():
+                manifest = json.loads(json.dumps(self._refresh()))
+                for existing in reversed(manifest['versions']):
+                    if existing['model_path'] == model_path:
+                        if existing['files'] == files and existing['model_type'] == model_type:
+                            # 同一份文件重复保存，不产生新版本
+                            return existing
+                        break
+                entry = {
+                    'version': manifest['next_version'],
+                    'model_type': model_type,
+                    'source': source,
+                    'checkpoint': checkpoint,
+                    'model_path': model_path,
+                    'files': files,
+                    'metrics': _json_safe(metrics or {}),
+                    'pipeline_hash': pipeline_hash,
+                    'created_at': datetime.now().isoformat(),
+                    'pid': os.getpid(),
+                }
+                if extra:
+                    entry.update(_json_safe(extra))
+                manifest['next_version'] += 1
+                manifest['versions'].append(entry)
+                self._prune(manifest, model_type)
+                self._write(manifest)
+            return entry
+        except Exception as e:
+            print(f"❌ 注册模型版本失败: {e}")
+            return None
+
+    def _prune(self, manifest: Dict[str, Any], model_type: str):
+        """每种类型只保留最近 max_versions 条记录（当前激活版本始终保留）"""
+        active = manifest['active'].get(model_type)
+        entries = [e for e in manifest['versions'] if e['model_type'] == model_type]
+        drop = {e['version'] for e in entries[:-self.max_versions] if e['version'] != active}
+        if drop:
+            manifest['versions'] = [e for e in manifest['versions'] if e['version'] not in drop]
+
+    def prune_missing(self) -> int:
+        """删除文件已不存在的版本记录（清理旧checkpoint后调用）"""
+        with self._locked():
+            manifest = json.loads(json.dumps(self._refresh()))
+            kept = [e for e in manifest['versions'] if all(os.path.exists(path) for path in e['files'])]
+            removed = len(manifest['versions']) - len(kept)
+            if removed:
+                manifest['versions'] = kept
+                self._write(manifest)
+            return removed
+
+    def list_versions(self, model_type: Optional[str] = None, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """版本记录（按版本号升序）"""
+        with self._locked():
+            versions = list(self._refresh()['versions'])
+        return [e for e in versions
+                if (model_type is None or e['model_type'] == model_type)
+                and (source is None or e['source'] == source)]
+
+    def latest(self, model_type: str, source: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """最新的版本记录"""
+        versions = self.list_versions(model_type, source)
+        return versions[-1] if versions else None
+
+    def get(self, version: int) -> Optional[Dict[str, Any]]:
+        """按版本号查找"""
+        for entry in self.list_versions():
+            if entry['version'] == version:
+                return entry
+        return None
+
+    def find_by_path(self, model_path: str) -> Optional[Dict[str, Any]]:
+        """按模型文件路径查找最新的版本记录"""
+        matches = [e for e in self.list_versions() if e['model_path'] == model_path]
+        return matches[-1] if matches else None
+
+    def verify(self, entry: Dict[str, Any]) -> bool:
+        """校验版本的全部文件存在且 sha256 一致"""
+        try:
+            return all(os.path.exists(path) and file_sha256(path) == digest
+                       for path, digest in entry['files'].items())
+        except OSError:
+            return False
+
+    def set_active(self, model_type: str, version: Optional[int]):
+        """记录某类型当前上线的版本"""
+        try:
+            with self._locked():
+                manifest = json.loads(json.dumps(self._refresh()))
+                if manifest['active'].get(model_type) == version:
+                    return
+                manifest['active'][model_type] = version
+                self._write(manifest)
+        except Exception as e:
+            print(f"❌ 更新激活版本失败: {e}")
+
+    def get_active(self, model_type: str) -> Optional[int]:
+        with self._locked():
+            return self._refresh()['active'].get(model_type)
+
+
+def _json_safe(value: Any) -> Any:
+    """指标中的 numpy 数值等转为可写入JSON的类型"""
+    if isinstance(value, dict):
+        return {str(k): _json_safe(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class ModelHandle:
+    """带引用计数的模型句柄"""
+
+    def __init__(self, model, model_type: str, version: Optional[int] = None):
+        self.model = model
+        self.model_type = model_type
+        self.version = version
+        self.refs = 0
+        self.retired = False
+        self.loaded_at = time.time()
+
+
+class ModelSlot:
+    """一个模型类型的上线槽位：替换只交换引用，旧句柄在最后一个请求结束后释放"""
+
+    def __init__(self, handle: ModelHandle, on_drained: Optional[Callable[[ModelHandle], Any]] = None):
+        """
+        Args:
+            handle: 初始句柄
+            on_drained: 被替换的句柄不再被任何请求持有时的回调
+        """
+        self._handle = handle
+        self._lock = threading.Lock()
+        self.on_drained = on_drained
+
+    @property
+    def current(self) -> ModelHandle:
+        return self._handle
+
+    def acquire(self) -> ModelHandle:
+        with self._lock:
+            handle = self._handle
+            handle.refs += 1
+            return handle
+
+    def release(self, handle: ModelHandle):
+        with self._lock:
+            handle.refs -= 1
+            drained = handle.retired and handle.refs == 0
+        if drained:
+            self._drained(handle)
+
+    @contextmanager
+    def lease(self) -> Iterator[ModelHandle]:
+        """请求期间持有当前句柄"""
+        handle = self.acquire()
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    def swap(self, handle: ModelHandle) -> ModelHandle:
+        """原子替换为新句柄（新模型须已加载完成），返回旧句柄"""
+        with self._lock:
+            old, self._handle = self._handle, handle
+            old.retired = True
+            drained = old.refs == 0
+        if drained:
+            self._drained(old)
+        return old
+
+    def _drained(self, handle: ModelHandle):
+        if self.on_drained is not None:
+            try:
+                self.on_drained(handle)
+            except Exception as e:
+                print(f"⚠️ 模型句柄释放回调失败: {e}")
+
+
+class ShadowScorer:
+    """影子模式：候选模型异步重算线上请求的分数并记录差异"""
+
+    def __init__(self, candidate_model, model_type: str, candidate_version: Optional[int] = None,
+                 log_file: Optional[str] = "logs/shadow_scores.jsonl", max_pending: int = 100):
+        """
+        Args:
+            candidate_model: 候选模型（提供 predict_ctr_batch）
+            model_type: 跟随的线上模型类型
+            candidate_version: 候选模型的注册表版本
+            log_file: 差异日志（JSON Lines），为None时只做统计
+            max_pending: 排队的请求上限，超过时丢弃（不影响线上请求）
+        """
+        self.candidate_model = candidate_model
+        self.model_type = model_type
+        self.candidate_version = candidate_version
+        self.log_file = log_file
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shadow-scorer")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._stats_lock = threading.Lock()
+        self.requests = 0
+        self.dropped = 0
+        self.errors = 0
+        self.items = 0
+        self._sum_delta = 0.0
+        self._sum_abs_delta = 0.0
+        self.max_abs_delta = 0.0
+
+    def submit(self, features_list: List[Dict[str, Any]], primary_scores: List[float],
+               primary_version: Optional[int] = None) -> bool:
+        """提交一次线上请求（非阻塞）"""
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.dropped += 1
+            return False
+        try:
+            self._executor.submit(self._score, list(features_list), list(primary_scores), primary_version)
+            return True
+        except RuntimeError:
+            # 已关闭
+            self._slots.release()
+            return False
+
+    def _score(self, features_list: List[Dict[str, Any]], primary_scores: List[float],
+               primary_version: Optional[int]):
+        try:
+            shadow_scores = np.asarray(self.candidate_model.predict_ctr_batch(features_list), dtype=np.float64)
+            deltas = shadow_scores - np.asarray(primary_scores, dtype=np.float64)
+            with self._stats_lock:
+                self.requests += 1
+                self.items += len(deltas)
+                self._sum_delta += float(deltas.sum())
+                self._sum_abs_delta += float(np.abs(deltas).sum())
+                self.max_abs_delta = max(self.max_abs_delta, float(np.abs(deltas).max(initial=0.0)))
+            if self.log_file:
+                record = {
+                    'time': datetime.now().isoformat(),
+                    'model_type': self.model_type,
+                    'primary_version': primary_version,
+                    'candidate_version': self.candidate_version,
+                    'items': len(deltas),
+                    'mean_delta': round(float(deltas.mean()), 6) if len(deltas) else 0.0,
+                    'max_abs_delta': round(float(np.abs(deltas).max(initial=0.0)), 6),
+                    'doc_ids': [item.get('doc_id') for item in features_list],
+                    'deltas': [round(float(d), 6) for d in deltas],
+                }
+                directory = os.path.dirname(self.log_file)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.log_file, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except Exception as e:
+            with self._stats_lock:
+                self.errors += 1
+            print(f"⚠️ 影子模型打分失败: {e}")
+        finally:
+            self._slots.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                'model_type': self.model_type,
+                'candidate_version': self.candidate_version,
+                'requests': self.requests,
+                'items': self.items,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'mean_delta': self._sum_delta / self.items if self.items else 0.0,
+                'mean_abs_delta': self._sum_abs_delta / self.items if self.items else 0.0,
+                'max_abs_delta': self.max_abs_delta,
+            }
+
+    def close(self, wait: bool = True):
+        """停止影子打分（wait=True 时等待排队的请求完成）"""
+        self._executor.shutdown(wait=wait)
@@ -2,25 +2,50 @@ import os
 import json
 import pickle
 from typing import Dict, Any, Optional, List
+from contextlib import contextmanager
 from datetime import datetime
+import numpy as np
 import pandas as pd
 from .training_tab.ctr_model import CTRModel
+from .training_tab.online_ctr_model import CURSOR_DATA_SERVICE, OnlineCTRModel
+from .training_worker import TrainingWorkerProcess, list_checkpoints
+from .training_tab.model_artifact import ARTIFACT_EXT, LEGACY_EXT, artifact_files, metadata_path, resolve_model_file
+from .model_registry import ModelHandle, ModelRegistry, ModelSlot, ShadowScorer
 from .training_tab.ctr_config import CTRSampleConfig, CTRModelConfig
+from .query_cache import get_query_cache
 from flask import Flask, request, jsonify
 import threading
 import time
 
+# 预热用的合成请求（走一遍完整的特征流水线和模型推理）
+WARMUP_FEATURES = {'query': '模型预热', 'doc_id': 'warmup', 'position': 1, 'score': 0.5, 'summary': '模型预热请求'}
+
 
 class ModelService:
     """模型服务：负责模型训练、配置管理、模型文件等"""
     
-    def __init__(self, model_file: str = None):
+    def __init__(self, model_file: str = None, lazy_load: bool = False):
+        """
+        Args:
+            model_file: 默认LR模型文件
+            lazy_load: 构造时不加载模型文件，首次使用或调用 warm_up 时再加载
+        """
         if model_file is None:
-            model_file = os.path.join(os.getcwd(), "models", "ctr_model.pkl")
+            model_file = os.path.join(os.getcwd(), "models", "ctr_model.npz")
         self.model_file = model_file
-        self.ctr_model = CTRModel()  # 默认使用LR模型
-        self.current_model_type = "logistic_regression"
-        self.model_instances = {}  # 存储不同类型的模型实例
+        self.current_model_type = "logistic_regression"  # 默认使用LR模型
+        # 每种模型类型一个上线槽位：替换模型只交换引用，进行中的请求在旧版本上完成
+        self._slots: Dict[str, ModelSlot] = {}
+        self._slots_lock = threading.Lock()  # 只串行化槽位的创建
+        self._load_lock = threading.RLock()
+        self._pending_load = False
+        self._loading_thread = None
+        self._install_model("logistic_regression", CTRModel())
+        
+        # 模型版本清单（版本、指标、特征流水线指纹、文件校验和）
+        self.registry = ModelRegistry(os.path.join(os.getcwd(), "models", "model_registry.json"))
+        self.last_training_result = None  # 最近一次训练的指标，注册版本时写入清单
+        self.shadow_scorer = None  # 影子模式的候选模型打分器
         
         # 在线学习相关配置
         self.online_learning_enabled = False  # 在线学习开关
@@ -32,47 +57,203 @@ class ModelService:
         self.online_training_in_progress = False  # 是否正在训练
         self.last_online_training_time = None  # 上次在线训练时间
         self.online_checkpoint_counter = 0  # 在线checkpoint计数器
+        self.online_learner = None  # 增量学习的LR模型（首次增量更新时创建）
+        self.online_label_delay_seconds = 60  # 展示后等待点击回流的时间，超过后才用于增量更新
         
-        self._load_model()
+        # 后台训练进程与checkpoint热加载
+        self.training_worker = None  # TrainingWorkerProcess，启用在线学习时启动
+        self.checkpoint_poll_interval = 5.0  # 检查新checkpoint的间隔（秒）
+        self._checkpoint_watcher = None
+        self._watcher_stop = threading.Event()
+        
+        # 预热状态：warm_up 完成后服务才报告就绪
+        self.ready = False
+        self.warmup_report: Dict[str, Any] = {}
+        
+        self._pending_load = True
+        if not lazy_load:
+            self._ensure_loaded()
         
         # Flask API 服务相关
         self.flask_app = None
         self.api_running = False
     
+    @property
+    def ctr_model(self):
+        """当前上线的模型（赋值等同于原子替换）"""
+        self._ensure_loaded()
+        return self._slots[self.current_model_type].current.model
+    
+    @ctr_model.setter
+    def ctr_model(self, model):
+        self._install_model(self.current_model_type, model)
+    
+    @property
+    def model_instances(self) -> Dict[str, Any]:
+        """各模型类型当前上线的实例"""
+        return {model_type: slot.current.model for model_type, slot in self._slots.items()}
+    
+    def _install_model(self, model_type: str, model, version: Optional[int] = None):
+        """上线已加载完成的模型：原子替换槽位中的句柄，不阻塞正在进行的预测
+        
+        Args:
+            model_type: 模型类型
+            model: 已加载/训练完成的模型实例
+            version: 注册表中的版本号
+        """
+        # 延迟加载的模型文件不能在之后覆盖这次安装的模型
+        self._ensure_loaded()
+        handle = ModelHandle(model, model_type, version)
+        slot = self._slots.get(model_type)
+        if slot is None:
+            with self._slots_lock:
+                slot = self._slots.get(model_type)
+                if slot is None:
+                    # 写时复制，读取方看到的字典始终完整
+                    slots = dict(self._slots)
+                    slots[model_type] = ModelSlot(handle, on_drained=self._on_model_drained)
+                    self._slots = slots
+        if slot is not None:
+            slot.swap(handle)
+        if version is not None and getattr(self, 'registry', None) is not None:
+            self.registry.set_active(model_type, version)
+        self._invalidate_query_cache()
+    
+    @staticmethod
+    def _on_model_drained(handle: ModelHandle):
+        if handle.version is not None:
+            print(f"♻️ 模型 {handle.model_type} v{handle.version} 已无进行中的请求，旧版本释放")
+    
+    def _model_version(self, model_path: str, model_type: str, source: str,
+                       checkpoint: Optional[int] = None) -> Optional[int]:
+        """模型文件对应的注册表版本：文件与清单一致时沿用，否则（旧文件或被外部修改）重新注册"""
+        model_path = resolve_model_file(model_path) or model_path
+        entry = self.registry.find_by_path(model_path)
+        if entry is not None and self.registry.verify(entry):
+            return entry['version']
+        if entry is not None:
+            print(f"⚠️ 模型文件与注册表校验和不一致，重新注册: {model_path}")
+        entry = self.registry.register(model_type, model_path, source=source, checkpoint=checkpoint)
+        return entry['version'] if entry else None
+    
+    @contextmanager
+    def acquire_model(self, model_type: Optional[str] = None):
+        """请求期间持有某类型当前上线模型的句柄（替换模型后旧句柄仍可用到请求结束）"""
+        model_type = model_type or self.current_model_type
+        self._ensure_loaded()
+        if model_type not in self._slots:
+            self.create_model_instance(model_type)
+        with self._slots[model_type].lease() as handle:
+            yield handle
+    
     def _ensure_model_directories(self):
         """确保在线和离线模型目录存在"""
         os.makedirs(self.online_model_base_dir, exist_ok=True)
         os.makedirs(self.offline_model_base_dir, exist_ok=True)
     
+    def _ensure_loaded(self):
+        """延迟加载模式下，首次使用模型时加载模型文件（其他线程等待加载完成）"""
+        if self._pending_load and self._loading_thread != threading.get_ident():
+            with self._load_lock:
+                if self._pending_load:
+                    self._loading_thread = threading.get_ident()
+                    try:
+                        self._load_model()
+                    finally:
+                        self._pending_load = False
+                        self._loading_thread = None
+    
+    def registered_model_types(self) -> List[str]:
+        """需要上线的模型类型：当前模型、LR以及注册表中有版本的类型"""
+        types = {self.current_model_type, 'logistic_regression'}
+        types.update(entry['model_type'] for entry in self.registry.list_versions())
+        return sorted(types)
+    
+    def warm_up(self, model_types: Optional[List[str]] = None) -> Dict[str, Any]:
+        """加载并预热模型，完成后服务报告就绪
+        
+        预热用一条合成请求调用每个已训练模型的批量预测，提前完成分词词典加载、特征流水线缓存、
+        数值库初始化等首次调用才发生的开销，避免落到第一个真实请求上。
+        
+        Args:
+            model_types: 要预热的模型类型，默认 registered_model_types()
+        
+        Returns:
+            Dict: 模型类型 -> {loaded, trained, version, seconds} 或 {loaded: False, error}
+        """
+        with self._load_lock:
+            start = time.time()
+            self._ensure_loaded()
+            report = {}
+            for model_type in model_types or self.registered_model_types():
+                type_start = time.time()
+                try:
+                    model = self.create_model_instance(model_type)
+                    if model.is_trained:
+                        model.predict_ctr_batch([dict(WARMUP_FEATURES)])
+                    report[model_type] = {
+                        'loaded': True,
+                        'trained': bool(model.is_trained),
+                        'version': self.get_model_version(model_type),
+                        'seconds': round(time.time() - type_start, 3),
+                    }
+                except Exception as e:
+                    report[model_type] = {'loaded': False, 'error': str(e)}
+            self.warmup_report = report
+            self.ready = True
+            print(f"🔥 模型预热完成 ({time.time() - start:.2f}s): "
+                  + ", ".join(f"{t}{'' if r.get('loaded') else '(失败)'}" for t, r in report.items()))
+            return report
+    
+    def start_warm_up(self) -> threading.Thread:
+        """在后台线程中预热（服务先启动监听，预热完成前健康检查返回未就绪）"""
+        thread = threading.Thread(target=self.warm_up, daemon=True, name="model-warmup")
+        thread.start()
+        return thread
+    
+    def is_ready(self) -> bool:
+        """模型是否已加载并预热"""
+        return self.ready
+    
     def _load_model(self):
         """加载模型（优先加载在线模型，如果不存在则加载离线模型）"""
         # 优先尝试加载最新的在线模型
         latest_online_checkpoint = self._get_latest_online_checkpoint()
         if latest_online_checkpoint:
             online_model_path = self._get_online_model_path(checkpoint_num=latest_online_checkpoint)
-            if os.path.exists(online_model_path):
-                if self.ctr_model.load_model(online_model_path):
+            if resolve_model_file(online_model_path):
+                model = CTRModel()
+                if model.load_model(online_model_path):
+                    version = self._model_version(online_model_path, self.current_model_type, 'online',
+                                                  latest_online_checkpoint)
+                    self._install_model(self.current_model_type, model, version)
                     print(f"✅ 在线CTR模型加载成功 (checkpoint {latest_online_checkpoint}): {online_model_path}")
                     self.model_file = online_model_path
                     self.online_checkpoint_counter = latest_online_checkpoint
                     return
         
-        # 如果在线模型不存在，尝试加载离线模型
-        offline_model_path = self._get_offline_model_path()
-        if os.path.exists(offline_model_path):
-            if self.ctr_model.load_model(offline_model_path):
-                print(f"✅ 离线CTR模型加载成功: {offline_model_path}")
-                self.model_file = offline_model_path
+        # 如果在线模型不存在，尝试加载离线模型；都不存在时尝试加载默认路径的模型（向后兼容）
+        for model_path in (self._get_offline_model_path(), self.model_file):
+            model = CTRModel()
+            if resolve_model_file(model_path) and model.load_model(model_path):
+                self._install_model(self.current_model_type, model,
+                                    self._model_version(model_path, self.current_model_type, 'offline'))
+                print(f"✅ CTR模型加载成功: {model_path}")
+                self.model_file = model_path
                 return
         
-        # 如果都不存在，尝试加载默认路径的模型（向后兼容）
-        if self.ctr_model.load_model(self.model_file):
-            print(f"✅ CTR模型加载成功: {self.model_file}")
-        else:
-            print(f"⚠️ CTR模型未找到，将使用未训练状态: {self.model_file}")
+        print(f"⚠️ CTR模型未找到，将使用未训练状态: {self.model_file}")
     
     def _get_latest_online_checkpoint(self) -> Optional[int]:
-        """获取最新的在线checkpoint编号"""
+        """获取最新的在线checkpoint编号（以注册表为准，没有注册记录的旧目录按文件名解析）"""
+        checkpoints = [entry['checkpoint'] for entry in self.registry.list_versions(source='online')
+                       if entry.get('checkpoint') is not None and all(os.path.exists(p) for p in entry['files'])]
+        if checkpoints:
+            return max(checkpoints)
+        return self._scan_online_checkpoints()
+    
+    def _scan_online_checkpoints(self) -> Optional[int]:
+        """按文件名解析在线checkpoint编号（注册表引入前的目录）"""
         try:
             if not os.path.exists(self.online_model_base_dir):
                 return None
@@ -82,13 +263,14 @@ class ModelService:
             checkpoint_nums = []
             
             for file in files:
-                # 匹配 ctr_model_ckpt_N.pkl 或 wide_deep_ctr_model_ckpt_N.h5
-                if 'ckpt_' in file and (file.endswith('.pkl') or file.endswith('.h5')):
+                # 匹配 ctr_model_ckpt_N.npz（旧版为.pkl）或 wide_deep_ctr_model_ckpt_N.h5
+                stem, ext = os.path.splitext(file)
+                if 'ckpt_' in stem and ext in (ARTIFACT_EXT, LEGACY_EXT, '.h5'):
                     try:
                         # 提取checkpoint编号
-                        parts = file.split('ckpt_')
+                        parts = stem.split('ckpt_')
                         if len(parts) == 2:
-                            num_str = parts[1].replace('.pkl', '').replace('.h5', '')
+                            num_str = parts[1]
                             checkpoint_nums.append(int(num_str))
                     except ValueError:
                         continue
@@ -111,7 +293,7 @@ class ModelService:
             if not os.path.exists(self.online_model_base_dir):
                 return
             
-            # 查找所有在线checkpoint文件（包括.pkl和.h5文件）
+            # 查找所有在线checkpoint文件（包括.npz/.json、旧的.pkl和.h5文件）
             files = os.listdir(self.online_model_base_dir)
             checkpoint_files = {}  # {checkpoint_num: [file_paths]}
             
@@ -121,7 +303,7 @@ class ModelService:
                         # 提取checkpoint编号
                         parts = file.split('ckpt_')
                         if len(parts) == 2:
-                            num_str = parts[1].replace('.pkl', '').replace('.h5', '').replace('_info.json', '')
+                            num_str = os.path.splitext(parts[1])[0].replace('_info', '')
                             checkpoint_num = int(num_str)
                             
                             if checkpoint_num not in checkpoint_files:
@@ -147,6 +329,7 @@ class ModelService:
                                 print(f"❌ 删除文件失败 {file_path}: {e}")
                 
                 print(f"✅ 清理完成，保留最近{max_checkpoints}个在线checkpoint")
+                self.registry.prune_missing()
         
         except Exception as e:
             print(f"❌ 清理旧checkpoint失败: {e}")
@@ -166,7 +349,7 @@ class ModelService:
         if model_type == 'wide_and_deep':
             return os.path.join(self.online_model_base_dir, f"wide_deep_ctr_model_ckpt_{checkpoint_num}.h5")
         else:
-            return os.path.join(self.online_model_base_dir, f"ctr_model_ckpt_{checkpoint_num}.pkl")
+            return os.path.join(self.online_model_base_dir, f"ctr_model_ckpt_{checkpoint_num}{ARTIFACT_EXT}")
     
     def _get_offline_model_path(self, model_type: str = None) -> str:
         """获取离线模型路径"""
@@ -174,15 +357,110 @@ class ModelService:
         if model_type == 'wide_and_deep':
             return os.path.join(self.offline_model_base_dir, "wide_deep_ctr_model.h5")
         else:
-            return os.path.join(self.offline_model_base_dir, "ctr_model.pkl")
+            return os.path.join(self.offline_model_base_dir, f"ctr_model{ARTIFACT_EXT}")
     
-    def enable_online_learning(self, enabled: bool = True):
-        """启用/禁用在线学习"""
+    def enable_online_learning(self, enabled: bool = True, use_worker: bool = True):
+        """启用/禁用在线学习
+        
+        Args:
+            enabled: 是否启用
+            use_worker: 启用时在后台训练进程中训练（否则在服务进程内按阈值触发增量更新）
+        """
         self.online_learning_enabled = enabled
+        if enabled and use_worker:
+            self.start_training_worker()
+        elif not enabled:
+            self.stop_training_worker()
         status = "启用" if enabled else "禁用"
         print(f"🔄 在线学习已{status}")
         return enabled
     
+    def start_training_worker(self, **worker_config) -> bool:
+        """启动后台训练进程和checkpoint热加载线程
+        
+        Args:
+            worker_config: 传给 TrainingWorker 的参数（覆盖默认值）
+        """
+        if self.is_training_worker_running():
+            return True
+        config = {
+            'checkpoint_dir': self.online_model_base_dir,
+            'offline_model_files': (self._get_offline_model_path('logistic_regression'),
+                                    os.path.join(os.getcwd(), "models", "ctr_model.npz")),
+            'label_delay_seconds': self.online_label_delay_seconds,
+            'registry_path': self.registry.manifest_path,
+        }
+        config.update(worker_config)
+        self.training_worker = TrainingWorkerProcess(**config)
+        if not self.training_worker.start():
+            self.training_worker = None
+            return False
+        self._start_checkpoint_watcher()
+        print("✅ 后台训练进程已启动")
+        return True
+    
+    def stop_training_worker(self):
+        """停止后台训练进程和checkpoint热加载线程"""
+        self._watcher_stop.set()
+        if self._checkpoint_watcher is not None:
+            self._checkpoint_watcher.join(self.checkpoint_poll_interval + 1)
+            self._checkpoint_watcher = None
+        if self.training_worker is not None:
+            self.training_worker.stop()
+            self.training_worker = None
+            print("🛑 后台训练进程已停止")
+    
+    def is_training_worker_running(self) -> bool:
+        """后台训练进程是否在运行"""
+        return self.training_worker is not None and self.training_worker.is_alive()
+    
+    def submit_training_event(self, event: Dict[str, Any]) -> bool:
+        """把CTR事件投递给后台训练进程（非阻塞，未启动时忽略）"""
+        worker = self.training_worker
+        return worker.submit(event) if worker is not None else False
+    
+    def set_online_batch_size(self, batch_size: int):
+        """设置后台训练进程每次训练的最少样本数"""
+        self.submit_training_event({'op': 'config', 'min_batch_size': batch_size})
+    
+    def _start_checkpoint_watcher(self):
+        if self._checkpoint_watcher is not None and self._checkpoint_watcher.is_alive():
+            return
+        self._watcher_stop = threading.Event()
+        self._checkpoint_watcher = threading.Thread(target=self._watch_checkpoints, args=(self._watcher_stop,),
+                                                    name="ctr-checkpoint-watcher", daemon=True)
+        self._checkpoint_watcher.start()
+    
+    def _watch_checkpoints(self, stop_event: threading.Event):
+        """定期检查训练进程是否存活、是否发布了新checkpoint"""
+        while not stop_event.wait(self.checkpoint_poll_interval):
+            try:
+                self.reload_latest_checkpoint()
+                worker = self.training_worker
+                if worker is not None:
+                    worker.ensure_running()
+            except Exception as e:
+                print(f"❌ checkpoint热加载检查失败: {e}")
+    
+    def reload_latest_checkpoint(self) -> bool:
+        """注册表中有更新的LR在线版本时，校验文件后热加载"""
+        if self.current_model_type != 'logistic_regression':
+            return False
+        entry = self.registry.latest('logistic_regression', source='online')
+        if entry is None:
+            # 注册表引入前的训练进程只写文件
+            checkpoints = list_checkpoints(self.online_model_base_dir)
+            if not checkpoints or checkpoints[-1] <= self.online_checkpoint_counter:
+                return False
+            return self._hot_reload_model(checkpoints[-1])
+        if entry.get('checkpoint') is None or entry['checkpoint'] <= self.online_checkpoint_counter:
+            return False
+        if not self.registry.verify(entry):
+            print(f"⚠️ 在线checkpoint v{entry['version']} 校验和不一致，跳过热加载")
+            self.online_checkpoint_counter = entry['checkpoint']
+            return False
+        return self._hot_reload_model(entry['checkpoint'], entry['version'])
+    
     def is_online_learning_enabled(self) -> bool:
         """检查在线学习是否启用"""
         return self.online_learning_enabled
@@ -190,32 +468,24 @@ class ModelService:
     def create_model_instance(self, model_type: str):
         """创建指定类型的模型实例"""
         try:
-            if model_type in self.model_instances:
-                return self.model_instances[model_type]
+            self._ensure_loaded()
+            slot = self._slots.get(model_type)
+            if slot is not None:
+                return slot.current.model
             
-            model_config = CTRModelConfig.get_model_config(model_type)
-            if not model_config:
-                raise ValueError(f"不支持的模型类型: {model_type}")
-            
-            if model_type == 'logistic_regression':
-                from .training_tab.ctr_model import CTRModel
-                model_instance = CTRModel()
-            elif model_type == 'wide_and_deep':
-                from .training_tab.ctr_wide_deep_model import WideAndDeepCTRModel
-                model_instance = WideAndDeepCTRModel()
-            else:
-                raise ValueError(f"未实现的模型类型: {model_type}")
+            model_instance = self._new_model(model_type)
             
             # 尝试加载对应的模型文件
             if model_type == 'logistic_regression':
-                model_file = os.path.join(os.getcwd(), "models", "ctr_model.pkl")  # LR使用绝对路径
+                model_file = os.path.join(os.getcwd(), "models", "ctr_model.npz")  # LR使用绝对路径
             elif model_type == 'wide_and_deep':
                 model_file = os.path.join(os.getcwd(), "models", "wide_deep_ctr_model")
             else:
-                model_file = os.path.join(os.getcwd(), "models", f"{model_type}_ctr_model.pkl")
+                model_file = os.path.join(os.getcwd(), "models", f"{model_type}_ctr_model{ARTIFACT_EXT}")
             
             model_instance.load_model(model_file)
-            self.model_instances[model_type] = model_instance
+            version = self._model_version(model_file, model_type, 'offline') if model_instance.is_trained else None
+            self._install_model(model_type, model_instance, version)
             
             return model_instance
             
@@ -225,11 +495,31 @@ class ModelService:
             from .training_tab.ctr_model import CTRModel
             return CTRModel()
     
+    @staticmethod
+    def _new_model(model_type: str):
+        """创建指定类型的空模型实例"""
+        model_config = CTRModelConfig.get_model_config(model_type)
+        if not model_config:
+            raise ValueError(f"不支持的模型类型: {model_type}")
+        
+        if model_type == 'logistic_regression':
+            return CTRModel()
+        elif model_type == 'wide_and_deep':
+            from .training_tab.ctr_wide_deep_model import WideAndDeepCTRModel
+            return WideAndDeepCTRModel()
+        raise ValueError(f"未实现的模型类型: {model_type}")
+    
+    def _invalidate_query_cache(self):
+        """模型变更后使已缓存的排序结果失效"""
+        get_query_cache().bump_model_version()
+    
     def switch_model(self, model_type: str):
         """切换到指定类型的模型"""
         try:
-            self.ctr_model = self.create_model_instance(model_type)
+            self.create_model_instance(model_type)
+            # 槽位已就绪，切换只改一个引用
             self.current_model_type = model_type
+            self._invalidate_query_cache()
             print(f"✅ 已切换到模型: {CTRModelConfig.get_model_config(model_type).get('name', model_type)}")
             return True
         except Exception as e:
@@ -251,29 +541,36 @@ class ModelService:
             training_mode = "在线" if is_online else "离线"
             print(f"🚀 开始{training_mode}训练CTR模型...")
             
+            # 在新实例上训练，训练期间线上继续使用当前模型
+            model = self._new_model(self.current_model_type)
+            
             # 在线训练时，检查是否已有模型可以继续训练
             if is_online:
                 # 尝试加载最新的在线模型作为基础
                 latest_checkpoint = self._get_latest_online_checkpoint()
                 if latest_checkpoint:
                     online_model_path = self._get_online_model_path(checkpoint_num=latest_checkpoint)
-                    if os.path.exists(online_model_path):
+                    if resolve_model_file(online_model_path):
                         print(f"📥 加载现有在线模型作为基础 (checkpoint {latest_checkpoint}): {online_model_path}")
-                        self.ctr_model.load_model(online_model_path)
+                        model.load_model(online_model_path)
                         self.online_checkpoint_counter = latest_checkpoint
             
-            # 获取训练数据
-            samples = data_service.get_all_samples()
-            if not samples:
+            # 获取训练数据（直接读取列式数据）
+            samples = data_service.get_samples_dataframe()
+            if samples.empty:
                 return {
                     'success': False,
                     'error': '没有CTR数据用于训练'
                 }
             
             # 训练模型
-            result = self.ctr_model.train(samples)
+            result = model.train(samples)
             
             if result.get('success', False):
+                # 训练完成后再原子替换线上模型
+                self.last_training_result = result
+                self._install_model(self.current_model_type, model)
+                
                 # 在线训练时，先更新checkpoint计数器
                 if is_online:
                     self.online_checkpoint_counter += 1
@@ -286,8 +583,8 @@ class ModelService:
                     self.last_online_training_time = datetime.now()
                     # 清理旧的checkpoint，只保留最近5个
                     self._cleanup_old_online_checkpoints(max_checkpoints=5)
-                    # 自动热更新：重新加载模型
-                    self._hot_reload_model()
+                    # 增量学习从新的全量模型重新热启动
+                    self.online_learner = None
                 
                 print(f"✅ {training_mode}模型训练完成并保存")
             else:
@@ -303,19 +600,26 @@ class ModelService:
                 'error': error_msg
             }
     
-    def _hot_reload_model(self):
-        """热更新模型：重新加载最新的在线模型"""
+    def _hot_reload_model(self, checkpoint_num: Optional[int] = None, version: Optional[int] = None):
+        """热更新模型：在新实例中加载在线checkpoint，加载完成后再替换线上模型（不中断预测）
+        
+        Args:
+            checkpoint_num: checkpoint编号，默认为当前计数器
+            version: 注册表版本号，默认按文件查找
+        """
         try:
-            # 获取最新的checkpoint路径
-            online_model_path = self._get_online_model_path(checkpoint_num=self.online_checkpoint_counter)
-            if os.path.exists(online_model_path):
-                # 重新创建模型实例并加载
-                self.ctr_model = CTRModel()
-                if self.ctr_model.load_model(online_model_path):
-                    print(f"🔄 模型热更新成功 (checkpoint {self.online_checkpoint_counter}): {online_model_path}")
+            checkpoint_num = self.online_checkpoint_counter if checkpoint_num is None else checkpoint_num
+            online_model_path = self._get_online_model_path(checkpoint_num=checkpoint_num)
+            if resolve_model_file(online_model_path):
+                model = self._new_model(self.current_model_type)
+                if model.load_model(online_model_path):
+                    if version is None:
+                        version = self._model_version(online_model_path, self.current_model_type, 'online', checkpoint_num)
+                    # 原子替换槽位中的句柄，正在进行的预测继续使用旧模型
+                    self._install_model(self.current_model_type, model, version)
+                    self.online_checkpoint_counter = checkpoint_num
+                    print(f"🔄 模型热更新成功 (checkpoint {checkpoint_num}, v{version}): {online_model_path}")
                     self.model_file = online_model_path
-                    # 清除模型实例缓存，强制重新加载
-                    self.model_instances.clear()
                     return True
             return False
         except Exception as e:
@@ -336,6 +640,13 @@ class ModelService:
                 'skipped': True
             }
         
+        if self.is_training_worker_running():
+            return {
+                'success': False,
+                'error': '在线训练由后台训练进程负责',
+                'skipped': True
+            }
+        
         if self.online_training_in_progress:
             return {
                 'success': False,
@@ -344,20 +655,11 @@ class ModelService:
             }
         
         try:
-            # 检查是否有足够的新数据
-            samples = data_service.get_all_samples()
-            if len(samples) < min_new_samples:
-                return {
-                    'success': False,
-                    'error': f'数据量不足，需要至少{min_new_samples}条记录',
-                    'skipped': True
-                }
-            
             # 标记训练进行中
             self.online_training_in_progress = True
             
-            # 执行在线训练
-            result = self.train_model(data_service, is_online=True)
+            # 只用新样本增量更新（不再全量重训）
+            result = self.update_online_model(data_service, min_new_samples=min_new_samples)
             
             # 标记训练完成
             self.online_training_in_progress = False
@@ -373,6 +675,107 @@ class ModelService:
                 'error': error_msg
             }
     
+    def update_online_model(self, data_service, min_new_samples: int = 10) -> Dict[str, Any]:
+        """用上次更新之后的新样本增量更新LR模型，并保存为新的在线checkpoint
+        
+        Args:
+            data_service: 数据服务实例（提供 get_samples_range 或 get_all_samples）
+            min_new_samples: 可用的新样本少于该数量时跳过
+        """
+        if self.current_model_type != 'logistic_regression':
+            return {
+                'success': False,
+                'error': '增量学习只支持LR模型',
+                'skipped': True
+            }
+        
+        learner = self._get_online_learner(data_service)
+        if learner.samples_seen > self._count_samples(data_service):
+            # 数据被清空或替换，从头消费数据流（保留模型权重）
+            print("⚠️ 样本数少于已学习的样本数，重置增量学习游标")
+            learner.seed_history([])
+        
+        # 只读取游标之后的一个窗口，单次更新的开销与历史数据量无关
+        start = learner.samples_seen
+        window = self._get_samples_window(data_service, start, start + learner.max_batch_size)
+        batch = window.iloc[:self._label_ready_count(window)]
+        if len(batch) < min_new_samples:
+            return {
+                'success': False,
+                'error': f'新样本不足，需要至少{min_new_samples}条，当前可用{len(batch)}条',
+                'skipped': True
+            }
+        
+        result = learner.partial_fit(batch)
+        if not result.get('success', False):
+            print(f"❌ 在线模型增量更新失败: {result.get('error', '未知错误')}")
+            return result
+        
+        self.online_checkpoint_counter += 1
+        checkpoint_path = self._get_online_model_path('logistic_regression')
+        learner.save_model(checkpoint_path)
+        self._write_model_info(checkpoint_path, 'logistic_regression', is_online=True)
+        entry = self.registry.register('logistic_regression', checkpoint_path, source='online',
+                                       checkpoint=self.online_checkpoint_counter, metrics=result,
+                                       pipeline_hash=learner.pipeline.fingerprint())
+        # 线上模型换成更新后权重的副本，在线学习器继续累积状态
+        self._install_model('logistic_regression', learner.serving_copy(), entry['version'] if entry else None)
+        self.model_file = checkpoint_path
+        self.last_online_training_time = datetime.now()
+        self._cleanup_old_online_checkpoints(max_checkpoints=5)
+        self._invalidate_query_cache()
+        print(f"✅ 在线模型增量更新完成 (checkpoint {self.online_checkpoint_counter}): "
+              f"{result['samples']}条新样本, 损失 {result['log_loss']}")
+        return result
+    
+    @staticmethod
+    def _count_samples(data_service) -> int:
+        if hasattr(data_service, 'get_sample_count'):
+            return data_service.get_sample_count()
+        return len(data_service.get_all_samples())
+    
+    @staticmethod
+    def _get_samples_window(data_service, start: int, end: int) -> pd.DataFrame:
+        """按写入顺序的 [start, end) 区间样本"""
+        if hasattr(data_service, 'get_samples_range'):
+            return pd.DataFrame(data_service.get_samples_range(start, end))
+        return pd.DataFrame(data_service.get_all_samples()[start:end])
+    
+    def _get_online_learner(self, data_service) -> OnlineCTRModel:
+        """获取增量学习器：优先从最新在线checkpoint恢复，否则从当前LR模型热启动"""
+        if self.online_learner is not None:
+            return self.online_learner
+        
+        learner = OnlineCTRModel()
+        latest_checkpoint = self._get_latest_online_checkpoint()
+        checkpoint_path = self._get_online_model_path('logistic_regression', latest_checkpoint) if latest_checkpoint else None
+        if checkpoint_path and os.path.exists(checkpoint_path) and learner.load_model(checkpoint_path):
+            print(f"📥 增量学习从在线checkpoint恢复 (checkpoint {latest_checkpoint})")
+            self.online_checkpoint_counter = max(self.online_checkpoint_counter, latest_checkpoint)
+        elif learner.warm_start(self.ctr_model):
+            print("📥 增量学习从当前LR模型热启动")
+        else:
+            learner.reset()
+            learner.cursor_source = CURSOR_DATA_SERVICE
+            print("🆕 增量学习从零开始")
+        
+        if learner.samples_seen is None or learner.cursor_source != CURSOR_DATA_SERVICE:
+            # 全量训练得到的模型、训练进程发布的checkpoint（游标不是样本位置）视为已学过现有的全部样本，
+            # 重新初始化历史计数并把游标对齐到样本末尾（只在此时读取一次全量数据）
+            learner.seed_history(self._get_samples_window(data_service, 0, None))
+            learner.cursor_source = CURSOR_DATA_SERVICE
+        self.online_learner = learner
+        return learner
+    
+    def _label_ready_count(self, window: pd.DataFrame) -> int:
+        """窗口开头连续的、展示时间已超过点击回流等待时间的样本数"""
+        if window.empty or 'timestamp' not in window.columns or self.online_label_delay_seconds <= 0:
+            return len(window)
+        timestamps = pd.to_datetime(window['timestamp'], errors='coerce', format='ISO8601')
+        cutoff = pd.Timestamp(datetime.now()) - pd.Timedelta(seconds=self.online_label_delay_seconds)
+        not_ready = ~(timestamps.isna() | (timestamps <= cutoff)).to_numpy()
+        return int(np.argmax(not_ready)) if not_ready.any() else len(window)
+    
     def save_model(self, filepath: Optional[str] = None, model_type: Optional[str] = None, is_online: bool = None) -> bool:
         """保存模型
         
@@ -400,26 +803,22 @@ class ModelService:
             os.makedirs(os.path.dirname(save_path), exist_ok=True)
             
             # 保存模型
-            self.ctr_model.save_model(save_path)
-            
-            # 保存模型信息
-            info_suffix = '_info.json' if model_type != 'wide_and_deep' else '_info.json'
-            info_path = save_path.replace('.pkl', info_suffix).replace('.h5', info_suffix)
-            
-            model_config = CTRModelConfig.get_model_config(model_type)
-            model_info = {
-                'model_file': save_path,
-                'save_time': datetime.now().isoformat(),
-                'model_type': model_config.get('name', model_type),
-                'model_class': model_config.get('class', 'Unknown'),
-                'is_online': is_online if is_online is not None else self.online_learning_enabled,
-                'checkpoint_number': self.online_checkpoint_counter if (is_online or self.online_learning_enabled) else None,
-                'feature_count': 0,  # 简化处理
-                'training_samples': 0  # 简化处理
-            }
-            
-            with open(info_path, 'w', encoding='utf-8') as f:
-                json.dump(model_info, f, ensure_ascii=False, indent=2)
+            with self.acquire_model(model_type) as handle:
+                model = handle.model
+                model.save_model(save_path)
+                
+                # 保存模型信息，并在注册表中登记新版本
+                self._write_model_info(save_path, model_type, is_online)
+                source = 'online' if (is_online or (is_online is None and self.online_learning_enabled)) else 'offline'
+                pipeline = getattr(model, 'pipeline', None)
+                entry = self.registry.register(
+                    model_type, save_path, source=source,
+                    checkpoint=self.online_checkpoint_counter if source == 'online' else None,
+                    metrics=self.last_training_result,
+                    pipeline_hash=pipeline.fingerprint() if pipeline is not None else None)
+                if entry is not None and handle.version is None:
+                    handle.version = entry['version']
+                    self.registry.set_active(model_type, entry['version'])
             
             model_type_str = "在线" if (is_online or (is_online is None and self.online_learning_enabled)) else "离线"
             print(f"✅ {model_type_str}模型保存成功: {save_path}")
@@ -429,11 +828,38 @@ class ModelService:
             print(f"❌ 保存模型失败: {e}")
             return False
     
+    @staticmethod
+    def _info_path(model_path: str) -> str:
+        """模型信息文件路径（与模型文件同名的 _info.json）"""
+        return os.path.splitext(model_path)[0] + '_info.json'
+    
+    def _write_model_info(self, save_path: str, model_type: str, is_online: Optional[bool]):
+        """保存模型信息文件（与模型文件同名的 _info.json）"""
+        info_path = self._info_path(save_path)
+        
+        model_config = CTRModelConfig.get_model_config(model_type)
+        model_info = {
+            'model_file': save_path,
+            'save_time': datetime.now().isoformat(),
+            'model_type': model_config.get('name', model_type),
+            'model_class': model_config.get('class', 'Unknown'),
+            'is_online': is_online if is_online is not None else self.online_learning_enabled,
+            'checkpoint_number': self.online_checkpoint_counter if (is_online or self.online_learning_enabled) else None,
+            'feature_count': 0,  # 简化处理
+            'training_samples': 0  # 简化处理
+        }
+        
+        with open(info_path, 'w', encoding='utf-8') as f:
+            json.dump(model_info, f, ensure_ascii=False, indent=2)
+    
     def load_model(self, filepath: Optional[str] = None) -> bool:
         """加载模型"""
         try:
             load_path = filepath or self.model_file
-            if self.ctr_model.load_model(load_path):
+            model = self._new_model(self.current_model_type)
+            if model.load_model(load_path):
+                self._install_model(self.current_model_type, model,
+                                    self._model_version(load_path, self.current_model_type, 'offline'))
                 print(f"✅ 模型加载成功: {load_path}")
                 return True
             else:
@@ -445,44 +871,104 @@ class ModelService:
     
     def predict_ctr(self, features: Dict[str, Any], model_type: Optional[str] = None) -> float:
         """预测CTR"""
+        return self.predict_ctr_batch([features], model_type)[0]
+    
+    def predict_ctr_batch(self, features_list: List[Dict[str, Any]], model_type: Optional[str] = None) -> List[float]:
+        """
+        批量预测CTR（同一模型实例、一次特征构建和一次模型调用）
+        
+        Args:
+            features_list: 每项包含 query、doc_id、position、score、summary，可选 timestamp
+            model_type: 模型类型，默认使用当前模型
+        
+        Returns:
+            List[float]: 与输入顺序一致的CTR分数
+        """
+        if not features_list:
+            return []
         try:
-            # 始终使用指定类型的模型实例，确保使用最新训练的模型
-            if model_type:
-                model_instance = self.get_model_instance(model_type)
-            else:
-                # 如果没有指定模型类型，使用当前默认模型类型
-                model_instance = self.get_model_instance(self.current_model_type)
-            
-            if not model_instance.is_trained:
-                return 0.1  # 默认CTR
-            
-            # 使用指定模型的predict_ctr方法
-            query = features.get('query', '')
-            doc_id = features.get('doc_id', '')
-            position = features.get('position', 1)
-            score = features.get('score', 0.0)
-            summary = features.get('summary', '')
-            current_timestamp = features.get('timestamp')  # 获取时间戳参数
-            
-            # 检查模型是否是Wide & Deep模型，如果是则传递时间戳参数
-            if hasattr(model_instance, '__class__') and 'WideAndDeep' in model_instance.__class__.__name__:
-                ctr_score = model_instance.predict_ctr(query, doc_id, position, score, summary, current_timestamp)
-            else:
-                # 对于其他CTR模型（如LR模型），保持原有的调用方式
-                ctr_score = model_instance.predict_ctr(query, doc_id, position, score, summary)
+            model_type = model_type or self.current_model_type
+            # 整个请求持有同一个模型句柄，期间的热替换不影响本次预测
+            with self.acquire_model(model_type) as handle:
+                if not handle.model.is_trained:
+                    return [0.1] * len(features_list)  # 默认CTR
+                scores = [float(score) for score in handle.model.predict_ctr_batch(features_list)]
             
-            return float(ctr_score)
+            shadow = self.shadow_scorer
+            if shadow is not None and shadow.model_type == model_type:
+                shadow.submit(features_list, scores, handle.version)
+            return scores
             
         except Exception as e:
             print(f"❌ CTR预测失败: {e}")
-            return 0.1
+            return [0.1] * len(features_list)
+    
+    def get_model_version(self, model_type: Optional[str] = None) -> Optional[int]:
+        """指定类型当前上线模型在注册表中的版本号"""
+        slot = self._slots.get(model_type or self.current_model_type)
+        return slot.current.version if slot is not None else None
+    
+    def peek_model_handle(self, model_type: str) -> Optional[ModelHandle]:
+        """指定类型当前上线的模型句柄（只读槽位，不触发加载、不等待加载锁，未上线时为None）"""
+        slot = self._slots.get(model_type)
+        return slot.current if slot is not None else None
     
     def get_model_instance(self, model_type: str):
-        """获取指定类型的模型实例"""
-        # 每次都重新创建实例，确保加载最新的模型文件
-        # 这解决了训练后模型不同步的问题
-        self.model_instances[model_type] = self.create_model_instance(model_type)
-        return self.model_instances[model_type]
+        """获取指定类型当前上线的模型实例（训练、热加载后槽位中即为最新模型）"""
+        return self.create_model_instance(model_type)
+    
+    # ---------------- 影子模式 ----------------
+    
+    def enable_shadow(self, version: Optional[int] = None, model_path: Optional[str] = None,
+                      model_type: Optional[str] = None,
+                      log_file: Optional[str] = None) -> bool:
+        """用候选模型对线上流量做影子打分（异步，不影响线上结果）
+        
+        Args:
+            version: 注册表中的候选版本（优先）
+            model_path: 候选模型文件路径（不在注册表中时）
+            model_type: 候选模型类型，默认当前模型类型
+            log_file: 分数差异日志，默认 logs/shadow_scores.jsonl
+        """
+        try:
+            candidate_version = version
+            if version is not None:
+                entry = self.registry.get(version)
+                if entry is None or not self.registry.verify(entry):
+                    print(f"❌ 候选版本不存在或文件校验失败: v{version}")
+                    return False
+                model_type, model_path = entry['model_type'], entry['model_path']
+            model_type = model_type or self.current_model_type
+            if not model_path:
+                print("❌ 需要指定候选版本或模型文件")
+                return False
+            
+            candidate = self._new_model(model_type)
+            if not candidate.load_model(model_path) or not candidate.is_trained:
+                print(f"❌ 候选模型加载失败: {model_path}")
+                return False
+            
+            self.disable_shadow()
+            self.shadow_scorer = ShadowScorer(
+                candidate, model_type, candidate_version,
+                log_file=log_file or os.path.join(os.getcwd(), "logs", "shadow_scores.jsonl"))
+            print(f"🌓 影子模式已启用: {model_type} {f'v{candidate_version}' if candidate_version else model_path}")
+            return True
+        except Exception as e:
+            print(f"❌ 启用影子模式失败: {e}")
+            return False
+    
+    def disable_shadow(self):
+        """关闭影子模式"""
+        shadow, self.shadow_scorer = self.shadow_scorer, None
+        if shadow is not None:
+            shadow.close(wait=False)
+            print("🌓 影子模式已关闭")
+    
+    def get_shadow_stats(self) -> Optional[Dict[str, Any]]:
+        """影子打分统计（未启用时为None）"""
+        shadow = self.shadow_scorer
+        return shadow.get_stats() if shadow is not None else None
     
     def _prepare_features(self, features: Dict[str, Any]) -> Optional[List[float]]:
         """准备特征向量"""
@@ -511,7 +997,7 @@ class ModelService:
     def get_model_info(self) -> Dict[str, Any]:
         """获取模型信息"""
         try:
-            info_path = self.model_file.replace('.pkl', '_info.json')
+            info_path = self._info_path(self.model_file)
             
             if os.path.exists(info_path):
                 with open(info_path, 'r', encoding='utf-8') as f:
@@ -526,10 +1012,15 @@ class ModelService:
                 }
             
             # 添加当前状态
+            handle = self._slots[self.current_model_type].current
+            model_path = resolve_model_file(self.model_file)
             model_info.update({
+                'model_version': handle.version,
+                'shadow': self.get_shadow_stats(),
+                'ready': self.ready,
                 'is_trained': self.ctr_model.is_trained,
-                'model_exists': os.path.exists(self.model_file),
-                'last_modified': datetime.fromtimestamp(os.path.getmtime(self.model_file)).isoformat() if os.path.exists(self.model_file) else None
+                'model_exists': model_path is not None,
+                'last_modified': datetime.fromtimestamp(os.path.getmtime(model_path)).isoformat() if model_path else None
             })
             
             return model_info
@@ -588,13 +1079,19 @@ class ModelService:
             
             os.makedirs(os.path.dirname(export_path), exist_ok=True)
             
-            # 复制模型文件
+            # 复制模型文件（.npz 与 .json 元数据）
             import shutil
-            shutil.copy2(self.model_file, export_path)
+            model_path = resolve_model_file(self.model_file)
+            if model_path is None or model_path.endswith(LEGACY_EXT):
+                # 旧格式或尚未保存：按当前格式重新保存
+                self.ctr_model.save_model(export_path)
+            else:
+                shutil.copy2(model_path, export_path)
+                shutil.copy2(metadata_path(model_path), metadata_path(export_path))
             
             # 复制模型信息
-            info_src = self.model_file.replace('.pkl', '_info.json')
-            info_dst = export_path.replace('.pkl', '_info.json')
+            info_src = self._info_path(self.model_file)
+            info_dst = self._info_path(export_path)
             if os.path.exists(info_src):
                 shutil.copy2(info_src, info_dst)
             
@@ -612,18 +1109,24 @@ class ModelService:
                 print(f"❌ 模型文件不存在: {import_path}")
                 return False
             
-            # 复制模型文件
+            # 复制模型文件；导入旧 .pkl 文件即显式迁移，转存为 .npz
             import shutil
-            shutil.copy2(import_path, self.model_file)
+            if import_path.endswith(LEGACY_EXT):
+                if not CTRModel().migrate_legacy(import_path, self.model_file):
+                    return False
+            else:
+                shutil.copy2(import_path, self.model_file)
+                shutil.copy2(metadata_path(import_path), metadata_path(self.model_file))
             
             # 复制模型信息
-            info_src = import_path.replace('.pkl', '_info.json')
-            info_dst = self.model_file.replace('.pkl', '_info.json')
+            info_src = self._info_path(import_path)
+            info_dst = self._info_path(self.model_file)
             if os.path.exists(info_src):
                 shutil.copy2(info_src, info_dst)
             
             # 重新加载模型
             self._load_model()
+            self._invalidate_query_cache()
             
             print(f"✅ 模型导入成功: {import_path}")
             return True
@@ -635,17 +1138,19 @@ class ModelService:
     def delete_model(self) -> bool:
         """删除模型"""
         try:
-            if os.path.exists(self.model_file):
-                os.remove(self.model_file)
-                print(f"✅ 模型文件删除成功: {self.model_file}")
+            base = os.path.splitext(self.model_file)[0]
+            for model_path in artifact_files(self.model_file) + [p for p in (base + LEGACY_EXT,) if os.path.exists(p)]:
+                os.remove(model_path)
+                print(f"✅ 模型文件删除成功: {model_path}")
             
-            info_path = self.model_file.replace('.pkl', '_info.json')
+            info_path = self._info_path(self.model_file)
             if os.path.exists(info_path):
                 os.remove(info_path)
                 print(f"✅ 模型信息文件删除成功: {info_path}")
             
             # 重置模型
             self.ctr_model = CTRModel()
+            self._invalidate_query_cache()
             
             return True
             
@@ -656,16 +1161,15 @@ class ModelService:
     def validate_training_data(self, data_service) -> Dict[str, Any]:
         """验证训练数据"""
         try:
-            samples = data_service.get_all_samples()
+            df = data_service.get_samples_dataframe()
             
-            if not samples:
+            if df.empty:
                 return {
                     'valid': False,
                     'issues': ['没有CTR数据'],
                     'recommendations': ['进行一些搜索实验生成数据']
                 }
             
-            df = pd.DataFrame(samples)
             issues = []
             recommendations = []
             
@@ -743,6 +1247,8 @@ class ModelService:
             
             self.flask_app = Flask(__name__)
             self._setup_api_routes()
+            if not self.ready:
+                self.start_warm_up()
             
             self.api_running = True
             print(f"🚀 Model Serving API启动在 {host}:{port}")
@@ -760,17 +1266,49 @@ class ModelService:
             print(f"❌ 启动API服务器失败: {e}")
             return False
     
+    def start_async_api_server(self, host="0.0.0.0", port=8501, workers: int = 1, num_threads: int = 4,
+                               max_batch_size: int = 64, max_wait_ms: float = 2.0):
+        """启动FastAPI异步服务（请求微批处理 + 计算线程池，生产模式）
+        
+        Args:
+            workers: uvicorn worker 进程数（大于1时每个进程各自加载模型）
+            num_threads: 每个进程的模型计算线程数
+            max_batch_size: 微批最大样本数
+            max_wait_ms: 微批最大等待毫秒数
+        """
+        try:
+            from .serving_api import run_serving_api
+            self.api_running = True
+            return run_serving_api(self, host=host, port=port, workers=workers, num_threads=num_threads,
+                                   max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+        except Exception as e:
+            print(f"❌ 启动异步API服务器失败: {e}")
+            return False
+        finally:
+            self.api_running = False
+    
     def stop_api_server(self):
         """停止Flask API服务器"""
         self.api_running = False
         print("🛑 API服务器已停止")
     
+    @staticmethod
+    def _serving_type(model_type: str, model_instance=None) -> str:
+        """模型的推理方式：LR与有NumPy运行时的Wide & Deep为numpy，否则为tensorflow"""
+        if model_type == 'logistic_regression':
+            return "numpy"
+        if model_instance is not None and getattr(model_instance, 'runtime', None) is not None:
+            return "numpy"
+        return "tensorflow"
+    
     def _setup_api_routes(self):
         """设置API路由"""
         
         @self.flask_app.route('/health', methods=['GET'])
         def health():
-            """健康检查"""
+            """健康检查（模型预热完成前返回503）"""
+            if not self.ready:
+                return jsonify({"status": "warming_up", "model_type": self.current_model_type}), 503
             return jsonify({
                 "status": "healthy",
                 "model_type": self.current_model_type,
@@ -787,13 +1325,13 @@ class ModelService:
                     models.append({
                         "name": model_type,
                         "status": "loaded" if model_instance.is_trained else "unloaded",
-                        "type": "pickle" if model_type == 'logistic_regression' else "tensorflow"
+                        "type": self._serving_type(model_type, model_instance)
                     })
                 except:
                     models.append({
                         "name": model_type,
                         "status": "error",
-                        "type": "pickle" if model_type == 'logistic_regression' else "tensorflow"
+                        "type": "numpy" if model_type == 'logistic_regression' else "tensorflow"
                     })
             
             return jsonify({"model": models})
@@ -807,7 +1345,7 @@ class ModelService:
                     "model": {
                         "name": model_name,
                         "status": "loaded" if model_instance.is_trained else "unloaded",
-                        "type": "pickle" if model_name == 'logistic_regression' else "tensorflow"
+                        "type": self._serving_type(model_name, model_instance)
                     }
                 })
             except Exception as e:
@@ -851,11 +1389,9 @@ class ModelService:
                 if not inputs_list:
                     return jsonify({"error": "No inputs provided"}), 400
                 
-                # 执行批量预测
-                results = []
-                for inputs in inputs_list:
-                    ctr_score = self.predict_ctr(inputs, model_name)
-                    results.append({"ctr_score": ctr_score})
+                # 执行批量预测（一次模型调用）
+                ctr_scores = self.predict_ctr_batch(inputs_list, model_name)
+                results = [{"ctr_score": ctr_score} for ctr_score in ctr_scores]
                 
                 return jsonify({
                     "outputs": results
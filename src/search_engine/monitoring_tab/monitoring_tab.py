@@ -1,5 +1,7 @@
 import gradio as gr
 from datetime import datetime
+from ..tokenization_service import get_tokenization_service
+from ..query_cache import get_query_cache
 
 def run_data_quality_check():
     """运行数据质量检查"""
@@ -152,7 +154,9 @@ def build_monitoring_tab(data_service=None, index_service=None, model_service=No
             return html
         
         def show_performance():
-            html = """
+            token_stats = get_tokenization_service().get_stats()
+            cache_stats = index_service.get_cache_stats() if index_service is not None else get_query_cache().get_stats()
+            html = f"""
             <div style="background-color: #f8f9fa; padding: 15px; border-radius: 8px;">
                 <h4 style="margin: 0 0 15px 0; color: #333;">⚡ 性能监控</h4>
                 
@@ -174,6 +178,27 @@ def build_monitoring_tab(data_service=None, index_service=None, model_service=No
                     </ul>
                 </div>
                 
+                <div style="margin-bottom: 15px;">
+                    <h5 style="margin: 0 0 10px 0; color: #fd7e14;">🗃️ 查询结果缓存</h5>
+                    <ul style="margin: 0; padding-left: 20px;">
+                        <li><strong>命中率:</strong> {cache_stats['hit_rate']:.2%} (命中 {cache_stats['hits']}, 未命中 {cache_stats['misses']})</li>
+                        <li><strong>缓存条目:</strong> {cache_stats['size']}/{cache_stats['max_size']} (TTL {cache_stats['ttl_seconds']:.0f}s)</li>
+                        <li><strong>淘汰:</strong> 过期 {cache_stats['expired']}, 容量 {cache_stats['evicted']}, 版本失效 {cache_stats['invalidated']}</li>
+                        <li><strong>版本号:</strong> 索引 v{cache_stats['index_version']}, 模型 v{cache_stats['model_version']}</li>
+                    </ul>
+                </div>
+                
+                <div style="margin-bottom: 15px;">
+                    <h5 style="margin: 0 0 10px 0; color: #6f42c1;">🧩 分词缓存</h5>
+                    <ul style="margin: 0; padding-left: 20px;">
+                        <li><strong>命中率:</strong> {token_stats['hit_rate']:.2%}</li>
+                        <li><strong>查询缓存:</strong> {token_stats['cache_size']}/{token_stats['cache_capacity']} (命中 {token_stats['cache_hits']}, 未命中 {token_stats['cache_misses']})</li>
+                        <li><strong>词ID库:</strong> {token_stats['store_entries']}/{token_stats['store_capacity']}条文本, {token_stats['store_vocab']}个词 (命中 {token_stats['store_hits']}, 未命中 {token_stats['store_misses']})</li>
+                        <li><strong>平均分词耗时:</strong> {token_stats['avg_tokenize_ms']:.2f}ms</li>
+                        <li><strong>节省分词时间:</strong> {token_stats['time_saved_seconds']:.2f}s</li>
+                    </ul>
+                </div>
+                
                 <div style="background-color: #d4edda; color: #155724; padding: 10px; border-radius: 4px; border: 1px solid #c3e6cb;">
                     <strong>✅ 性能表现良好</strong> - 系统运行流畅，响应及时
                 </div>
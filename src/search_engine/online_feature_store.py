@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在线特征存储模块
+进程内维护按查询、文档、(查询, 文档) 的时间衰减展示/点击计数，
+由 DataService 的展示和点击事件实时更新，预测时 O(1) 查出历史CTR，
+使线上特征与训练时的历史CTR特征同源。
+
+计数按半衰期指数衰减：每个键只保存 (展示数, 点击数, 参考时间)，
+更新时先把已有计数衰减到事件时间再累加，乱序事件按时间差折算权重。
+默认 half_life_seconds 为 None（不衰减），CTR与训练时 point_in_time 的累计均值一致；
+设置半衰期后线上特征与训练特征不再同分布，需要重新训练模型。
+计数定期快照到文件，未接入 DataService 的进程（如独立的模型服务）从快照读取。
+"""
+
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Union
+
+DEFAULT_CTR = 0.1
+
+
+def to_epoch(value: Union[str, float, int, None]) -> float:
+    """事件时间转为秒级时间戳（ISO字符串或数值，无法解析时取当前时间）"""
+    if value is None:
+        return time.time()
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except ValueError:
+        return time.time()
+
+
+class OnlineFeatureStore:
+    """时间衰减计数的在线特征存储"""
+
+    SNAPSHOT_VERSION = 1
+
+    def __init__(self, half_life_seconds: Optional[float] = None,
+                 snapshot_path: Optional[str] = "models/online_features.pkl",
+                 snapshot_interval: float = 60.0, default_ctr: float = DEFAULT_CTR):
+        """
+        Args:
+            half_life_seconds: 计数半衰期（秒），为None时不衰减（与训练特征一致）
+            snapshot_path: 快照文件路径，为None时不持久化
+            snapshot_interval: 快照最小间隔（秒），也是只读进程检查快照更新的间隔
+            default_ctr: 没有历史时的默认CTR（与训练特征默认值一致）
+        """
+        self.half_life_seconds = half_life_seconds
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.default_ctr = default_ctr
+        self._lock = threading.Lock()
+        # 键 -> [展示数, 点击数, 参考时间]
+        self._queries: Dict[Hashable, List[float]] = {}
+        self._docs: Dict[Hashable, List[float]] = {}
+        self._pairs: Dict[Hashable, List[float]] = {}
+        self.events = 0
+        self._dirty = False
+        # 是否由本进程的事件更新；只读进程才按快照刷新
+        self._fed = False
+        self._last_snapshot_time = time.time()
+        self._snapshot_mtime = 0.0
+        self._last_reload_check = 0.0
+
+    # ---------------- 计数更新 ----------------
+
+    def _decay(self, dt: float) -> float:
+        if not self.half_life_seconds or dt <= 0:
+            return 1.0
+        return 0.5 ** (dt / self.half_life_seconds)
+
+    def _add(self, table: Dict[Hashable, List[float]], key: Hashable, impressions: float, clicks: float, ts: float):
+        counter = table.get(key)
+        if counter is None:
+            table[key] = [impressions, clicks, ts]
+            return
+        if ts >= counter[2]:
+            factor = self._decay(ts - counter[2])
+            counter[0] = counter[0] * factor + impressions
+            counter[1] = counter[1] * factor + clicks
+            counter[2] = ts
+        else:
+            # 乱序事件：按距参考时间的间隔折算后累加
+            factor = self._decay(counter[2] - ts)
+            counter[0] += impressions * factor
+            counter[1] += clicks * factor
+
+    def _record(self, query: str, doc_id: str, impressions: float, clicks: float, timestamp):
+        ts = to_epoch(timestamp)
+        with self._lock:
+            self._add(self._queries, query, impressions, clicks, ts)
+            self._add(self._docs, doc_id, impressions, clicks, ts)
+            self._add(self._pairs, (query, doc_id), impressions, clicks, ts)
+            self.events += 1
+            self._dirty = True
+            self._fed = True
+
+    def record_impression(self, query: str, doc_id: str, timestamp=None, clicked: bool = False):
+        """
+        记录一次展示
+
+        Args:
+            query: 查询
+            doc_id: 文档ID
+            timestamp: 展示时间（ISO字符串或秒级时间戳），默认当前时间
+            clicked: 样本已被点击（加载历史样本时）
+        """
+        self._record(query, doc_id, 1.0, 1.0 if clicked else 0.0, timestamp)
+
+    def record_click(self, query: str, doc_id: str, timestamp=None):
+        """记录一次首次点击（同一展示的重复点击不计入，与训练标签一致）"""
+        self._record(query, doc_id, 0.0, 1.0, timestamp)
+
+    def clear(self):
+        """清空所有计数"""
+        with self._lock:
+            self._queries.clear()
+            self._docs.clear()
+            self._pairs.clear()
+            self.events = 0
+            self._dirty = True
+            self._fed = True
+
+    # ---------------- 特征查询 ----------------
+
+    def _ctr(self, table: Dict[Hashable, List[float]], key: Hashable) -> float:
+        self._maybe_reload()
+        counter = table.get(key)
+        # 计数同比例衰减，点击率与读取时间无关
+        if counter is None or counter[0] <= 0:
+            return self.default_ctr
+        return min(counter[1] / counter[0], 1.0)
+
+    def query_ctr(self, query: str) -> float:
+        """查询的历史CTR"""
+        return self._ctr(self._queries, query)
+
+    def doc_ctr(self, doc_id: str) -> float:
+        """文档的历史CTR"""
+        return self._ctr(self._docs, doc_id)
+
+    def pair_ctr(self, query: str, doc_id: str) -> float:
+        """(查询, 文档) 的历史CTR"""
+        return self._ctr(self._pairs, (query, doc_id))
+
+    def get_features(self, query: str, doc_id: str) -> Dict[str, float]:
+        """
+        获取一个 (查询, 文档) 的在线特征
+
+        Returns:
+            Dict: query_ctr、doc_ctr、pair_ctr
+        """
+        return {
+            'query_ctr': self.query_ctr(query),
+            'doc_ctr': self.doc_ctr(doc_id),
+            'pair_ctr': self.pair_ctr(query, doc_id),
+        }
+
+    # ---------------- 快照 ----------------
+
+    def save_snapshot(self) -> bool:
+        """保存快照（无变更时跳过）"""
+        if not self.snapshot_path or not self._dirty:
+            return False
+        try:
+            with self._lock:
+                data = {
+                    'version': self.SNAPSHOT_VERSION,
+                    'half_life_seconds': self.half_life_seconds,
+                    'queries': {k: list(v) for k, v in self._queries.items()},
+                    'docs': {k: list(v) for k, v in self._docs.items()},
+                    'pairs': {k: list(v) for k, v in self._pairs.items()},
+                    'events': self.events,
+                }
+                self._dirty = False
+                self._last_snapshot_time = time.time()
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = self.snapshot_path + ".tmp"
+            with open(temp_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.snapshot_path)
+            return True
+        except Exception as e:
+            print(f"❌ 保存在线特征快照失败: {e}")
+            return False
+
+    def maybe_snapshot(self) -> bool:
+        """距上次快照超过间隔时保存快照"""
+        if time.time() - self._last_snapshot_time < self.snapshot_interval:
+            return False
+        return self.save_snapshot()
+
+    def load_snapshot(self) -> bool:
+        """从快照加载计数"""
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+            with open(self.snapshot_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != self.SNAPSHOT_VERSION:
+                print(f"⚠️ 在线特征快照版本不匹配，忽略: {self.snapshot_path}")
+                return False
+            if data.get('half_life_seconds') != self.half_life_seconds:
+                # 衰减设置不同的计数不能混用
+                print(f"⚠️ 在线特征快照半衰期不一致，忽略: {self.snapshot_path}")
+                return False
+            with self._lock:
+                self._queries = data['queries']
+                self._docs = data['docs']
+                self._pairs = data['pairs']
+                self.events = data.get('events', 0)
+                self._dirty = False
+                self._snapshot_mtime = mtime
+            return True
+        except Exception as e:
+            print(f"❌ 加载在线特征快照失败: {e}")
+            return False
+
+    def _maybe_reload(self):
+        """只读进程：快照文件更新后重新加载（按间隔检查）"""
+        if self._fed or not self.snapshot_path:
+            return
+        now = time.time()
+        if now - self._last_reload_check < self.snapshot_interval:
+            return
+        self._last_reload_check = now
+        try:
+            if os.path.getmtime(self.snapshot_path) > self._snapshot_mtime:
+                self.load_snapshot()
+        except OSError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取存储统计"""
+        with self._lock:
+            return {
+                'queries': len(self._queries),
+                'docs': len(self._docs),
+                'pairs': len(self._pairs),
+                'events': self.events,
+                'half_life_seconds': self.half_life_seconds,
+                'last_snapshot_time': self._last_snapshot_time,
+            }
+
+
+# 全局在线特征存储实例
+_online_feature_store = None
+
+
+def get_online_feature_store() -> OnlineFeatureStore:
+    """
+    获取全局在线特征存储实例（单例模式，首次获取时加载快照）
+
+    Returns:
+        OnlineFeatureStore: 在线特征存储实例
+    """
+    global _online_feature_store
+    if _online_feature_store is None:
+        _online_feature_store = OnlineFeatureStore()
+        _online_feature_store.load_snapshot()
+    return _online_feature_store
+
+
+def reset_online_feature_store():
+    """重置全局在线特征存储实例"""
+    global _online_feature_store
+    _online_feature_store = None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存模块
+按规范化查询缓存召回和排序结果，容量和TTL双重淘汰；
+索引或模型变更时递增版本号，旧版本的缓存项在读取时失效。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+def normalize_query(query: str) -> str:
+    """规范化查询：去首尾空白、合并连续空白、转小写"""
+    return " ".join(query.split()).lower()
+
+
+class QueryResultCache:
+    """LRU + TTL 查询结果缓存"""
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 300.0):
+        """
+        Args:
+            max_size: 最大缓存条目数
+            ttl_seconds: 缓存有效期（秒）
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # key -> (过期时间, (索引版本, 模型版本), 值)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.index_version = 0
+        self.model_version = 0
+
+        # 统计
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+        self._invalidated = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """读取缓存，未命中、过期或版本不一致时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, version, value = entry
+            if version != (self.index_version, self.model_version):
+                del self._entries[key]
+                self._invalidated += 1
+                self._misses += 1
+                return None
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._expired += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def version(self) -> tuple:
+        """当前 (索引版本, 模型版本)；计算结果前读取，写入时传给 put"""
+        with self._lock:
+            return (self.index_version, self.model_version)
+
+    def put(self, key: Hashable, value: Any, version: Optional[tuple] = None):
+        """
+        写入缓存，超出容量时淘汰最久未使用的条目
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            version: 开始计算时通过 version() 读取的版本；计算期间索引或模型已变更时不写入
+        """
+        with self._lock:
+            current = (self.index_version, self.model_version)
+            if version is not None and version != current:
+                self._invalidated += 1
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, current, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+
+    def bump_index_version(self):
+        """索引内容变更（增删文档、重建、加载）"""
+        with self._lock:
+            self.index_version += 1
+
+    def bump_model_version(self):
+        """排序模型变更（训练、切换、加载）"""
+        with self._lock:
+            self.model_version += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: 命中/未命中次数、命中率、淘汰数量、当前版本号
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'expired': self._expired,
+                'evicted': self._evicted,
+                'invalidated': self._invalidated,
+                'index_version': self.index_version,
+                'model_version': self.model_version,
+            }
+
+
+# 全局查询缓存实例
+_query_cache = None
+
+
+def get_query_cache() -> QueryResultCache:
+    """
+    获取全局查询结果缓存实例（单例模式）
+
+    Returns:
+        QueryResultCache: 查询结果缓存实例
+    """
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryResultCache()
+    return _query_cache
+
+
+def reset_query_cache():
+    """重置全局查询结果缓存实例"""
+    global _query_cache
+    _query_cache = None
@@ -61,9 +61,12 @@ class SearchEngine(SearchInterface):
         # 第二步：使用CTR模型重新排序
         if self.ctr_model.is_trained:
             # 有CTR模型时，计算CTR分数并重新排序
+            batch_scores = self.ctr_model.predict_ctr_batch([
+                {'query': query, 'doc_id': doc_id, 'position': position, 'score': tfidf_score, 'summary': summary}
+                for position, (doc_id, tfidf_score, summary) in enumerate(filtered_results, 1)
+            ])
             ctr_scores = {}
-            for position, (doc_id, tfidf_score, summary) in enumerate(filtered_results, 1):
-                ctr_score = self.ctr_model.predict_ctr(query, doc_id, position, tfidf_score, summary)
+            for (doc_id, tfidf_score, summary), ctr_score in zip(filtered_results, batch_scores):
                 ctr_scores[doc_id] = (ctr_score, tfidf_score, summary)
             
             # 按CTR分数排序
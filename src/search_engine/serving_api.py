@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高吞吐模型服务 - FastAPI 异步服务 + 请求微批处理
+- 并发请求在事件循环中排队，按 max_batch_size / max_wait_ms 合并成一批，一次调用批量预测接口
+- 模型计算在线程池中执行，不阻塞事件循环；可用 uvicorn 多进程（workers）横向扩展
+- 兼容原 Flask 接口（/v1/models/<name>/predict、batch_predict）以及
+  TF Serving REST 接口（/v1/models/<name>:predict、/v1/models/<name>/versions/<v>:predict）
+
+依赖 fastapi 与 uvicorn（pip install -e .[api]）。
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import uvicorn
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+    FASTAPI_AVAILABLE = True
+except ImportError:
+    FASTAPI_AVAILABLE = False
+
+MODEL_TYPES = ('logistic_regression', 'wide_and_deep')
+# TF Serving 部署时使用的模型名
+MODEL_ALIASES = {'wide_deep_ctr': 'wide_and_deep', 'lr_ctr': 'logistic_regression'}
+TENSOR_KEYS = ('wide', 'deep', 'query_hash', 'doc_hash', 'position_group')
+
+# 多进程模式下通过环境变量把配置传给每个 worker
+ENV_PREFIX = 'SEARCH_SERVING_'
+
+
+class MicroBatcher:
+    """把并发请求合并成批次调用同一个批量预测函数"""
+
+    def __init__(self, predict_fn: Callable[[List[Any]], List[Any]], executor: ThreadPoolExecutor,
+                 max_batch_size: int = 64, max_wait_ms: float = 2.0, max_concurrent_batches: int = 2):
+        """
+        Args:
+            predict_fn: 批量预测函数，输入样本列表，返回等长结果列表（在线程池中执行）
+            executor: 执行模型计算的线程池
+            max_batch_size: 一批最多合并的样本数（单个请求超过时整体作为一批）
+            max_wait_ms: 第一个请求到达后最多等待的毫秒数
+            max_concurrent_batches: 同时计算的批次数，满时新请求继续排队并合并成更大的批次
+        """
+        self.predict_fn = predict_fn
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue: Optional[asyncio.Queue] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {'requests': 0, 'items': 0, 'batches': 0, 'max_batch': 0, 'fallbacks': 0}
+
+    def _ensure_started(self):
+        # 队列和任务必须在服务的事件循环中创建
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def submit(self, items: List[Any]) -> List[Any]:
+        """提交一个请求的样本，返回对应的预测结果"""
+        if not items:
+            return []
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((items, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(request)
+                size += len(request[0])
+            # 计算槽位占满时等待，期间到达的请求留给下一批
+            await self._semaphore.acquire()
+            loop.create_task(self._execute(batch))
+
+    async def _execute(self, batch: List[Tuple[List[Any], asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            items = [item for request_items, _ in batch for item in request_items]
+            try:
+                results = await loop.run_in_executor(self.executor, self.predict_fn, items)
+                if len(results) != len(items):
+                    raise ValueError(f"批量预测返回 {len(results)} 条结果，期望 {len(items)} 条")
+                offset = 0
+                for request_items, future in batch:
+                    if not future.done():
+                        future.set_result(results[offset:offset + len(request_items)])
+                    offset += len(request_items)
+            except Exception:
+                # 整批失败时逐个请求重试，只让有问题的请求失败
+                self.stats['fallbacks'] += 1
+                for request_items, future in batch:
+                    try:
+                        result = await loop.run_in_executor(self.executor, self.predict_fn, request_items)
+                        if not future.done():
+                            future.set_result(result)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+            self.stats['requests'] += len(batch)
+            self.stats['items'] += len(items)
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(items))
+        finally:
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = dict(self.stats)
+        stats['avg_batch'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+
+def resolve_model_type(model_name: str) -> Optional[str]:
+    """URL中的模型名 -> 模型类型，未知模型返回None"""
+    model_type = MODEL_ALIASES.get(model_name, model_name)
+    return model_type if model_type in MODEL_TYPES else None
+
+
+def _stack_instances(instances: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """TF Serving 行格式 instances -> 模型输入张量"""
+    return {
+        'wide': np.asarray([instance['wide'] for instance in instances], dtype=np.float32),
+        'deep': np.asarray([instance['deep'] for instance in instances], dtype=np.float32),
+        'query_hash': np.asarray([instance['query_hash'] for instance in instances], dtype=np.int32),
+        'doc_hash': np.asarray([instance['doc_hash'] for instance in instances], dtype=np.int32),
+        'position_group': np.asarray([instance['position_group'] for instance in instances], dtype=np.int32),
+    }
+
+
+class ServingApp:
+    """绑定 ModelService 的异步服务：每种模型、每种输入格式一个微批处理器"""
+
+    def __init__(self, model_service, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                 num_threads: int = 4):
+        """
+        Args:
+            model_service: ModelService 实例
+            max_batch_size: 微批最大样本数
+            max_wait_ms: 微批最大等待毫秒数
+            num_threads: 模型计算线程数
+        """
+        self.model_service = model_service
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.num_threads = num_threads
+        self.executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='serving')
+        self.batchers: Dict[Tuple[str, str], MicroBatcher] = {}
+        self.started_at = time.time()
+
+    def _batcher(self, model_type: str, kind: str) -> MicroBatcher:
+        key = (model_type, kind)
+        batcher = self.batchers.get(key)
+        if batcher is None:
+            if kind == 'tensor':
+                predict_fn = lambda items: self._predict_tensors(model_type, items)
+            else:
+                predict_fn = lambda items: self.model_service.predict_ctr_batch(items, model_type)
+            batcher = MicroBatcher(predict_fn, self.executor, self.max_batch_size, self.max_wait_ms,
+                                   max_concurrent_batches=max(1, self.num_threads))
+            self.batchers[key] = batcher
+        return batcher
+
+    def _predict_tensors(self, model_type: str, instances: List[Dict[str, Any]]) -> List[List[float]]:
+        """已标准化的模型输入（TF Serving 签名）-> 每行 [点击概率]"""
+        with self.model_service.acquire_model(model_type) as handle:
+            if not hasattr(handle.model, 'predict_tensors'):
+                raise ValueError(f"模型 {model_type} 不支持张量输入")
+            probs = handle.model.predict_tensors(_stack_instances(instances))
+        return [[float(p)] for p in probs]
+
+    async def predict(self, model_type: str, features_list: List[Dict[str, Any]]) -> List[float]:
+        return await self._batcher(model_type, 'features').submit(features_list)
+
+    async def predict_tensors(self, model_type: str, instances: List[Dict[str, Any]]) -> List[List[float]]:
+        return await self._batcher(model_type, 'tensor').submit(instances)
+
+    def model_status(self, model_type: str) -> Dict[str, Any]:
+        """模型状态（只读槽位，不加载模型，可在事件循环中直接调用）"""
+        handle = self.model_service.peek_model_handle(model_type)
+        model_instance = handle.model if handle is not None else None
+        if model_instance is not None and model_instance.is_trained:
+            status = "loaded"
+        elif not self.model_service.is_ready():
+            status = "loading"
+        else:
+            status = "unloaded"
+        return {
+            "name": model_type,
+            "status": status,
+            "type": self.model_service._serving_type(model_type, model_instance),
+            "version": handle.version if handle is not None else None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'pid': os.getpid(),
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'batchers': {f"{model_type}:{kind}": batcher.get_stats()
+                         for (model_type, kind), batcher in self.batchers.items()},
+        }
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def create_app(model_service=None, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+               num_threads: int = 4) -> "FastAPI":
+    """创建 FastAPI 应用（model_service 为空时在本进程新建）"""
+    if not FASTAPI_AVAILABLE:
+        raise ImportError("FastAPI未安装，请运行: pip install fastapi uvicorn")
+    if model_service is None:
+        from .model_service import ModelService
+        model_service = ModelService(lazy_load=True)
+
+    serving = ServingApp(model_service, max_batch_size, max_wait_ms, num_threads)
+
+    @asynccontextmanager
+    async def lifespan(app):
+        # 先开始监听，模型在后台加载和预热，完成前 /health 返回503
+        if not model_service.is_ready():
+            model_service.start_warm_up()
+        yield
+        serving.close()
+
+    app = FastAPI(title="Model Serving API", lifespan=lifespan)
+    app.state.serving = serving
+
+    def error(message: str, status_code: int) -> JSONResponse:
+        return JSONResponse({"error": message}, status_code=status_code)
+
+    async def read_json(request: Request) -> Optional[Dict[str, Any]]:
+        try:
+            data = await request.json()
+        except Exception:
+            return None
+        return data if isinstance(data, dict) else None
+
+    @app.get('/health')
+    async def health():
+        """健康检查（模型预热完成前返回503）"""
+        if not model_service.is_ready():
+            return JSONResponse({"status": "warming_up", "model_type": model_service.current_model_type},
+                                status_code=503)
+        return {
+            "status": "healthy",
+            "model_type": model_service.current_model_type,
+            "model_trained": model_service.ctr_model.is_trained,
+        }
+
+    @app.get('/v1/models')
+    async def list_models():
+        """列出所有模型"""
+        models = []
+        for model_type in MODEL_TYPES:
+            try:
+                models.append(serving.model_status(model_type))
+            except Exception:
+                models.append({"name": model_type, "status": "error",
+                               "type": "numpy" if model_type == 'logistic_regression' else "tensorflow"})
+        return {"model": models}
+
+    @app.get('/v1/serving/stats')
+    async def serving_stats():
+        """微批处理统计"""
+        return serving.get_stats()
+
+    @app.get('/v1/models/{model_name}')
+    async def get_model_status(model_name: str):
+        """模型状态（兼容 TF Serving 的 model_version_status）"""
+        model_type = resolve_model_type(model_name)
+        if model_type is None:
+            return error(f"Model not found: {model_name}", 404)
+        status = serving.model_status(model_type)
+        return {
+            "model": status,
+            "model_version_status": [{
+                "version": str(status['version'] or 0),
+                "state": "AVAILABLE" if status['status'] == 'loaded' else "LOADING",
+                "status": {"error_code": "OK", "error_message": ""},
+            }],
+        }
+
+    @app.get('/v1/models/{model_name}/metadata')
+    async def get_model_metadata(model_name: str):
+        """模型元数据（TF Serving 格式的输入签名）"""
+        model_type = resolve_model_type(model_name)
+        if model_type is None:
+            return error(f"Model not found: {model_name}", 404)
+        status = serving.model_status(model_type)
+        inputs = list(TENSOR_KEYS) if model_type == 'wide_and_deep' else []
+        return {
+            "model_spec": {"name": model_name, "signature_name": "", "version": str(status['version'] or 0)},
+            "metadata": {"signature_def": {"serving_default": {
+                "inputs": inputs,
+                "raw_inputs": ['query', 'doc_id', 'position', 'score', 'summary', 'timestamp'],
+                "outputs": ['ctr_score'],
+            }}},
+        }
+
+    @app.post('/v1/models/{model_name}/predict')
+    async def predict(model_name: str, request: Request):
+        """单条预测（原 Flask 接口）"""
+        model_type = resolve_model_type(model_name)
+        if model_type is None:
+            return error(f"Model not found: {model_name}", 404)
+        data = await read_json(request)
+        if not data:
+            return error("No JSON data provided", 400)
+        inputs = data.get('inputs', {})
+        if not inputs or not isinstance(inputs, dict):
+            return error("No inputs provided", 400)
+        try:
+            scores = await serving.predict(model_type, [inputs])
+            return {"outputs": {"ctr_score": scores[0]}}
+        except Exception as e:
+            return error(str(e), 500)
+
+    @app.post('/v1/models/{model_name}/batch_predict')
+    async def batch_predict(model_name: str, request: Request):
+        """批量预测（原 Flask 接口）"""
+        model_type = resolve_model_type(model_name)
+        if model_type is None:
+            return error(f"Model not found: {model_name}", 404)
+        data = await read_json(request)
+        if not data:
+            return error("No JSON data provided", 400)
+        inputs_list = data.get('inputs', [])
+        if not inputs_list or not isinstance(inputs_list, list):
+            return error("No inputs provided", 400)
+        try:
+            scores = await serving.predict(model_type, inputs_list)
+            return {"outputs": [{"ctr_score": score} for score in scores]}
+        except Exception as e:
+            return error(str(e), 500)
+
+    async def tf_serving_predict(model_name: str, version: Optional[str], request: Request):
+        model_type = resolve_model_type(model_name)
+        if model_type is None:
+            return error(f"Servable not found for request: Latest({model_name})", 404)
+        if version is not None and str(model_service.get_model_version(model_type)) != version:
+            return error(f"Servable not found for request: Specific({model_name}, {version})", 404)
+        data = await read_json(request)
+        instances = data.get('instances') if data else None
+        if not instances or not isinstance(instances, list) or not all(isinstance(i, dict) for i in instances):
+            return error("Missing 'instances' key or instances are not objects", 400)
+        try:
+            if all(key in instances[0] for key in TENSOR_KEYS):
+                # 已标准化的模型输入张量（与导出的 SavedModel 签名一致）
+                if not all(all(key in instance for key in TENSOR_KEYS) for instance in instances):
+                    return error(f"Every instance needs keys: {', '.join(TENSOR_KEYS)}", 400)
+                predictions = await serving.predict_tensors(model_type, instances)
+            else:
+                # 原始特征（query、doc_id、position、score、summary）
+                predictions = await serving.predict(model_type, instances)
+            return {"predictions": predictions}
+        except ValueError as e:
+            return error(str(e), 400)
+        except Exception as e:
+            return error(str(e), 500)
+
+    @app.post('/v1/models/{model_name}:predict')
+    async def tf_predict(model_name: str, request: Request):
+        """TF Serving 预测接口"""
+        return await tf_serving_predict(model_name, None, request)
+
+    @app.post('/v1/models/{model_name}/versions/{version}:predict')
+    async def tf_predict_version(model_name: str, version: str, request: Request):
+        """TF Serving 指定版本预测（只服务当前上线版本）"""
+        return await tf_serving_predict(model_name, version, request)
+
+    return app
+
+
+def create_app_from_env() -> "FastAPI":
+    """uvicorn 多进程模式的应用工厂：每个 worker 进程各自加载模型"""
+    return create_app(
+        max_batch_size=int(os.environ.get(f'{ENV_PREFIX}MAX_BATCH_SIZE', 64)),
+        max_wait_ms=float(os.environ.get(f'{ENV_PREFIX}MAX_WAIT_MS', 2.0)),
+        num_threads=int(os.environ.get(f'{ENV_PREFIX}THREADS', 4)),
+    )
+
+
+def run_serving_api(model_service=None, host: str = "0.0.0.0", port: int = 8501, workers: int = 1,
+                    num_threads: int = 4, max_batch_size: int = 64, max_wait_ms: float = 2.0) -> bool:
+    """
+    启动异步模型服务（阻塞）
+
+    Args:
+        model_service: 单进程模式使用的 ModelService（workers > 1 时每个进程各自创建）
+        host: 监听地址
+        port: 端口
+        workers: uvicorn worker 进程数
+        num_threads: 每个进程的模型计算线程数
+        max_batch_size: 微批最大样本数
+        max_wait_ms: 微批最大等待毫秒数
+    """
+    if not FASTAPI_AVAILABLE:
+        print("❌ FastAPI/uvicorn未安装，请运行: pip install fastapi uvicorn")
+        return False
+
+    print(f"🚀 异步 Model Serving API 启动在 {host}:{port} "
+          f"(workers={workers}, threads={num_threads}, max_batch_size={max_batch_size}, max_wait_ms={max_wait_ms})")
+    print("📋 可用接口:")
+    print(f"   - 健康检查: http://localhost:{port}/health")
+    print(f"   - 模型列表: http://localhost:{port}/v1/models")
+    print(f"   - 预测接口: http://localhost:{port}/v1/models/<model_name>/predict")
+    print(f"   - 批量预测: http://localhost:{port}/v1/models/<model_name>/batch_predict")
+    print(f"   - TF Serving: http://localhost:{port}/v1/models/<model_name>:predict")
+    print(f"   - 微批统计: http://localhost:{port}/v1/serving/stats")
+    print("=" * 50)
+
+    if workers > 1:
+        os.environ[f'{ENV_PREFIX}MAX_BATCH_SIZE'] = str(max_batch_size)
+        os.environ[f'{ENV_PREFIX}MAX_WAIT_MS'] = str(max_wait_ms)
+        os.environ[f'{ENV_PREFIX}THREADS'] = str(num_threads)
+        uvicorn.run("search_engine.serving_api:create_app_from_env", factory=True, host=host, port=port,
+                    workers=workers, access_log=False, log_level="warning")
+    else:
+        app = create_app(model_service, max_batch_size, max_wait_ms, num_threads)
+        uvicorn.run(app, host=host, port=port, access_log=False, log_level="warning")
+    return True
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本嵌入缓存与查询微批模块 - 文搜图的文本编码
+- TextEmbeddingCache：规范化查询 -> 文本嵌入的 LRU 缓存，重复查询不再运行 CLIP 文本塔
+- TextQueryBatcher：多个线程同时提交的查询合并成一批，一次调用批量编码函数（get_text_features）
+
+微批不使用单独的后台线程：先到的请求线程成为 leader，等待至多 max_wait_ms 收集同时到达的查询，
+编码这一批并把结果分发给其他线程；编码期间到达的查询排队，由其中一个请求线程接着组成下一批。
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+class TextEmbeddingCache:
+    """文本嵌入 LRU 缓存（容量为 0 时不缓存）"""
+
+    def __init__(self, max_size: int = 1024):
+        """
+        Args:
+            max_size: 最大缓存条目数
+        """
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        # 统计
+        self._hits = 0
+        self._misses = 0
+        self._evicted = 0
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        """读取缓存，未命中时返回None"""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: np.ndarray) -> np.ndarray:
+        """写入缓存（只读副本），超出容量时淘汰最久未使用的条目；返回写入的只读副本"""
+        embedding = np.array(embedding, dtype=np.float32)
+        embedding.setflags(write=False)
+        if self.max_size <= 0:
+            return embedding
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evicted += 1
+        return embedding
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'evicted': self._evicted,
+            }
+
+
+class _PendingQuery:
+    """排队中的一条查询"""
+
+    __slots__ = ('text', 'event', 'result', 'error', 'done')
+
+    def __init__(self, text: str):
+        self.text = text
+        self.event = threading.Event()
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class TextQueryBatcher:
+    """线程间的文本查询微批：并发查询合并为一次批量编码"""
+
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0):
+        """
+        Args:
+            encode_fn: 批量编码函数，输入文本列表，返回 (n, dim) 嵌入
+            max_batch_size: 一批最多合并的查询数
+            max_wait_ms: leader 等待同批查询的最长时间（毫秒）
+        """
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._cond = threading.Condition()
+        self._queue: List[_PendingQuery] = []
+        self._leader_active = False
+        self.stats = {'requests': 0, 'items': 0, 'batches': 0, 'max_batch': 0}
+
+    def encode(self, text: str) -> np.ndarray:
+        """编码一条查询（阻塞到所在批次完成）"""
+        request = _PendingQuery(text)
+        with self._cond:
+            self._queue.append(request)
+            self.stats['requests'] += 1
+            lead = not self._leader_active
+            if lead:
+                self._leader_active = True
+            else:
+                self._cond.notify_all()
+        while True:
+            if lead:
+                self._lead()
+            request.event.wait()
+            if request.done:
+                break
+            # 被上一个 leader 唤醒但查询还在队列中：接任 leader
+            request.event.clear()
+            lead = True
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _lead(self):
+        """收集一批查询并编码，完成后把 leader 交给队列中的下一个请求线程"""
+        deadline = time.monotonic() + self.max_wait
+        with self._cond:
+            while len(self._queue) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._cond.wait(timeout)
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+
+        # 同一批中的重复查询只编码一次
+        texts = list(dict.fromkeys(request.text for request in batch))
+        try:
+            embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            if len(embeddings) != len(texts):
+                raise ValueError(f"批量编码返回 {len(embeddings)} 条结果，期望 {len(texts)} 条")
+            by_text = dict(zip(texts, embeddings))
+            for request in batch:
+                request.result = by_text[request.text]
+        except Exception as e:
+            for request in batch:
+                request.error = e
+
+        with self._cond:
+            self.stats['items'] += len(texts)
+            self.stats['batches'] += 1
+            self.stats['max_batch'] = max(self.stats['max_batch'], len(texts))
+            if self._queue:
+                self._queue[0].event.set()
+            else:
+                self._leader_active = False
+        for request in batch:
+            request.done = True
+            request.event.set()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats = dict(self.stats)
+            stats['avg_batch'] = round(stats['items'] / stats['batches'], 2) if stats['batches'] else 0.0
+            stats['queued'] = len(self._queue)
+        return stats
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分词服务模块
+各子系统共享的 jieba 分词入口：
+- 查询、摘要等查询时文本走有界 LRU 缓存
+- 索引文档走持久化的词ID库（按文本哈希存储词ID序列），索引构建时一次写入，条目数有上限
+"""
+
+import atexit
+import hashlib
+import os
+import pickle
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from itertools import islice
+from typing import Dict, Iterable, List, Optional
+
+import jieba
+
+
+class TokenizationService:
+    """共享分词服务"""
+
+    STORE_VERSION = 1
+
+    def __init__(self, cache_size: int = 10000, store_path: Optional[str] = "models/token_store.pkl",
+                 max_store_entries: int = 100000):
+        """
+        Args:
+            cache_size: 查询LRU缓存容量
+            store_path: 词ID库文件路径，为None时不持久化
+            max_store_entries: 词ID库最多保存的文本数，写满后新文本只分词不入库
+        """
+        self.cache_size = cache_size
+        self.store_path = store_path
+        self.max_store_entries = max_store_entries
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+
+        # 词ID库：词表 + 文本哈希 -> 词ID序列
+        self._vocab: Dict[str, int] = {}
+        self._tokens: List[str] = []
+        self._entries: Dict[bytes, array] = {}
+        self._dirty = False
+
+        # 统计
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._store_hits = 0
+        self._store_misses = 0
+        self._store_rejected = 0
+        self._tokenize_calls = 0
+        self._tokenize_seconds = 0.0
+
+        if store_path:
+            self.load_store()
+            atexit.register(self.save_store)
+
+    @staticmethod
+    def _text_key(text: str) -> bytes:
+        return hashlib.md5(text.encode('utf-8')).digest()
+
+    def _tokenize(self, text: str) -> List[str]:
+        """调用jieba分词并计时（不持锁，避免阻塞其他线程的缓存命中）"""
+        # 词典加载不计入分词耗时，否则会高估节省的时间
+        if not jieba.dt.initialized:
+            jieba.initialize()
+        start = time.perf_counter()
+        words = jieba.lcut(text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._tokenize_calls += 1
+            self._tokenize_seconds += elapsed
+        return words
+
+    def _encode(self, words: Iterable[str]) -> array:
+        """词序列 -> 词ID数组（调用方持锁）"""
+        ids = array('I')
+        for word in words:
+            token_id = self._vocab.get(word)
+            if token_id is None:
+                token_id = self._vocab[word] = len(self._tokens)
+                self._tokens.append(word)
+            ids.append(token_id)
+        return ids
+
+    def lcut(self, text: str, persist: bool = False) -> List[str]:
+        """
+        分词（与 jieba.lcut 结果一致）
+
+        Args:
+            text: 待分词文本
+            persist: True 时使用持久化词ID库（仅索引文档），否则使用LRU缓存（查询、摘要等）
+
+        Returns:
+            List[str]: 分词结果（调用方可自由修改）
+        """
+        if persist:
+            return self._lcut_persisted(text)
+
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                self._cache_hits += 1
+                return list(cached)
+            self._cache_misses += 1
+
+        words = self._tokenize(text)
+        with self._lock:
+            self._cache[text] = tuple(words)
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return words
+
+    def _lcut_persisted(self, text: str) -> List[str]:
+        key = self._text_key(text)
+        with self._lock:
+            ids = self._entries.get(key)
+            if ids is not None:
+                self._store_hits += 1
+                tokens = self._tokens
+                return [tokens[i] for i in ids]
+            self._store_misses += 1
+
+        words = self._tokenize(text)
+        self.store(text, words)
+        return words
+
+    def store(self, text: str, words: List[str]):
+        """写入已分词的文本（索引构建时由分词进程返回结果后批量写入）"""
+        key = self._text_key(text)
+        with self._lock:
+            if key in self._entries:
+                return
+            if len(self._entries) >= self.max_store_entries:
+                self._store_rejected += 1
+                return
+            self._entries[key] = self._encode(words)
+            self._dirty = True
+
+    def load_store(self) -> bool:
+        """从文件加载词ID库"""
+        if not self.store_path or not os.path.exists(self.store_path):
+            return False
+        try:
+            with open(self.store_path, 'rb') as f:
+                data = pickle.load(f)
+            if data.get('version') != self.STORE_VERSION:
+                print(f"⚠️ 词ID库版本不匹配，忽略: {self.store_path}")
+                return False
+            entries = data['entries']
+            with self._lock:
+                self._tokens = data['tokens']
+                self._vocab = {token: i for i, token in enumerate(self._tokens)}
+                # 超出上限的旧库（如曾写入摘要）只保留最早写入的条目，下次保存时缩小文件
+                self._dirty = len(entries) > self.max_store_entries
+                self._entries = dict(islice(entries.items(), self.max_store_entries)) if self._dirty else entries
+            print(f"✅ 词ID库加载成功: {len(self._entries)}条文本, {len(self._tokens)}个词")
+            return True
+        except Exception as e:
+            print(f"❌ 加载词ID库失败: {e}")
+            return False
+
+    def save_store(self) -> bool:
+        """保存词ID库（无新增内容时跳过）"""
+        if not self.store_path or not self._dirty:
+            return False
+        try:
+            with self._lock:
+                data = {'version': self.STORE_VERSION, 'tokens': list(self._tokens), 'entries': dict(self._entries)}
+                self._dirty = False
+            directory = os.path.dirname(self.store_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_file = self.store_path + ".tmp"
+            with open(temp_file, 'wb') as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_file, self.store_path)
+            return True
+        except Exception as e:
+            print(f"❌ 保存词ID库失败: {e}")
+            return False
+
+    def clear_cache(self):
+        """清空查询缓存"""
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        """
+        获取缓存统计
+
+        Returns:
+            Dict: 命中率、估算节省的分词耗时等
+        """
+        with self._lock:
+            hits = self._cache_hits + self._store_hits
+            lookups = hits + self._cache_misses + self._store_misses
+            avg_tokenize_ms = self._tokenize_seconds * 1000 / self._tokenize_calls if self._tokenize_calls else 0.0
+            return {
+                'cache_size': len(self._cache),
+                'cache_capacity': self.cache_size,
+                'cache_hits': self._cache_hits,
+                'cache_misses': self._cache_misses,
+                'store_entries': len(self._entries),
+                'store_capacity': self.max_store_entries,
+                'store_rejected': self._store_rejected,
+                'store_vocab': len(self._tokens),
+                'store_hits': self._store_hits,
+                'store_misses': self._store_misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'avg_tokenize_ms': avg_tokenize_ms,
+                # 每次命中按平均分词耗时估算
+                'time_saved_seconds': hits * avg_tokenize_ms / 1000,
+            }
+
+
+# 全局分词服务实例
+_tokenization_service = None
+
+
+def get_tokenization_service() -> TokenizationService:
+    """
+    获取全局分词服务实例（单例模式）
+
+    Returns:
+        TokenizationService: 分词服务实例
+    """
+    global _tokenization_service
+    if _tokenization_service is None:
+        _tokenization_service = TokenizationService()
+    return _tokenization_service
+
+
+def configure_tokenization_service(cache_size: int = 10000,
+                                   store_path: Optional[str] = "models/token_store.pkl",
+                                   max_store_entries: int = 100000) -> TokenizationService:
+    """
+    用指定配置替换全局分词服务实例（如基准测试时关闭持久化）
+
+    Returns:
+        TokenizationService: 新的分词服务实例
+    """
+    global _tokenization_service
+    _tokenization_service = TokenizationService(cache_size=cache_size, store_path=store_path,
+                                                max_store_entries=max_store_entries)
+    return _tokenization_service
+
+
+def reset_tokenization_service():
+    """重置全局分词服务实例"""
+    global _tokenization_service
+    _tokenization_service = None
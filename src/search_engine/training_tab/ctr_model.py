@@ -11,142 +11,42 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, roc_auc_score
-import pickle
 import os
-from typing import List, Dict, Any, Tuple
-import jieba
+from typing import List, Dict, Any, Tuple, Union
 from sklearn.model_selection import StratifiedShuffleSplit
+from .feature_pipeline import FeaturePipeline
+from .model_artifact import ARTIFACT_EXT, LEGACY_EXT, load_artifact, load_legacy_pickle, resolve_model_file, save_artifact
 from .ctr_config import CTRFeatureConfig, CTRTrainingConfig, ctr_feature_config, ctr_training_config
 
 class CTRModel:
     """CTR模型类"""
     
+    # 加载时内存映射权重（只读）；会原地更新参数的子类设为False
+    ARTIFACT_MMAP = True
+    
     def __init__(self):
         self.model = None
         self.vectorizer = None
         self.scaler = None
         self.is_trained = False
+        self.pipeline = FeaturePipeline()
     
-    def extract_features(self, ctr_data: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
-        """从CTR数据中提取特征"""
-        if not ctr_data:
-            return np.array([]), np.array([])
-        
-        # 转换为DataFrame
-        df = pd.DataFrame(ctr_data)
-        
-        # 1. 位置特征（绝对位置）
-        position_features = df['position'].values.reshape(-1, 1)
-        
-        # 2. 文档长度特征
-        doc_lengths = df['doc_length'].values.reshape(-1, 1)
-        
-        # 3. 查询长度特征
-        query_lengths = df['query'].str.len().values.reshape(-1, 1)
-        
-        # 4. 摘要长度特征
-        summary_lengths = df['summary'].str.len().values.reshape(-1, 1)
-        
-        # 5. 查询词在摘要中的匹配度
-        match_scores = []
-        for _, row in df.iterrows():
-            query_words = set(jieba.lcut(row['query']))
-            summary_words = set(jieba.lcut(row['summary']))
-            if len(query_words) > 0:
-                match_ratio = len(query_words.intersection(summary_words)) / len(query_words)
-            else:
-                match_ratio = 0
-            match_scores.append(match_ratio)
-        match_scores = np.array(match_scores).reshape(-1, 1)
-        
-        # 6. 历史点击率特征（基于查询的统计）- 修复数据泄露
-        # 按时间戳排序，确保历史特征只使用过去的数据
-        df_sorted = df.sort_values('timestamp').reset_index(drop=True)
-        
-        query_ctr_features = []
-        doc_ctr_features = []
-        
-        for idx, row in df_sorted.iterrows():
-            # 查询历史CTR - 只使用当前样本之前的数据
-            query = row['query']
-            query_history = df_sorted.loc[:idx-1]  # 不包括当前样本
-            query_history_filtered = query_history[query_history['query'] == query]
-            
-            if len(query_history_filtered) > 0:
-                query_ctr = query_history_filtered['clicked'].mean()
-            else:
-                query_ctr = 0.1  # 默认值
-            query_ctr_features.append(query_ctr)
-            
-            # 文档历史CTR - 只使用当前样本之前的数据
-            doc_id = row['doc_id']
-            doc_history = df_sorted.loc[:idx-1]  # 不包括当前样本
-            doc_history_filtered = doc_history[doc_history['doc_id'] == doc_id]
-            
-            if len(doc_history_filtered) > 0:
-                doc_ctr = doc_history_filtered['clicked'].mean()
-            else:
-                doc_ctr = 0.1  # 默认值
-            doc_ctr_features.append(doc_ctr)
-        
-        # 按原始顺序重新排列
-        original_order = df.index
-        query_ctr_features = [query_ctr_features[i] for i in original_order]
-        doc_ctr_features = [doc_ctr_features[i] for i in original_order]
-        
-        query_ctr_features = np.array(query_ctr_features).reshape(-1, 1)
-        doc_ctr_features = np.array(doc_ctr_features).reshape(-1, 1)
-        
-        # 7. 添加更多变化性特征
-        # 查询词数量
-        query_word_counts = []
-        for _, row in df.iterrows():
-            word_count = len(jieba.lcut(row['query']))
-            query_word_counts.append(word_count)
-        query_word_counts = np.array(query_word_counts).reshape(-1, 1)
-        
-        # 摘要词数量
-        summary_word_counts = []
-        for _, row in df.iterrows():
-            word_count = len(jieba.lcut(row['summary']))
-            summary_word_counts.append(word_count)
-        summary_word_counts = np.array(summary_word_counts).reshape(-1, 1)
+    def extract_features(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame], fit: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        从CTR数据中提取特征（训练、评估与预测共用特征流水线）
         
-        # 时间特征（基于timestamp的数值化）
-        time_features = []
-        for _, row in df.iterrows():
-            try:
-                # 提取时间戳中的数值部分作为特征
-                timestamp_str = str(row['timestamp'])
-                time_value = sum(ord(c) for c in timestamp_str) % 1000  # 简单的哈希
-                time_features.append(time_value)
-            except:
-                time_features.append(0)
-        time_features = np.array(time_features).reshape(-1, 1)
-        
-        # 8. 位置衰减特征（位置越靠前，权重越高）
-        position_decay = 1.0 / (position_features + 1)  # 避免除零
-        
-        # 组合所有特征
-        features = np.hstack([
-            position_features,           # 位置
-            doc_lengths,                 # 文档长度
-            query_lengths,               # 查询长度
-            summary_lengths,             # 摘要长度
-            match_scores,                # 查询匹配度
-            query_ctr_features,          # 查询历史CTR
-            doc_ctr_features,            # 文档历史CTR
-            position_decay,              # 位置衰减
-            query_word_counts,           # 查询词数量
-            summary_word_counts,         # 摘要词数量
-            time_features,               # 时间特征
-            df['score'].values.reshape(-1, 1)  # 原始相似度分数
-        ])
-        
-        # 标签
-        labels = df['clicked'].values
+        Args:
+            ctr_data: CTR数据列表或DataFrame
+            fit: 是否先用这批数据拟合流水线（训练时为True；流水线未拟合时总会拟合）
+        """
+        if ctr_data is None or len(ctr_data) == 0:
+            return np.array([]), np.array([])
         
-        return features, labels
+        if fit or not self.pipeline.fitted:
+            self.pipeline.fit(ctr_data)
+        # 历史CTR按时间戳只使用当前样本之前的数据（修复数据泄露）
+        columns = self.pipeline.transform(ctr_data)
+        return self.pipeline.lr_features(columns), columns['clicked']
     
     def _empty_metrics(self, error_msg):
         return {
@@ -163,13 +63,13 @@ class CTRModel:
             'data_quality': {}
         }
     
-    def train(self, ctr_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def train(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame]) -> Dict[str, Any]:
         """训练CTR模型"""
-        if not ctr_data:
+        if ctr_data is None or len(ctr_data) == 0:
             return self._empty_metrics('没有CTR数据用于训练')
         
         # 检查数据分布
-        df = pd.DataFrame(ctr_data)
+        df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame(ctr_data)
         total_samples = len(df)
         click_samples = df['clicked'].sum()
         no_click_samples = total_samples - click_samples
@@ -196,7 +96,7 @@ class CTRModel:
         
         try:
             # 提取特征
-            features, labels = self.extract_features(ctr_data)
+            features, labels = self.extract_features(ctr_data, fit=True)
             if len(features) == 0:
                 return self._empty_metrics('特征提取失败')
             # 检查特征质量 - 降低阈值，允许更多变化
@@ -281,6 +181,7 @@ class CTRModel:
                 'train_score': round(train_score, 4),
                 'test_score': round(test_score, 4),
                 'feature_weights': feature_weights,
+                'feature_timings': dict(self.pipeline.last_timings),
                 'data_quality': {
                     'total_samples': total_samples,
                     'click_rate': round(click_samples / total_samples, 4),
@@ -294,107 +195,133 @@ class CTRModel:
     
     def predict_ctr(self, query: str, doc_id: str, position: int, score: float, summary: str) -> float:
         """预测CTR分数"""
+        return self.predict_ctr_batch([{
+            'query': query,
+            'doc_id': doc_id,
+            'position': position,
+            'score': score,
+            'summary': summary
+        }])[0]
+    
+    def predict_ctr_batch(self, features_list: List[Dict[str, Any]]) -> List[float]:
+        """
+        批量预测CTR分数（一次构建特征矩阵、一次模型调用）
+        
+        Args:
+            features_list: 每项包含 query、doc_id、position、score、summary
+        
+        Returns:
+            List[float]: 与输入顺序一致的CTR分数
+        """
+        if not features_list:
+            return []
         if not self.is_trained or not self.model:
-            return score  # 如果模型未训练，返回原始分数
+            return [item.get('score', 0.0) for item in features_list]  # 如果模型未训练，返回原始分数
         
         try:
-            # 构建特征（与训练时保持一致）
-            position_feature = np.array([[position]])
-            doc_length = np.array([[len(summary)]])
-            query_length = np.array([[len(query)]])
-            summary_length = np.array([[len(summary)]])
-            
-            # 查询匹配度
-            query_words = set(jieba.lcut(query))
-            summary_words = set(jieba.lcut(summary))
-            if len(query_words) > 0:
-                match_ratio = len(query_words.intersection(summary_words)) / len(query_words)
-            else:
-                match_ratio = 0
-            match_score = np.array([[match_ratio]])
-            
-            # 历史CTR特征（简化版本，实际应用中需要从数据库获取）
-            query_ctr = np.array([[0.1]])  # 默认值
-            doc_ctr = np.array([[0.1]])    # 默认值
-            
-            # 位置衰减
-            position_decay = np.array([[1.0 / (position + 1)]])
-            
-            # 组合特征
-            features = np.hstack([
-                position_feature,      # 位置
-                doc_length,            # 文档长度
-                query_length,          # 查询长度
-                summary_length,        # 摘要长度
-                match_score,           # 查询匹配度
-                query_ctr,             # 查询历史CTR
-                doc_ctr,               # 文档历史CTR
-                position_decay,        # 位置衰减
-                np.array([[len(jieba.lcut(query))]]),  # 查询词数量
-                np.array([[len(jieba.lcut(summary))]]), # 摘要词数量
-                np.array([[0]]),       # 时间特征（预测时设为0）
-                np.array([[score]])    # 原始相似度分数
-            ])
+            # 与训练相同的特征流水线，历史CTR从在线特征存储读取
+            columns = self.pipeline.transform(features_list, history='online')
+            features = self.pipeline.lr_features(columns)
             
             # 标准化
             if self.scaler:
-                features_scaled = self.scaler.transform(features)
-            else:
-                features_scaled = features
+                features = self.scaler.transform(features)
             
             # 预测CTR概率
-            ctr_score = self.model.predict_proba(features_scaled)[0, 1]
-            
-            return ctr_score
+            return [float(p) for p in self.model.predict_proba(features)[:, 1]]
             
         except Exception as e:
             print(f"CTR预测失败: {e}")
-            return score  # 返回原始分数
+            return [item.get('score', 0.0) for item in features_list]  # 返回原始分数
     
     def save_model(self, filepath: str = None):
-        """保存模型"""
+        """保存模型（.npz 权重 + 同名 .json 元数据）"""
         if self.is_trained and self.model:
             # 如果没有指定文件路径，使用默认路径
             if filepath is None:
                 # 统一使用项目根目录的相对路径
-                filepath = os.path.join("models", "ctr_model.pkl")
-            
-            # 确保目录存在
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+                filepath = os.path.join("models", "ctr_model.npz")
             
-            model_data = {
-                'model': self.model,
-                'vectorizer': self.vectorizer,
-                'scaler': self.scaler,
-                'is_trained': self.is_trained
-            }
-            with open(filepath, 'wb') as f:
-                pickle.dump(model_data, f)
+            save_artifact(filepath, self._model_state(), meta={'model_class': type(self).__name__})
             print(f"CTR模型已保存到 {filepath}")
     
-    def load_model(self, filepath: str = None):
-        """加载模型"""
+    def load_model(self, filepath: str = None, verify: bool = True, allow_legacy: bool = False):
+        """加载模型
+        
+        Args:
+            filepath: 模型文件路径
+            verify: 校验 .npz 的 sha256
+            allow_legacy: .npz 不存在时加载同名的旧 .pkl 文件（pickle 会执行文件中的代码，
+                默认不加载，请用 migrate_legacy 迁移）
+        """
         # 如果没有指定文件路径，使用默认路径
         if filepath is None:
             # 统一使用项目根目录的相对路径
-            filepath = os.path.join("models", "ctr_model.pkl")
+            filepath = os.path.join("models", "ctr_model.npz")
         
-        if os.path.exists(filepath):
-            try:
-                with open(filepath, 'rb') as f:
-                    model_data = pickle.load(f)
-                
-                self.model = model_data['model']
-                self.vectorizer = model_data['vectorizer']
-                self.scaler = model_data['scaler']
-                self.is_trained = model_data['is_trained']
-                
-                print(f"CTR模型已从 {filepath} 加载")
-                return True
-            except Exception as e:
-                print(f"加载CTR模型失败: {e}")
-                return False
-        return False
+        resolved = resolve_model_file(filepath)
+        if resolved is None:
+            return False
+        try:
+            if resolved.endswith(LEGACY_EXT):
+                if not allow_legacy:
+                    print(f"⚠️ 发现旧格式模型 {resolved}，未加载（pickle 会执行文件中的代码）；"
+                          f"请确认来源可信后调用 migrate_legacy 迁移为 {ARTIFACT_EXT}")
+                    return False
+                model_data = load_legacy_pickle(resolved)
+            else:
+                model_data, _ = load_artifact(resolved, mmap=self.ARTIFACT_MMAP, verify=verify)
+            
+            self._restore_state(model_data)
+            
+            print(f"CTR模型已从 {resolved} 加载")
+            return True
+        except Exception as e:
+            print(f"加载CTR模型失败: {e}")
+            return False
+    
+    def migrate_legacy(self, legacy_path: str, filepath: str = None) -> bool:
+        """
+        把旧的 .pkl 模型迁移为 .npz + .json（只对可信来源的文件调用）
+        
+        Args:
+            legacy_path: 旧 .pkl 文件路径
+            filepath: 输出的 .npz 路径，默认与旧文件同名
+        
+        Returns:
+            bool: 是否迁移成功
+        """
+        if filepath is None:
+            filepath = os.path.splitext(legacy_path)[0] + ARTIFACT_EXT
+        if not legacy_path.endswith(LEGACY_EXT) or not os.path.exists(legacy_path):
+            print(f"❌ 旧格式模型文件不存在: {legacy_path}")
+            return False
+        if not self.load_model(legacy_path, allow_legacy=True):
+            return False
+        if not self.is_trained or self.model is None:
+            print(f"❌ 旧格式模型未训练，无法迁移: {legacy_path}")
+            return False
+        self.save_model(filepath)
+        print(f"✅ 旧格式模型已迁移: {legacy_path} -> {filepath}")
+        return True
+    
+    def _model_state(self) -> Dict[str, Any]:
+        """模型文件中保存的内容"""
+        return {
+            'model': self.model,
+            'vectorizer': self.vectorizer,
+            'scaler': self.scaler,
+            'pipeline': self.pipeline.to_dict(),
+            'is_trained': self.is_trained
+        }
+    
+    def _restore_state(self, model_data: Dict[str, Any]):
+        """从模型文件内容恢复"""
+        self.model = model_data['model']
+        self.vectorizer = model_data['vectorizer']
+        self.scaler = model_data['scaler']
+        self.pipeline = FeaturePipeline.from_dict(model_data.get('pipeline'))
+        self.is_trained = model_data['is_trained']
     
     def reset(self):
         """重置模型"""
@@ -402,4 +329,5 @@ class CTRModel:
         self.vectorizer = None
         self.scaler = None
         self.is_trained = False
+        self.pipeline = FeaturePipeline()
         print("CTR模型已重置") 
\ No newline at end of file
@@ -6,24 +6,31 @@ Wide & Deep CTR模型模块 - 基于TensorFlow的Wide & Deep Learning
 
 import pandas as pd
 import numpy as np
-import pickle
 import os
-from typing import List, Dict, Any, Tuple, Optional
-import jieba
-from datetime import datetime
+import importlib.util
+from typing import List, Dict, Any, Tuple, Optional, Union
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report, roc_auc_score
 from .ctr_config import CTRFeatureConfig, CTRTrainingConfig
+from .feature_pipeline import FeaturePipeline
+from .model_artifact import LEGACY_EXT, load_artifact, load_legacy_pickle, save_artifact
+from .wide_deep_runtime import WideDeepRuntime
 
-try:
-    import tensorflow as tf
-    from tensorflow import keras
-    from tensorflow.keras import layers
-    TF_AVAILABLE = True
-except ImportError:
-    TF_AVAILABLE = False
-    print("⚠️ TensorFlow未安装，Wide & Deep模型将不可用")
+# TensorFlow 只在训练或加载 Keras 模型时导入；有 NumPy 运行时文件时推理不依赖 TensorFlow
+TF_AVAILABLE = importlib.util.find_spec("tensorflow") is not None
+tf = keras = layers = None
+if not TF_AVAILABLE:
+    print("⚠️ TensorFlow未安装，Wide & Deep模型只能使用已导出的NumPy运行时")
+
+
+def _import_tensorflow():
+    """按需导入TensorFlow"""
+    global tf, keras, layers
+    if keras is None:
+        import tensorflow as tf
+        from tensorflow import keras
+        from tensorflow.keras import layers
 
 class WideAndDeepCTRModel:
     """Wide & Deep CTR模型类"""
@@ -35,198 +42,43 @@ class WideAndDeepCTRModel:
         self.categorical_encoders = {}
         self.is_trained = False
         self.feature_columns = None
-        
-        if not TF_AVAILABLE:
-            print("❌ TensorFlow未安装，无法使用Wide & Deep模型")
+        # NumPy推理运行时（加载了导出文件时使用，不需要TensorFlow）
+        self.runtime: Optional[WideDeepRuntime] = None
+        self.pipeline = FeaturePipeline()
     
     def _check_tensorflow(self):
         """检查TensorFlow是否可用"""
         if not TF_AVAILABLE:
             raise ImportError("TensorFlow未安装，请运行: pip install tensorflow")
+        _import_tensorflow()
     
-    def extract_features(self, ctr_data: List[Dict[str, Any]], is_training: bool = True, train_indices: Optional[np.ndarray] = None) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
+    def extract_features(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame], is_training: bool = True, train_indices: Optional[np.ndarray] = None,
+                         history_ctr: Optional[np.ndarray] = None, fit: bool = False) -> Tuple[Dict[str, np.ndarray], np.ndarray]:
         """
-        从CTR数据中提取Wide和Deep特征（修复数据泄露问题）
+        从CTR数据中提取Wide和Deep特征（修复数据泄露问题，训练、评估与预测共用特征流水线）
         
         Args:
-            ctr_data: CTR数据列表
+            ctr_data: CTR数据列表或DataFrame
             is_training: 是否为训练模式
             train_indices: 训练集索引（用于避免数据泄露）
+            history_ctr: 预先给定的历史CTR (N, 2)
+            fit: 是否先用这批数据拟合流水线（训练时为True；流水线未拟合时总会拟合）
         
         Returns:
             Tuple[Dict[str, np.ndarray], np.ndarray]: (特征字典, 标签)
         """
-        if not ctr_data:
+        if ctr_data is None or len(ctr_data) == 0:
             return {}, np.array([])
         
-        # 转换为DataFrame
-        df = pd.DataFrame(ctr_data)
-        
-        # === Wide特征 (线性特征) ===
-        wide_features = []
-        
-        # 1. 位置特征
-        position_features = df['position'].values.reshape(-1, 1)
-        wide_features.append(position_features)
-        
-        # 2. 位置衰减特征
-        position_decay = 1.0 / (position_features.flatten() + 1)
-        wide_features.append(position_decay.reshape(-1, 1))
-        
-        # 3. 原始相似度分数
-        score_features = df['score'].values.reshape(-1, 1)
-        wide_features.append(score_features)
-        
-        # 4. 查询匹配度
-        match_scores = []
-        for _, row in df.iterrows():
-            query_words = set(jieba.lcut(row['query']))
-            summary_words = set(jieba.lcut(row['summary']))
-            if len(query_words) > 0:
-                match_ratio = len(query_words.intersection(summary_words)) / len(query_words)
-            else:
-                match_ratio = 0
-            match_scores.append(match_ratio)
-        wide_features.append(np.array(match_scores).reshape(-1, 1))
-        
-        # 5. 历史CTR特征（修复数据泄露）
-        query_ctr_features = []
-        doc_ctr_features = []
-        
-        # 保持原始索引到排序索引的映射
-        df_with_orig_idx = df.reset_index()
-        df_with_orig_idx['orig_idx'] = df_with_orig_idx['index']
-        df_sorted = df_with_orig_idx.sort_values('timestamp').reset_index(drop=True)
-        
-        for idx, row in df_sorted.iterrows():
-            # 查询历史CTR - 只使用当前样本之前的数据
-            query = row['query']
-            query_history = df_sorted.loc[:idx-1]
-            
-            # 如果是训练模式且有训练集索引，只使用训练集数据计算历史CTR
-            if is_training and train_indices is not None:
-                query_history = query_history[query_history['orig_idx'].isin(train_indices)]
-            
-            query_history_filtered = query_history[query_history['query'] == query]
-            
-            if len(query_history_filtered) > 0:
-                query_ctr = query_history_filtered['clicked'].mean()
-            else:
-                query_ctr = 0.1
-            query_ctr_features.append(query_ctr)
-            
-            # 文档历史CTR - 只使用当前样本之前的数据
-            doc_id = row['doc_id']
-            doc_history = df_sorted.loc[:idx-1]
-            
-            # 如果是训练模式且有训练集索引，只使用训练集数据计算历史CTR
-            if is_training and train_indices is not None:
-                doc_history = doc_history[doc_history['orig_idx'].isin(train_indices)]
-            
-            doc_history_filtered = doc_history[doc_history['doc_id'] == doc_id]
-            
-            if len(doc_history_filtered) > 0:
-                doc_ctr = doc_history_filtered['clicked'].mean()
-            else:
-                doc_ctr = 0.1
-            doc_ctr_features.append(doc_ctr)
-        
-        # 创建排序索引到原始索引的映射
-        sorted_to_orig = {i: row['orig_idx'] for i, row in df_sorted.iterrows()}
-        
-        # 按原始顺序重新排列特征（保持时间因果关系）
-        query_ctr_reordered = [0.1] * len(df)
-        doc_ctr_reordered = [0.1] * len(df)
-        
-        for sorted_idx, orig_idx in sorted_to_orig.items():
-            query_ctr_reordered[orig_idx] = query_ctr_features[sorted_idx]
-            doc_ctr_reordered[orig_idx] = doc_ctr_features[sorted_idx]
-        
-        wide_features.append(np.array(query_ctr_reordered).reshape(-1, 1))
-        wide_features.append(np.array(doc_ctr_reordered).reshape(-1, 1))
-        
-        # 合并Wide特征
-        wide_features_combined = np.hstack(wide_features)
-        
-        # === Deep特征 (非线性特征) ===
-        deep_features = []
-        
-        # 1. 长度特征
-        doc_lengths = df['doc_length'].values.reshape(-1, 1)
-        query_lengths = df['query'].str.len().values.reshape(-1, 1)
-        summary_lengths = df['summary'].str.len().values.reshape(-1, 1)
-        deep_features.extend([doc_lengths, query_lengths, summary_lengths])
-        
-        # 2. 词数量特征
-        query_word_counts = []
-        summary_word_counts = []
-        for _, row in df.iterrows():
-            query_word_count = len(jieba.lcut(row['query']))
-            summary_word_count = len(jieba.lcut(row['summary']))
-            query_word_counts.append(query_word_count)
-            summary_word_counts.append(summary_word_count)
-        
-        deep_features.append(np.array(query_word_counts).reshape(-1, 1))
-        deep_features.append(np.array(summary_word_counts).reshape(-1, 1))
-        
-        # 3. 时间特征
-        time_features = []
-        for _, row in df.iterrows():
-            try:
-                timestamp_str = str(row['timestamp'])
-                time_value = sum(ord(c) for c in timestamp_str) % 1000
-                time_features.append(time_value)
-            except:
-                time_features.append(0)
-        deep_features.append(np.array(time_features).reshape(-1, 1))
-        
-        # 4. 交叉特征 (位置×分数，查询长度×匹配度等)
-        position_score_cross = position_features.flatten() * score_features.flatten()
-        query_len_match_cross = np.array(query_lengths).flatten() * np.array(match_scores)
-        
-        deep_features.append(position_score_cross.reshape(-1, 1))
-        deep_features.append(query_len_match_cross.reshape(-1, 1))
-        
-        # 合并Deep特征
-        deep_features_combined = np.hstack(deep_features)
-        
-        # === 分类特征 (嵌入特征) ===
-        # 查询哈希特征 - 使用abs确保非负数
-        query_hashes = []
-        for query in df['query']:
-            query_hash = abs(hash(query)) % 1000  # 简单哈希到1000个桶，确保非负
-            query_hashes.append(query_hash)
-        
-        # 文档ID哈希特征 - 使用abs确保非负数
-        doc_hashes = []
-        for doc_id in df['doc_id']:
-            doc_hash = abs(hash(doc_id)) % 1000  # 简单哈希到1000个桶，确保非负
-            doc_hashes.append(doc_hash)
-        
-        # 位置分组特征
-        position_groups = []
-        for pos in df['position']:
-            if pos <= 3:
-                group = 0  # 头部
-            elif pos <= 10:
-                group = 1  # 中部
-            else:
-                group = 2  # 尾部
-            position_groups.append(group)
-        
-        # 标签
-        labels = df['clicked'].values
-        
-        # 返回特征字典
-        features = {
-            'wide': wide_features_combined,
-            'deep': deep_features_combined,
-            'query_hash': np.array(query_hashes),
-            'doc_hash': np.array(doc_hashes),
-            'position_group': np.array(position_groups)
-        }
-        
-        return features, labels
+        if fit or not self.pipeline.fitted:
+            self.pipeline.fit(ctr_data)
+        # 历史CTR只使用当前样本之前的数据；训练模式下只统计训练集样本
+        columns = self.pipeline.transform(
+            ctr_data,
+            train_indices=train_indices if is_training else None,
+            history_ctr=history_ctr
+        )
+        return self.pipeline.wide_deep_features(columns), columns['clicked']
     
     def _build_model(self, wide_dim: int, deep_dim: int, vocab_sizes: Dict[str, int]):
         """构建Wide & Deep模型"""
@@ -303,16 +155,17 @@ class WideAndDeepCTRModel:
             'data_quality': {}
         }
     
-    def train(self, ctr_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def train(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame]) -> Dict[str, Any]:
         """训练Wide & Deep模型"""
         if not TF_AVAILABLE:
             return self._empty_metrics('TensorFlow未安装，无法训练Wide & Deep模型')
+        _import_tensorflow()
         
-        if not ctr_data:
+        if ctr_data is None or len(ctr_data) == 0:
             return self._empty_metrics('没有CTR数据用于训练')
         
         # 检查数据分布
-        df = pd.DataFrame(ctr_data)
+        df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame(ctr_data)
         total_samples = len(df)
         click_samples = df['clicked'].sum()
         no_click_samples = total_samples - click_samples
@@ -339,7 +192,7 @@ class WideAndDeepCTRModel:
         
         try:
             # 首先进行数据分割（在特征提取之前）
-            df = pd.DataFrame(ctr_data)
+            df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame(ctr_data)
             labels_temp = df['clicked'].values
             
             # 数据分割
@@ -349,7 +202,7 @@ class WideAndDeepCTRModel:
             )
             
             # 提取特征（传入训练集索引以避免数据泄露）
-            features, labels = self.extract_features(ctr_data, is_training=True, train_indices=train_indices)
+            features, labels = self.extract_features(ctr_data, is_training=True, train_indices=train_indices, fit=True)
             if len(features) == 0:
                 return self._empty_metrics('特征提取失败')
             
@@ -501,29 +354,43 @@ class WideAndDeepCTRModel:
     
     def predict_ctr(self, query: str, doc_id: str, position: int, score: float, summary: str, current_timestamp: str = None) -> float:
         """预测CTR分数"""
-        if not self.is_trained or not self.model:
-            return score  # 如果模型未训练，返回原始分数
+        return self.predict_ctr_batch([{
+            'query': query,
+            'doc_id': doc_id,
+            'position': position,
+            'score': score,
+            'summary': summary,
+            'timestamp': current_timestamp
+        }])[0]
+    
+    def predict_ctr_batch(self, features_list: List[Dict[str, Any]]) -> List[float]:
+        """
+        批量预测CTR分数（一次特征提取、一次模型调用）
+        
+        Args:
+            features_list: 每项包含 query、doc_id、position、score、summary，可选 timestamp
+        
+        Returns:
+            List[float]: 与输入顺序一致的加权分数 score * (1 + ctr)
+        """
+        if not features_list:
+            return []
+        scores = [item.get('score', 0.0) for item in features_list]
+        if not self.is_trained or (self.model is None and self.runtime is None):
+            return scores  # 如果模型未训练，返回原始分数
         
         try:
-            # 使用当前时间戳或生成一个合理的时间戳
-            if current_timestamp is None:
-                current_timestamp = datetime.now().isoformat()
-            
-            # 构建单个样本的特征
-            sample_data = [{
-                'query': query,
-                'doc_id': doc_id,
-                'position': position,
-                'score': score,
-                'summary': summary,
-                'clicked': 0,  # 预测时不需要真实标签
-                'timestamp': current_timestamp  # 使用真实的时间戳
-            }]
-            
-            # 预测时不使用训练集索引限制
-            features, _ = self.extract_features(sample_data, is_training=False)
+            # 与训练相同的特征流水线：缺少时间戳取当前时间，文档长度取摘要长度，
+            # 历史CTR从在线特征存储读取（待预测样本之间不构成历史）
+            columns = self.pipeline.transform(features_list, history='online')
+            features = self.pipeline.wide_deep_features(columns)
             if len(features) == 0:
-                return score
+                return scores
+            
+            if self.runtime is not None:
+                # NumPy运行时（标准化参数已冻结在运行时中）
+                ctr_probs = self.runtime.predict(features)
+                return [float(score * (1 + ctr_prob)) for score, ctr_prob in zip(scores, ctr_probs)]
             
             # 标准化特征
             if self.wide_scaler and self.deep_scaler:
@@ -539,18 +406,34 @@ class WideAndDeepCTRModel:
                 'position_group': features['position_group']
             }
             
-            # 预测CTR
-            ctr_prob = self.model.predict(pred_input, verbose=0)[0][0]
+            # 一次调用预测整批CTR
+            ctr_probs = self.model.predict(pred_input, batch_size=len(features_list), verbose=0).reshape(-1)
             
             # 将CTR概率转换为分数加权
-            return float(score * (1 + ctr_prob))
+            return [float(score * (1 + ctr_prob)) for score, ctr_prob in zip(scores, ctr_probs)]
             
         except Exception as e:
             print(f"Wide & Deep预测失败: {e}")
-            return score
+            return scores
     
-    def save_model(self, model_path: str = "models/wide_deep_ctr_model"):
-        """保存模型"""
+    def predict_tensors(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        从已标准化的模型输入预测点击概率（与导出到 TF Serving 的签名相同）
+        
+        Args:
+            inputs: wide、deep、query_hash、doc_hash、position_group
+        
+        Returns:
+            np.ndarray: 形状 (N,) 的点击概率
+        """
+        if not self.is_trained or (self.model is None and self.runtime is None):
+            raise ValueError("Wide & Deep模型未训练")
+        if self.runtime is not None:
+            return self.runtime.forward(inputs)
+        return self.model.predict(inputs, batch_size=len(inputs['wide']), verbose=0).reshape(-1)
+    
+    def save_model(self, model_path: str = "models/wide_deep_ctr_model", runtime_dtype: str = 'float32'):
+        """保存模型（同时导出NumPy推理运行时）"""
         if not self.model:
             return False
         
@@ -560,41 +443,123 @@ class WideAndDeepCTRModel:
             # 保存TensorFlow模型
             self.model.save(f"{model_path}.h5")
             
-            # 保存预处理器
-            with open(f"{model_path}_preprocessors.pkl", 'wb') as f:
-                pickle.dump({
-                    'wide_scaler': self.wide_scaler,
-                    'deep_scaler': self.deep_scaler,
-                    'categorical_encoders': self.categorical_encoders,
-                    'is_trained': self.is_trained
-                }, f)
+            self._save_preprocessors(model_path)
             
+            self.export_runtime(model_path, runtime_dtype)
             return True
         except Exception as e:
             print(f"保存Wide & Deep模型失败: {e}")
             return False
     
-    def load_model(self, model_path: str = "models/wide_deep_ctr_model"):
-        """加载模型"""
+    def export_runtime(self, model_path: str = "models/wide_deep_ctr_model", dtype: str = 'float32') -> Optional[str]:
+        """
+        冻结Keras权重和标准化参数，导出为NumPy推理运行时
+        
+        Args:
+            model_path: 模型路径前缀，输出 {model_path}_runtime.npz
+            dtype: float32 或 int8
+        
+        Returns:
+            Optional[str]: 输出路径，失败时为None
+        """
+        if not self.model:
+            return None
+        try:
+            path = WideDeepRuntime.from_keras(self.model, self.wide_scaler, self.deep_scaler).save(
+                f"{model_path}_runtime.npz", dtype)
+            print(f"✅ Wide & Deep推理运行时已导出 ({dtype}): {path}")
+            return path
+        except Exception as e:
+            print(f"导出Wide & Deep推理运行时失败: {e}")
+            return None
+    
+    def _save_preprocessors(self, model_path: str):
+        """保存预处理器（.npz + .json）"""
+        save_artifact(f"{model_path}_preprocessors.npz", {
+            'wide_scaler': self.wide_scaler,
+            'deep_scaler': self.deep_scaler,
+            'categorical_encoders': self.categorical_encoders,
+            'pipeline': self.pipeline.to_dict(),
+            'is_trained': self.is_trained
+        }, meta={'model_class': type(self).__name__})
+    
+    def load_model(self, model_path: str = "models/wide_deep_ctr_model", use_runtime: bool = True,
+                   allow_legacy: bool = False):
+        """
+        加载模型
+        
+        Args:
+            model_path: 模型路径前缀
+            use_runtime: 优先加载NumPy推理运行时（不导入TensorFlow）；
+                运行时文件比 .h5 旧时仍加载Keras模型
+            allow_legacy: 没有 _preprocessors.npz 时加载旧的 _preprocessors.pkl
+                （pickle 会执行文件中的代码，默认不加载，请用 migrate_legacy 迁移）
+        """
+        runtime_path = f"{model_path}_runtime.npz"
+        keras_path = f"{model_path}.h5"
+        if use_runtime and os.path.exists(runtime_path) and (
+                not os.path.exists(keras_path) or os.path.getmtime(runtime_path) >= os.path.getmtime(keras_path)):
+            try:
+                self.runtime = WideDeepRuntime.load(runtime_path)
+                self._load_preprocessors(model_path, allow_legacy)
+                self.is_trained = True
+                return True
+            except Exception as e:
+                print(f"加载Wide & Deep推理运行时失败，尝试Keras模型: {e}")
+                self.runtime = None
+        
         if not TF_AVAILABLE:
             print("TensorFlow未安装，无法加载Wide & Deep模型")
             return False
         
         try:
-            if os.path.exists(f"{model_path}.h5"):
-                self.model = keras.models.load_model(f"{model_path}.h5")
-                
-                # 加载预处理器
-                if os.path.exists(f"{model_path}_preprocessors.pkl"):
-                    with open(f"{model_path}_preprocessors.pkl", 'rb') as f:
-                        data = pickle.load(f)
-                        self.wide_scaler = data.get('wide_scaler')
-                        self.deep_scaler = data.get('deep_scaler')
-                        self.categorical_encoders = data.get('categorical_encoders', {})
-                        self.is_trained = data.get('is_trained', False)
-                
+            if os.path.exists(keras_path):
+                _import_tensorflow()
+                self.model = keras.models.load_model(keras_path)
+                self._load_preprocessors(model_path, allow_legacy)
                 return True
         except Exception as e:
             print(f"加载Wide & Deep模型失败: {e}")
         
         return False
+    
+    def _load_preprocessors(self, model_path: str, allow_legacy: bool = False):
+        """加载预处理器（allow_legacy 时兼容旧的 _preprocessors.pkl）"""
+        data = None
+        legacy_path = f"{model_path}_preprocessors{LEGACY_EXT}"
+        if os.path.exists(f"{model_path}_preprocessors.npz"):
+            data, _ = load_artifact(f"{model_path}_preprocessors.npz", mmap=False)
+        elif os.path.exists(legacy_path):
+            if not allow_legacy:
+                raise ValueError(f"发现旧格式预处理器 {legacy_path}，未加载（pickle 会执行文件中的代码）；"
+                                 f"请确认来源可信后调用 migrate_legacy 迁移")
+            data = load_legacy_pickle(legacy_path)
+        if data is not None:
+            self.wide_scaler = data.get('wide_scaler')
+            self.deep_scaler = data.get('deep_scaler')
+            self.categorical_encoders = data.get('categorical_encoders', {})
+            self.pipeline = FeaturePipeline.from_dict(data.get('pipeline'))
+            self.is_trained = data.get('is_trained', False)
+    
+    def migrate_legacy(self, model_path: str = "models/wide_deep_ctr_model") -> bool:
+        """
+        把旧的 _preprocessors.pkl 迁移为 _preprocessors.npz + .json（只对可信来源的文件调用）
+        
+        Args:
+            model_path: 模型路径前缀
+        
+        Returns:
+            bool: 是否迁移成功
+        """
+        legacy_path = f"{model_path}_preprocessors{LEGACY_EXT}"
+        if not os.path.exists(legacy_path):
+            print(f"❌ 旧格式预处理器文件不存在: {legacy_path}")
+            return False
+        try:
+            self._load_preprocessors(model_path, allow_legacy=True)
+            self._save_preprocessors(model_path)
+            print(f"✅ 旧格式预处理器已迁移: {legacy_path} -> {model_path}_preprocessors.npz")
+            return True
+        except Exception as e:
+            print(f"❌ 迁移旧格式预处理器失败: {e}")
+            return False
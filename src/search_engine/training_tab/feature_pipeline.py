@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CTR特征流水线
+训练、评估和线上预测共用的一个 transform()：
+- 文本特征：每个不同的查询/摘要只分词一次，匹配度按 (查询, 摘要) 去重计算
+- 数值特征：按列向量化计算
+- 时间特征：时间戳解析为一天中的小时数（训练和预测口径一致）
+- 历史CTR：训练时为无泄露的时点特征，预测时从在线特征存储读取
+- 分类特征：fit 时按频次建立查询/文档词表，词表外的值用稳定哈希（与进程无关）分到 OOV 桶
+
+流水线参数（词表、桶数）随模型一起序列化，每个阶段的耗时记录在 last_timings 中。
+"""
+
+import hashlib
+import json
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from ..online_feature_store import get_online_feature_store
+from ..tokenization_service import get_tokenization_service
+from .point_in_time import DEFAULT_CTR, historical_ctr_features
+
+# LR模型的特征列（顺序即特征矩阵的列顺序）
+LR_COLUMNS = [
+    'position', 'doc_length', 'query_length', 'summary_length', 'match_score',
+    'query_ctr', 'doc_ctr', 'position_decay', 'query_word_count', 'summary_word_count',
+    'time_of_day', 'score',
+]
+# Wide & Deep 模型的特征列
+WIDE_COLUMNS = ['position', 'position_decay', 'score', 'match_score', 'query_ctr', 'doc_ctr']
+DEEP_COLUMNS = [
+    'doc_length', 'query_length', 'summary_length', 'query_word_count', 'summary_word_count',
+    'time_of_day', 'position_score_cross', 'query_len_match_cross',
+]
+CATEGORICAL_COLUMNS = ['query_hash', 'doc_hash', 'position_group']
+
+STAGES = ('text', 'numeric', 'time', 'history', 'categorical')
+# 不同时间戳不超过该数量时逐个解析
+SMALL_BATCH_TIMESTAMPS = 256
+
+CTRData = Union[pd.DataFrame, List[Dict[str, Any]]]
+
+
+def stable_hash(values: Sequence[Any], buckets: int) -> np.ndarray:
+    """与进程无关的稳定哈希（pandas 固定密钥的 SipHash），替代加盐的内置 hash()"""
+    if len(values) == 0:
+        return np.array([], dtype=np.int64)
+    hashed = pd.util.hash_array(np.asarray([str(v) for v in values], dtype=object))
+    return (hashed % np.uint64(buckets)).astype(np.int64)
+
+
+class FeaturePipeline:
+    """可拟合、可序列化的CTR特征流水线"""
+
+    VERSION = 1
+    MAX_OOV_CACHE = 100000
+
+    def __init__(self, hash_buckets: int = 1000, oov_buckets: int = 100, default_ctr: float = DEFAULT_CTR):
+        """
+        Args:
+            hash_buckets: 分类特征的总桶数（即嵌入表大小）
+            oov_buckets: 其中留给词表外取值的哈希桶数
+            default_ctr: 没有历史时的默认CTR
+        """
+        self.hash_buckets = hash_buckets
+        self.oov_buckets = oov_buckets
+        self.default_ctr = default_ctr
+        # 词表：字段 -> 按频次排序的取值，下标即编号
+        self.vocabularies: Dict[str, List[str]] = {}
+        self._lookups: Dict[str, Dict[str, int]] = {}
+        # 词表外取值的哈希桶缓存（线上请求大多重复）
+        self._oov_cache: Dict[str, int] = {}
+        self.fitted = False
+
+        # 耗时统计（毫秒）
+        self.last_timings: Dict[str, float] = {}
+        self._total_timings: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self._transform_calls = 0
+        self._transform_rows = 0
+
+    # ---------------- 拟合与序列化 ----------------
+
+    def fit(self, ctr_data: CTRData) -> "FeaturePipeline":
+        """
+        按训练数据建立查询/文档词表（频次降序，同频按取值排序，保证可复现）
+
+        Returns:
+            FeaturePipeline: self
+        """
+        capacity = self.hash_buckets - self.oov_buckets
+        for field in ('query', 'doc_id'):
+            values = pd.Series(_column(ctr_data, field, ''), dtype=object).astype(str)
+            counts = values.value_counts()
+            ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+            self.vocabularies[field] = [value for value, _ in ordered[:capacity]]
+        self._lookups = {}
+        self._oov_cache = {}
+        self.fitted = True
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为普通字典（随模型文件保存）"""
+        return {
+            'version': self.VERSION,
+            'hash_buckets': self.hash_buckets,
+            'oov_buckets': self.oov_buckets,
+            'default_ctr': self.default_ctr,
+            'vocabularies': self.vocabularies,
+            'fitted': self.fitted,
+        }
+
+    def fingerprint(self) -> str:
+        """流水线参数的指纹（sha256），用于确认模型版本与特征口径匹配"""
+        payload = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "FeaturePipeline":
+        """从字典恢复；旧模型文件没有流水线时返回未拟合的流水线"""
+        if not data or data.get('version') != cls.VERSION:
+            return cls()
+        pipeline = cls(data['hash_buckets'], data['oov_buckets'], data.get('default_ctr', DEFAULT_CTR))
+        pipeline.vocabularies = data.get('vocabularies', {})
+        pipeline.fitted = data.get('fitted', bool(pipeline.vocabularies))
+        return pipeline
+
+    # ---------------- 变换 ----------------
+
+    def transform(self, ctr_data: CTRData, history: str = 'point_in_time',
+                  train_indices: Optional[np.ndarray] = None,
+                  history_ctr: Optional[np.ndarray] = None) -> Dict[str, np.ndarray]:
+        """
+        计算全部特征列
+
+        Args:
+            ctr_data: 样本（DataFrame 或字典列表）；预测时缺少 doc_length 取摘要长度，缺少时间戳取当前时间
+            history: 'point_in_time'（训练/评估，按时间戳只用之前的样本）或 'online'（预测，读在线特征存储）
+            train_indices: 时点特征只统计这些行（训练集）
+            history_ctr: 直接给定的 (N, 2) 历史CTR，优先于 history
+
+        Returns:
+            Dict[str, np.ndarray]: 特征名 -> 长度为 N 的一维数组（另含 clicked 标签）
+        """
+        timings: Dict[str, float] = {}
+        n = len(ctr_data)
+        columns: Dict[str, np.ndarray] = {}
+
+        start = time.perf_counter()
+        queries = [q if isinstance(q, str) else '' for q in _column(ctr_data, 'query', '')]
+        summaries = [s if isinstance(s, str) else '' for s in _column(ctr_data, 'summary', '')]
+        self._text_features(queries, summaries, columns)
+        timings['text'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        position = np.asarray(_column(ctr_data, 'position', 1), dtype=np.float64)
+        score = np.asarray(_column(ctr_data, 'score', 0.0), dtype=np.float64)
+        columns['position'] = position
+        columns['score'] = score
+        columns['position_decay'] = 1.0 / (position + 1)
+        columns['query_length'] = np.fromiter((len(q) for q in queries), dtype=np.float64, count=n)
+        columns['summary_length'] = np.fromiter((len(s) for s in summaries), dtype=np.float64, count=n)
+        if _has_column(ctr_data, 'doc_length'):
+            columns['doc_length'] = np.asarray(_column(ctr_data, 'doc_length', 0), dtype=np.float64)
+        else:
+            columns['doc_length'] = columns['summary_length']
+        columns['position_score_cross'] = position * score
+        columns['query_len_match_cross'] = columns['query_length'] * columns['match_score']
+        columns['clicked'] = np.asarray(_column(ctr_data, 'clicked', 0))
+        timings['numeric'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns['time_of_day'] = _time_of_day(_column(ctr_data, 'timestamp', None))
+        timings['time'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if history_ctr is None:
+            history_ctr = self._history_ctr(ctr_data, queries, history, train_indices)
+        columns['query_ctr'] = np.asarray(history_ctr[:, 0], dtype=np.float64)
+        columns['doc_ctr'] = np.asarray(history_ctr[:, 1], dtype=np.float64)
+        timings['history'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns['query_hash'] = self.encode('query', queries)
+        columns['doc_hash'] = self.encode('doc_id', _column(ctr_data, 'doc_id', ''))
+        columns['position_group'] = np.select([position <= 3, position <= 10], [0, 1], 2).astype(np.int64)
+        timings['categorical'] = time.perf_counter() - start
+
+        self._record_timings(timings, n)
+        return columns
+
+    def _text_features(self, queries: List[str], summaries: List[str], columns: Dict[str, np.ndarray]):
+        """分词相关特征（每个不同文本只分词一次）"""
+        tokenizer = get_tokenization_service()
+        query_words = {q: tokenizer.lcut(q) for q in dict.fromkeys(queries)}
+        summary_words = {s: tokenizer.lcut(s) for s in dict.fromkeys(summaries)}
+
+        match_cache: Dict[tuple, float] = {}
+        match_scores = []
+        for q, s in zip(queries, summaries):
+            key = (q, s)
+            ratio = match_cache.get(key)
+            if ratio is None:
+                q_set = set(query_words[q])
+                ratio = len(q_set.intersection(summary_words[s])) / len(q_set) if q_set else 0
+                match_cache[key] = ratio
+            match_scores.append(ratio)
+
+        n = len(queries)
+        columns['match_score'] = np.asarray(match_scores, dtype=np.float64).reshape(n)
+        columns['query_word_count'] = np.fromiter((len(query_words[q]) for q in queries), dtype=np.float64, count=n)
+        columns['summary_word_count'] = np.fromiter((len(summary_words[s]) for s in summaries),
+                                                    dtype=np.float64, count=n)
+
+    def _history_ctr(self, ctr_data: CTRData, queries: List[str], history: str,
+                     train_indices: Optional[np.ndarray]) -> np.ndarray:
+        doc_ids = _column(ctr_data, 'doc_id', '')
+        if history == 'online':
+            feature_store = get_online_feature_store()
+            return np.array([[feature_store.query_ctr(q), feature_store.doc_ctr(d)]
+                             for q, d in zip(queries, doc_ids)], dtype=np.float64).reshape(len(queries), 2)
+        df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame({
+            'query': _column(ctr_data, 'query', None),
+            'doc_id': doc_ids,
+            'clicked': _column(ctr_data, 'clicked', 0),
+            'timestamp': _column(ctr_data, 'timestamp', ''),
+        })
+        return historical_ctr_features(df, ('query', 'doc_id'), train_indices=train_indices)
+
+    def encode(self, field: str, values: Sequence[Any]) -> np.ndarray:
+        """
+        分类取值 -> 桶编号：词表内为词表下标，词表外为 [容量, 总桶数) 内的稳定哈希桶
+        """
+        values = [str(v) for v in values]
+        lookup = self._lookups.get(field)
+        if lookup is None:
+            lookup = self._lookups[field] = {value: i for i, value in enumerate(self.vocabularies.get(field, []))}
+        oov_cache = self._oov_cache
+        missing = [v for v in dict.fromkeys(values) if v not in lookup and v not in oov_cache]
+        if missing:
+            if len(oov_cache) > self.MAX_OOV_CACHE:
+                oov_cache.clear()
+            capacity = self.hash_buckets - self.oov_buckets
+            oov_cache.update(zip(missing, (capacity + stable_hash(missing, self.oov_buckets)).tolist()))
+        return np.fromiter((lookup[v] if v in lookup else oov_cache[v] for v in values),
+                           dtype=np.int64, count=len(values))
+
+    # ---------------- 组装 ----------------
+
+    @staticmethod
+    def matrix(columns: Dict[str, np.ndarray], names: Sequence[str]) -> np.ndarray:
+        """按列名拼成特征矩阵"""
+        return np.column_stack([columns[name] for name in names]).astype(np.float64)
+
+    def lr_features(self, columns: Dict[str, np.ndarray]) -> np.ndarray:
+        """LR模型的特征矩阵"""
+        return self.matrix(columns, LR_COLUMNS)
+
+    def wide_deep_features(self, columns: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        """Wide & Deep 模型的输入"""
+        return {
+            'wide': self.matrix(columns, WIDE_COLUMNS),
+            'deep': self.matrix(columns, DEEP_COLUMNS),
+            'query_hash': columns['query_hash'],
+            'doc_hash': columns['doc_hash'],
+            'position_group': columns['position_group'],
+        }
+
+    # ---------------- 耗时统计 ----------------
+
+    def _record_timings(self, timings: Dict[str, float], rows: int):
+        self.last_timings = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+        for stage, seconds in timings.items():
+            self._total_timings[stage] += seconds
+        self._transform_calls += 1
+        self._transform_rows += rows
+
+    def get_timing_stats(self) -> Dict[str, Any]:
+        """
+        获取各阶段耗时统计
+
+        Returns:
+            Dict: 调用次数、行数、各阶段累计耗时和每行平均耗时（毫秒/微秒）、最近一次耗时
+        """
+        rows = max(self._transform_rows, 1)
+        return {
+            'calls': self._transform_calls,
+            'rows': self._transform_rows,
+            'total_ms': {stage: round(seconds * 1000, 3) for stage, seconds in self._total_timings.items()},
+            'per_row_us': {stage: round(seconds * 1e6 / rows, 3) for stage, seconds in self._total_timings.items()},
+            'last_ms': dict(self.last_timings),
+        }
+
+
+def _has_column(ctr_data: CTRData, name: str) -> bool:
+    if isinstance(ctr_data, pd.DataFrame):
+        return name in ctr_data.columns
+    return bool(ctr_data) and all(name in row for row in ctr_data)
+
+
+def _column(ctr_data: CTRData, name: str, default: Any) -> Union[np.ndarray, List[Any]]:
+    """取一列（DataFrame 直接取底层数组，字典列表逐行取值）"""
+    if isinstance(ctr_data, pd.DataFrame):
+        if name in ctr_data.columns:
+            return ctr_data[name].to_numpy()
+        return [default] * len(ctr_data)
+    return [row.get(name, default) for row in ctr_data]
+
+
+def _time_of_day(timestamps: Sequence[Any]) -> np.ndarray:
+    """时间戳 -> 一天中的小时数（含分钟小数）；缺失时取当前时间，无法解析时为0"""
+    now = datetime.now()
+    values = [now if t is None or t == '' else t for t in timestamps]
+    unique = list(dict.fromkeys(str(v) if not isinstance(v, datetime) else v for v in values))
+    if len(unique) > SMALL_BATCH_TIMESTAMPS:
+        # 大批量（训练）用 pandas 向量化解析
+        parsed = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce', format='ISO8601')
+        hours = parsed.dt.hour + parsed.dt.minute / 60.0
+        return hours.fillna(0.0).to_numpy(dtype=np.float64)
+
+    # 小批量（线上预测）逐个解析不同的时间戳，省去 pandas 的固定开销
+    hour_of = {}
+    for value in unique:
+        try:
+            parsed = value if isinstance(value, datetime) else datetime.fromisoformat(value)
+            hour_of[value] = parsed.hour + parsed.minute / 60.0
+        except ValueError:
+            parsed = pd.to_datetime(value, errors='coerce')
+            hour_of[value] = 0.0 if pd.isna(parsed) else parsed.hour + parsed.minute / 60.0
+    return np.fromiter((hour_of[str(v) if not isinstance(v, datetime) else v] for v in values),
+                       dtype=np.float64, count=len(values))
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型文件格式 - NumPy 权重（.npz）+ JSON 元数据
+- 不使用 pickle：加载时只重建白名单中的类型（LogisticRegression、StandardScaler 等），不会执行文件中的代码
+- .npz 不压缩，加载时直接对其中的数组做内存映射（mmap），多个服务进程共享同一份页缓存
+- JSON 元数据（与 .npz 同名的 .json）记录模型状态结构和 .npz 的 sha256，加载时校验，
+  文件损坏或与元数据不匹配时拒绝加载
+- 旧的 .pkl 文件默认不加载，只能通过显式迁移（load_legacy_pickle / 各模型的 migrate_legacy）转换为 .npz
+
+model.npz   数组（权重、标准化参数）
+model.json  {"format", "version", "sha256", "size", "arrays", "meta", "state"}
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import struct
+import zipfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+
+FORMAT_NAME = 'search_engine.model_artifact'
+FORMAT_VERSION = 1
+ARTIFACT_EXT = '.npz'
+LEGACY_EXT = '.pkl'
+
+# 可以从模型文件重建的类型（类名 -> 类）
+_ARTIFACT_TYPES: Dict[str, type] = {}
+
+
+def register_artifact_type(cls: type) -> type:
+    """允许某个类（按属性字典保存/恢复）出现在模型文件中，可用作类装饰器"""
+    _ARTIFACT_TYPES[cls.__name__] = cls
+    return cls
+
+
+register_artifact_type(LogisticRegression)
+register_artifact_type(StandardScaler)
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def metadata_path(path: str) -> str:
+    """模型文件对应的 JSON 元数据路径"""
+    return os.path.splitext(path)[0] + '.json'
+
+
+def artifact_files(path: str) -> List[str]:
+    """组成一个模型的已存在文件（.npz 与 .json）"""
+    return [p for p in (path, metadata_path(path)) if os.path.exists(p)]
+
+
+def resolve_model_file(path: str) -> Optional[str]:
+    """实际要加载的文件：优先 .npz，不存在时回退到同名的旧 .pkl 文件"""
+    if os.path.exists(path):
+        return path
+    base, ext = os.path.splitext(path)
+    if ext == ARTIFACT_EXT and os.path.exists(base + LEGACY_EXT):
+        return base + LEGACY_EXT
+    return None
+
+
+# ---------------- 编码 ----------------
+
+# 按精确类型判断：np.float64 是 float 的子类，需要走 NumPy 标量分支保留类型
+_SCALARS = (bool, int, float, str, type(None))
+_MARKERS = ('__array__', '__scalar__', '__object__', '__tuple__', '__items__')
+
+
+def _encode(obj: Any, path: str, arrays: Dict[str, np.ndarray]) -> Any:
+    if type(obj) in _SCALARS:
+        return obj
+    if isinstance(obj, np.generic):
+        # 保留 NumPy 标量类型（sklearn 会按类型区分属性，如 n_samples_seen_）
+        return {'__scalar__': obj.item(), 'dtype': obj.dtype.str}
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            raise TypeError(f"不支持保存 object 数组: {path}")
+        key = f"{len(arrays)}:{path}"
+        arrays[key] = np.ascontiguousarray(obj)
+        return {'__array__': key}
+    if isinstance(obj, dict):
+        if all(isinstance(k, str) for k in obj) and not any(marker in obj for marker in _MARKERS):
+            return {k: v if type(v) in _SCALARS else _encode(v, f"{path}/{k}", arrays) for k, v in obj.items()}
+        return {'__items__': [[_encode(k, path, arrays), _encode(v, f"{path}/{k}", arrays)] for k, v in obj.items()]}
+    if isinstance(obj, (list, tuple)):
+        items = [v if type(v) in _SCALARS else _encode(v, f"{path}/{i}", arrays) for i, v in enumerate(obj)]
+        return {'__tuple__': items} if isinstance(obj, tuple) else items
+    name = type(obj).__name__
+    if _ARTIFACT_TYPES.get(name) is type(obj):
+        return {'__object__': name, 'state': _encode(vars(obj), f"{path}/{name}", arrays)}
+    raise TypeError(f"不支持保存的类型 {type(obj).__name__}: {path}")
+
+
+def _decode(obj: Any, arrays: Dict[str, np.ndarray]) -> Any:
+    if isinstance(obj, list):
+        return [v if isinstance(v, _SCALARS) else _decode(v, arrays) for v in obj]
+    if not isinstance(obj, dict):
+        return obj
+    if '__array__' in obj:
+        return arrays[obj['__array__']]
+    if '__scalar__' in obj:
+        return np.dtype(obj['dtype']).type(obj['__scalar__'])
+    if '__tuple__' in obj:
+        return tuple(_decode(obj['__tuple__'], arrays))
+    if '__items__' in obj:
+        return {_decode(k, arrays): _decode(v, arrays) for k, v in obj['__items__']}
+    if '__object__' in obj:
+        cls = _ARTIFACT_TYPES.get(obj['__object__'])
+        if cls is None:
+            raise ValueError(f"模型文件包含未注册的类型: {obj['__object__']}")
+        instance = cls.__new__(cls)
+        instance.__dict__.update(_decode(obj['state'], arrays))
+        return instance
+    return {k: v if isinstance(v, _SCALARS) else _decode(v, arrays) for k, v in obj.items()}
+
+
+# ---------------- 读写 ----------------
+
+def read_npz(path: str, mmap: bool = True) -> Dict[str, np.ndarray]:
+    """
+    读取 .npz 中的全部数组
+
+    Args:
+        path: 文件路径
+        mmap: 对未压缩的成员直接内存映射（只读），否则读入内存
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if not mmap or info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member, allow_pickle=False)
+                continue
+            # 跳过 zip 本地文件头，定位到 .npy 数据
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack('<HH', f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(f"模型文件包含 object 数组: {name}")
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                         order='F' if fortran_order else 'C')
+    return arrays
+
+
+def save_artifact(path: str, state: Dict[str, Any], meta: Optional[Dict[str, Any]] = None) -> str:
+    """
+    保存模型：数组写入 .npz（不压缩），其余结构和校验和写入同名 .json
+
+    Args:
+        path: .npz 文件路径
+        state: 模型状态（数组、标量、列表、字典和已注册类型的对象）
+        meta: 附加元数据（JSON 可序列化）
+
+    Returns:
+        str: .npz 文件路径
+    """
+    arrays: Dict[str, np.ndarray] = {}
+    encoded = _encode(state, 'state', arrays)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    metadata = {
+        'format': FORMAT_NAME,
+        'version': FORMAT_VERSION,
+        'created_at': datetime.now().isoformat(),
+        'sha256': file_sha256(tmp_path),
+        'size': os.path.getsize(tmp_path),
+        'arrays': {key: {'shape': list(array.shape), 'dtype': array.dtype.str} for key, array in arrays.items()},
+        'meta': meta or {},
+        'state': encoded,
+    }
+    json_path = metadata_path(path)
+    with open(f"{json_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, ensure_ascii=False)
+    # 先替换权重再替换元数据；两者之间读到的组合校验和不一致，会被拒绝而不是用错权重
+    os.replace(tmp_path, path)
+    os.replace(f"{json_path}.tmp", json_path)
+    return path
+
+
+def read_metadata(path: str) -> Dict[str, Any]:
+    """读取并检查模型的 JSON 元数据"""
+    with open(metadata_path(path), 'r', encoding='utf-8') as f:
+        metadata = json.load(f)
+    if metadata.get('format') != FORMAT_NAME or metadata.get('version') != FORMAT_VERSION:
+        raise ValueError(f"不支持的模型文件格式: {metadata.get('format')} v{metadata.get('version')}")
+    return metadata
+
+
+def verify_artifact(path: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+    """校验 .npz 与元数据中记录的大小和 sha256 一致"""
+    metadata = metadata or read_metadata(path)
+    return (os.path.getsize(path) == metadata.get('size')
+            and file_sha256(path) == metadata.get('sha256'))
+
+
+def load_artifact(path: str, mmap: bool = True, verify: bool = True) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    加载模型
+
+    Args:
+        path: .npz 文件路径
+        mmap: 内存映射数组（只读）
+        verify: 校验 sha256
+
+    Returns:
+        Tuple[Dict, Dict]: (模型状态, 附加元数据)
+    """
+    metadata = read_metadata(path)
+    if verify and not verify_artifact(path, metadata):
+        raise ValueError(f"模型文件校验失败（与元数据中的 sha256 不一致）: {path}")
+    arrays = read_npz(path, mmap=mmap)
+    return _decode(metadata['state'], arrays), metadata.get('meta', {})
+
+
+def load_legacy_pickle(path: str) -> Any:
+    """
+    读取旧的 .pkl 模型文件（仅用于迁移）
+    pickle 加载会执行文件中的代码，只应对可信来源的文件调用
+
+    Args:
+        path: .pkl 文件路径
+
+    Returns:
+        Any: 反序列化的内容
+    """
+    print(f"⚠️ 正在加载旧格式 pickle 文件（会执行文件中的代码，仅迁移可信文件）: {path}")
+    with open(path, 'rb') as f:
+        return pickle.load(f)
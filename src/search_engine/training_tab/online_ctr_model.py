@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+在线CTR模型 - 逻辑回归的增量学习
+每次只用新到的一小批样本更新，单次更新的开销与历史数据量无关：
+- 模型：AdaGrad 自适应学习率的 SGD 逻辑回归（带L2正则），可从离线 LogisticRegression 热启动
+- 标准化：StandardScaler.partial_fit 维护的运行均值/方差
+- 历史CTR特征：按查询/文档维护累计 (点击数, 展示数)，每批按时间顺序先取特征再累加，
+  与离线训练的时点特征口径一致
+- 类别权重：按累计正负样本数做 balanced 加权，与离线模型的 class_weight='balanced' 一致
+
+保存格式与 CTRModel 相同（另含 online_state），CTRModel.load_model 可直接加载用于预测。
+历史CTR计数不随每个checkpoint全量保存：写入checkpoint同目录的追加日志（online_history_<代>.jsonl），
+首行为全量计数，之后每次保存只追加上次保存后变化的键；checkpoint 只记录日志文件名和字节偏移。
+日志增长到全量大小的数倍后换一代重写为全量，只保留当前和上一代日志。
+"""
+
+import copy
+import glob
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from .ctr_model import CTRModel
+from .model_artifact import register_artifact_type
+from .point_in_time import DEFAULT_CTR, time_order
+
+HISTORY_KEYS = ('query', 'doc_id')
+HISTORY_JOURNAL_PREFIX = "online_history_"
+
+# samples_seen 的含义（游标类型）
+CURSOR_DATA_SERVICE = 'data_service'  # DataService 按写入顺序的样本位置，可用作 get_samples_range 的起点
+CURSOR_EVENT_STREAM = 'event_stream'  # 训练进程：热启动时的落盘样本数 + 已消费的队列样本数，不是位置
+
+
+@register_artifact_type
+class OnlineLogisticRegression:
+    """AdaGrad SGD 逻辑回归（接口与 sklearn 分类器的 predict_proba / coef_ 兼容）"""
+
+    def __init__(self, n_features: int, learning_rate: float = 0.05, l2: float = 1e-4,
+                 minibatch_size: int = 64):
+        """
+        Args:
+            n_features: 特征维数
+            learning_rate: 基础学习率
+            l2: L2正则系数
+            minibatch_size: 一批样本内部按该大小分步更新
+        """
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.minibatch_size = minibatch_size
+        self.classes_ = np.array([0, 1])
+        self.coef_ = np.zeros((1, n_features))
+        self.intercept_ = np.zeros(1)
+        # AdaGrad 累计梯度平方（最后一维为截距）
+        self._grad_sq = np.zeros(n_features + 1)
+        self.n_updates = 0
+
+    @classmethod
+    def from_sklearn(cls, model, **kwargs) -> "OnlineLogisticRegression":
+        """从已训练的线性分类器（如 LogisticRegression）热启动"""
+        coef = np.asarray(model.coef_, dtype=np.float64).reshape(1, -1)
+        online = cls(coef.shape[1], **kwargs)
+        online.coef_ = coef.copy()
+        online.intercept_ = np.asarray(model.intercept_, dtype=np.float64).reshape(1).copy()
+        return online
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=np.float64) @ self.coef_[0] + self.intercept_[0]
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        p = 1.0 / (1.0 + np.exp(-np.clip(self.decision_function(X), -500, 500)))
+        return np.column_stack([1.0 - p, p])
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return (self.decision_function(X) > 0).astype(np.int64)
+
+    def score(self, X: np.ndarray, y: np.ndarray) -> float:
+        return float(np.mean(self.predict(X) == np.asarray(y)))
+
+    def partial_fit(self, X: np.ndarray, y: np.ndarray, sample_weight: Optional[np.ndarray] = None) -> float:
+        """
+        用一批样本更新参数
+
+        Returns:
+            float: 更新前在这批样本上的加权对数损失（渐进验证）
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        weights = np.ones(len(y)) if sample_weight is None else np.asarray(sample_weight, dtype=np.float64)
+        p = np.clip(self.predict_proba(X)[:, 1], 1e-7, 1 - 1e-7)
+        loss = float(np.sum(-weights * (y * np.log(p) + (1 - y) * np.log(1 - p))) / max(np.sum(weights), 1e-12))
+
+        coef, intercept, grad_sq = self.coef_[0].copy(), self.intercept_.copy(), self._grad_sq.copy()
+        for start in range(0, len(y), self.minibatch_size):
+            xb = X[start:start + self.minibatch_size]
+            wb = weights[start:start + self.minibatch_size]
+            pb = 1.0 / (1.0 + np.exp(-np.clip(xb @ coef + intercept[0], -500, 500)))
+            error = wb * (pb - y[start:start + self.minibatch_size]) / len(xb)
+            grad = np.append(xb.T @ error + self.l2 * coef, error.sum())
+            grad_sq += grad ** 2
+            step = self.learning_rate * grad / (np.sqrt(grad_sq) + 1e-8)
+            coef -= step[:-1]
+            intercept -= step[-1]
+        # 整体替换参数，预测线程不会读到更新到一半的权重
+        self.coef_, self.intercept_, self._grad_sq = coef.reshape(1, -1), intercept, grad_sq
+        self.n_updates += 1
+        return loss
+
+
+class OnlineCTRModel(CTRModel):
+    """支持 partial_fit 增量更新的LR CTR模型"""
+
+    # 增量更新会替换或原地修改标准化参数，加载到内存而不是只读映射
+    ARTIFACT_MMAP = False
+    # 历史计数日志超过 全量大小 * 倍数 + 下限 时换一代重写为全量
+    JOURNAL_COMPACT_RATIO = 4
+    JOURNAL_COMPACT_MIN_BYTES = 1 << 20
+
+    def __init__(self, learning_rate: float = 0.05, l2: float = 1e-4, max_batch_size: int = 5000):
+        """
+        Args:
+            learning_rate: 基础学习率
+            l2: L2正则系数
+            max_batch_size: 单次更新最多使用的样本数（更多的新样本留到下次更新）
+        """
+        super().__init__()
+        self.learning_rate = learning_rate
+        self.l2 = l2
+        self.max_batch_size = max_batch_size
+        # 最近一次 load_model 的目录（历史计数日志与checkpoint同目录）
+        self._load_dir = "."
+        self._reset_online_state()
+
+    def _reset_online_state(self):
+        # 已消费的样本数（数据流中的游标），为None表示未知（需由调用方对齐）
+        self.samples_seen: Optional[int] = 0
+        # 游标类型（CURSOR_*），为None表示未知（旧checkpoint），由调用方设置
+        self.cursor_source: Optional[str] = None
+        self.update_count = 0
+        # [未点击, 点击] 累计样本数，用于 balanced 类别权重
+        self.class_counts = np.zeros(2)
+        # 键 -> [点击数, 展示数]
+        self.history: Dict[str, Dict[str, List[float]]] = {key: {} for key in HISTORY_KEYS}
+        # 上次保存后变化的历史计数键
+        self._history_dirty: Dict[str, set] = {key: set() for key in HISTORY_KEYS}
+        # 历史计数日志 {'dir', 'file', 'offset', 'full_bytes'}，为None时下次保存写一代新的全量日志
+        self._journal: Optional[Dict[str, Any]] = None
+
+    # ---------------- 初始化 ----------------
+
+    def warm_start(self, ctr_model: CTRModel) -> bool:
+        """
+        从已训练的离线LR模型热启动（复制权重、标准化参数和特征流水线）
+
+        Returns:
+            bool: 是否热启动成功
+        """
+        model = getattr(ctr_model, 'model', None)
+        if not getattr(ctr_model, 'is_trained', False) or not hasattr(model, 'coef_'):
+            return False
+        self.model = (copy.deepcopy(model) if isinstance(model, OnlineLogisticRegression)
+                      else OnlineLogisticRegression.from_sklearn(model, learning_rate=self.learning_rate, l2=self.l2))
+        self.scaler = copy.deepcopy(ctr_model.scaler)
+        self.pipeline = copy.deepcopy(ctr_model.pipeline)
+        self.is_trained = True
+        self.samples_seen = None
+        return True
+
+    def seed_history(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame]):
+        """
+        用已被模型学过的历史样本初始化历史CTR计数和类别计数（热启动后调用一次）
+        """
+        df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame(ctr_data)
+        self.history = {key: {} for key in HISTORY_KEYS}
+        self.class_counts = np.zeros(2)
+        if len(df) > 0:
+            clicked = df['clicked'].astype(float)
+            for key in HISTORY_KEYS:
+                grouped = clicked.groupby(df[key].astype(str)).agg(['sum', 'count'])
+                self.history[key] = {k: [float(c), float(n)] for k, c, n in
+                                     zip(grouped.index, grouped['sum'], grouped['count'])}
+            positives = float(clicked.sum())
+            self.class_counts = np.array([len(df) - positives, positives])
+        self.samples_seen = len(df)
+        self._journal = None
+
+    # ---------------- 增量更新 ----------------
+
+    def _history_features(self, df: pd.DataFrame) -> np.ndarray:
+        """按时间顺序：先取每个样本之前的历史CTR，再把该样本计入历史"""
+        result = np.full((len(df), len(HISTORY_KEYS)), DEFAULT_CTR)
+        keys = [df[key].astype(str).to_numpy() for key in HISTORY_KEYS]
+        clicked = df['clicked'].astype(float).to_numpy()
+        order = time_order(df) if 'timestamp' in df.columns else np.arange(len(df))
+        for key, values in zip(HISTORY_KEYS, keys):
+            self._history_dirty[key].update(values)
+        for row in order:
+            for col, key in enumerate(HISTORY_KEYS):
+                counter = self.history[key].get(keys[col][row])
+                if counter is None:
+                    self.history[key][keys[col][row]] = [clicked[row], 1.0]
+                    continue
+                if counter[1] > 0:
+                    result[row, col] = counter[0] / counter[1]
+                counter[0] += clicked[row]
+                counter[1] += 1.0
+        return result
+
+    def partial_fit(self, ctr_data: Union[List[Dict[str, Any]], pd.DataFrame]) -> Dict[str, Any]:
+        """
+        用一批新样本增量更新模型（开销只与这批样本数有关）
+
+        Args:
+            ctr_data: 新样本（超过 max_batch_size 时只用前 max_batch_size 条）
+
+        Returns:
+            Dict: success、samples、log_loss（更新前的渐进验证损失）、samples_seen、update_count、feature_timings
+        """
+        df = ctr_data if isinstance(ctr_data, pd.DataFrame) else pd.DataFrame(ctr_data)
+        if len(df) == 0:
+            return {'success': False, 'error': '没有新样本'}
+        df = df.iloc[:self.max_batch_size].reset_index(drop=True)
+
+        try:
+            if not self.pipeline.fitted:
+                self.pipeline.fit(df)
+            columns = self.pipeline.transform(df, history_ctr=self._history_features(df))
+            features = self.pipeline.lr_features(columns)
+            labels = np.asarray(columns['clicked'], dtype=np.int64)
+
+            if self.scaler is None:
+                self.scaler = StandardScaler()
+            self.scaler.partial_fit(features)
+            features_scaled = self.scaler.transform(features)
+
+            if self.model is None:
+                self.model = OnlineLogisticRegression(features.shape[1], self.learning_rate, self.l2)
+            self.class_counts += np.bincount(labels, minlength=2)[:2]
+            total = self.class_counts.sum()
+            class_weight = np.where(self.class_counts > 0, total / (2.0 * np.maximum(self.class_counts, 1)), 1.0)
+            log_loss = self.model.partial_fit(features_scaled, labels, class_weight[labels])
+
+            self.is_trained = True
+            self.samples_seen = (self.samples_seen or 0) + len(df)
+            self.update_count += 1
+            return {
+                'success': True,
+                'samples': len(df),
+                'clicks': int(labels.sum()),
+                'log_loss': round(log_loss, 4),
+                'samples_seen': self.samples_seen,
+                'update_count': self.update_count,
+                'feature_timings': dict(self.pipeline.last_timings),
+            }
+        except Exception as e:
+            return {'success': False, 'error': f'增量更新失败: {str(e)}'}
+
+    def serving_copy(self) -> CTRModel:
+        """当前权重的只读预测模型（不含历史计数，可直接替换线上模型）"""
+        serving = CTRModel()
+        serving.model = copy.deepcopy(self.model)
+        serving.scaler = copy.deepcopy(self.scaler)
+        serving.pipeline = self.pipeline
+        serving.is_trained = self.is_trained
+        return serving
+
+    # ---------------- 持久化 ----------------
+
+    def save_model(self, filepath: str = None):
+        """保存模型；历史计数先追加到同目录的日志，checkpoint 只记录日志位置"""
+        if filepath is None:
+            filepath = os.path.join("models", "ctr_model.npz")
+        if self.is_trained and self.model:
+            self._write_history_journal(os.path.dirname(filepath) or ".")
+        super().save_model(filepath)
+
+    def load_model(self, filepath: str = None, verify: bool = True, allow_legacy: bool = False):
+        """加载模型（历史计数从checkpoint记录的日志位置恢复）"""
+        if filepath is None:
+            filepath = os.path.join("models", "ctr_model.npz")
+        self._load_dir = os.path.dirname(filepath) or "."
+        return super().load_model(filepath, verify, allow_legacy)
+
+    def _write_history_journal(self, directory: str):
+        """把上次保存后变化的历史计数追加到日志（需要时换一代写全量）"""
+        journal = self._journal
+        path = os.path.join(directory, journal['file']) if journal else None
+        if (journal is None or journal['dir'] != directory or not os.path.exists(path)
+                or os.path.getsize(path) < journal['offset']
+                or journal['offset'] > self.JOURNAL_COMPACT_RATIO * journal['full_bytes'] + self.JOURNAL_COMPACT_MIN_BYTES):
+            self._write_full_journal(directory)
+            return
+        delta = {key: {k: self.history[key][k] for k in self._history_dirty[key] if k in self.history[key]}
+                 for key in HISTORY_KEYS}
+        line = (json.dumps({'delta': delta}, ensure_ascii=False) + "\n").encode('utf-8')
+        with open(path, 'r+b') as f:
+            # 截掉上次保存后未被checkpoint引用的内容（如写日志后、保存checkpoint前中断）
+            f.truncate(journal['offset'])
+            f.seek(journal['offset'])
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        journal['offset'] += len(line)
+        self._history_dirty = {key: set() for key in HISTORY_KEYS}
+
+    def _write_full_journal(self, directory: str):
+        name = f"{HISTORY_JOURNAL_PREFIX}{time.time_ns()}.jsonl"
+        line = (json.dumps({'history': self.history}, ensure_ascii=False) + "\n").encode('utf-8')
+        os.makedirs(directory, exist_ok=True)
+        temp_file = os.path.join(directory, name + ".tmp")
+        with open(temp_file, 'wb') as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, os.path.join(directory, name))
+        previous = self._journal['file'] if self._journal and self._journal['dir'] == directory else None
+        # 只保留当前和上一代（较旧checkpoint引用的日志不存在时，加载后由调用方重新初始化历史计数）
+        for old in glob.glob(os.path.join(directory, f"{HISTORY_JOURNAL_PREFIX}*.jsonl")):
+            if os.path.basename(old) not in (name, previous):
+                os.remove(old)
+        self._journal = {'dir': directory, 'file': name, 'offset': len(line), 'full_bytes': len(line)}
+        self._history_dirty = {key: set() for key in HISTORY_KEYS}
+
+    def _read_history_journal(self, directory: str, name: str, offset: int) -> Optional[Dict[str, Dict[str, List[float]]]]:
+        """读取日志前 offset 字节（全量 + 各次增量），日志缺失或不完整时返回None"""
+        path = os.path.join(directory, name)
+        if not os.path.exists(path) or os.path.getsize(path) < offset:
+            return None
+        with open(path, 'rb') as f:
+            lines = f.read(offset).decode('utf-8').splitlines()
+        history = json.loads(lines[0])['history']
+        for line in lines[1:]:
+            for key, changed in json.loads(line)['delta'].items():
+                history[key].update(changed)
+        return history
+
+    def _model_state(self) -> Dict[str, Any]:
+        state = super()._model_state()
+        state['online_state'] = {
+            'samples_seen': self.samples_seen,
+            'cursor_source': self.cursor_source,
+            'update_count': self.update_count,
+            'class_counts': self.class_counts.tolist(),
+        }
+        if self._journal is not None:
+            state['online_state']['history_journal'] = {'file': self._journal['file'], 'offset': self._journal['offset']}
+        else:
+            # 未经 save_model 写日志时全量保存
+            state['online_state']['history'] = self.history
+        return state
+
+    def _restore_state(self, model_data: Dict[str, Any]):
+        super()._restore_state(model_data)
+        online_state = model_data.get('online_state')
+        if online_state is None:
+            # 全量训练的模型文件：转为可增量更新的形式，游标由调用方对齐
+            self._reset_online_state()
+            if self.is_trained and hasattr(self.model, 'coef_') and not isinstance(self.model, OnlineLogisticRegression):
+                self.model = OnlineLogisticRegression.from_sklearn(
+                    self.model, learning_rate=self.learning_rate, l2=self.l2)
+            self.samples_seen = None
+            return
+        self._reset_online_state()
+        self.samples_seen = online_state['samples_seen']
+        self.cursor_source = online_state.get('cursor_source')
+        self.update_count = online_state.get('update_count', 0)
+        self.class_counts = np.asarray(online_state.get('class_counts', [0, 0]), dtype=np.float64)
+        journal = online_state.get('history_journal')
+        if journal is None:
+            # 旧checkpoint：历史计数全量保存在模型文件中
+            self.history = online_state.get('history') or {key: {} for key in HISTORY_KEYS}
+            return
+        directory = self._load_dir
+        history = self._read_history_journal(directory, journal['file'], journal['offset'])
+        if history is None:
+            # 日志已被清理：权重可用，历史计数和游标由调用方重新初始化
+            print(f"⚠️ 在线模型历史计数日志缺失: {journal['file']}")
+            self.samples_seen = None
+            return
+        self.history = history
+        self._journal = {'dir': directory, 'file': journal['file'], 'offset': journal['offset'],
+                         'full_bytes': journal['offset']}
+
+    def reset(self):
+        """重置模型和在线状态"""
+        super().reset()
+        self._reset_online_state()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+时点特征模块 - 无数据泄露的历史点击率
+每个样本只使用时间戳在它之前的样本计算历史CTR。
+按时间戳排序一次，再对每个键做分组累计求和/计数并减去当前行，整体 O(N log N)，
+取代逐行切片 df_sorted.loc[:idx-1] 再过滤的 O(N²) 实现，结果逐位一致。
+"""
+
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CTR = 0.1
+
+
+def time_order(df: pd.DataFrame, timestamp_col: str = 'timestamp') -> np.ndarray:
+    """
+    按时间戳排序后的行位置
+
+    与 df.sort_values(timestamp_col) 使用同一排序算法，
+    时间戳相同的样本之间的先后与原实现一致。
+    """
+    return df[[timestamp_col]].reset_index(drop=True).sort_values(timestamp_col).index.to_numpy()
+
+
+def historical_ctr(df: pd.DataFrame, key_col: str, order: Optional[np.ndarray] = None,
+                   history_mask: Optional[np.ndarray] = None, label_col: str = 'clicked',
+                   timestamp_col: str = 'timestamp', default: float = DEFAULT_CTR) -> np.ndarray:
+    """
+    计算每个样本在其之前的同键样本上的平均点击率
+
+    Args:
+        df: 样本
+        key_col: 分组键列（如 query、doc_id）
+        order: 按时间排序的行位置，为None时现算（多个键共用时传入可省去重复排序）
+        history_mask: 按行位置的布尔数组，只有为True的样本计入历史（如只用训练集）
+        label_col: 点击标签列
+        timestamp_col: 时间戳列
+        default: 没有历史时的默认值
+
+    Returns:
+        np.ndarray: 与 df 行顺序对齐的历史CTR
+    """
+    n = len(df)
+    if n == 0:
+        return np.array([], dtype=np.float64)
+    if order is None:
+        order = time_order(df, timestamp_col)
+
+    # 键为空值时与任何历史都不相等，编码为 -1 后单独处理
+    codes, _ = pd.factorize(df[key_col].to_numpy()[order], use_na_sentinel=True)
+    clicks = df[label_col].to_numpy()[order].astype(np.int64)
+    if history_mask is None:
+        counted = np.ones(n, dtype=np.int64)
+    else:
+        counted = np.asarray(history_mask, dtype=bool)[order].astype(np.int64)
+        clicks = clicks * counted
+
+    grouped = pd.DataFrame({'clicks': clicks, 'counted': counted}).groupby(codes, sort=False).cumsum()
+    # 累计值减去当前行 = 严格在当前样本之前的历史
+    prior_clicks = grouped['clicks'].to_numpy() - clicks
+    prior_counts = grouped['counted'].to_numpy() - counted
+
+    has_history = (prior_counts > 0) & (codes >= 0)
+    ctr_sorted = np.full(n, default, dtype=np.float64)
+    ctr_sorted[has_history] = prior_clicks[has_history] / prior_counts[has_history]
+
+    # 按原始行顺序放回
+    ctr = np.empty(n, dtype=np.float64)
+    ctr[order] = ctr_sorted
+    return ctr
+
+
+def historical_ctr_features(df: pd.DataFrame, key_cols: Sequence[str] = ('query', 'doc_id'),
+                            train_indices: Optional[np.ndarray] = None,
+                            timestamp_col: str = 'timestamp') -> np.ndarray:
+    """
+    多个键的历史CTR特征（共用一次排序）
+
+    Args:
+        df: 样本
+        key_cols: 分组键列
+        train_indices: 训练集行位置，给定时历史只使用训练集样本
+        timestamp_col: 时间戳列
+
+    Returns:
+        np.ndarray: 形状 (N, len(key_cols))，列顺序与 key_cols 一致
+    """
+    if len(df) == 0:
+        return np.empty((0, len(key_cols)), dtype=np.float64)
+    order = time_order(df, timestamp_col)
+    history_mask = None
+    if train_indices is not None:
+        history_mask = np.zeros(len(df), dtype=bool)
+        history_mask[np.asarray(train_indices, dtype=np.int64)] = True
+    return np.column_stack([historical_ctr(df, key, order=order, history_mask=history_mask,
+                                           timestamp_col=timestamp_col)
+                            for key in key_cols])
@@ -60,6 +60,7 @@ from ..data_utils import (
     analyze_click_patterns
 )
 from .ctr_config import CTRModelConfig
+from ..query_cache import get_query_cache
 
 def get_history_html(ctr_collector):
     """获取历史记录HTML"""
@@ -116,8 +117,8 @@ def create_model_instance(model_type: str):
 def train_ctr_model_direct(ctr_model, data_service, model_type: str = "logistic_regression"):
     """直接使用data_service训练CTR模型"""
     try:
-        # 获取训练数据
-        records = data_service.get_all_samples()
+        # 获取训练数据（直接读取列式数据）
+        records = data_service.get_samples_dataframe()
         
         if len(records) < 10:
             return (
@@ -141,6 +142,8 @@ def train_ctr_model_direct(ctr_model, data_service, model_type: str = "logistic_
                 "<p>请检查数据质量</p>",
                 "<p>暂无特征权重数据</p>"
             )
+        # 新模型已落盘，已缓存的CTR排序结果失效
+        get_query_cache().bump_model_version()
         
         # 获取模型配置信息
         model_config = CTRModelConfig.get_model_config(model_type)
@@ -225,6 +228,8 @@ def train_ctr_model(ctr_model, ctr_collector, model_type: str = "logistic_regres
                 "<p>请检查数据质量</p>",
                 "<p>暂无特征权重数据</p>"
             )
+        # 新模型已落盘，已缓存的CTR排序结果失效
+        get_query_cache().bump_model_version()
         
         # 获取模型配置信息
         model_config = CTRModelConfig.get_model_config(model_type)
@@ -734,7 +739,7 @@ def build_training_tab(model_service, data_service):
                     return "<p style='color: orange;'>⚠️ 请先训练模型</p>"
                 
                 # 获取训练数据
-                records = data_service.get_all_samples()
+                records = data_service.get_samples_dataframe()
                 
                 if len(records) < 10:
                     return "<p style='color: red;'>❌ 数据量不足</p>"
@@ -860,7 +865,7 @@ def build_training_tab(model_service, data_service):
             """执行AutoML优化"""
             try:
                 # 获取训练数据
-                records = data_service.get_all_samples()
+                records = data_service.get_samples_dataframe()
                 
                 if len(records) < 30:
                     return "<p style='color: red;'>❌ 数据量不足，至少需要30条记录</p>"
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Wide & Deep 推理运行时 - 只依赖 NumPy
+把训练好的 Keras 模型（全连接层、嵌入表）和特征标准化参数冻结为一个 .npz 文件，
+推理时不导入 TensorFlow。支持 float32 和 int8 两种存储：
+int8 对全连接层按输出通道、对嵌入表按行做对称量化，文件约为 float32 的 1/4，
+加载时全连接层反量化为 float32，嵌入表保持 int8、按查到的行反量化。
+文件格式见 model_artifact（.npz + 带 sha256 的 .json 元数据），加载时内存映射嵌入表。
+
+网络结构与 WideAndDeepCTRModel._build_model 一致：
+    deep_concat = [deep, query_emb, doc_emb, position_emb]
+    h = relu(Dense128) -> relu(Dense64) -> relu(Dense32)
+    output = sigmoid(Dense1([wide, h]))
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .model_artifact import load_artifact, metadata_path, save_artifact
+
+RUNTIME_VERSION = 1
+DTYPES = ('float32', 'int8')
+
+# (嵌入层名, 输入名)，顺序即 deep_concat 中的拼接顺序
+EMBEDDINGS: Tuple[Tuple[str, str], ...] = (
+    ('query_embedding', 'query_hash'),
+    ('doc_embedding', 'doc_hash'),
+    ('position_embedding', 'position_group'),
+)
+HIDDEN_LAYERS = ('deep_hidden1', 'deep_hidden2', 'deep_hidden3')
+OUTPUT_LAYER = 'output'
+
+
+def quantize_int8(weights: np.ndarray, axis: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对称 int8 量化
+
+    Args:
+        weights: 权重
+        axis: 沿该轴共享一个缩放系数之外的轴（全连接核取0即按输出列，嵌入表取1即按行）
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: (int8 权重, float32 缩放系数，形状可直接广播)
+    """
+    max_abs = np.max(np.abs(weights), axis=axis, keepdims=True)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    quantized = np.clip(np.round(weights / scale), -127, 127).astype(np.int8)
+    return quantized, scale
+
+
+def _scaler_params(scaler, dim: int) -> Tuple[np.ndarray, np.ndarray]:
+    """StandardScaler -> (均值, 标准差)，未拟合或未使用时为恒等变换"""
+    mean = getattr(scaler, 'mean_', None) if scaler is not None else None
+    scale = getattr(scaler, 'scale_', None) if scaler is not None else None
+    mean = np.zeros(dim) if mean is None else mean
+    scale = np.ones(dim) if scale is None else scale
+    return np.asarray(mean, dtype=np.float32), np.asarray(scale, dtype=np.float32)
+
+
+class WideDeepRuntime:
+    """NumPy 实现的 Wide & Deep 前向计算"""
+
+    def __init__(self, hidden: List[Tuple[np.ndarray, np.ndarray]], output: Tuple[np.ndarray, np.ndarray],
+                 embeddings: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]],
+                 wide_mean: np.ndarray, wide_scale: np.ndarray,
+                 deep_mean: np.ndarray, deep_scale: np.ndarray, dtype: str = 'float32'):
+        """
+        Args:
+            hidden: 隐藏层 [(kernel, bias)]，kernel 形状 (输入, 输出)
+            output: 输出层 (kernel, bias)
+            embeddings: 嵌入层名 -> (嵌入表, 按行缩放系数或None)
+            wide_mean, wide_scale: Wide特征标准化参数
+            deep_mean, deep_scale: Deep特征标准化参数
+            dtype: 存储精度（float32 / int8）
+        """
+        self.hidden = hidden
+        self.output = output
+        self.embeddings = embeddings
+        self.wide_mean, self.wide_scale = wide_mean, wide_scale
+        self.deep_mean, self.deep_scale = deep_mean, deep_scale
+        self.dtype = dtype
+        self.wide_dim = len(wide_mean)
+        self.deep_dim = len(deep_mean)
+
+    # ---------------- 导出 ----------------
+
+    @classmethod
+    def from_keras(cls, model, wide_scaler=None, deep_scaler=None) -> "WideDeepRuntime":
+        """
+        从 Keras 模型冻结权重
+
+        Args:
+            model: WideAndDeepCTRModel._build_model 构建的 Keras 模型
+            wide_scaler: Wide特征的 StandardScaler
+            deep_scaler: Deep特征的 StandardScaler
+        """
+        def dense(name):
+            kernel, bias = model.get_layer(name).get_weights()
+            return np.asarray(kernel, dtype=np.float32), np.asarray(bias, dtype=np.float32)
+
+        embeddings = {name: (np.asarray(model.get_layer(name).get_weights()[0], dtype=np.float32), None)
+                      for name, _ in EMBEDDINGS}
+        hidden = [dense(name) for name in HIDDEN_LAYERS]
+        output = dense(OUTPUT_LAYER)
+
+        embedding_dim = sum(table.shape[1] for table, _ in embeddings.values())
+        deep_dim = hidden[0][0].shape[0] - embedding_dim
+        wide_dim = output[0].shape[0] - hidden[-1][0].shape[1]
+        wide_mean, wide_scale = _scaler_params(wide_scaler, wide_dim)
+        deep_mean, deep_scale = _scaler_params(deep_scaler, deep_dim)
+        return cls(hidden, output, embeddings, wide_mean, wide_scale, deep_mean, deep_scale)
+
+    def save(self, path: str, dtype: str = 'float32') -> str:
+        """
+        保存为 .npz + .json（float32 运行时可另存为 int8）
+
+        Args:
+            path: 文件路径
+            dtype: float32 或 int8
+
+        Returns:
+            str: 文件路径
+        """
+        if dtype not in DTYPES:
+            raise ValueError(f"不支持的精度: {dtype}，可选 {DTYPES}")
+        if dtype == 'int8' and self.dtype != 'float32':
+            raise ValueError("只能从 float32 运行时导出 int8")
+
+        arrays: Dict[str, np.ndarray] = {
+            'wide_mean': self.wide_mean, 'wide_scale': self.wide_scale,
+            'deep_mean': self.deep_mean, 'deep_scale': self.deep_scale,
+        }
+        for name, (kernel, bias) in zip(HIDDEN_LAYERS + (OUTPUT_LAYER,), self.hidden + [self.output]):
+            if dtype == 'int8':
+                arrays[f'{name}/kernel'], arrays[f'{name}/kernel_scale'] = quantize_int8(kernel, axis=0)
+            else:
+                arrays[f'{name}/kernel'] = kernel
+            arrays[f'{name}/bias'] = bias
+        for name, (table, row_scale) in self.embeddings.items():
+            if dtype == 'int8':
+                arrays[f'{name}/table'], arrays[f'{name}/row_scale'] = quantize_int8(table, axis=1)
+            else:
+                arrays[f'{name}/table'] = table
+        meta = {'version': RUNTIME_VERSION, 'dtype': dtype, 'wide_dim': self.wide_dim, 'deep_dim': self.deep_dim}
+        return save_artifact(path, {'meta': meta, 'arrays': arrays}, meta={'model_class': 'WideDeepRuntime'})
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True, verify: bool = True) -> "WideDeepRuntime":
+        """
+        从 .npz 加载
+
+        Args:
+            path: 文件路径
+            mmap: 内存映射嵌入表等数组
+            verify: 校验 sha256（没有 .json 元数据的旧文件不校验）
+        """
+        if os.path.exists(metadata_path(path)):
+            state, _ = load_artifact(path, mmap=mmap, verify=verify)
+            return cls._from_arrays(state['arrays'], state['meta'])
+        with np.load(path, allow_pickle=False) as data:
+            arrays = {key: data[key] for key in data.files}
+        return cls._from_arrays(arrays, json.loads(arrays.pop('meta').tobytes().decode('utf-8')))
+
+    @classmethod
+    def _from_arrays(cls, data: Dict[str, np.ndarray], meta: Dict[str, Any]) -> "WideDeepRuntime":
+        """从数组和元数据构建运行时（int8 全连接层反量化，嵌入表保持原样）"""
+        if meta.get('version') != RUNTIME_VERSION:
+            raise ValueError(f"运行时版本不匹配: {meta.get('version')}")
+        dtype = meta['dtype']
+
+        def dense(name):
+            kernel = data[f'{name}/kernel']
+            if dtype == 'int8':
+                kernel = kernel.astype(np.float32) * data[f'{name}/kernel_scale']
+            return np.ascontiguousarray(kernel, dtype=np.float32), data[f'{name}/bias'].astype(np.float32)
+
+        hidden = [dense(name) for name in HIDDEN_LAYERS]
+        output = dense(OUTPUT_LAYER)
+        embeddings = {}
+        for name, _ in EMBEDDINGS:
+            row_scale = data[f'{name}/row_scale'] if dtype == 'int8' else None
+            embeddings[name] = (data[f'{name}/table'], row_scale)
+        return cls(hidden, output, embeddings,
+                   data['wide_mean'], data['wide_scale'], data['deep_mean'], data['deep_scale'], dtype=dtype)
+
+    # ---------------- 推理 ----------------
+
+    def _embed(self, name: str, indices: np.ndarray) -> np.ndarray:
+        table, row_scale = self.embeddings[name]
+        indices = np.clip(np.asarray(indices, dtype=np.int64).reshape(-1), 0, len(table) - 1)
+        rows = table[indices]
+        if row_scale is not None:
+            rows = rows.astype(np.float32) * row_scale[indices]
+        return rows
+
+    def forward(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        前向计算（输入为已标准化的特征，与 Keras model.predict 的输入相同）
+
+        Args:
+            inputs: wide、deep、query_hash、doc_hash、position_group
+
+        Returns:
+            np.ndarray: 形状 (N,) 的点击概率
+        """
+        wide = np.asarray(inputs['wide'], dtype=np.float32)
+        deep = np.asarray(inputs['deep'], dtype=np.float32)
+        hidden = np.concatenate([deep] + [self._embed(name, inputs[key]) for name, key in EMBEDDINGS], axis=1)
+        for kernel, bias in self.hidden:
+            hidden = np.maximum(hidden @ kernel + bias, 0.0)
+        kernel, bias = self.output
+        logits = (np.concatenate([wide, hidden], axis=1) @ kernel + bias).reshape(-1)
+        # 裁剪避免 exp 溢出（float32 下 sigmoid 在 ±88 之外已饱和）
+        return 1.0 / (1.0 + np.exp(-np.clip(logits, -88.0, 88.0)))
+
+    def predict(self, features: Dict[str, np.ndarray]) -> np.ndarray:
+        """
+        从 extract_features 的原始特征预测（内部完成标准化）
+
+        Returns:
+            np.ndarray: 形状 (N,) 的点击概率
+        """
+        inputs = dict(features)
+        inputs['wide'] = (np.asarray(features['wide'], dtype=np.float32) - self.wide_mean) / self.wide_scale
+        inputs['deep'] = (np.asarray(features['deep'], dtype=np.float32) - self.deep_mean) / self.deep_scale
+        return self.forward(inputs)
+
+    def get_info(self) -> Dict[str, Any]:
+        """运行时信息（精度、维度、权重字节数）"""
+        nbytes = sum(kernel.nbytes + bias.nbytes for kernel, bias in self.hidden + [self.output])
+        nbytes += sum(table.nbytes + (row_scale.nbytes if row_scale is not None else 0)
+                      for table, row_scale in self.embeddings.values())
+        return {'dtype': self.dtype, 'wide_dim': self.wide_dim, 'deep_dim': self.deep_dim, 'weight_bytes': nbytes}
+
+
+def export_wide_deep_runtime(model, wide_scaler, deep_scaler, path: str, dtype: str = 'float32') -> str:
+    """
+    导出 Keras Wide & Deep 模型为 NumPy 运行时文件
+
+    Args:
+        model: Keras 模型
+        wide_scaler: Wide特征的 StandardScaler
+        deep_scaler: Deep特征的 StandardScaler
+        path: 输出 .npz 路径
+        dtype: float32 或 int8
+
+    Returns:
+        str: 输出路径
+    """
+    return WideDeepRuntime.from_keras(model, wide_scaler, deep_scaler).save(path, dtype)
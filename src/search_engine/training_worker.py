@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台训练进程模块
+在线训练放在独立的子进程中执行，与搜索服务进程隔离：
+- 服务进程把CTR事件（与事件日志同格式的 impression / click / clear）非阻塞地放入队列，队列满时丢弃并计数
+- 训练进程缓存展示样本，等待点击回流（label_delay_seconds）后攒成小批，
+  用 OnlineCTRModel.partial_fit 增量更新，发布新的在线checkpoint（models/online/ctr_model_ckpt_N.npz）
+- checkpoint 先写临时文件再原子替换并登记到模型注册表，服务进程的 ModelService 检测到新版本后热加载
+- 子进程用 spawn 方式启动（不继承服务进程的线程和 scikit-learn 状态），崩溃后由 ensure_running 重启
+
+训练进程崩溃只会丢失尚未训练的缓存事件，不影响搜索服务。
+"""
+
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .model_registry import ModelRegistry
+from .training_tab.ctr_config import CTRModelConfig
+from .training_tab.model_artifact import ARTIFACT_EXT, LEGACY_EXT, metadata_path
+
+CHECKPOINT_PREFIX = "ctr_model_ckpt_"
+
+
+def list_checkpoints(checkpoint_dir: str) -> List[int]:
+    """目录中已发布的LR在线checkpoint编号（升序，包括旧的 .pkl checkpoint）"""
+    if not os.path.isdir(checkpoint_dir):
+        return []
+    numbers = set()
+    for name in os.listdir(checkpoint_dir):
+        stem, ext = os.path.splitext(name)
+        if stem.startswith(CHECKPOINT_PREFIX) and ext in (ARTIFACT_EXT, LEGACY_EXT):
+            try:
+                numbers.add(int(stem[len(CHECKPOINT_PREFIX):]))
+            except ValueError:
+                continue
+    return sorted(numbers)
+
+
+def checkpoint_path(checkpoint_dir: str, number: int) -> str:
+    """LR在线checkpoint的模型文件路径"""
+    return os.path.join(checkpoint_dir, f"{CHECKPOINT_PREFIX}{number}{ARTIFACT_EXT}")
+
+
+def _event_time(value: Optional[str]) -> float:
+    try:
+        return datetime.fromisoformat(value).timestamp() if value else time.time()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class TrainingWorker:
+    """训练进程内的事件消费与增量训练逻辑"""
+
+    def __init__(self, checkpoint_dir: str = "models/online",
+                 offline_model_files: Tuple[str, ...] = ("models/offline/ctr_model.npz", "models/ctr_model.npz"),
+                 samples_dir: Optional[str] = "models/ctr_store",
+                 label_delay_seconds: float = 60.0, min_batch_size: int = 10,
+                 max_wait_seconds: float = 300.0, max_checkpoints: int = 5,
+                 registry_path: Optional[str] = "models/model_registry.json"):
+        """
+        Args:
+            checkpoint_dir: 在线checkpoint目录
+            offline_model_files: 没有在线checkpoint时用于热启动的离线模型（按顺序尝试）
+            samples_dir: 列式CTR数据目录，热启动时用于初始化历史CTR计数
+            label_delay_seconds: 展示后等待点击回流的时间
+            min_batch_size: 攒够该数量的样本才训练
+            max_wait_seconds: 有样本但不足一批时，最长等待该时间后也训练
+            max_checkpoints: 保留的checkpoint数量
+            registry_path: 模型注册表清单路径，为None时不登记版本
+        """
+        self.checkpoint_dir = checkpoint_dir
+        self.offline_model_files = offline_model_files
+        self.samples_dir = samples_dir
+        self.label_delay_seconds = label_delay_seconds
+        self.min_batch_size = min_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.max_checkpoints = max_checkpoints
+        self.registry = ModelRegistry(registry_path) if registry_path else None
+
+        self.learner = None
+        # (request_id, doc_id) -> 等待点击回流的展示样本（按到达顺序）
+        self._pending: "OrderedDict[Tuple[str, str], List[Dict[str, Any]]]" = OrderedDict()
+        self._ready: List[Dict[str, Any]] = []
+        self._last_train_time = time.time()
+        self.stats = {'events': 0, 'trained_samples': 0, 'checkpoints': 0, 'errors': 0}
+
+    # ---------------- 初始化 ----------------
+
+    def load_learner(self):
+        """从最新在线checkpoint恢复，否则从离线LR模型热启动"""
+        from .training_tab.ctr_model import CTRModel
+        from .training_tab.online_ctr_model import CURSOR_EVENT_STREAM, OnlineCTRModel
+
+        learner = OnlineCTRModel()
+        checkpoints = list_checkpoints(self.checkpoint_dir)
+        loaded = bool(checkpoints) and learner.load_model(
+            checkpoint_path(self.checkpoint_dir, checkpoints[-1]))
+        if not loaded:
+            learner.reset()
+            for path in self.offline_model_files:
+                offline = CTRModel()
+                if offline.load_model(path) and learner.warm_start(offline):
+                    print(f"📥 训练进程从离线模型热启动: {path}")
+                    break
+        if learner.samples_seen is None:
+            learner.seed_history(self._load_samples())
+        # 之后只按队列事件计数，服务进程加载这些checkpoint时不把游标当作样本位置
+        learner.cursor_source = CURSOR_EVENT_STREAM
+        self.learner = learner
+
+    def _load_samples(self):
+        """已落盘的CTR样本（用于初始化历史CTR计数）"""
+        try:
+            from .ctr_columnar_store import PARQUET_AVAILABLE, CTRColumnarStore
+            if self.samples_dir and PARQUET_AVAILABLE:
+                store = CTRColumnarStore(self.samples_dir)
+                if store.exists():
+                    return store.load_frame()
+        except Exception as e:
+            print(f"⚠️ 训练进程读取历史样本失败: {e}")
+        return []
+
+    # ---------------- 事件处理 ----------------
+
+    def handle_event(self, event: Dict[str, Any]):
+        """处理一条事件（与 CTREventStore 日志同格式，另支持 config 控制消息）"""
+        op = event.get('op')
+        self.stats['events'] += 1
+        if op == 'impression':
+            sample = dict(event['sample'])
+            key = (sample.get('request_id'), sample.get('doc_id'))
+            self._pending.setdefault(key, []).append(sample)
+        elif op == 'click':
+            samples = self._pending.get((event.get('request_id'), event.get('doc_id')), [])
+            # 与 CTREventStore.apply_click 一致：批量点击只更新第一条
+            for sample in (samples if event.get('all', True) else samples[:1]):
+                sample['clicked'] = 1
+        elif op == 'clear':
+            self._pending.clear()
+            self._ready = []
+            if self.learner is not None:
+                self.learner.seed_history([])
+        elif op == 'config':
+            self.min_batch_size = max(1, int(event.get('min_batch_size', self.min_batch_size)))
+
+    def _collect_ready(self, now: float):
+        """展示时间超过点击回流等待时间的样本移入待训练列表"""
+        cutoff = now - self.label_delay_seconds
+        while self._pending:
+            key, samples = next(iter(self._pending.items()))
+            if _event_time(samples[-1].get('timestamp')) > cutoff:
+                break
+            self._pending.popitem(last=False)
+            self._ready.extend(samples)
+
+    def maybe_train(self, now: Optional[float] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        样本够一批（或等待超时、force）时训练并发布checkpoint
+
+        Returns:
+            Optional[Dict]: 训练结果，未训练时为None
+        """
+        now = time.time() if now is None else now
+        self._collect_ready(now)
+        if not self._ready:
+            return None
+        waited = now - self._last_train_time >= self.max_wait_seconds
+        if len(self._ready) < self.min_batch_size and not (waited or force):
+            return None
+
+        batch_size = self.learner.max_batch_size
+        batch, self._ready = self._ready[:batch_size], self._ready[batch_size:]
+        self._last_train_time = now
+        result = self.learner.partial_fit(batch)
+        if not result.get('success', False):
+            self.stats['errors'] += 1
+            print(f"❌ 训练进程增量更新失败: {result.get('error', '未知错误')}")
+            return result
+        self.stats['trained_samples'] += result['samples']
+        result['checkpoint'] = self.publish_checkpoint(result)
+        return result
+
+    # ---------------- 发布 ----------------
+
+    def publish_checkpoint(self, metrics: Optional[Dict[str, Any]] = None) -> Optional[str]:
+        """原子发布下一个版本的checkpoint（并登记到注册表），清理旧版本"""
+        try:
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            existing = list_checkpoints(self.checkpoint_dir)
+            number = (existing[-1] if existing else 0) + 1
+            path = checkpoint_path(self.checkpoint_dir, number)
+            info = {
+                'model_file': path,
+                'save_time': datetime.now().isoformat(),
+                'model_type': CTRModelConfig.get_model_config('logistic_regression').get('name', 'logistic_regression'),
+                'model_class': 'OnlineCTRModel',
+                'is_online': True,
+                'checkpoint_number': number,
+                'samples_seen': self.learner.samples_seen,
+                'cursor_source': self.learner.cursor_source,
+                'update_count': self.learner.update_count,
+                'trainer_pid': os.getpid(),
+            }
+            with open(os.path.join(self.checkpoint_dir, f"{CHECKPOINT_PREFIX}{number}_info.json"), 'w',
+                      encoding='utf-8') as f:
+                json.dump(info, f, ensure_ascii=False, indent=2)
+            # 权重和元数据各自原子替换，服务进程加载时校验两者一致
+            self.learner.save_model(path)
+            self.stats['checkpoints'] += 1
+            if self.registry is not None:
+                self.registry.register('logistic_regression', path, source='online', checkpoint=number,
+                                       metrics=metrics, pipeline_hash=self.learner.pipeline.fingerprint())
+            self._cleanup(existing + [number])
+            print(f"✅ 训练进程发布checkpoint #{number}: {path}")
+            return path
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"❌ 训练进程发布checkpoint失败: {e}")
+            return None
+
+    def _cleanup(self, numbers: List[int]):
+        removed = False
+        for number in numbers[:-self.max_checkpoints]:
+            path = checkpoint_path(self.checkpoint_dir, number)
+            base = os.path.splitext(path)[0]
+            for path in (path, metadata_path(path), base + LEGACY_EXT, base + '_info.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+                    removed = True
+        if removed and self.registry is not None:
+            self.registry.prune_missing()
+
+    # ---------------- 主循环 ----------------
+
+    def run(self, event_queue, stop_event, poll_interval: float = 1.0):
+        """消费事件直到 stop_event 置位（退出前把已就绪的样本训练完）"""
+        self.load_learner()
+        print(f"🚀 训练进程已启动 (pid {os.getpid()})")
+        while not stop_event.is_set():
+            deadline = time.time() + poll_interval
+            while time.time() < deadline:
+                try:
+                    self.handle_event(event_queue.get(timeout=max(0.01, deadline - time.time())))
+                except queue.Empty:
+                    break
+            self.maybe_train()
+        self.maybe_train(force=True)
+        print(f"🛑 训练进程已退出 (pid {os.getpid()})")
+
+
+def run_training_worker(event_queue, stop_event, config: Dict[str, Any]):
+    """子进程入口"""
+    poll_interval = config.pop('poll_interval', 1.0)
+    TrainingWorker(**config).run(event_queue, stop_event, poll_interval)
+
+
+class TrainingWorkerProcess:
+    """服务进程侧：启动、监护训练子进程并向其投递事件"""
+
+    def __init__(self, max_queue_size: int = 10000, poll_interval: float = 1.0, **worker_config):
+        """
+        Args:
+            max_queue_size: 事件队列容量，满时丢弃新事件（不阻塞搜索请求）
+            poll_interval: 训练进程检查是否需要训练的间隔（秒）
+            worker_config: 传给 TrainingWorker 的参数
+        """
+        self._context = multiprocessing.get_context('spawn')
+        self.max_queue_size = max_queue_size
+        self.worker_config = dict(worker_config, poll_interval=poll_interval)
+        self._queue = None
+        self._stop_event = None
+        self._process = None
+        self.submitted = 0
+        self.dropped = 0
+        self.restarts = 0
+
+    def start(self) -> bool:
+        """启动训练进程（已在运行时直接返回）"""
+        if self.is_alive():
+            return True
+        try:
+            self._queue = self._context.Queue(maxsize=self.max_queue_size)
+            self._stop_event = self._context.Event()
+            self._process = self._context.Process(
+                target=run_training_worker, args=(self._queue, self._stop_event, dict(self.worker_config)),
+                name="ctr-training-worker", daemon=True)
+            self._process.start()
+            return True
+        except Exception as e:
+            print(f"❌ 启动训练进程失败: {e}")
+            self._process = None
+            return False
+
+    def stop(self, timeout: float = 10.0):
+        """通知训练进程退出并等待，超时则强制结束"""
+        if self._process is None:
+            return
+        self._stop_event.set()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            self._process.terminate()
+            self._process.join(1.0)
+        self._process = None
+
+    def is_alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    def ensure_running(self) -> bool:
+        """训练进程意外退出时重启"""
+        if self._process is None or self.is_alive():
+            return self.is_alive()
+        print(f"⚠️ 训练进程已退出 (exitcode={self._process.exitcode})，正在重启")
+        self.restarts += 1
+        self._process = None
+        return self.start()
+
+    def submit(self, event: Dict[str, Any]) -> bool:
+        """非阻塞投递事件，队列满或进程未运行时丢弃"""
+        if self._process is None:
+            return False
+        event = dict(event)
+        if 'sample' in event:
+            # 队列在后台线程中序列化，先复制，避免与之后的点击更新并发
+            event['sample'] = dict(event['sample'])
+        try:
+            self._queue.put_nowait(event)
+            self.submitted += 1
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'alive': self.is_alive(),
+            'pid': self._process.pid if self._process is not None else None,
+            'submitted': self.submitted,
+            'dropped': self.dropped,
+            'restarts': self.restarts,
+        }
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+向量索引模块 - 图搜图/文搜图的最近邻检索
+向量按内积（已归一化即余弦相似度）检索，索引只保存检索结构，不复制向量本身：
+search 时由调用方传入嵌入矩阵（行号即槽位）或 EmbeddingStore（按槽位寻址，槽位即图片的 embedding_index）。
+删除只把槽位标记为无效，不移动其他槽位。
+
+- FlatIndex: 精确检索，全量内积 + argpartition 取 top-k（不对全部得分排序）
+- IVFIndex: 倒排文件近似检索，球面 k-means 把向量分成 nlist 个簇，查询时只扫描最近的 nprobe 个簇；
+  nprobe 越大召回越高、延迟越高。向量数不足以训练时退化为精确检索
+
+索引文件（.npz）与图片嵌入放在同一目录，加载时按向量数校验是否与嵌入一致。
+"""
+
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple, Type
+
+import numpy as np
+
+INDEX_FORMAT_VERSION = 1
+
+# 训练 k-means 时每个簇最多使用的样本数
+TRAIN_SAMPLES_PER_LIST = 256
+# 向量数不足 nlist * MIN_POINTS_PER_LIST 时不训练 IVF，使用精确检索
+MIN_POINTS_PER_LIST = 8
+# 分块计算 (向量, 簇中心) 内积，限制临时矩阵大小
+ASSIGN_CHUNK_SIZE = 65536
+# IVF 新增槽位先放在待整理列表中，超过 max(该值, 1% 向量数) 时重排倒排列表
+PENDING_SLOTS_LIMIT = 4096
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """得分最高的 top_k 个位置（按得分降序）；argpartition 选出 top_k 后只对这 top_k 个排序"""
+    top_k = min(top_k, len(scores))
+    if top_k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if top_k < len(scores):
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def all_slots(vectors) -> np.ndarray:
+    """全部有效槽位：矩阵为全部行号，EmbeddingStore 为未删除的槽位"""
+    if isinstance(vectors, np.ndarray):
+        return np.arange(len(vectors), dtype=np.int64)
+    return vectors.live_slots()
+
+
+def inner_products(vectors, query: np.ndarray, slots: np.ndarray) -> np.ndarray:
+    """query 与指定槽位向量的内积；vectors 为矩阵或 EmbeddingStore（量化时为近似值）"""
+    if isinstance(vectors, np.ndarray):
+        return vectors[slots] @ query
+    return vectors.inner_products(query, slots)
+
+
+def exact_search(vectors, query: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+    """精确检索：全量内积 + top_k_indices"""
+    if isinstance(vectors, np.ndarray):
+        slots, scores = None, vectors @ query
+    else:
+        slots, scores = vectors.scan(query)
+    indices = top_k_indices(scores, top_k)
+    return (indices if slots is None else slots[indices]), scores[indices]
+
+
+class VectorIndex(ABC):
+    """向量索引基类"""
+
+    index_type = 'base'
+
+    def __init__(self):
+        self.size = 0
+
+    def build(self, vectors):
+        """用全部有效向量重建索引"""
+        self.size = len(vectors)
+
+    def add(self, vectors: np.ndarray, slots: np.ndarray):
+        """加入新向量及其槽位"""
+        self.size += len(vectors)
+
+    def remove(self, slot: int):
+        """删除一个槽位（其他槽位不变）"""
+        self.size -= 1
+
+    def needs_build(self) -> bool:
+        """追加向量后是否需要用全部向量重建（如 IVF 的向量数已足够训练）"""
+        return False
+
+    @abstractmethod
+    def search(self, vectors, query: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        检索与 query 内积最大的 top_k 个向量
+
+        Args:
+            vectors: 嵌入矩阵 (n, dim) 或 EmbeddingStore，槽位与索引一致
+            query: 查询向量 (dim,)
+            top_k: 返回数量
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (槽位, 内积得分)，按得分降序
+        """
+
+    def get_config(self) -> Dict[str, Any]:
+        """索引参数（保存到索引文件）"""
+        return {}
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'index_type': self.index_type, 'size': self.size, **self.get_config()}
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        """需要保存的数组"""
+        return {}
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        pass
+
+    def save(self, path: str):
+        """保存索引（先写临时文件再替换）"""
+        header = {'format_version': INDEX_FORMAT_VERSION, 'index_type': self.index_type,
+                  'size': self.size, 'config': self.get_config()}
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, header=np.array(json.dumps(header)), **self._state())
+        os.replace(tmp_path, path)
+
+
+class FlatIndex(VectorIndex):
+    """精确检索：全量内积 + argpartition 取 top-k"""
+
+    index_type = 'flat'
+
+    def search(self, vectors, query: np.ndarray, top_k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        return exact_search(vectors, query, top_k)
+
+
+class IVFIndex(VectorIndex):
+    """
+    倒排文件（IVF）近似检索
+    写入（add/remove/build）与检索可以在不同线程并发：倒排布局和待整理槽位由 _lock 保护，
+    检索取得一致的快照后在锁外计算
+    """
+
+    index_type = 'ivf'
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 8, kmeans_iters: int = 10, seed: int = 42):
+        """
+        Args:
+            nlist: 簇数（None 表示每次训练时取 4 * sqrt(n)）
+            nprobe: 查询时扫描的簇数（召回/延迟的权衡）
+            kmeans_iters: k-means 迭代次数
+            seed: 随机种子
+        """
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.kmeans_iters = kmeans_iters
+        self.seed = seed
+        self.centroids: Optional[np.ndarray] = None
+        # 每个槽位所属的簇，-1 表示已删除或不存在
+        self.assignments = np.empty(0, dtype=np.int32)
+        # 按簇排列的槽位及每个簇的起止位置；之后新增的槽位在 _pending 中
+        self._order: Optional[np.ndarray] = None
+        self._offsets: Optional[np.ndarray] = None
+        self._pending = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def n_lists(self) -> int:
+        """训练得到的簇数"""
+        return 0 if self.centroids is None else len(self.centroids)
+
+    def _target_nlist(self, n: int) -> int:
+        return self.nlist or max(1, int(4 * np.sqrt(n)))
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """每个向量最近（内积最大）的簇"""
+        result = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+            chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+            result[start:start + len(chunk)] = np.argmax(chunk @ self.centroids.T, axis=1)
+        return result
+
+    def _assign_slots(self, vectors, slots: np.ndarray) -> np.ndarray:
+        """按槽位分块读取向量并分配簇"""
+        result = np.empty(len(slots), dtype=np.int32)
+        for start in range(0, len(slots), ASSIGN_CHUNK_SIZE):
+            chunk = slots[start:start + ASSIGN_CHUNK_SIZE]
+            result[start:start + len(chunk)] = self._assign(np.asarray(vectors[chunk], dtype=np.float32))
+        return result
+
+    def _set_assignments(self, slots: np.ndarray, clusters: np.ndarray):
+        if len(slots) and slots.max() >= len(self.assignments):
+            grown = np.full(max(int(slots.max()) + 1, 2 * len(self.assignments)), -1, dtype=np.int32)
+            grown[:len(self.assignments)] = self.assignments
+            self.assignments = grown
+        self.assignments[slots] = clusters
+
+    def train(self, vectors, slots: Optional[np.ndarray] = None):
+        """球面 k-means 训练簇中心（在至多 nlist * TRAIN_SAMPLES_PER_LIST 个样本上）"""
+        slots = all_slots(vectors) if slots is None else slots
+        nlist = self._target_nlist(len(slots))
+        rng = np.random.RandomState(self.seed)
+        sample_size = min(len(slots), nlist * TRAIN_SAMPLES_PER_LIST)
+        sample_slots = np.sort(rng.choice(slots, sample_size, replace=False))
+        sample = np.asarray(vectors[sample_slots], dtype=np.float32)
+
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iters):
+            self.centroids = centroids
+            labels = self._assign(sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            # 空簇重新用随机样本初始化
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sums / np.maximum(norms, 1e-12)
+        self.centroids = centroids.astype(np.float32)
+
+    def build(self, vectors):
+        slots = all_slots(vectors)
+        centroids, assignments = None, np.empty(0, dtype=np.int32)
+        if len(slots) >= self._target_nlist(len(slots)) * MIN_POINTS_PER_LIST:
+            # 在新对象上训练和分配，完成后在锁内一次替换，检索线程不会看到训练中的簇中心
+            trainer = IVFIndex(self.nlist, self.nprobe, self.kmeans_iters, self.seed)
+            trainer.train(vectors, slots)
+            trainer._set_assignments(slots, trainer._assign_slots(vectors, slots))
+            centroids, assignments = trainer.centroids, trainer.assignments
+        with self._lock:
+            self.size = len(slots)
+            self.centroids = centroids
+            self.assignments = assignments
+            self._order = None
+            self._pending = np.empty(0, dtype=np.int64)
+
+    def add(self, vectors: np.ndarray, slots: np.ndarray):
+        clusters = self._assign(vectors) if self.trained else None
+        with self._lock:
+            self.size += len(vectors)
+            if clusters is None:
+                # 未训练时只记录数量，向量足够后 needs_build() 为 True，由调用方重建
+                return
+            self._set_assignments(slots, clusters)
+            self._pending = np.concatenate([self._pending, slots])
+
+    def remove(self, slot: int):
+        # 只标记为 -1，倒排列表中的该槽位在检索时过滤
+        with self._lock:
+            if self.trained and slot < len(self.assignments):
+                self.assignments[slot] = -1
+            self.size -= 1
+
+    def needs_build(self) -> bool:
+        return not self.trained and self.size >= self._target_nlist(self.size) * MIN_POINTS_PER_LIST
+
+    def _layout(self):
+        """倒排布局的一致快照 (簇中心, 槽位所属簇, 按簇排列的槽位, 簇起止位置, 待整理槽位)；需要时先重排"""
+        with self._lock:
+            if self.centroids is None:
+                return None
+            if self._order is None or len(self._pending) > max(PENDING_SLOTS_LIMIT, self.size // 100):
+                valid = np.flatnonzero(self.assignments >= 0)
+                clusters = self.assignments[valid]
+                self._order = valid[np.argsort(clusters, kind='stable')]
+                self._offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+                np.cumsum(np.bincount(clusters, minlength=self.n_lists), out=self._offsets[1:])
+                self._pending = np.empty(0, dtype=np.int64)
+            return self.centroids, self.assignments, self._order, self._offsets, self._pending
+
+    def search(self, vectors, query: np.ndarray, top_k: int = 10,
+               nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        layout = self._layout()
+        if layout is None:
+            return exact_search(vectors, query, top_k)
+        centroids, assignments, order, offsets, pending = layout
+        nprobe = min(nprobe or self.nprobe, len(centroids))
+        probes = top_k_indices(centroids @ query, nprobe)
+        parts = [order[offsets[c]:offsets[c + 1]] for c in probes]
+        if len(pending):
+            parts.append(pending[np.isin(assignments[pending], probes)])
+        slots = np.concatenate(parts)
+        slots = slots[assignments[slots] >= 0]
+        if len(slots) < top_k:
+            # 扫描的簇中向量不足 top_k，退化为精确检索
+            return exact_search(vectors, query, top_k)
+        slots.sort()
+        scores = inner_products(vectors, query, slots)
+        best = top_k_indices(scores, top_k)
+        return slots[best], scores[best]
+
+    def get_config(self) -> Dict[str, Any]:
+        return {'nlist': self.nlist, 'nprobe': self.nprobe, 'kmeans_iters': self.kmeans_iters, 'seed': self.seed}
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats['trained'] = self.trained
+        stats['n_lists'] = self.n_lists
+        if self.trained:
+            counts = np.bincount(self.assignments[self.assignments >= 0], minlength=self.n_lists)
+            stats['max_list_size'] = int(counts.max()) if len(counts) else 0
+        return stats
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        if not self.trained:
+            return {}
+        return {'centroids': self.centroids, 'assignments': self.assignments}
+
+    def _restore(self, arrays: Dict[str, np.ndarray]):
+        if 'centroids' in arrays:
+            self.centroids = arrays['centroids']
+            self.assignments = arrays['assignments']
+
+
+INDEX_TYPES: Dict[str, Type[VectorIndex]] = {
+    FlatIndex.index_type: FlatIndex,
+    IVFIndex.index_type: IVFIndex,
+}
+
+
+def create_vector_index(index_type: str = 'flat', **params) -> VectorIndex:
+    """按类型创建索引（'flat' 或 'ivf'）"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"未知的向量索引类型: {index_type}，可选 {list(INDEX_TYPES)}")
+    return INDEX_TYPES[index_type](**params)
+
+
+def load_vector_index(path: str) -> VectorIndex:
+    """从 .npz 加载索引"""
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data['header']))
+        if header.get('format_version') != INDEX_FORMAT_VERSION:
+            raise ValueError(f"不支持的向量索引版本: {header.get('format_version')}")
+        index = create_vector_index(header['index_type'], **header.get('config', {}))
+        index._restore({key: data[key] for key in data.files if key != 'header'})
+    index.size = header['size']
+    return index
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 """
 启动Model Serving API服务 - 独立进程模式
+
+用法:
+    python start_model_serving.py                  # Flask 服务
+    python start_model_serving.py --async --workers 2 --max-batch-size 64 --max-wait-ms 2
 """
 
+import argparse
 import sys
 import os
 import signal
@@ -18,8 +23,20 @@ def signal_handler(signum, frame):
     print("\n🛑 收到停止信号，正在关闭模型服务...")
     sys.exit(0)
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="启动Model Serving API服务")
+    parser.add_argument('--port', type=int, default=8501, help='监听端口')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='使用FastAPI异步服务（请求微批处理，需安装 fastapi、uvicorn）')
+    parser.add_argument('--workers', type=int, default=1, help='异步模式的 worker 进程数')
+    parser.add_argument('--threads', type=int, default=4, help='异步模式每个进程的模型计算线程数')
+    parser.add_argument('--max-batch-size', type=int, default=64, help='微批最大样本数')
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help='微批最大等待毫秒数')
+    return parser.parse_args()
+
 def main():
     """主函数"""
+    args = parse_args()
     print("🚀 启动Model Serving API服务（独立进程）...")
     print("=" * 60)
     
@@ -29,18 +46,24 @@ def main():
     
     try:
         # 创建并启动服务
-        model_service = ModelService()
+        # 模型在服务开始监听后加载和预热，/health 在预热完成后才返回200
+        model_service = ModelService(lazy_load=True)
         
         print("📋 服务信息:")
         print(f"   进程ID: {os.getpid()}")
-        print(f"   地址: http://0.0.0.0:8501")
-        print(f"   健康检查: http://localhost:8501/health")
-        print(f"   模型列表: http://localhost:8501/v1/models")
+        print(f"   模式: {'FastAPI异步（微批处理）' if args.use_async else 'Flask'}")
+        print(f"   地址: http://0.0.0.0:{args.port}")
+        print(f"   健康检查: http://localhost:{args.port}/health")
+        print(f"   模型列表: http://localhost:{args.port}/v1/models")
         print("   按 Ctrl+C 停止服务")
         print("=" * 60)
         
         # 启动服务（这会阻塞进程）
-        model_service.start_api_server(port=8501)
+        if args.use_async:
+            model_service.start_async_api_server(port=args.port, workers=args.workers, num_threads=args.threads,
+                                                 max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms)
+        else:
+            model_service.start_api_server(port=args.port)
         
     except KeyboardInterrupt:
         print("\n🛑 模型服务已停止")
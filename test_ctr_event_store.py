@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+测试 CTREventStore 的追加写日志：重放后样本和计数器与写入时一致，
+快照与日志轮转之间任意时刻中断后重启，事件既不丢失也不重复
+"""
+
+import copy
+import json
+import os
+import sys
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.ctr_columnar_store import CTRColumnarStore, PARQUET_AVAILABLE
+from search_engine.ctr_event_store import CTREventStore
+
+
+def _sample(i: int, request: int, doc: int, position: int = 1):
+    return {'query': f"q{request % 3}", 'doc_id': f"d{doc}", 'position': position,
+            'request_id': f"r{request}", 'clicked': 0, 'timestamp': f"2024-01-01T00:00:{i % 60:02d}"}
+
+
+def _write_events(store: CTREventStore, start: int, count: int):
+    """展示、首次点击、重复点击、批量点击交替"""
+    for i in range(start, start + count):
+        store.append(_sample(i, i // 4, i % 5, i % 4 + 1))
+        if i % 3 == 0:
+            store.apply_click(f"r{i // 4}", f"d{i % 5}", click_time=f"t{i}")
+        if i % 7 == 0:
+            store.apply_click(f"r{i // 4}", f"d{i % 5}", all_matches=False, click_time=f"t{i}b")
+
+
+def _state(store: CTREventStore):
+    return (store.samples,
+            {query: store.query_ctr(query) for query in ('q0', 'q1', 'q2')},
+            {doc: store.doc_ctr(doc) for doc in ('d0', 'd1', 'd2', 'd3', 'd4')},
+            store.total_clicked, store.total_click_events, store.max_click_count, store.duplicate_count)
+
+
+def _restart(log_file: str, snapshot, covered_seq: int) -> CTREventStore:
+    """模拟重启：加载快照后重放日志"""
+    store = CTREventStore(log_file)
+    store.load(copy.deepcopy(snapshot))
+    store.replay_log(covered_seq)
+    return store
+
+
+def test_replay_matches_live_state():
+    """只靠日志重放即可重建样本和计数器（含清空），写到一半的最后一行被忽略"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'events.jsonl')
+        live = CTREventStore(log_file)
+        _write_events(live, 0, 20)
+        live.clear()
+        _write_events(live, 20, 40)
+        live.close()
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write('{"op": "impression", "sam')
+
+        replayed = _restart(log_file, [], -1)
+        assert _state(replayed) == _state(live)
+        replayed.close()
+
+
+def test_snapshot_then_discard():
+    """正常落盘：快照后删除轮转日志，重启只重放之后的事件"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'events.jsonl')
+        live = CTREventStore(log_file)
+        _write_events(live, 0, 30)
+        rotated = live.rotate_log()
+        snapshot, covered_seq = copy.deepcopy(live.samples), live.log_seq
+        live.discard_log(rotated)
+        _write_events(live, 30, 30)
+        live.close()
+
+        assert not os.path.exists(rotated)
+        restarted = _restart(log_file, snapshot, covered_seq)
+        assert _state(restarted) == _state(live)
+        restarted.close()
+
+
+def test_interrupted_before_discard():
+    """快照已落盘、轮转日志未删除时中断：已包含的日志不再重放并被删除，之后的轮转序号继续递增"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'events.jsonl')
+        live = CTREventStore(log_file)
+        _write_events(live, 0, 30)
+        live.discard_log(live.rotate_log())
+        _write_events(live, 30, 10)
+        rotated = live.rotate_log()
+        snapshot, covered_seq = copy.deepcopy(live.samples), live.log_seq
+        # 未调用 discard_log 即中断
+        _write_events(live, 40, 10)
+        live.close()
+
+        restarted = _restart(log_file, snapshot, covered_seq)
+        assert _state(restarted) == _state(live)
+        assert not os.path.exists(rotated)
+        _write_events(restarted, 50, 5)
+        assert restarted.rotate_log().endswith(f".{covered_seq + 1}.pending")
+        restarted.close()
+
+
+def test_interrupted_before_snapshot():
+    """轮转后、快照落盘前中断：在上一次快照之上重放轮转日志和当前日志"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'events.jsonl')
+        live = CTREventStore(log_file)
+        _write_events(live, 0, 20)
+        live.rotate_log()
+        snapshot, covered_seq = copy.deepcopy(live.samples), live.log_seq
+        live.discard_log(f"{log_file}.{covered_seq}.pending")
+        _write_events(live, 20, 20)
+        live.rotate_log()
+        # 新快照未落盘即中断
+        _write_events(live, 40, 10)
+        live.close()
+
+        restarted = _restart(log_file, snapshot, covered_seq)
+        assert _state(restarted) == _state(live)
+        restarted.close()
+
+
+def test_columnar_manifest_records_log_seq():
+    """列式存储的清单与分块一起提交日志序号"""
+    if not PARQUET_AVAILABLE:
+        import pytest
+        pytest.skip("pyarrow 未安装")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        columnar = CTRColumnarStore(os.path.join(temp_dir, 'ctr_store'))
+        assert columnar.log_seq() == -1
+        rows = [_sample(i, i, i) for i in range(5)]
+        columnar.append_rows(list(range(5)), rows, 5, log_seq=3)
+        assert columnar.log_seq() == 3
+        columnar.append_rows([], [], 5)
+        assert columnar.log_seq() == 3
+        with open(columnar.manifest_path, 'r', encoding='utf-8') as f:
+            assert json.load(f)['log_seq'] == 3
+        assert [record['doc_id'] for record in columnar.load_records()] == [row['doc_id'] for row in rows]
+
+
+def test_lazy_columnar_load():
+    """从列式数据加载：索引和计数器与逐行加载一致，且不构建行字典，直到被访问或点击"""
+    if not PARQUET_AVAILABLE:
+        import pytest
+        pytest.skip("pyarrow 未安装")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        live = CTREventStore()
+        _write_events(live, 0, 40)
+        columnar = CTRColumnarStore(os.path.join(temp_dir, 'ctr_store'))
+        columnar.append_rows(list(range(len(live))), [dict(sample) for sample in live.samples], len(live))
+
+        loaded = CTREventStore()
+        loaded.load_records(columnar.load_records())
+        assert sum(row is not None for row in loaded.samples._rows) == 0
+        assert _state(loaded)[1:] == _state(live)[1:]
+        assert loaded.by_request('r3') == live.by_request('r3')
+        assert list(loaded.samples) == live.samples
+
+        loaded.apply_click('r9', 'd1', click_time='t')
+        live.apply_click('r9', 'd1', click_time='t')
+        loaded.append(_sample(99, 99, 0))
+        live.append(_sample(99, 99, 0))
+        assert _state(loaded)[1:] == _state(live)[1:]
+        assert loaded.samples[:] == live.samples
+
+
+if __name__ == "__main__":
+    test_replay_matches_live_state()
+    test_snapshot_then_discard()
+    test_interrupted_before_discard()
+    test_interrupted_before_snapshot()
+    test_columnar_manifest_records_log_seq()
+    test_lazy_columnar_load()
+    print("🎯 测试结果: 通过")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+测试 EmbeddingStore 的槽位、墓碑、压实和崩溃恢复：
+追加/删除/压实后重新打开，槽位和向量不变；清单提交与删除日志重写之间中断后数据仍一致；
+元数据与嵌入不一致时 reconcile_slots 对齐
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pytest
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.embedding_store import EmbeddingStore
+from search_engine.image_index_journal import reconcile_slots
+
+
+def _vectors(count: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _fill(store: EmbeddingStore, batches: int = 6, batch_size: int = 10) -> np.ndarray:
+    """分多次追加，返回按槽位排列的全部向量"""
+    vectors = _vectors(batches * batch_size)
+    for start in range(0, len(vectors), batch_size):
+        store.append(vectors[start:start + batch_size])
+    return vectors
+
+
+def _assert_matches(store: EmbeddingStore, vectors: np.ndarray, deleted):
+    live = [slot for slot in range(len(vectors)) if slot not in deleted]
+    assert store.live_slots().tolist() == live
+    assert len(store) == len(live)
+    assert np.allclose(store.get(live), vectors[live])
+    assert not any(store.is_live(slot) for slot in deleted)
+    slots, scores = store.scan(vectors[live[0]])
+    assert slots.tolist() == live
+    assert np.allclose(scores, vectors[live] @ vectors[live[0]], atol=1e-5)
+
+
+def test_append_delete_reload():
+    """槽位在追加时分配且之后不变，删除写入日志，重新打开后墓碑仍在"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        vectors = _fill(store)
+        # 小段按二进制计数规则合并
+        assert len(store.segments) <= 3
+        deleted = {3, 17, 42}
+        for slot in deleted:
+            assert store.delete(slot)
+        assert not store.delete(17) and not store.delete(len(vectors))
+        _assert_matches(store, vectors, deleted)
+
+        reopened = EmbeddingStore(temp_dir)
+        _assert_matches(reopened, vectors, deleted)
+        assert reopened.get_stats()['tombstones'] == len(deleted)
+        assert reopened.append(_vectors(1, seed=1)).tolist() == [len(vectors)]
+
+
+def test_compaction_keeps_slots():
+    """压实丢弃墓碑行，槽位不变，删除日志只保留仍在段中的墓碑"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        vectors = _fill(store)
+        deleted = set(range(0, len(vectors), 3))
+        for slot in deleted:
+            store.delete(slot)
+        result = store.compact()
+        assert result['removed_rows'] == len(deleted)
+        assert store.fragmentation() == 0.0
+        assert os.path.getsize(store.delete_log_path) == 0
+        _assert_matches(store, vectors, deleted)
+        _assert_matches(EmbeddingStore(temp_dir), vectors, deleted)
+
+
+def test_background_compaction():
+    """后台压实与检索并存，完成后结果一致"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        vectors = _fill(store)
+        deleted = set(range(10, 40))
+        for slot in deleted:
+            store.delete(slot)
+        assert store.start_background_compaction(0.2)
+        _assert_matches(store, vectors, deleted)
+        store.wait_for_compaction()
+        assert store.last_compaction['removed_rows'] == len(deleted)
+        _assert_matches(store, vectors, deleted)
+
+
+def test_interrupted_after_manifest_commit():
+    """压实已提交新清单、删除日志未重写时中断：日志中指向已压实槽位的记录被忽略"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        vectors = _fill(store)
+        deleted = {1, 2, 30, 31, 55}
+        for slot in deleted:
+            store.delete(slot)
+        log_size = os.path.getsize(store.delete_log_path)
+
+        def interrupted():
+            raise RuntimeError("进程退出")
+        store._rewrite_delete_log = interrupted
+        with pytest.raises(RuntimeError):
+            store.compact()
+        assert os.path.getsize(store.delete_log_path) == log_size
+
+        reopened = EmbeddingStore(temp_dir)
+        _assert_matches(reopened, vectors, deleted)
+        assert reopened.get_stats()['tombstones'] == 0
+        # 之后的删除和压实照常
+        reopened.delete(40)
+        reopened.compact()
+        _assert_matches(EmbeddingStore(temp_dir), vectors, deleted | {40})
+
+
+def test_interrupted_before_manifest_commit():
+    """压实已写出新段、清单未替换时中断：旧清单和旧段仍完整，多余的段文件在下次提交时删除"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        vectors = _fill(store)
+        deleted = {5, 6, 7}
+        for slot in deleted:
+            store.delete(slot)
+        files_before = set(os.listdir(temp_dir))
+
+        def interrupted():
+            raise RuntimeError("进程退出")
+        store._write_manifest = interrupted
+        with pytest.raises(RuntimeError):
+            store.compact()
+        assert set(os.listdir(temp_dir)) > files_before
+
+        reopened = EmbeddingStore(temp_dir)
+        _assert_matches(reopened, vectors, deleted)
+        assert reopened.get_stats()['tombstones'] == len(deleted)
+        reopened.append(_vectors(1, seed=2))
+        referenced = {name for segment in reopened.segments for name in os.listdir(temp_dir)
+                      if name.startswith(segment.name)}
+        assert {name for name in os.listdir(temp_dir) if name.startswith('seg_')} == referenced
+
+
+def test_reconcile_slots():
+    """嵌入已追加但元数据未记录的槽位被删除，嵌入已删除的图片从元数据中丢弃"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        store = EmbeddingStore(temp_dir)
+        slots = store.append(_vectors(5)).tolist()
+        image_index = {f"img{slot}": {'id': f"img{slot}", 'embedding_index': slot} for slot in slots[:4]}
+        store.delete(slots[1])
+
+        slot_ids, changed = reconcile_slots(image_index, store)
+        assert changed
+        assert sorted(image_index) == ['img0', 'img2', 'img3']
+        assert slot_ids == {0: 'img0', 2: 'img2', 3: 'img3'}
+        assert store.live_slots().tolist() == [0, 2, 3]
+
+        assert reconcile_slots(image_index, store) == (slot_ids, False)
+
+
+if __name__ == "__main__":
+    test_append_delete_reload()
+    test_compaction_keeps_slots()
+    test_background_compaction()
+    test_interrupted_after_manifest_commit()
+    test_interrupted_before_manifest_commit()
+    test_reconcile_slots()
+    print("🎯 测试结果: 通过")
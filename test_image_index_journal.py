@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+测试图片元数据的检查点 + 追加写日志：重放结果与写入时一致，
+检查点替换后、日志删除前中断时重放不改变结果
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.image_index_journal import JOURNAL_CHECKPOINT_MIN_OPS, ImageIndexJournal
+
+
+def _image(i: int):
+    return {'id': f"img{i}", 'embedding_index': i, 'description': f"图片{i}", 'tags': []}
+
+
+def _journal(temp_dir: str) -> ImageIndexJournal:
+    return ImageIndexJournal(os.path.join(temp_dir, 'image_index.json'), os.path.join(temp_dir, 'image_index.journal'))
+
+
+def test_replay_after_checkpoint():
+    """检查点之后的新增和删除从日志重放，写到一半的最后一行被忽略"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        journal = _journal(temp_dir)
+        images = {f"img{i}": _image(i) for i in range(5)}
+        journal.checkpoint(images)
+        assert not os.path.exists(journal.journal_file)
+
+        images['img5'] = _image(5)
+        journal.record_add([images['img5']])
+        del images['img1']
+        journal.record_delete('img1')
+        journal.record_delete('missing')
+        journal.close()
+        with open(journal.journal_file, 'a', encoding='utf-8') as f:
+            f.write('{"op": "add", "ima')
+
+        reloaded = _journal(temp_dir)
+        assert reloaded.load() == images
+        assert reloaded.pending_ops == 3
+
+
+def test_interrupted_before_journal_removal():
+    """检查点已替换、日志未删除时中断：重放已包含的操作结果不变"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        journal = _journal(temp_dir)
+        images = {f"img{i}": _image(i) for i in range(3)}
+        journal.record_add(list(images.values()))
+        del images['img0']
+        journal.record_delete('img0')
+        journal.close()
+        saved_journal = journal.journal_file + '.saved'
+        shutil.copy(journal.journal_file, saved_journal)
+        journal.checkpoint(images)
+        os.replace(saved_journal, journal.journal_file)
+
+        assert _journal(temp_dir).load() == images
+
+
+def test_checkpoint_threshold_and_clear():
+    """日志条数达到阈值时需要检查点；清空删除全部文件"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        journal = _journal(temp_dir)
+        journal.record_add([_image(i) for i in range(JOURNAL_CHECKPOINT_MIN_OPS - 1)])
+        assert not journal.needs_checkpoint(100)
+        journal.record_delete('img0')
+        assert journal.needs_checkpoint(100)
+        assert not journal.needs_checkpoint(100 * JOURNAL_CHECKPOINT_MIN_OPS)
+
+        journal.checkpoint(journal.load())
+        assert journal.pending_ops == 0
+        journal.clear()
+        assert not os.path.exists(journal.index_file) and not os.path.exists(journal.journal_file)
+        assert _journal(temp_dir).load() == {}
+
+
+if __name__ == "__main__":
+    test_replay_after_checkpoint()
+    test_interrupted_before_journal_removal()
+    test_checkpoint_threshold_and_clear()
+    print("🎯 测试结果: 通过")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+测试模型注册表（版本登记、校验、裁剪、多实例并发写入）和
+ModelSlot 热替换（旧句柄在最后一个请求结束后才释放）
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.model_registry import ModelHandle, ModelRegistry, ModelSlot, ShadowScorer
+
+
+def _write_model(path: str, content: bytes):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def test_register_versions_and_verify():
+    """新文件产生新版本，同一份文件重复登记返回已有记录，文件被改动后校验失败"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        registry = ModelRegistry(os.path.join(temp_dir, 'registry.json'))
+        model_path = os.path.join(temp_dir, 'ctr_model.npz')
+        _write_model(model_path, b'v1')
+        first = registry.register('logistic_regression', model_path, metrics={'auc': np.float64(0.7)})
+        assert first['version'] == 1 and first['metrics'] == {'auc': 0.7}
+        assert registry.register('logistic_regression', model_path)['version'] == 1
+
+        _write_model(model_path, b'v2')
+        second = registry.register('logistic_regression', model_path, source='online', checkpoint=3)
+        assert second['version'] == 2
+        assert registry.latest('logistic_regression')['version'] == 2
+        assert registry.latest('logistic_regression', source='offline')['version'] == 1
+        assert registry.find_by_path(model_path)['version'] == 2
+        assert registry.verify(second) and not registry.verify(first)
+
+        assert registry.register('logistic_regression', os.path.join(temp_dir, 'missing.npz')) is None
+
+
+def test_prune_keeps_active_and_drops_missing():
+    """超出 max_versions 时裁剪最旧的记录（激活版本保留），文件删除后 prune_missing 删除记录"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        registry = ModelRegistry(os.path.join(temp_dir, 'registry.json'), max_versions=3)
+        paths = []
+        for i in range(6):
+            path = os.path.join(temp_dir, f'ctr_model_ckpt_{i}.npz')
+            _write_model(path, str(i).encode())
+            paths.append(path)
+            entry = registry.register('logistic_regression', path, source='online', checkpoint=i)
+            if i == 0:
+                registry.set_active('logistic_regression', entry['version'])
+        assert [e['version'] for e in registry.list_versions()] == [1, 4, 5, 6]
+        assert registry.get_active('logistic_regression') == 1
+
+        os.remove(paths[4])
+        assert registry.prune_missing() == 1
+        assert [e['version'] for e in registry.list_versions()] == [1, 4, 6]
+
+
+def test_concurrent_registration_across_instances():
+    """两个实例（模拟服务进程和训练进程）并发登记，版本号不重复，且互相可见"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        manifest = os.path.join(temp_dir, 'registry.json')
+        registries = [ModelRegistry(manifest, max_versions=100), ModelRegistry(manifest, max_versions=100)]
+        errors = []
+
+        def worker(index: int):
+            try:
+                for i in range(10):
+                    path = os.path.join(temp_dir, f'model_{index}_{i}.npz')
+                    _write_model(path, f'{index}-{i}'.encode())
+                    registries[index % 2].register('logistic_regression', path)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        for registry in registries:
+            versions = [e['version'] for e in registry.list_versions()]
+            assert versions == list(range(1, 41))
+
+
+def test_slot_swap_waits_for_inflight_requests():
+    """替换后新请求拿到新句柄，持有旧句柄的请求结束后才触发释放回调"""
+    drained = []
+    slot = ModelSlot(ModelHandle('old', 'logistic_regression', 1), on_drained=drained.append)
+    with slot.lease() as held:
+        old = slot.swap(ModelHandle('new', 'logistic_regression', 2))
+        assert old is held and old.retired
+        assert slot.current.model == 'new'
+        with slot.lease() as fresh:
+            assert fresh.version == 2
+        assert drained == []
+    assert drained == [old]
+
+    # 没有请求持有时替换立即释放
+    replaced = slot.swap(ModelHandle('newer', 'logistic_regression', 3))
+    assert drained == [old, replaced]
+
+
+def test_slot_concurrent_leases():
+    """并发请求与多次替换：请求持有的句柄在释放前不会被回调，所有旧句柄最终都被释放"""
+    drained = []
+    released_while_held = []
+    slot = ModelSlot(ModelHandle(0, 'logistic_regression', 0), on_drained=drained.append)
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            with slot.lease() as handle:
+                if handle in drained:
+                    released_while_held.append(handle)
+                time.sleep(0.0005)
+
+    readers = [threading.Thread(target=reader) for _ in range(8)]
+    for thread in readers:
+        thread.start()
+    for version in range(1, 30):
+        slot.swap(ModelHandle(version, 'logistic_regression', version))
+        time.sleep(0.002)
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert not released_while_held
+    assert sorted(handle.version for handle in drained) == list(range(29))
+    assert all(handle.refs == 0 for handle in drained)
+    assert slot.current.version == 29 and slot.current.refs == 0
+
+
+class _ConstantModel:
+    def __init__(self, value: float):
+        self.value = value
+
+    def predict_ctr_batch(self, features_list):
+        return [self.value] * len(features_list)
+
+
+def test_shadow_scorer_records_deltas():
+    """影子模型异步打分，统计与线上分数的差异"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_file = os.path.join(temp_dir, 'shadow.jsonl')
+        shadow = ShadowScorer(_ConstantModel(0.5), 'logistic_regression', candidate_version=2, log_file=log_file)
+        features = [{'doc_id': 'a'}, {'doc_id': 'b'}]
+        assert shadow.submit(features, [0.25, 0.75], primary_version=1)
+        shadow.close()
+        stats = shadow.get_stats()
+        assert stats['requests'] == 1 and stats['items'] == 2
+        assert np.isclose(stats['mean_delta'], 0.0) and np.isclose(stats['max_abs_delta'], 0.25)
+        with open(log_file, 'r', encoding='utf-8') as f:
+            assert len(f.readlines()) == 1
+
+
+if __name__ == "__main__":
+    test_register_versions_and_verify()
+    test_prune_keeps_active_and_drops_missing()
+    test_concurrent_registration_across_instances()
+    test_slot_swap_waits_for_inflight_requests()
+    test_slot_concurrent_leases()
+    test_shadow_scorer_records_deltas()
+    print("🎯 测试结果: 通过")
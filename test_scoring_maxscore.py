@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+测试 ScoringEngine 的 MaxScore 裁剪与穷举打分结果一致（含同分文档）
+"""
+
+import os
+import sys
+
+import numpy as np
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.index_tab.scoring import RETRIEVAL_MODES, ScoringEngine
+
+
+def _random_engine(num_docs: int = 2000, num_terms: int = 40, seed: int = 0) -> ScoringEngine:
+    """随机倒排表；文档长度和词频取值很少，制造大量同分文档"""
+    rng = np.random.default_rng(seed)
+    doc_lens = rng.choice([5, 10, 20], size=num_docs).astype(np.float64)
+    postings = {}
+    for t in range(num_terms):
+        df = int(rng.integers(1, num_docs // 2))
+        doc_ords = np.sort(rng.choice(num_docs, df, replace=False)).astype(np.uint32)
+        tfs = rng.integers(1, 3, df).astype(np.uint32)
+        postings[f"t{t}"] = (doc_ords, tfs)
+    return ScoringEngine(doc_lens, num_docs, lambda term: postings.get(term, (None, None)), str)
+
+
+def _brute_force(engine: ScoringEngine, query_words, top_k: int, mode: str):
+    """逐文档累加分数，按 (分数降序, 文档序号升序) 取前k"""
+    scores = np.zeros(len(engine.doc_lens))
+    for word in query_words:
+        doc_ords, tfs = engine._postings(word)
+        if doc_ords is None:
+            continue
+        scores[doc_ords] += engine.idf(len(doc_ords), mode) * engine.impacts(doc_ords, tfs, mode)
+    ranked = sorted((-score, doc_ord) for doc_ord, score in enumerate(scores) if score > 0)[:top_k]
+    return [doc_ord for _, doc_ord in ranked]
+
+
+def test_pruned_matches_exhaustive():
+    """MaxScore 裁剪与穷举返回相同的文档和分数"""
+    engine = _random_engine()
+    rng = np.random.default_rng(1)
+    for mode in RETRIEVAL_MODES:
+        for _ in range(50):
+            query = [f"t{t}" for t in rng.integers(0, 45, rng.integers(1, 6))]
+            top_k = int(rng.integers(1, 30))
+            pruned = engine.top_k_ordinals(query, top_k, mode, prune=True)
+            exhaustive = engine.top_k_ordinals(query, top_k, mode, prune=False)
+            assert [d for d, _ in pruned] == [d for d, _ in exhaustive], (mode, query, top_k)
+            assert np.allclose([s for _, s in pruned], [s for _, s in exhaustive])
+
+
+def test_ties_broken_by_doc_ordinal():
+    """第k名有多个同分文档时取文档序号最小的"""
+    engine = _random_engine(seed=2)
+    for mode in RETRIEVAL_MODES:
+        for query in (["t0"], ["t1", "t2"], ["t3", "t3", "t4"]):
+            for top_k in (1, 5, 17):
+                expected = _brute_force(engine, query, top_k, mode)
+                for prune in (True, False):
+                    actual = [d for d, _ in engine.top_k_ordinals(query, top_k, mode, prune)]
+                    assert actual == expected, (mode, query, top_k, prune)
+
+
+def test_all_tied_single_term():
+    """单个词项、所有文档同分：返回文档序号最小的k个"""
+    doc_ords = np.arange(0, 1000, 3, dtype=np.uint32)
+    postings = {'a': (doc_ords, np.ones(len(doc_ords), dtype=np.uint32))}
+    engine = ScoringEngine(np.full(1000, 10.0), 1000, lambda term: postings.get(term, (None, None)), str)
+    for prune in (True, False):
+        assert [d for d, _ in engine.top_k_ordinals(['a'], 10, 'bm25', prune)] == doc_ords[:10].tolist()
+
+
+if __name__ == "__main__":
+    test_pruned_matches_exhaustive()
+    test_ties_broken_by_doc_ordinal()
+    test_all_tied_single_term()
+    print("🎯 测试结果: 通过")
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+测试 TextQueryBatcher 的线程间微批：并发查询合并编码，
+编码期间到达的查询由队首的请求线程接任 leader 组成下一批，异常只影响所在批次
+"""
+
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+# 添加src目录到Python路径
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
+
+from search_engine.text_embedding_cache import TextEmbeddingCache, TextQueryBatcher
+
+
+def _embed(text: str) -> np.ndarray:
+    return np.array([len(text), sum(map(ord, text)) % 97], dtype=np.float32)
+
+
+class _Encoder:
+    """记录每批输入；block_first 时第一批阻塞到 release"""
+
+    def __init__(self, block_first: bool = False, fail_on: str = None):
+        self.batches = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.block_first = block_first
+        self.fail_on = fail_on
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.block_first and len(self.batches) == 1:
+            self.started.set()
+            assert self.release.wait(5)
+        if self.fail_on in texts:
+            raise RuntimeError(f"编码失败: {self.fail_on}")
+        return np.stack([_embed(text) for text in texts])
+
+
+def _submit(batcher: TextQueryBatcher, texts, results, errors):
+    threads = []
+    for text in texts:
+        def run(text=text):
+            try:
+                results[text] = batcher.encode(text)
+            except Exception as e:
+                errors[text] = e
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def _wait_queued(batcher: TextQueryBatcher, count: int):
+    deadline = time.monotonic() + 5
+    while batcher.get_stats()['queued'] < count:
+        assert time.monotonic() < deadline, "查询未进入队列"
+        time.sleep(0.001)
+
+
+def _assert_idle(batcher: TextQueryBatcher):
+    assert batcher.get_stats()['queued'] == 0
+    assert not batcher._leader_active
+
+
+def test_concurrent_queries_are_batched():
+    """同时到达的查询合并编码，每个线程拿到自己的结果，重复查询只编码一次"""
+    encoder = _Encoder()
+    batcher = TextQueryBatcher(encoder, max_batch_size=64, max_wait_ms=200)
+    texts = [f"query {i}" for i in range(16)] + ["query 0"] * 4
+    results, errors = {}, {}
+    for thread in _submit(batcher, texts, results, errors):
+        thread.join(5)
+    assert not errors
+    assert all(np.array_equal(results[text], _embed(text)) for text in texts)
+    assert len(encoder.batches) < len(texts)
+    assert sum(len(batch) for batch in encoder.batches) == batcher.get_stats()['items']
+    assert all(len(batch) == len(set(batch)) for batch in encoder.batches)
+    _assert_idle(batcher)
+
+
+def test_leader_hands_off_to_queued_request():
+    """编码期间到达的查询排队，leader 完成后由队首线程接任并把它们编成下一批"""
+    encoder = _Encoder(block_first=True)
+    batcher = TextQueryBatcher(encoder, max_batch_size=32, max_wait_ms=1)
+    results, errors = {}, {}
+    first = _submit(batcher, ["first"], results, errors)
+    assert encoder.started.wait(5)
+
+    later = [f"later {i}" for i in range(5)]
+    threads = _submit(batcher, later, results, errors)
+    _wait_queued(batcher, len(later))
+    # 第一批仍在编码：排队的查询没有另起一批
+    assert encoder.batches == [["first"]]
+
+    encoder.release.set()
+    for thread in first + threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert not errors
+    assert encoder.batches[0] == ["first"]
+    assert sorted(encoder.batches[1]) == sorted(later)
+    assert all(np.array_equal(results[text], _embed(text)) for text in later)
+    _assert_idle(batcher)
+
+
+def test_hand_off_respects_max_batch_size():
+    """排队的查询超过 max_batch_size 时连续接任多次，直到队列清空"""
+    encoder = _Encoder(block_first=True)
+    batcher = TextQueryBatcher(encoder, max_batch_size=2, max_wait_ms=1)
+    results, errors = {}, {}
+    threads = _submit(batcher, ["first"], results, errors)
+    assert encoder.started.wait(5)
+    later = [f"later {i}" for i in range(5)]
+    threads += _submit(batcher, later, results, errors)
+    _wait_queued(batcher, len(later))
+
+    encoder.release.set()
+    for thread in threads:
+        thread.join(5)
+        assert not thread.is_alive()
+    assert not errors and len(results) == 6
+    assert [len(batch) for batch in encoder.batches] == [1, 2, 2, 1]
+    assert sorted(text for batch in encoder.batches[1:] for text in batch) == sorted(later)
+    _assert_idle(batcher)
+
+
+def test_error_fails_only_its_batch():
+    """编码异常抛给同批的所有请求，leader 照常交接，之后的查询正常编码"""
+    encoder = _Encoder(block_first=True, fail_on="bad")
+    batcher = TextQueryBatcher(encoder, max_batch_size=32, max_wait_ms=1)
+    results, errors = {}, {}
+    threads = _submit(batcher, ["first"], results, errors)
+    assert encoder.started.wait(5)
+    threads += _submit(batcher, ["bad", "unlucky"], results, errors)
+    _wait_queued(batcher, 2)
+
+    encoder.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert set(results) == {"first"}
+    assert set(errors) == {"bad", "unlucky"}
+    assert all(isinstance(error, RuntimeError) for error in errors.values())
+    _assert_idle(batcher)
+
+    assert np.array_equal(batcher.encode("after"), _embed("after"))
+    with pytest.raises(RuntimeError):
+        batcher.encode("bad")
+    _assert_idle(batcher)
+
+
+def test_cache_lru_eviction():
+    """LRU 缓存：命中刷新顺序，超出容量淘汰最久未使用的条目，返回只读副本"""
+    cache = TextEmbeddingCache(max_size=2)
+    a = cache.put("a", _embed("a"))
+    assert not a.flags.writeable
+    cache.put("b", _embed("b"))
+    assert cache.get("a") is a
+    cache.put("c", _embed("c"))
+    assert cache.get("b") is None and cache.get("a") is a
+    stats = cache.get_stats()
+    assert stats['size'] == 2 and stats['evicted'] == 1 and stats['hits'] == 2 and stats['misses'] == 1
+
+
+if __name__ == "__main__":
+    test_concurrent_queries_are_batched()
+    test_leader_hands_off_to_queued_request()
+    test_hand_off_respects_max_batch_size()
+    test_error_fails_only_its_batch()
+    test_cache_lru_eviction()
+    print("🎯 测试结果: 通过")
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+嵌入存储基准测试工具
+在合成的 512 维归一化向量上对比 EmbeddingStore 的 float32 / float16 / int8 扫描格式：
+每百万张图片的扫描内存（检索时常驻页缓存的部分）和磁盘占用、打开存储的耗时，
+以及不重排 / 用 float32 原始向量重排时的 recall@k 和 QPS（精确检索，结果以 float32 为准）。
+
+量化格式用内存换 QPS：NumPy 没有 float16 / int8 的 BLAS，每次查询都要把扫描到的分块转成 float32 再做内积，
+精确全量扫描的 QPS 明显低于 float32（50000 x 512 实测约 float32 155、float16 27、int8 115），
+输出的「相对 float32」一列即这部分开销。IVF 只转换被探测的簇，开销按扫描比例缩小。
+
+用法:
+    python tools/embedding_store_benchmark.py --vectors 200000
+    python tools/embedding_store_benchmark.py --vectors 1000000 --rescore-factor 2 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from search_engine.embedding_store import EMBEDDING_DTYPES, EmbeddingStore, search_with_rescore
+from search_engine.vector_index import FlatIndex
+from vector_index_benchmark import make_queries, make_vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='嵌入存储格式的内存 / 召回基准测试')
+    parser.add_argument('--vectors', type=int, default=200000, help='库向量数')
+    parser.add_argument('--dim', type=int, default=512, help='向量维度')
+    parser.add_argument('--clusters', type=int, default=1000, help='合成数据的簇数')
+    parser.add_argument('--noise', type=float, default=1.0, help='簇内噪声')
+    parser.add_argument('--queries', type=int, default=100, help='查询数')
+    parser.add_argument('--top-k', type=int, default=10, help='top-k')
+    parser.add_argument('--rescore-factor', type=int, nargs='+', default=[1, 2, 4], help='重排候选倍数（1 表示不重排）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    rng = np.random.RandomState(args.seed)
+    centers, vectors = make_vectors(args.vectors, args.dim, args.clusters, args.noise, rng)
+    queries = make_queries(centers, args.queries, args.noise, rng)
+    index = FlatIndex()
+    truth = [set(index.search(vectors, query, args.top_k)[0].tolist()) for query in queries]
+    print(f"📊 {args.vectors} 个 {args.dim} 维向量, {args.queries} 个查询, top-{args.top_k}")
+    print("=" * 88)
+
+    per_million = 1_000_000 / args.vectors
+    baseline_qps = None
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in EMBEDDING_DTYPES:
+            path = os.path.join(directory, dtype)
+            EmbeddingStore(path, dtype).append(vectors)
+            start = time.perf_counter()
+            store = EmbeddingStore(path, dtype)
+            open_ms = (time.perf_counter() - start) * 1000
+            stats = store.get_stats()
+            print(f"{dtype:<8} 扫描内存 {stats['scan_mb'] * per_million:>8.1f} MB/百万张  "
+                  f"磁盘 {stats['disk_mb'] * per_million:>8.1f} MB/百万张  打开 {open_ms:.1f}ms")
+            factors = args.rescore_factor if store.quantized else [1]
+            for factor in factors:
+                start = time.perf_counter()
+                results = [search_with_rescore(index, store, query, args.top_k, factor)[0] for query in queries]
+                elapsed = time.perf_counter() - start
+                recall = np.mean([len(truth[i] & set(results[i].tolist())) / args.top_k
+                                  for i in range(len(queries))])
+                qps = len(queries) / elapsed
+                baseline_qps = baseline_qps or qps
+                label = '不重排' if factor == 1 else f'重排 x{factor}'
+                print(f"    {label:<8} recall@{args.top_k}={recall:.4f}  QPS={qps:>7.1f}  "
+                      f"相对 float32 {qps / baseline_qps:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+历史CTR特征基准测试工具
+对比逐行切片的 O(N²) 实现与分组累计的时点特征实现在不同样本量下的耗时，
+并在逐行实现能跑完的规模上校验两者结果逐位一致
+
+用法:
+    python tools/feature_benchmark.py --sizes 1000 10000 100000 1000000
+    python tools/feature_benchmark.py --sizes 1000 5000 --legacy-max 5000 --train-ratio 0.7
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from search_engine.training_tab.point_in_time import historical_ctr_features
+
+
+def make_samples(num_rows: int, seed: int = 42) -> pd.DataFrame:
+    """合成按时间顺序写入的展示日志（查询和文档按 Zipf 分布）"""
+    rng = np.random.default_rng(seed)
+    num_queries = max(10, num_rows // 20)
+    num_docs = max(20, num_rows // 10)
+    queries = rng.zipf(1.3, num_rows) % num_queries
+    docs = rng.zipf(1.2, num_rows) % num_docs
+    positions = rng.integers(1, 11, num_rows)
+    clicked = (rng.random(num_rows) < 0.3 / positions).astype(np.int64)
+    base = pd.Timestamp('2024-01-01')
+    timestamps = (base + pd.to_timedelta(np.arange(num_rows) * 1000, unit='us')).strftime('%Y-%m-%dT%H:%M:%S.%f')
+    return pd.DataFrame({
+        'query': [f"query_{q}" for q in queries],
+        'doc_id': [f"doc_{d}" for d in docs],
+        'clicked': clicked,
+        'timestamp': timestamps,
+    })
+
+
+def legacy_historical_ctr(df: pd.DataFrame, train_indices: Optional[np.ndarray] = None) -> np.ndarray:
+    """原逐行实现（ctr_wide_deep_model 中的版本），作为对照"""
+    df_with_orig_idx = df.reset_index()
+    df_with_orig_idx['orig_idx'] = df_with_orig_idx['index']
+    df_sorted = df_with_orig_idx.sort_values('timestamp').reset_index(drop=True)
+
+    result = np.full((len(df), 2), 0.1)
+    for idx, row in df_sorted.iterrows():
+        history = df_sorted.loc[:idx - 1]
+        if train_indices is not None:
+            history = history[history['orig_idx'].isin(train_indices)]
+        for col, key in enumerate(('query', 'doc_id')):
+            filtered = history[history[key] == row[key]]
+            if len(filtered) > 0:
+                result[row['orig_idx'], col] = filtered['clicked'].mean()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史CTR特征基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000, 1000000], help='样本量列表')
+    parser.add_argument('--legacy-max', type=int, default=5000, help='逐行实现只在不超过该样本量时运行')
+    parser.add_argument('--train-ratio', type=float, default=None, help='按该比例抽取训练集，只用训练集计算历史')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    print(f"{'样本量':<10}{'逐行(s)':>12}{'分组累计(s)':>14}{'加速比':>10}{'结果一致':>10}")
+    for size in args.sizes:
+        df = make_samples(size, args.seed)
+        train_indices = None
+        if args.train_ratio is not None:
+            rng = np.random.default_rng(args.seed)
+            train_indices = rng.permutation(size)[:int(size * args.train_ratio)]
+
+        start = time.perf_counter()
+        features = historical_ctr_features(df, ('query', 'doc_id'), train_indices=train_indices)
+        fast_seconds = time.perf_counter() - start
+
+        if size <= args.legacy_max:
+            start = time.perf_counter()
+            expected = legacy_historical_ctr(df, train_indices)
+            legacy_seconds = time.perf_counter() - start
+            identical = '是' if np.array_equal(features, expected) else '否'
+            print(f"{size:<10}{legacy_seconds:>12.3f}{fast_seconds:>14.3f}"
+                  f"{legacy_seconds / max(fast_seconds, 1e-9):>10.0f}x{identical:>10}")
+        else:
+            print(f"{size:<10}{'-':>12}{fast_seconds:>14.3f}{'-':>10}{'-':>10}")
+
+
+if __name__ == "__main__":
+    main()
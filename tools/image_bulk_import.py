@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片批量导入工具
+把目录下的图片批量加入图片索引（ImageService.add_images_bulk），报告吞吐（新增张数/秒）和各阶段耗时。
+
+用法:
+    python tools/image_bulk_import.py /path/to/images
+    python tools/image_bulk_import.py /path/to/images --batch-size 64 --workers 8
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from search_engine.image_service import ImageService
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp'}
+
+
+def find_images(directory: str):
+    """递归查找目录下的图片文件（按路径排序）"""
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files
+                     if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS)
+    return sorted(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='图片批量导入')
+    parser.add_argument('directory', help='图片目录')
+    parser.add_argument('--storage-dir', default='models/images', help='图片索引存储目录')
+    parser.add_argument('--batch-size', type=int, default=32, help='每批编码的图片数')
+    parser.add_argument('--workers', type=int, default=None, help='读取/预处理线程数')
+    parser.add_argument('--save-every', type=int, default=0, help='每多少批保存一次索引（0 表示只在结束时保存）')
+    parser.add_argument('--limit', type=int, default=0, help='最多导入的图片数（0 表示全部）')
+    args = parser.parse_args()
+
+    paths = find_images(args.directory)
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        print(f"❌ 目录中没有图片: {args.directory}")
+        return
+
+    service = ImageService(storage_dir=args.storage_dir)
+    result = service.add_images_bulk(paths, batch_size=args.batch_size, num_workers=args.workers,
+                                     save_every=args.save_every)
+
+    print("=" * 50)
+    print(f"新增 {result['added']} 张, 重复 {result['skipped']} 张, 失败 {len(result['failed'])} 张")
+    print(f"用时 {result['seconds']}s, 吞吐 {result['images_per_sec']} 张/秒")
+    print("阶段耗时(s): " + ", ".join(f"{key}={value}" for key, value in result['timings'].items()))
+    for failure in result['failed'][:5]:
+        print(f"失败示例: {failure['path']}: {failure['error']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+倒排索引基准测试工具
+对比字典实现 (InvertedIndex) 与紧凑实现 (CompactInvertedIndex) 的内存占用和查询延迟，
+JSON索引与mmap段文件 (SegmentIndex) 的启动耗时，TF-IDF/BM25 打分在 MaxScore 裁剪前后的查询延迟，
+以及不同进程数下的并行构建吞吐
+
+用法:
+    python tools/index_benchmark.py memory --docs 5000
+    python tools/index_benchmark.py startup --docs 5000
+    python tools/index_benchmark.py scoring --docs 5000
+    python tools/index_benchmark.py build --docs 20000 --workers 1 2 4
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from search_engine.index_tab.offline_index import InvertedIndex
+from search_engine.index_tab.compact_index import CompactInvertedIndex
+from search_engine.index_tab.parallel_build import parallel_build_index
+from search_engine.index_tab.segment_store import SegmentIndex, convert_json_to_segment
+from search_engine.tokenization_service import configure_tokenization_service
+
+DEFAULT_QUERIES = ["人工智能", "机器学习", "深度学习", "自然语言处理", "计算机视觉", "知识图谱", "数据分析", "神经网络"]
+
+
+def load_documents(num_docs: int, seed: int = 42) -> Dict[str, str]:
+    """加载预置文档；文档数不足时用预置文档的词汇合成文档补足"""
+    documents: Dict[str, str] = {}
+    preloaded_path = os.path.join("data", "preloaded_documents.json")
+    if os.path.exists(preloaded_path):
+        with open(preloaded_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        documents = data['documents'] if isinstance(data, dict) and 'documents' in data else data
+    if not documents:
+        from search_engine.index_tab.offline_index import create_sample_documents
+        documents = create_sample_documents()
+
+    documents = dict(list(documents.items())[:num_docs])
+    if len(documents) >= num_docs:
+        return documents
+
+    # 按 Zipf 分布从已有词汇中抽词，模拟长尾词项
+    import jieba
+    vocab = sorted({w for text in documents.values() for w in jieba.lcut(text) if len(w) > 1})
+    weights = [1.0 / (rank + 1) for rank in range(len(vocab))]
+    rng = random.Random(seed)
+    rng.shuffle(vocab)
+    for i in range(len(documents), num_docs):
+        words = rng.choices(vocab, weights=weights, k=rng.randint(80, 300))
+        documents[f"synthetic_{i}"] = "，".join(words)
+    return documents
+
+
+def measure_build(index_cls, documents: Dict[str, str]):
+    """构建索引并返回 (索引, 构建耗时秒, 倒排结构内存字节)"""
+    # 每次构建使用空的分词缓存，避免后构建的实现命中前一次的分词结果
+    configure_tokenization_service(store_path=None)
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = index_cls()
+    for doc_id, content in documents.items():
+        index.add_document(doc_id, content)
+    index.optimize()
+    elapsed = time.perf_counter() - start
+    # 释放词ID库，只统计倒排结构
+    configure_tokenization_service(store_path=None)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # 文档原文字符串为共享引用，统计值主要是倒排结构
+    return index, elapsed, current
+
+
+def measure_latency(index, queries: List[str], rounds: int) -> Dict[str, float]:
+    """测量查询延迟（毫秒）"""
+    latencies = []
+    for _ in range(rounds):
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, top_k=10)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {
+        'p50': statistics.median(latencies),
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'mean': statistics.fmean(latencies)
+    }
+
+
+def run_memory_benchmark(args):
+    """内存/延迟对比"""
+    documents = load_documents(args.docs)
+    postings = None
+    print(f"📄 文档数: {len(documents)}")
+
+    # 预热分词器，避免词典加载计入第一个实现
+    import jieba
+    jieba.lcut("预热分词器")
+
+    rows = []
+    for name, index_cls in [('dict', InvertedIndex), ('compact', CompactInvertedIndex)]:
+        index, build_seconds, memory_bytes = measure_build(index_cls, documents)
+        if postings is None:
+            postings = sum(len(doc_ids) for doc_ids in index.index.values())
+        latency = measure_latency(index, DEFAULT_QUERIES, args.rounds)
+        rows.append((name, build_seconds, memory_bytes, latency))
+        del index
+        gc.collect()
+
+    print(f"🔢 倒排记录数: {postings}")
+    print(f"{'实现':<10}{'构建(s)':>10}{'内存(MB)':>12}{'字节/记录':>12}{'p50(ms)':>10}{'p99(ms)':>10}")
+    for name, build_seconds, memory_bytes, latency in rows:
+        print(f"{name:<10}{build_seconds:>10.2f}{memory_bytes / 1024 / 1024:>12.2f}"
+              f"{memory_bytes / max(postings, 1):>12.1f}{latency['p50']:>10.3f}{latency['p99']:>10.3f}")
+
+
+def run_startup_benchmark(args):
+    """启动耗时对比：JSON反序列化 vs mmap打开段文件"""
+    documents = load_documents(args.docs)
+    print(f"📄 文档数: {len(documents)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = os.path.join(tmp_dir, "index_data.json")
+        segment_path = os.path.join(tmp_dir, "index_data.seg")
+
+        index = InvertedIndex()
+        for doc_id, content in documents.items():
+            index.add_document(doc_id, content)
+        index.save_to_file(json_path)
+        del index
+
+        start = time.perf_counter()
+        convert_json_to_segment(json_path, segment_path)
+        print(f"🔄 JSON -> 段文件转换耗时: {time.perf_counter() - start:.2f}s")
+        print(f"💾 JSON: {os.path.getsize(json_path) / 1024 / 1024:.2f}MB, "
+              f"段文件+文档库: {(os.path.getsize(segment_path) + os.path.getsize(segment_path + '.docs')) / 1024 / 1024:.2f}MB")
+
+        def open_json(index_cls):
+            def opener():
+                index = index_cls()
+                index.load_from_file(json_path)
+                return index
+            return opener
+
+        openers = [
+            ('json/dict', open_json(InvertedIndex)),
+            ('json/compact', open_json(CompactInvertedIndex)),
+            ('segment', lambda: SegmentIndex(segment_path)),
+        ]
+
+        print(f"{'实现':<14}{'打开(ms)':>12}{'首次查询(ms)':>14}")
+        for name, opener in openers:
+            open_times = []
+            first_query_times = []
+            for _ in range(args.rounds):
+                gc.collect()
+                start = time.perf_counter()
+                index = opener()
+                open_times.append((time.perf_counter() - start) * 1000)
+                start = time.perf_counter()
+                index.search(DEFAULT_QUERIES[0], top_k=10)
+                first_query_times.append((time.perf_counter() - start) * 1000)
+                if isinstance(index, SegmentIndex):
+                    index.close()
+                del index
+            print(f"{name:<14}{statistics.median(open_times):>12.2f}{statistics.median(first_query_times):>14.3f}")
+
+
+def run_scoring_benchmark(args):
+    """打分延迟对比：穷举打分 vs MaxScore 裁剪"""
+    documents = load_documents(args.docs)
+    index = InvertedIndex()
+    for doc_id, content in documents.items():
+        index.add_document(doc_id, content)
+    print(f"📄 文档数: {len(documents)}")
+
+    # 高频词和默认查询混合，高频词命中大部分文档，是裁剪的主要收益来源
+    frequent_terms = sorted(index.doc_freq, key=index.doc_freq.get, reverse=True)[:20]
+    rng = random.Random(args.seed)
+    queries = [index.preprocess_text(q) for q in DEFAULT_QUERIES]
+    queries += [rng.sample(frequent_terms, 3) + index.preprocess_text(rng.choice(DEFAULT_QUERIES))
+                for _ in range(len(DEFAULT_QUERIES))]
+
+    engine = index.scoring_engine()
+    print(f"{'模式':<8}{'裁剪':<6}{'p50(ms)':>10}{'p99(ms)':>10}{'mean(ms)':>10}")
+    for mode in ('tfidf', 'bm25'):
+        for prune in (False, True):
+            latencies = []
+            for _ in range(args.rounds):
+                for query_words in queries:
+                    start = time.perf_counter()
+                    engine.top_k(query_words, args.top_k, mode, prune=prune)
+                    latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            print(f"{mode:<8}{'是' if prune else '否':<6}{statistics.median(latencies):>10.3f}"
+                  f"{latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:>10.3f}"
+                  f"{statistics.fmean(latencies):>10.3f}")
+
+
+def run_build_benchmark(args):
+    """并行构建吞吐对比（每个进程数构建一次）"""
+    documents = load_documents(args.docs)
+    print(f"📄 文档数: {len(documents)}")
+
+    rows = []
+    for workers in args.workers:
+        configure_tokenization_service(store_path=None)
+        _, stats = parallel_build_index(documents, workers=workers)
+        rows.append(stats)
+        gc.collect()
+
+    print(f"{'进程数':<8}{'耗时(s)':>10}{'docs/sec':>12}{'主进程RSS(MB)':>16}{'子进程RSS(MB)':>16}")
+    for stats in rows:
+        worker_rss = stats['worker_peak_rss_mb']
+        print(f"{stats['workers']:<8}{stats['total_seconds']:>10.2f}{stats['docs_per_sec']:>12.1f}"
+              f"{stats['peak_rss_mb'] or 0:>16.1f}{worker_rss if worker_rss is not None else 0:>16.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='倒排索引基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    memory_parser = subparsers.add_parser('memory', help='对比字典实现与紧凑实现的内存和查询延迟')
+    memory_parser.add_argument('--docs', type=int, default=2000, help='文档数量（不足时合成补足）')
+    memory_parser.add_argument('--rounds', type=int, default=20, help='每个查询的重复次数')
+    memory_parser.set_defaults(func=run_memory_benchmark)
+
+    startup_parser = subparsers.add_parser('startup', help='对比JSON索引与mmap段文件的启动耗时')
+    startup_parser.add_argument('--docs', type=int, default=2000, help='文档数量（不足时合成补足）')
+    startup_parser.add_argument('--rounds', type=int, default=3, help='重复打开次数（取中位数）')
+    startup_parser.set_defaults(func=run_startup_benchmark)
+
+    scoring_parser = subparsers.add_parser('scoring', help='对比穷举打分与MaxScore裁剪的查询延迟')
+    scoring_parser.add_argument('--docs', type=int, default=5000, help='文档数量（不足时合成补足）')
+    scoring_parser.add_argument('--rounds', type=int, default=20, help='每个查询的重复次数')
+    scoring_parser.add_argument('--top-k', type=int, default=10, help='返回结果数量')
+    scoring_parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    scoring_parser.set_defaults(func=run_scoring_benchmark)
+
+    build_parser = subparsers.add_parser('build', help='对比不同进程数的并行构建吞吐和峰值内存')
+    build_parser.add_argument('--docs', type=int, default=20000, help='文档数量（不足时合成补足）')
+    build_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='进程数列表')
+    build_parser.set_defaults(func=run_build_benchmark)
+
+    args = parser.parse_args()
+    # 基准测试不读写持久化的词ID库
+    configure_tokenization_service(store_path=None)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模型服务压测工具
+用多个并发客户端持续请求 Model Serving API，统计延迟分位数（p50/p95/p99）、QPS 和错误数。
+Flask 服务和异步微批服务（start_model_serving.py --async）的接口相同，可直接对比。
+
+用法:
+    python tools/serving_load_test.py --concurrency 32 --duration 30
+    python tools/serving_load_test.py --concurrency 128 --processes 4 --duration 30
+    python tools/serving_load_test.py --endpoint batch --items 20 --requests 5000
+    python tools/serving_load_test.py --endpoint tfserving --model wide_deep_ctr --tensor-inputs
+"""
+
+import argparse
+import multiprocessing
+import random
+import threading
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import requests
+
+QUERIES = ["机器学习", "深度学习", "推荐系统", "搜索引擎", "自然语言处理", "知识图谱", "向量检索", "点击率预估"]
+
+
+def make_features(rng: random.Random) -> Dict[str, Any]:
+    """随机的原始特征（与搜索结果重排时的输入一致）"""
+    return {
+        "query": rng.choice(QUERIES),
+        "doc_id": f"doc_{rng.randint(0, 999)}",
+        "position": rng.randint(1, 10),
+        "score": round(rng.random(), 4),
+        "summary": "这是一段用于压测的文档摘要" * rng.randint(1, 5),
+    }
+
+
+def make_tensor_instance(rng: random.Random) -> Dict[str, Any]:
+    """已标准化的 Wide & Deep 输入（与 tf_serving/client_example.py 相同）"""
+    return {
+        "wide": [rng.gauss(0, 1) for _ in range(6)],
+        "deep": [rng.gauss(0, 1) for _ in range(8)],
+        "query_hash": rng.randint(0, 999),
+        "doc_hash": rng.randint(0, 999),
+        "position_group": rng.randint(0, 2),
+    }
+
+
+def build_request(args, rng: random.Random) -> Tuple[str, Dict[str, Any]]:
+    """按接口类型生成 (URL, 请求体)"""
+    base = args.url.rstrip('/')
+    if args.endpoint == 'predict':
+        return f"{base}/v1/models/{args.model}/predict", {"inputs": make_features(rng)}
+    if args.endpoint == 'batch':
+        return (f"{base}/v1/models/{args.model}/batch_predict",
+                {"inputs": [make_features(rng) for _ in range(args.items)]})
+    make_instance = make_tensor_instance if args.tensor_inputs else make_features
+    return f"{base}/v1/models/{args.model}:predict", {"instances": [make_instance(rng) for _ in range(args.items)]}
+
+
+def run_client(args, client_id: int, deadline: float, max_requests: int, counter: List[int],
+               lock: threading.Lock, latencies: List[float], errors: List[str]):
+    """单个客户端：串行发送请求直到达到请求数或时长"""
+    rng = random.Random(args.seed + client_id)
+    session = requests.Session()
+    while time.time() < deadline:
+        with lock:
+            if max_requests and counter[0] >= max_requests:
+                return
+            counter[0] += 1
+        url, body = build_request(args, rng)
+        start = time.perf_counter()
+        try:
+            response = session.post(url, json=body, timeout=args.timeout)
+            elapsed = time.perf_counter() - start
+            if response.status_code == 200:
+                latencies.append(elapsed)
+            else:
+                errors.append(f"HTTP {response.status_code}: {response.text[:100]}")
+        except requests.exceptions.RequestException as e:
+            errors.append(str(e)[:100])
+
+
+def run_process(args, process_id: int, concurrency: int, deadline: float,
+                max_requests: int) -> Tuple[List[float], List[str]]:
+    """一个压测进程：concurrency 个线程客户端（多进程避免客户端自身受 GIL 限制）"""
+    latencies: List[float] = []
+    errors: List[str] = []
+    counter, lock = [0], threading.Lock()
+    threads = [threading.Thread(target=run_client, args=(args, process_id * 10000 + i, deadline, max_requests,
+                                                         counter, lock, latencies, errors))
+               for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Model Serving API 压测')
+    parser.add_argument('--url', default='http://localhost:8501', help='服务地址')
+    parser.add_argument('--model', default='logistic_regression', help='模型名（TF Serving 模式可用 wide_deep_ctr）')
+    parser.add_argument('--endpoint', choices=['predict', 'batch', 'tfserving'], default='predict',
+                        help='predict=单条、batch=batch_predict、tfserving=/v1/models/<name>:predict')
+    parser.add_argument('--items', type=int, default=10, help='batch/tfserving 每个请求的样本数')
+    parser.add_argument('--tensor-inputs', action='store_true', help='tfserving 模式发送已标准化的模型输入张量')
+    parser.add_argument('--concurrency', type=int, default=16, help='并发客户端数（所有进程合计）')
+    parser.add_argument('--processes', type=int, default=1, help='压测进程数')
+    parser.add_argument('--duration', type=float, default=10.0, help='压测时长（秒）')
+    parser.add_argument('--requests', type=int, default=0, help='总请求数（>0 时达到即停止）')
+    parser.add_argument('--warmup', type=int, default=20, help='正式压测前的预热请求数')
+    parser.add_argument('--timeout', type=float, default=10.0, help='单个请求超时（秒）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    session = requests.Session()
+    for _ in range(args.warmup):
+        url, body = build_request(args, rng)
+        try:
+            session.post(url, json=body, timeout=args.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"❌ 预热请求失败，请确认服务已启动: {e}")
+            return
+
+    processes = max(1, min(args.processes, args.concurrency))
+    print(f"🚀 压测 {args.url} ({args.endpoint}, model={args.model}, 并发={args.concurrency}, 进程={processes})")
+    start = time.time()
+    deadline = start + args.duration if not args.requests else float('inf')
+    jobs = [(args, i, args.concurrency // processes + (i < args.concurrency % processes), deadline,
+             args.requests // processes + (i < args.requests % processes) if args.requests else 0)
+            for i in range(processes)]
+    if processes == 1:
+        results = [run_process(*jobs[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.starmap(run_process, jobs)
+    elapsed = time.time() - start
+    latencies = [latency for result in results for latency in result[0]]
+    errors = [error for result in results for error in result[1]]
+
+    items_per_request = 1 if args.endpoint == 'predict' else args.items
+    print("=" * 50)
+    print(f"请求数: {len(latencies)} 成功, {len(errors)} 失败, 用时 {elapsed:.2f}s")
+    if latencies:
+        ms = np.array(latencies) * 1000
+        print(f"QPS: {len(latencies) / elapsed:.1f} 请求/s, {len(latencies) * items_per_request / elapsed:.1f} 样本/s")
+        print(f"延迟(ms): p50={np.percentile(ms, 50):.2f}  p95={np.percentile(ms, 95):.2f}  "
+              f"p99={np.percentile(ms, 99):.2f}  max={ms.max():.2f}  mean={ms.mean():.2f}")
+    if errors:
+        print(f"错误示例: {errors[0]}")
+
+    try:
+        stats = session.get(f"{args.url.rstrip('/')}/v1/serving/stats", timeout=args.timeout)
+        if stats.status_code == 200:
+            for name, batcher in stats.json().get('batchers', {}).items():
+                print(f"微批 {name}: 平均批大小 {batcher['avg_batch']}, 最大 {batcher['max_batch']}, "
+                      f"批次数 {batcher['batches']}")
+    except requests.exceptions.RequestException:
+        pass
+
+
+if __name__ == "__main__":
+    main()